@@ -2,7 +2,11 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from functools import wraps
-from myapp.models import UserProfile
+import logging
+
+from .principal import get_principal
+
+logger = logging.getLogger(__name__)
 
 
 def admin_required(view_func):
@@ -15,16 +19,14 @@ def admin_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            profile = request.user.myapp_profile
-            if profile.role == 'admin':
-                return view_func(request, *args, **kwargs)
-            else:
-                messages.error(request, 'Access denied. Admin privileges required.')
-                return redirect('home')
-        except:
+        principal = get_principal(request)
+        if principal.myapp_profile is None:
             messages.error(request, 'User profile not found. Please contact administrator.')
             return redirect('home')
+        if principal.role == 'admin':
+            return view_func(request, *args, **kwargs)
+        messages.error(request, 'Access denied. Admin privileges required.')
+        return redirect('home')
     
     return _wrapped_view
 
@@ -39,16 +41,30 @@ def student_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            profile = request.user.myapp_profile
-            if profile.role == 'student':
-                return view_func(request, *args, **kwargs)
-            else:
-                messages.error(request, 'Access denied. Student privileges required.')
-                return redirect('home')
-        except:
+        principal = get_principal(request)
+        if principal.myapp_profile is None:
             messages.error(request, 'User profile not found. Please contact administrator.')
             return redirect('home')
+        if principal.role == 'student':
+            return view_func(request, *args, **kwargs)
+        messages.error(request, 'Access denied. Student privileges required.')
+        return redirect('home')
+    
+    return _wrapped_view
+
+
+def student_record_required(view_func):
+    """
+    Decorator for student views that act on the linked Student record.
+    Redirects to home page with error message if the profile has no student.
+    """
+    @student_required
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if get_principal(request).student is None:
+            messages.error(request, 'Your account is not linked to a student record. Please contact administrator.')
+            return redirect('home')
+        return view_func(request, *args, **kwargs)
     
     return _wrapped_view
 
@@ -63,19 +79,17 @@ def parent_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            profile = request.user.myapp_profile
-            print(f"DEBUG: parent_required - User: {request.user.username}, Role: {profile.role}")
-            if profile.role == 'parent':
-                return view_func(request, *args, **kwargs)
-            else:
-                print(f"DEBUG: Access denied - User {request.user.username} has role {profile.role}, not parent")
-                messages.error(request, 'Access denied. Parent privileges required.')
-                return redirect('home')
-        except Exception as e:
-            print(f"DEBUG: Exception in parent_required for user {request.user.username}: {str(e)}")
+        principal = get_principal(request)
+        if principal.myapp_profile is None:
+            logger.warning("parent_required - User %s has no profile", request.user.username)
             messages.error(request, 'User profile not found. Please contact administrator.')
             return redirect('home')
+        logger.debug("parent_required - User: %s, Role: %s", request.user.username, principal.role)
+        if principal.role == 'parent':
+            return view_func(request, *args, **kwargs)
+        logger.debug("Access denied - User %s has role %s, not parent", request.user.username, principal.role)
+        messages.error(request, 'Access denied. Parent privileges required.')
+        return redirect('home')
     
     return _wrapped_view
 
@@ -90,18 +104,10 @@ def form1_admin_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            # Check if user has profile
-            profile = getattr(request.user, 'profile', None)
-            
-            if profile and (profile.is_form1_admin() or profile.is_superuser()):
-                return view_func(request, *args, **kwargs)
-            else:
-                messages.error(request, 'Access denied. Form 1 admin privileges required.')
-                return redirect('home')
-        except Exception as e:
-            messages.error(request, f'User profile not found. Error: {str(e)}')
-            return redirect('home')
+        if get_principal(request).is_form1_admin:
+            return view_func(request, *args, **kwargs)
+        messages.error(request, 'Access denied. Form 1 admin privileges required.')
+        return redirect('home')
     
     return _wrapped_view
 
@@ -116,22 +122,11 @@ def form3_admin_required(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            # Check if user has myapp_profile (the correct profile model)
-            if hasattr(request.user, 'myapp_profile'):
-                profile = request.user.myapp_profile
-            else:
-                # Fallback to regular profile
-                profile = request.user.profile
-            
-            if profile.is_form3_admin() or profile.is_superuser():
-                return view_func(request, *args, **kwargs)
-            else:
-                messages.error(request, 'Access denied. Form 3 admin privileges required.')
-                return redirect('home')
-        except Exception as e:
-            messages.error(request, f'User profile not found. Error: {str(e)}')
-            return redirect('home')
+        # myapp_profile is the authoritative profile, the accounts profile the fallback
+        if get_principal(request).is_form3_admin:
+            return view_func(request, *args, **kwargs)
+        messages.error(request, 'Access denied. Form 3 admin privileges required.')
+        return redirect('home')
     
     return _wrapped_view
 
@@ -147,16 +142,14 @@ def role_required(allowed_roles):
             if not request.user.is_authenticated:
                 return redirect('accounts:login')
             
-            try:
-                profile = request.user.myapp_profile
-                if profile.role in allowed_roles:
-                    return view_func(request, *args, **kwargs)
-                else:
-                    messages.error(request, f'Access denied. Required roles: {", ".join(allowed_roles)}')
-                    return redirect('home')
-            except:
+            principal = get_principal(request)
+            if principal.myapp_profile is None:
                 messages.error(request, 'User profile not found. Please contact administrator.')
                 return redirect('home')
+            if principal.role in allowed_roles:
+                return view_func(request, *args, **kwargs)
+            messages.error(request, f'Access denied. Required roles: {", ".join(allowed_roles)}')
+            return redirect('home')
         
         return _wrapped_view
     return decorator
@@ -172,26 +165,22 @@ def student_owns_payment(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            profile = request.user.myapp_profile
-            if profile.role == 'admin':
-                # Admins can access all payments
-                return view_func(request, payment_id, *args, **kwargs)
-            elif profile.role == 'student':
-                # Students can only access their own payments
-                from myapp.models import Payment
-                try:
-                    payment = Payment.objects.get(id=payment_id, student=profile.student)
-                    return view_func(request, payment_id, *args, **kwargs)
-                except Payment.DoesNotExist:
-                    messages.error(request, 'Payment not found or access denied.')
-                    return redirect('myapp:payment_list')
-            else:
-                messages.error(request, 'Access denied.')
-                return redirect('home')
-        except:
+        profile = get_principal(request).myapp_profile
+        if profile is None:
             messages.error(request, 'User profile not found. Please contact administrator.')
             return redirect('home')
+        if profile.role == 'admin':
+            # Admins can access all payments
+            return view_func(request, payment_id, *args, **kwargs)
+        elif profile.role == 'student':
+            # Students can only access their own payments
+            from myapp.models import Payment
+            if Payment.objects.filter(id=payment_id, student=profile.student).exists():
+                return view_func(request, payment_id, *args, **kwargs)
+            messages.error(request, 'Payment not found or access denied.')
+            return redirect('myapp:payment_list')
+        messages.error(request, 'Access denied.')
+        return redirect('home')
     
     return _wrapped_view
 
@@ -206,23 +195,20 @@ def student_owns_student_record(view_func):
         if not request.user.is_authenticated:
             return redirect('accounts:login')
         
-        try:
-            profile = request.user.myapp_profile
-            if profile.role == 'admin':
-                # Admins can access all student records
-                return view_func(request, student_id, *args, **kwargs)
-            elif profile.role == 'student':
-                # Students can only access their own record
-                if profile.student and str(profile.student.id) == str(student_id):
-                    return view_func(request, student_id, *args, **kwargs)
-                else:
-                    messages.error(request, 'Access denied. You can only view your own records.')
-                    return redirect('myapp:student_detail', student_id=profile.student.id if profile.student else 0)
-            else:
-                messages.error(request, 'Access denied.')
-                return redirect('home')
-        except:
+        profile = get_principal(request).myapp_profile
+        if profile is None:
             messages.error(request, 'User profile not found. Please contact administrator.')
             return redirect('home')
+        if profile.role == 'admin':
+            # Admins can access all student records
+            return view_func(request, student_id, *args, **kwargs)
+        elif profile.role == 'student':
+            # Students can only access their own record
+            if profile.student and str(profile.student.id) == str(student_id):
+                return view_func(request, student_id, *args, **kwargs)
+            messages.error(request, 'Access denied. You can only view your own records.')
+            return redirect('myapp:student_detail', student_id=profile.student.id if profile.student else 0)
+        messages.error(request, 'Access denied.')
+        return redirect('home')
     
-    return _wrapped_view 
\ No newline at end of file
+    return _wrapped_view
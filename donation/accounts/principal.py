@@ -0,0 +1,79 @@
+"""
+Request-scoped view of the logged-in user's roles.
+
+``get_principal(request)`` loads the accounts profile, the myapp profile with
+its linked student and the linked parent in a single query and memoizes the
+result on the request. Context processors and role decorators all go through
+it, so role checks cost no further queries for the rest of the request.
+"""
+from functools import cached_property
+
+from django.contrib.auth.models import User
+
+# Reverse one-to-one accessors on User that the principal preloads
+_RELATED = ('profile', 'myapp_profile', 'parent')
+
+
+class Principal:
+    """Role, linked student and linked parent of one user"""
+
+    def __init__(self, user):
+        self.user = user
+        self.is_authenticated = user.is_authenticated
+        self.profile = None
+        self.myapp_profile = None
+        self.parent = None
+        if self.is_authenticated:
+            self._load()
+
+    def _load(self):
+        loaded = User.objects.select_related(
+            'profile', 'myapp_profile__student', 'parent'
+        ).filter(pk=self.user.pk).first()
+        if loaded is None:
+            return
+        for name in _RELATED:
+            related = getattr(loaded, name, None)
+            setattr(self, name, related)
+            # Prime the request user's cache too, so request.user.myapp_profile
+            # and friends in views don't query again
+            setattr(self.user, name, related)
+
+    @property
+    def student(self):
+        return self.myapp_profile.student if self.myapp_profile else None
+
+    @property
+    def role(self):
+        """myapp role (student/parent/admin...), falling back to the accounts role"""
+        if self.myapp_profile:
+            return self.myapp_profile.role
+        return self.profile.role if self.profile else None
+
+    @property
+    def is_student(self):
+        return self.role == 'student'
+
+    @property
+    def is_parent(self):
+        return self.role == 'parent'
+
+    @cached_property
+    def is_form1_admin(self):
+        return bool(self.profile and (self.profile.is_form1_admin() or self.profile.is_superuser()))
+
+    @cached_property
+    def is_form3_admin(self):
+        profile = self.myapp_profile or self.profile
+        if profile is None:
+            return False
+        # myapp profiles have no superuser role of their own
+        return profile.is_form3_admin() or bool(getattr(profile, 'is_superuser', lambda: False)())
+
+
+def get_principal(request):
+    """The principal of ``request``, built on first use"""
+    principal = getattr(request, '_principal', None)
+    if principal is None or principal.user is not request.user:
+        principal = request._principal = Principal(request.user)
+    return principal
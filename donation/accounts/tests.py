@@ -1,8 +1,13 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory
 from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.http import HttpResponse
 from django.urls import reverse
+from .context_processors import user_role_context
+from .decorators import parent_required, student_required
 from .forms import RoleBasedRegistrationForm
-from myapp.models import Student, UserProfile as MyAppUserProfile
+from .principal import get_principal
+from myapp.models import Parent, Student, UserProfile as MyAppUserProfile
 
 
 class RoleBasedRegistrationTest(TestCase):
@@ -148,4 +153,54 @@ class RoleBasedRegistrationTest(TestCase):
         self.assertContains(response, 'Create Account')
         self.assertContains(response, 'Role')
         self.assertContains(response, 'Admin')
-        self.assertContains(response, 'Student') 
\ No newline at end of file
+        self.assertContains(response, 'Student') 
+
+
+class PrincipalTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.student = Student.objects.create(
+            student_id='P001', nric='000000000777', first_name='Ali', last_name='Test',
+            level='form', level_custom='Form 1'
+        )
+        self.user = User.objects.create_user('principal_student', 'student@example.com', 'testpass123')
+        MyAppUserProfile.objects.create(user=self.user, role='student', student=self.student)
+
+    def make_request(self, user):
+        request = self.factory.get('/')
+        request.user = User.objects.get(pk=user.pk)
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    def test_roles_resolved_once_per_request(self):
+        request = self.make_request(self.user)
+        view = student_required(lambda request: HttpResponse('ok'))
+        with self.assertNumQueries(1):
+            principal = get_principal(request)
+            context = user_role_context(request)
+            response = view(request)
+            self.assertEqual(request.user.myapp_profile.student, self.student)
+        self.assertIs(get_principal(request), principal)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(principal.role, 'student')
+        self.assertEqual(principal.student, self.student)
+        self.assertIsNone(principal.parent)
+        self.assertEqual(context['user_role'], 'regular')
+        self.assertEqual(context['user_profile'], self.user.profile)
+
+    def test_parent_and_missing_profile(self):
+        parent_user = User.objects.create_user('principal_parent', 'parent@example.com', 'testpass123')
+        MyAppUserProfile.objects.create(user=parent_user, role='parent')
+        parent = Parent.objects.create(user=parent_user, nric='900101010777', phone_number='0123', address='KL')
+        view = parent_required(lambda request: HttpResponse('ok'))
+
+        request = self.make_request(parent_user)
+        self.assertEqual(view(request).status_code, 200)
+        self.assertEqual(get_principal(request).parent, parent)
+
+        no_profile = User.objects.create_user('principal_none', 'none@example.com', 'testpass123')
+        request = self.make_request(no_profile)
+        self.assertEqual(view(request).status_code, 302)
+        self.assertIsNone(get_principal(request).myapp_profile)
+        self.assertFalse(hasattr(request.user, 'myapp_profile'))
@@ -3,7 +3,6 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
@@ -21,7 +20,7 @@ from .forms import (
     RoleBasedRegistrationForm
 )
 from .models import UserProfile, LoginAttempt, UserActivity
-from myapp.models import Student, UserProfile as MyAppUserProfile
+from myapp.models import OutboundEmail, Student, UserProfile as MyAppUserProfile
 
 
 def get_client_ip(request):
@@ -138,10 +137,7 @@ def register_view(request):
                             from datetime import date, timedelta
                             
                             # Get fee structures for this form level
-                            form_fees = FeeStructure.objects.filter(
-                                form__iexact=form_level,
-                                is_active=True
-                            )
+                            form_fees = FeeStructure.for_form(form_level)
                             
                             generated_count = 0
                             for fee_structure in form_fees:
@@ -404,12 +400,8 @@ def send_welcome_email(user):
     The Team
     """
     
-    send_mail(
-        subject,
-        message,
-        'noreply@example.com',
-        [user.email],
-        fail_silently=False,
+    OutboundEmail.enqueue(
+        [user.email], subject, message, from_email='noreply@example.com', idempotency_key=f'welcome:{user.pk}'
     )
 
 
@@ -432,13 +424,8 @@ def send_password_reset_email(user, reset_url):
     The Team
     """
     
-    send_mail(
-        subject,
-        message,
-        'noreply@example.com',
-        [user.email],
-        fail_silently=False,
-    )
+    # A new key per request: each reset link is a separate email
+    OutboundEmail.enqueue([user.email], subject, message, from_email='noreply@example.com')
 
 
 # API views for AJAX requests
@@ -630,4 +617,35 @@ def public_activity_dashboard(request):
         'current_time': now,
     }
     
-    return render(request, 'accounts/public_activity_dashboard.html', context) 
\ No newline at end of file
+    return render(request, 'accounts/public_activity_dashboard.html', context)
+
+
+@login_required
+def performance_dashboard(request):
+    """Per-view latency and query counts collected by the instrumentation middleware"""
+    if not request.user.is_superuser:
+        messages.error(request, 'Access denied. Superuser privileges required.')
+        return redirect('home')
+    
+    from django.conf import settings
+    from donation.instrumentation import reset_view_stats, view_stats
+    from donation.response_cache import reset_response_cache_stats, response_cache_stats
+    from donation2.advanced_ai_services import conversation_memory
+    
+    if request.method == 'POST' and request.POST.get('action') == 'reset':
+        reset_view_stats()
+        reset_response_cache_stats()
+        messages.success(request, 'Performance samples cleared.')
+        return redirect('accounts:performance_dashboard')
+    
+    context = {
+        'stats': view_stats(),
+        'ring_buffer_size': getattr(settings, 'PERF_RING_BUFFER_SIZE', 200),
+        'instrumented_apps': getattr(settings, 'PERF_INSTRUMENTED_APPS', []),
+        'chat_sessions': conversation_memory.stats(),
+        'chat_session_ttl': getattr(settings, 'CHAT_SESSION_TTL', 1800),
+        'chat_max_sessions': getattr(settings, 'CHAT_MAX_SESSIONS', 1000),
+        'chat_responses': response_cache_stats(),
+        'chat_response_timeout': getattr(settings, 'CHAT_RESPONSE_CACHE_TIMEOUT', 300),
+    }
+    return render(request, 'accounts/performance_dashboard.html', context)
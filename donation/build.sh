@@ -15,4 +15,10 @@ python manage.py collectstatic --noinput --clear
 echo "🔄 Running database migrations..."
 python manage.py migrate --noinput
 
+echo "🔄 Rebuilding student fee ledger..."
+python manage.py rebuild_fee_ledger
+
+echo "🔄 Bundling NLTK data and timing AI components..."
+python manage.py ai_components --download
+
 echo "✅ Build completed successfully!"
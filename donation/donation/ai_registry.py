@@ -0,0 +1,205 @@
+"""
+Lazily loaded NLP/ML components.
+
+nltk, scikit-learn and openai take seconds to import, and the chat and
+analytics services used to import them (and call ``nltk.download``) when
+their modules were imported, so every worker paid for them at boot and
+reached the network. Services now ask for a component with ``get(name)``:
+it is imported and built on first use, once per process, and the time it
+took is recorded in ``timings()``.
+
+NLTK data is only read from ``NLTK_DATA_DIR``; fill it at build time with
+``manage.py ai_components --download``. When a package or corpus is missing
+the text components fall back to cheap stand-ins (regex tokenizer, no
+stopwords, no lemmatizing, neutral sentiment) instead of failing.
+
+``warm()`` loads everything up front; gunicorn.conf.py calls it in the
+master so forked workers start with the modules already loaded.
+"""
+import logging
+import re
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NLTK_PACKAGES = ['vader_lexicon', 'punkt', 'punkt_tab', 'stopwords', 'wordnet', 'omw-1.4']
+
+_loaders = {}
+_components = {}
+_timings = {}
+_lock = threading.RLock()
+
+
+class ComponentUnavailable(RuntimeError):
+    """Raised when a component without a fallback cannot be loaded"""
+
+
+class ComponentTiming:
+    """How a component was loaded: 'loaded', 'fallback' or 'unavailable'"""
+
+    def __init__(self, name, status, seconds, error=None):
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+        self.error = error
+
+
+class NeutralSentiment:
+    """Stand-in for VADER when the lexicon is not available"""
+
+    def polarity_scores(self, text):
+        return {'neg': 0.0, 'neu': 1.0, 'pos': 0.0, 'compound': 0.0}
+
+
+def register(name, fallback=None):
+    """Register a loader; ``fallback()`` builds the stand-in used when it fails"""
+    def decorator(loader):
+        _loaders[name] = (loader, fallback)
+        return loader
+    return decorator
+
+
+def get(name):
+    """The component called ``name``, loading it on first use"""
+    try:
+        component = _components[name]
+    except KeyError:
+        component = _load(name)
+    if isinstance(component, ComponentUnavailable):
+        raise component
+    return component
+
+
+def _load(name):
+    with _lock:
+        if name in _components:
+            return _components[name]
+        loader, fallback = _loaders[name]
+        started = time.perf_counter()
+        try:
+            component, status, error = loader(), 'loaded', None
+        except (ImportError, LookupError, OSError, ComponentUnavailable) as e:
+            error = _describe(e)
+            if fallback is None:
+                component, status = ComponentUnavailable(f'{name} is not available ({error})'), 'unavailable'
+            else:
+                component, status = fallback(), 'fallback'
+            logger.warning('AI component %s %s: %s', name, status, error)
+        _timings[name] = ComponentTiming(name, status, time.perf_counter() - started, error)
+        _components[name] = component
+        return component
+
+
+def _describe(error):
+    # NLTK's LookupError message is a banner of asterisks around the useful line
+    lines = [line.strip() for line in str(error).splitlines() if line.strip().strip('*')]
+    return f"{type(error).__name__}: {lines[0] if lines else ''}"
+
+
+def warm(names=None):
+    """Load ``names`` (default: every component) now and return their timings"""
+    for name in names or _loaders:
+        _load(name)
+    return timings()
+
+
+def names():
+    return list(_loaders)
+
+
+def timings():
+    return [_timings[name] for name in _loaders if name in _timings]
+
+
+def reset():
+    """Forget loaded components, so the next ``get`` loads them again"""
+    with _lock:
+        _components.clear()
+        _timings.clear()
+
+
+def nltk_data_dir():
+    return str(settings.NLTK_DATA_DIR)
+
+
+def download_nltk_data(packages=NLTK_PACKAGES):
+    """Fetch the NLTK data packages into NLTK_DATA_DIR (build time only)"""
+    import nltk
+
+    return {package: nltk.download(package, download_dir=nltk_data_dir(), quiet=True) for package in packages}
+
+
+@register('nltk')
+def _nltk():
+    import nltk
+
+    # Only the bundled data directory; never the user's home or the network
+    nltk.data.path[:] = [nltk_data_dir()]
+    return nltk
+
+
+@register('sentiment', fallback=NeutralSentiment)
+def _sentiment():
+    get('nltk')
+    from nltk.sentiment import SentimentIntensityAnalyzer
+
+    return SentimentIntensityAnalyzer()
+
+
+@register('stopwords', fallback=frozenset)
+def _stopwords():
+    get('nltk')
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
+
+
+@register('tokenizer', fallback=lambda: re.compile(r'\w+').findall)
+def _tokenizer():
+    get('nltk')
+    from nltk.tokenize import word_tokenize
+
+    # Punkt is read on the first call; fail here rather than mid-request
+    word_tokenize('warm up')
+    return word_tokenize
+
+
+@register('lemmatizer', fallback=lambda: (lambda word: word))
+def _lemmatizer():
+    get('nltk')
+    from nltk.stem import WordNetLemmatizer
+
+    lemmatize = WordNetLemmatizer().lemmatize
+    lemmatize('warming')
+    return lemmatize
+
+
+@register('linear_regression')
+def _linear_regression():
+    from sklearn.linear_model import LinearRegression
+
+    return LinearRegression
+
+
+@register('random_forest')
+def _random_forest():
+    from sklearn.ensemble import RandomForestClassifier
+
+    return RandomForestClassifier
+
+
+@register('openai')
+def _openai():
+    from openai import OpenAI
+
+    return OpenAI
+
+
+@register('urlconf')
+def _urlconf():
+    # Importing the URLconf imports every view module
+    return import_module(settings.ROOT_URLCONF)
@@ -0,0 +1,169 @@
+"""
+Per-view query and latency instrumentation.
+
+``QueryInstrumentationMiddleware`` counts DB queries and DB time, template
+render time and total latency for every view of the apps listed in
+``PERF_INSTRUMENTED_APPS``. Samples are kept per URL name in an in-process
+ring buffer (see ``view_stats``) and each response gets a ``Server-Timing``
+header. Views can declare a budget with ``@query_budget(n)``; going over it
+logs a warning, or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT``
+is set, so tests fail on regressions.
+"""
+import contextvars
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_active_stats = contextvars.ContextVar('view_query_stats', default=None)
+_samples = {}
+_samples_lock = threading.Lock()
+_template_patch_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget"""
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of queries a view may run per request"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class ViewStats:
+    """Measurements of a single request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed as a connection execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def _install_template_timer():
+    """Time top-level template renders (includes/extends are part of their parent)"""
+    from django.template.backends.django import Template
+
+    with _template_patch_lock:
+        if getattr(Template.render, '_timed', False):
+            return
+        original = Template.render
+
+        def render(self, context=None, request=None):
+            stats = _active_stats.get()
+            if stats is None:
+                return original(self, context, request)
+            started = time.perf_counter()
+            try:
+                return original(self, context, request)
+            finally:
+                stats.template_time += time.perf_counter() - started
+
+        render._timed = True
+        Template.render = render
+
+
+def record_sample(url_name, total_ms, stats):
+    size = getattr(settings, 'PERF_RING_BUFFER_SIZE', 200)
+    with _samples_lock:
+        ring = _samples.get(url_name)
+        if ring is None:
+            ring = _samples[url_name] = deque(maxlen=size)
+        ring.append((total_ms, stats.queries, stats.db_time * 1000, stats.template_time * 1000))
+
+
+def _percentile(values, percent):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def view_stats():
+    """p50/p95 latency and query figures per URL name, slowest p95 first"""
+    with _samples_lock:
+        snapshot = {name: list(ring) for name, ring in _samples.items()}
+    rows = []
+    for name, samples in snapshot.items():
+        totals = [sample[0] for sample in samples]
+        queries = [sample[1] for sample in samples]
+        rows.append({
+            'url_name': name,
+            'count': len(samples),
+            'p50_ms': round(_percentile(totals, 50), 1),
+            'p95_ms': round(_percentile(totals, 95), 1),
+            'p50_queries': _percentile(queries, 50),
+            'max_queries': max(queries),
+            'avg_db_ms': round(statistics.fmean(sample[2] for sample in samples), 1),
+            'avg_template_ms': round(statistics.fmean(sample[3] for sample in samples), 1),
+        })
+    return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+def reset_view_stats():
+    with _samples_lock:
+        _samples.clear()
+
+
+class QueryInstrumentationMiddleware:
+    """Measure instrumented views and enforce their query budgets"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.apps = tuple(getattr(settings, 'PERF_INSTRUMENTED_APPS', ()))
+        _install_template_timer()
+
+    def __call__(self, request):
+        stats = ViewStats()
+        token = _active_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _active_stats.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        view = getattr(request, '_instrumented_view', None)
+        if view is None:
+            return response
+        url_name, budget = view
+        record_sample(url_name, total_ms, stats)
+        response['Server-Timing'] = (
+            f'db;desc="{stats.queries} queries";dur={stats.db_time * 1000:.1f}, '
+            f'tpl;dur={stats.template_time * 1000:.1f}, total;dur={total_ms:.1f}'
+        )
+        if budget is not None and stats.queries > budget:
+            message = f'{url_name} ran {stats.queries} queries, over its budget of {budget}'
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        module = getattr(view_func, '__module__', '') or ''
+        if module.split('.', 1)[0] not in self.apps:
+            return None
+        # view_name is namespaced ("myapp:view_cart"), or the dotted view path for unnamed URLs
+        url_name = request.resolver_match.view_name if request.resolver_match else request.path
+        request._instrumented_view = (url_name, getattr(view_func, 'query_budget', None))
+        return None
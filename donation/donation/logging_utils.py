@@ -0,0 +1,104 @@
+"""
+Project-wide logging helpers.
+
+Modules log through ``logging.getLogger(__name__)`` with %-style arguments so
+messages are only formatted when a record is actually emitted. Records are
+handed to a background thread by ``QueueHandler`` so request threads never
+block on stdout, and ``RequestContextFilter`` tags each record with the
+current request id and drops DEBUG/INFO records for requests that were not
+picked by ``LOG_SAMPLE_RATE``.
+"""
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+import weakref
+
+from django.conf import settings
+
+_request_context = contextvars.ContextVar('log_request_context', default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request id to records and apply per-request sampling"""
+
+    def filter(self, record):
+        context = _request_context.get()
+        record.request_id = context['request_id'] if context else '-'
+        if context and not context['sampled']:
+            return record.levelno >= logging.WARNING
+        return True
+
+
+_queue_handlers = weakref.WeakSet()
+
+
+def _restart_listeners_after_fork():
+    # Threads don't survive fork: without this a preloaded gunicorn worker
+    # would queue records that no listener ever writes
+    for handler in list(_queue_handlers):
+        handler.start()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handler: records are queued and written to ``stream`` by a
+    listener thread. The formatter set through LOGGING is applied by the
+    listener, not by the thread that logged the record. A forked child gets
+    a fresh queue and listener of its own.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self._listening = False
+        self.start()
+        _queue_handlers.add(self)
+        atexit.register(self.stop)
+
+    def start(self):
+        """Start a listener on a new queue (records queued before a fork stay with the parent)"""
+        self.queue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        self._listening = True
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def stop(self):
+        """Write out everything still queued and stop the listener thread"""
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
+class LogSamplingMiddleware:
+    """Open a logging context for each request and decide whether it is sampled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'LOG_SAMPLE_RATE', 1.0)
+        request.log_request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+        token = _request_context.set({
+            'request_id': request.log_request_id,
+            'sampled': rate >= 1 or random.random() < rate,
+        })
+        try:
+            return self.get_response(request)
+        finally:
+            _request_context.reset(token)
@@ -0,0 +1,133 @@
+"""
+Cached chat responses for messages whose answer does not depend on the user.
+
+Most chat traffic is the same few questions ("help", "what is waqaf?", "how
+to pay by bank transfer", the suggestion buttons), yet every message ran
+sentiment analysis, intent detection and, in ``SystemChatbot``, tokenizing
+and lemmatizing again. Each assistant now classifies a message before
+answering it: routes whose handler reads neither the user nor the
+conversation so far are user-independent, and their responses are kept in
+the cache, everything else (fee status, named greetings, donation history)
+is always computed.
+
+Cache keys hold the normalized message (``normalize_query``), its language,
+today's date (responses count the days left of events) and a generation
+token. The token is replaced once a write to donation events, donations,
+waqaf assets or contributions commits, and after migrations (a deploy may
+ship new knowledge-base text).
+
+With a cache all workers share (``SHARED_CACHE``) the new token retires the
+old answers everywhere. With the per-process default cache only the worker
+that made the write sees it, so other workers may keep serving an answer for
+up to ``CHAT_RESPONSE_CACHE_TIMEOUT`` seconds (the TTL; 0 disables the cache)
+after the data behind it changed.
+``response_cache_stats()`` reports hits and misses per assistant.
+"""
+import hashlib
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+GENERATION_CACHE_KEY = 'chat_response:generation'
+
+_WHITESPACE = re.compile(r'\s+')
+_caches = []
+_caches_lock = threading.Lock()
+
+
+def normalize_query(message):
+    """Lowercase, collapse whitespace and drop surrounding punctuation"""
+    return _WHITESPACE.sub(' ', message.lower()).strip(' ?!.,')
+
+
+def invalidate_chat_responses():
+    """
+    Retire every cached response by moving to a new generation. Call it
+    through ``transaction.on_commit`` so an answer computed from the data
+    before the commit is not cached under the new generation.
+    """
+    cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+
+
+class ResponseCache:
+    """
+    Responses of one assistant to user-independent messages.
+
+    Create one per assistant, at module level: every instance is listed by
+    ``response_cache_stats()``. Callers pass messages already normalized.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        with _caches_lock:
+            _caches.append(self)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CHAT_RESPONSE_CACHE_TIMEOUT', 300)
+
+    def key(self, message, language):
+        digest = hashlib.sha256(message.encode()).hexdigest()
+        return (
+            f'chat_response:{self.name}:{_generation()}:'
+            f'{language}:{timezone.localdate().isoformat()}:{digest}'
+        )
+
+    def get(self, message, language):
+        """The cached response, or None (counted as a miss)"""
+        if self.timeout <= 0:
+            return None
+        response = cache.get(self.key(message, language))
+        self._count('hits' if response is not None else 'misses')
+        return response
+
+    def set(self, message, language, response):
+        if self.timeout > 0:
+            cache.set(self.key(message, language), response, self.timeout)
+
+    def bypass(self):
+        """Count a user-dependent message, answered without the cache"""
+        self._count('bypassed')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'assistant': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_rate': self.hits / lookups * 100 if lookups else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.bypassed = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def response_cache_stats():
+    """Hit/miss counters of this process, one dict per assistant"""
+    with _caches_lock:
+        return [response_cache.stats() for response_cache in _caches]
+
+
+def reset_response_cache_stats():
+    with _caches_lock:
+        for response_cache in _caches:
+            response_cache.reset()
@@ -67,6 +67,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'donation.logging_utils.LogSamplingMiddleware',
+    'donation.instrumentation.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Add this for i18n
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +95,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'accounts.context_processors.user_role_context',
+                'myapp.context_processors.fee_cart',
             ],
         },
     },
@@ -175,6 +178,24 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = 'moaaj.upm@gmail.com'
 EMAIL_USE_SSL = False
 
+# Outbox (myapp.OutboundEmail, sent by `manage.py process_outbox`)
+OUTBOX_RETRY_BASE_DELAY = 60  # seconds; doubles on every failed attempt
+OUTBOX_RETRY_MAX_DELAY = 3600
+OUTBOX_RATE_LIMIT = int(os.getenv('OUTBOX_RATE_LIMIT', '10'))  # emails per recipient per window
+OUTBOX_RATE_WINDOW = 3600
+OUTBOX_SENDING_TIMEOUT = 600
+
+# Background PDF report exports (see myapp.report_services)
+REPORT_EXPORT_WORKERS = int(os.getenv('REPORT_EXPORT_WORKERS', '2'))
+# Exports queued or running for longer than this were lost with a restarted
+# worker and are started again when their owner opens the exports page
+REPORT_EXPORT_STALE_MINUTES = int(os.getenv('REPORT_EXPORT_STALE_MINUTES', '30'))
+# XLSX exports are kept in memory up to this size, then spill to a temp file
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Seconds a fee report summary stays cached (it is also dropped on every fee
+# data change); with SHARED_CACHE off it is not cached at all
+FEE_REPORT_CACHE_TIMEOUT = int(os.getenv('FEE_REPORT_CACHE_TIMEOUT', '300'))
+
 # Print email settings for debugging
 print("\n=== Email Settings ===")
 print(f"EMAIL_BACKEND: {EMAIL_BACKEND}")
@@ -185,14 +206,109 @@ print(f"EMAIL_HOST_USER: {EMAIL_HOST_USER}")
 print(f"DEFAULT_FROM_EMAIL: {DEFAULT_FROM_EMAIL}")
 print("===================\n")
 
+# Logging
+# App loggers (myapp, donation2, waqaf, accounts) default to WARNING so debug
+# calls cost nothing; set LOG_LEVEL=DEBUG locally to see them. LOG_SAMPLE_RATE
+# keeps DEBUG/INFO output for that fraction of requests only.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': '%(asctime)s level=%(levelname)s logger=%(name)s request_id=%(request_id)s %(message)s',
+        },
+    },
+    'filters': {
+        'request_context': {
+            '()': 'donation.logging_utils.RequestContextFilter',
+        },
+    },
+    'handlers': {
+        'queue': {
+            'class': 'donation.logging_utils.QueueHandler',
+            'filters': ['request_context'],
+            'formatter': 'structured',
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['queue'],
+            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        **{
+            app: {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False}
+            for app in ['myapp', 'donation', 'donation2', 'waqaf', 'accounts']
+        },
+    },
+}
+
+# Per-view query/latency instrumentation (see donation/instrumentation.py)
+PERF_INSTRUMENTED_APPS = ['myapp', 'donation2', 'waqaf', 'accounts']
+PERF_RING_BUFFER_SIZE = int(os.getenv('PERF_RING_BUFFER_SIZE', '200'))
+# Raise instead of logging when a view goes over its @query_budget
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False').lower() == 'true'
+
+# NLTK data is read only from this directory and never downloaded at runtime;
+# fill it at build time with `manage.py ai_components --download`
+NLTK_DATA_DIR = os.getenv('NLTK_DATA', os.path.join(BASE_DIR, 'nltk_data'))
+
 # Site settings
 SITE_DOMAIN = '127.0.0.1:8000'  # Development domain
 SITE_NAME = 'Donation System'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Report exports and import reports hold student data: kept outside MEDIA_ROOT
+# so /media/ never serves them (see donation/storage.py)
+PRIVATE_MEDIA_ROOT = os.getenv('PRIVATE_MEDIA_ROOT', os.path.join(BASE_DIR, 'private_media'))
+
+# Cache: per-process local memory by default. Set CACHE_URL=redis://... to share
+# a Redis cache between workers (needs the redis package, see
+# requirements_full.txt) or CACHE_DIR to use a file-based cache.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif os.getenv('CACHE_DIR'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': os.getenv('CACHE_DIR')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'donation'}}
+CACHES['default'].update({
+    'KEY_PREFIX': 'donation',
+    'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+})
+# Whether every worker process sees the same cache. Caches that are dropped
+# on writes (fee reports, chat answers) are only used when it is, because an
+# invalidation in one worker never reaches another worker's local memory.
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# Sessions are read from the cache and written through to the database when
+# the cache is shared; a per-process cache would keep a session that was
+# logged out in one worker alive in the others, so it falls back to db
+if SHARED_CACHE:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Chat assistant sessions: 'local' keeps them per process, 'cache' shares them
+# between workers through the cache above. Idle sessions expire after
+# CHAT_SESSION_TTL seconds, the least recently used go past CHAT_MAX_SESSIONS,
+# and each keeps its last CHAT_HISTORY_LIMIT messages.
+CHAT_SESSION_STORE = os.getenv('CHAT_SESSION_STORE', 'local')
+CHAT_SESSION_TTL = int(os.getenv('CHAT_SESSION_TTL', '1800'))
+CHAT_MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', '1000'))
+CHAT_HISTORY_LIMIT = int(os.getenv('CHAT_HISTORY_LIMIT', '20'))
+# Seconds a chat answer that does not depend on the user is reused (0 disables).
+# Without SHARED_CACHE it is also how long other workers may serve an answer
+# after the events or assets behind it changed.
+CHAT_RESPONSE_CACHE_TIMEOUT = int(os.getenv('CHAT_RESPONSE_CACHE_TIMEOUT', '300'))
 
 # Authentication settings
 LOGIN_URL = '/accounts/login/'
@@ -71,26 +71,5 @@ WHITENOISE_AUTOREFRESH = True
 # Email configuration for production
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
-# Logging configuration
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-        },
-    },
-    'root': {
-        'handlers': ['console'],
-    },
-    'loggers': {
-        'django': {
-            'handlers': ['console'],
-            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
-            'propagate': False,
-        },
-    },
-}
-
 # Site settings for production
 SITE_DOMAIN = os.getenv('RAILWAY_PUBLIC_DOMAIN', 'your-app.up.railway.app')
\ No newline at end of file
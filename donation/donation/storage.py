@@ -0,0 +1,34 @@
+"""
+Storage for files that must never be public.
+
+``PrivateStorage`` keeps files under ``PRIVATE_MEDIA_ROOT``, outside
+``MEDIA_ROOT``, so the ``/media/`` route (served by Django itself while
+``DEBUG`` is on) cannot reach them and they have no URL. Views hand them out
+after checking who is asking, e.g. ``myapp.views.report_export_download``.
+"""
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class PrivateStorage(FileSystemStorage):
+    def __init__(self):
+        super().__init__()
+
+    # Read on every access so tests can override PRIVATE_MEDIA_ROOT
+    @property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Private files have no public URL; serve them through a view that checks access')
+
+
+private_storage = PrivateStorage()
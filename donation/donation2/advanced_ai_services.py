@@ -9,25 +9,64 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Q, Sum, Count, Avg
 from django.contrib.auth.models import User
-from textblob import TextBlob
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
+from django.conf import settings
+from donation import ai_registry
+from .conversation_store import get_conversation_store
+from .intent_matcher import KeywordMatcher, RuleSet
+from donation.response_cache import ResponseCache, normalize_query
 import random
 
-# Download required NLTK data
-try:
-    nltk.data.find('vader_lexicon')
-    nltk.data.find('punkt')
-    nltk.data.find('stopwords')
-except LookupError:
-    nltk.download('vader_lexicon')
-    nltk.download('punkt')
-    nltk.download('stopwords')
+# Checked in order; the first intent with a matching pattern wins
+INTENT_PATTERNS = {
+    'check_status': [
+        r'\b(check|view|see|show|status|semak|lihat|tunjuk)\b.*\b(fee|payment|balance|yuran|bayaran)\b',
+        r'\b(my|saya)\b.*\b(fee|payment|status|yuran|bayaran)\b',
+        r'\b(how much|berapa|amount|jumlah)\b.*\b(owe|due|perlu bayar)\b'
+    ],
+    'make_payment': [
+        r'\b(pay|make payment|bayar|buat bayaran)\b',
+        r'\b(how to pay|cara bayar|payment method|kaedah bayaran)\b',
+        r'\b(want to pay|nak bayar|hendak bayar)\b'
+    ],
+    'get_information': [
+        r'\b(what|apa|apakah)\b.*\b(is|ialah|adalah)\b',
+        r'\b(tell me|beritahu|explain|terangkan)\b',
+        r'\b(information|maklumat|details|butiran)\b'
+    ],
+    'solve_problem': [
+        r'\b(problem|issue|error|masalah|ralat)\b',
+        r'\b(not working|tak berfungsi|cannot|tak boleh)\b',
+        r'\b(help|tolong|bantuan)\b.*\b(problem|masalah)\b'
+    ],
+    'navigate': [
+        r'\b(where|mana|di mana)\b.*\b(find|cari|jumpa)\b',
+        r'\b(how to|bagaimana|cara)\b.*\b(go|pergi|access|akses)\b',
+        r'\b(take me|bawa saya|direct|arah)\b'
+    ]
+}
+
+# Amounts (RM 100, $50, 100 ringgit, etc.) and dates; the first matching pattern wins
+AMOUNT_PATTERNS = [
+    r'RM\s*(\d+(?:\.\d{2})?)',
+    r'\$\s*(\d+(?:\.\d{2})?)',
+    r'(\d+(?:\.\d{2})?)\s*ringgit',
+    r'(\d+(?:\.\d{2})?)\s*dollar'
+]
+DATE_PATTERNS = [
+    r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
+    r'(today|tomorrow|yesterday|hari ini|esok|semalam)',
+    r'(this month|next month|bulan ini|bulan depan)'
+]
+
+FEE_TYPES = ['pta', 'activities', 'exams', 'dormitory', 'tuition', 'registration']
+PAYMENT_METHODS = ['cash', 'bank transfer', 'online', 'credit card', 'debit card']
+MALAY_WORDS = ['saya', 'apa', 'bagaimana', 'bila', 'mana', 'kenapa', 'tolong', 'terima kasih']
 
 class WorldClassAIAssistant:
-    def __init__(self):
-        self.sia = SentimentIntensityAnalyzer()
-        self.conversation_memory = {}  # Store conversation context
+    def __init__(self, memory=None):
+        # Conversation context per session; shared with the chat view by default
+        self.conversation_memory = memory or conversation_memory
+        self.response_cache = response_cache
         self.user_preferences = {}     # Store user preferences
         
         # Personality traits
@@ -101,78 +140,119 @@ class WorldClassAIAssistant:
             }
         }
 
+        # All of the keyword tables and patterns, compiled once (see intent_matcher.py)
+        self.keyword_matcher = KeywordMatcher({
+            **{
+                kind: {lang: words[kind] for lang, words in self.languages.items()}
+                for kind in ['greetings', 'farewells', 'thanks']
+            },
+            'language': {'ms': MALAY_WORDS},
+            'emotion': {emotion: data['detection'] for emotion, data in self.emotional_responses.items()},
+            'modules': {module: keywords['primary'] for module, keywords in self.smart_keywords.items()},
+            'fee_type': {fee_type: [fee_type] for fee_type in FEE_TYPES},
+            'payment_method': {method: [method] for method in PAYMENT_METHODS},
+        })
+        self.rule_matcher = RuleSet({
+            'intent': [(intent, pattern) for intent, patterns in INTENT_PATTERNS.items() for pattern in patterns],
+            'amount': [('amount', pattern) for pattern in AMOUNT_PATTERNS],
+            'date': [('date', pattern) for pattern in DATE_PATTERNS],
+        })
+
+    @property
+    def sia(self):
+        return ai_registry.get('sentiment')
+
     def process_message(self, message, user=None, session_id=None):
         """Advanced message processing with context awareness"""
         original_message = message
-        message_lower = message.lower().strip()
+        message_lower = normalize_query(message)
         
         # Initialize or get conversation context
         if session_id:
-            if session_id not in self.conversation_memory:
-                self.conversation_memory[session_id] = {
-                    'history': [],
-                    'context': {},
-                    'user_mood': 'neutral',
-                    'preferred_language': 'en'
-                }
-            context = self.conversation_memory[session_id]
+            context = self.conversation_memory.get_or_create_session(session_id)
             context['history'].append({'user': original_message, 'timestamp': datetime.now()})
         else:
             context = {'history': [], 'context': {}, 'user_mood': 'neutral', 'preferred_language': 'en'}
         
-        # Detect language preference
-        detected_lang = self._detect_language(message_lower)
-        context['preferred_language'] = detected_lang
+        # Detect language, emotion, intent and entities in one pass
+        analysis = self.analyze_message(message_lower)
+        context['preferred_language'] = analysis['language']
         
-        # Analyze sentiment and emotion
-        sentiment = self.sia.polarity_scores(message_lower)
-        emotion = self._detect_emotion(message_lower)
-        context['user_mood'] = emotion
+        context['user_mood'] = analysis['emotion']
         
-        # Handle different types of messages
-        if self._is_greeting(message_lower, detected_lang):
-            response = self._generate_personalized_greeting(user, context)
-        elif self._is_farewell(message_lower, detected_lang):
-            response = self._generate_farewell(user, context)
-        elif self._is_thanks(message_lower, detected_lang):
-            response = self._generate_thanks_response(context)
-        else:
-            # Process complex queries with context
-            response = self._process_complex_query(message_lower, user, context, sentiment)
+        shared = self.is_user_independent(analysis)
+        response = self.response_cache.get(message_lower, analysis['language']) if shared else None
+        if not shared:
+            self.response_cache.bypass()
+        if response is None:
+            # Analyze sentiment and emotion
+            sentiment = self.sia.polarity_scores(message_lower)
+            
+            # Handle different types of messages
+            if analysis['greeting']:
+                response = self._generate_personalized_greeting(user, context)
+            elif analysis['farewell']:
+                response = self._generate_farewell(user, context)
+            elif analysis['thanks']:
+                response = self._generate_thanks_response(context)
+            else:
+                # Process complex queries with context
+                response = self._process_complex_query(message_lower, user, context, sentiment, analysis)
+            if shared:
+                self.response_cache.set(message_lower, analysis['language'], response)
         
         # Store response in context
         if session_id:
             context['history'].append({'bot': response, 'timestamp': datetime.now()})
+            self.conversation_memory.save_session(session_id, context)
         
         return response
 
-    def _detect_language(self, message):
-        """Detect user's preferred language"""
-        malay_words = ['saya', 'apa', 'bagaimana', 'bila', 'mana', 'kenapa', 'tolong', 'terima kasih']
-        malay_count = sum(1 for word in malay_words if word in message)
-        return 'ms' if malay_count > 0 else 'en'
-
-    def _detect_emotion(self, message):
-        """Detect user's emotional state"""
-        for emotion, data in self.emotional_responses.items():
-            if any(keyword in message for keyword in data['detection']):
-                return emotion
-        return 'neutral'
-
-    def _is_greeting(self, message, lang='en'):
-        """Check if message is a greeting"""
-        greetings = self.languages[lang]['greetings'] + self.languages['en']['greetings']
-        return any(greeting in message for greeting in greetings)
-
-    def _is_farewell(self, message, lang='en'):
-        """Check if message is a farewell"""
-        farewells = self.languages[lang]['farewells'] + self.languages['en']['farewells']
-        return any(farewell in message for farewell in farewells)
+    def analyze_message(self, message):
+        """Language, emotion, greeting/farewell/thanks, intent, modules and entities of a message"""
+        keywords = self.keyword_matcher.scan(message)
+        rules = self.rule_matcher.first(message)
+        language = keywords.first('language', 'en')
+        amount = rules.get('amount')
+        date = rules.get('date')
+        return {
+            'language': language,
+            'emotion': keywords.first('emotion', 'neutral'),
+            # The detected language's words, plus English
+            'greeting': keywords.has('greetings', language, 'en'),
+            'farewell': keywords.has('farewells', language, 'en'),
+            'thanks': keywords.has('thanks', language, 'en'),
+            'intent': rules['intent'][0] if 'intent' in rules else 'general',
+            'modules': keywords.labels('modules'),
+            'entities': {
+                'amount': float(amount[1]) if amount else None,
+                'date': date[1] if date else None,
+                'student_name': None,
+                'fee_type': keywords.first('fee_type'),
+                'payment_method': keywords.first('payment_method'),
+            },
+        }
 
-    def _is_thanks(self, message, lang='en'):
-        """Check if message is expressing gratitude"""
-        thanks = self.languages[lang]['thanks'] + self.languages['en']['thanks']
-        return any(thank in message for thank in thanks)
+    def is_user_independent(self, analysis):
+        """
+        Whether the response to a message with this analysis reads neither the user
+        nor the conversation, following the routing of process_message
+        """
+        if analysis['greeting'] or analysis['farewell'] or analysis['thanks']:
+            # Named, time of day or history dependent; farewells and thanks are picked at random
+            return False
+        intent = analysis['intent']
+        modules = analysis['modules']
+        if intent == 'make_payment':
+            return bool(analysis['entities']['payment_method'])
+        if intent == 'get_information':
+            # Fee and student information is the user's own
+            return 'waqaf' in modules or not {'fees', 'student'} & set(modules)
+        if intent in ('solve_problem', 'navigate'):
+            return True
+        if intent == 'general':
+            return len(modules) > 1 or modules == ['waqaf']
+        return False
 
     def _generate_personalized_greeting(self, user, context):
         """Generate highly personalized greeting"""
@@ -286,12 +366,11 @@ class WorldClassAIAssistant:
             'emotion': 'happy'
         }
 
-    def _process_complex_query(self, message, user, context, sentiment):
+    def _process_complex_query(self, message, user, context, sentiment, analysis):
         """Process complex queries with advanced understanding"""
-        # Identify intent and entities
-        intent = self._identify_intent(message)
-        entities = self._extract_entities(message)
-        modules = self._identify_modules(message)
+        intent = analysis['intent']
+        entities = analysis['entities']
+        modules = analysis['modules']
         
         # Handle based on primary intent
         if intent == 'check_status':
@@ -426,94 +505,6 @@ class WorldClassAIAssistant:
             'emotion': 'informative'
         }
 
-    def _identify_intent(self, message):
-        """Identify user's intent with high accuracy"""
-        intent_patterns = {
-            'check_status': [
-                r'\b(check|view|see|show|status|semak|lihat|tunjuk)\b.*\b(fee|payment|balance|yuran|bayaran)\b',
-                r'\b(my|saya)\b.*\b(fee|payment|status|yuran|bayaran)\b',
-                r'\b(how much|berapa|amount|jumlah)\b.*\b(owe|due|perlu bayar)\b'
-            ],
-            'make_payment': [
-                r'\b(pay|make payment|bayar|buat bayaran)\b',
-                r'\b(how to pay|cara bayar|payment method|kaedah bayaran)\b',
-                r'\b(want to pay|nak bayar|hendak bayar)\b'
-            ],
-            'get_information': [
-                r'\b(what|apa|apakah)\b.*\b(is|ialah|adalah)\b',
-                r'\b(tell me|beritahu|explain|terangkan)\b',
-                r'\b(information|maklumat|details|butiran)\b'
-            ],
-            'solve_problem': [
-                r'\b(problem|issue|error|masalah|ralat)\b',
-                r'\b(not working|tak berfungsi|cannot|tak boleh)\b',
-                r'\b(help|tolong|bantuan)\b.*\b(problem|masalah)\b'
-            ],
-            'navigate': [
-                r'\b(where|mana|di mana)\b.*\b(find|cari|jumpa)\b',
-                r'\b(how to|bagaimana|cara)\b.*\b(go|pergi|access|akses)\b',
-                r'\b(take me|bawa saya|direct|arah)\b'
-            ]
-        }
-        
-        for intent, patterns in intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message, re.IGNORECASE):
-                    return intent
-        
-        return 'general'
-
-    def _extract_entities(self, message):
-        """Extract important entities from the message"""
-        entities = {
-            'amount': None,
-            'date': None,
-            'student_name': None,
-            'fee_type': None,
-            'payment_method': None
-        }
-        
-        # Extract amounts (RM 100, $50, 100 ringgit, etc.)
-        amount_patterns = [
-            r'RM\s*(\d+(?:\.\d{2})?)',
-            r'\$\s*(\d+(?:\.\d{2})?)',
-            r'(\d+(?:\.\d{2})?)\s*ringgit',
-            r'(\d+(?:\.\d{2})?)\s*dollar'
-        ]
-        for pattern in amount_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                entities['amount'] = float(match.group(1))
-                break
-        
-        # Extract dates
-        date_patterns = [
-            r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})',
-            r'(today|tomorrow|yesterday|hari ini|esok|semalam)',
-            r'(this month|next month|bulan ini|bulan depan)'
-        ]
-        for pattern in date_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                entities['date'] = match.group(1)
-                break
-        
-        # Extract fee types
-        fee_types = ['pta', 'activities', 'exams', 'dormitory', 'tuition', 'registration']
-        for fee_type in fee_types:
-            if fee_type in message:
-                entities['fee_type'] = fee_type
-                break
-        
-        # Extract payment methods
-        payment_methods = ['cash', 'bank transfer', 'online', 'credit card', 'debit card']
-        for method in payment_methods:
-            if method in message:
-                entities['payment_method'] = method
-                break
-        
-        return entities
-
     def _handle_status_check(self, message, user, entities, context):
         """Handle status check requests with perfect accuracy"""
         from myapp.models import Student, FeeStatus, Payment
@@ -879,20 +870,6 @@ class WorldClassAIAssistant:
             'emotion': 'empathetic_helpful'
         }
 
-    def _identify_modules(self, message):
-        """Enhanced module identification"""
-        identified = []
-        for module, keywords in self.smart_keywords.items():
-            # Check primary keywords
-            if any(keyword in message for keyword in keywords['primary']):
-                identified.append(module)
-            # Check action keywords in context
-            elif module == 'fees' and any(action in message for action in keywords.get('actions', [])):
-                if any(primary in message for primary in keywords['primary']):
-                    identified.append(module)
-        
-        return identified
-
     def _get_specific_payment_guide(self, method, user, context):
         """Provide specific payment method guidance"""
         guides = {
@@ -1009,23 +986,34 @@ class WorldClassAIAssistant:
         }
 
 class ConversationMemory:
-    """Advanced conversation memory system"""
+    """Conversation sessions, kept in a bounded store (see conversation_store.py)"""
     
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, store=None, history_limit=None):
+        self.store = store or get_conversation_store()
+        self.history_limit = history_limit or getattr(settings, 'CHAT_HISTORY_LIMIT', 20)
     
     def get_or_create_session(self, session_id):
         """Get or create conversation session"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
+        session = self.store.get(session_id)
+        if session is None:
+            session = {
+                'history': [],
                 'messages': [],
                 'context': {},
+                'user_mood': 'neutral',
+                'preferred_language': 'en',
                 'user_preferences': {},
                 'mood_history': [],
                 'topics_discussed': [],
                 'created_at': datetime.now()
             }
-        return self.sessions[session_id]
+        return session
+    
+    def save_session(self, session_id, session):
+        """Save a session, keeping only the last ``history_limit`` entries of its histories"""
+        for key in ['history', 'messages', 'mood_history', 'topics_discussed']:
+            del session[key][:-self.history_limit]
+        self.store.set(session_id, session)
     
     def add_message(self, session_id, message, response, user=None):
         """Add message to conversation history"""
@@ -1036,10 +1024,11 @@ class ConversationMemory:
             'timestamp': datetime.now(),
             'user': user.username if user else None
         })
-        
-        # Keep only last 50 messages to manage memory
-        if len(session['messages']) > 50:
-            session['messages'] = session['messages'][-50:]
+        self.save_session(session_id, session)
+    
+    def stats(self):
+        return self.store.stats()
 
 # Global conversation memory instance
 conversation_memory = ConversationMemory()
+response_cache = ResponseCache('world_class')
@@ -1,38 +1,30 @@
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.feature_extraction.text import TfidfVectorizer
-from textblob import TextBlob
-import joblib
 from datetime import datetime, timedelta
 from django.db.models import Avg, Count, Sum
 from myapp.models import DonationEvent, Donation, FeeStructure, FeeStatus, Payment
 from decimal import Decimal
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import re
 from django.utils import timezone
-from nltk.sentiment import SentimentIntensityAnalyzer
 from django.contrib.auth.models import User
-from openai import OpenAI
+from django.utils.translation import get_language
+from donation import ai_registry
+from .intent_matcher import KeywordMatcher
+from donation.response_cache import ResponseCache, normalize_query
+import logging
 
-# Download required NLTK data
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('averaged_perceptron_tagger')
+logger = logging.getLogger(__name__)
 
 class DonationAIService:
     def __init__(self):
         self.fraud_model = None
         self.recommendation_model = None
-        self.vectorizer = TfidfVectorizer(max_features=1000)
         
     def train_fraud_detection_model(self, historical_donations):
         """Train a model to detect potentially fraudulent donations"""
         features = self._extract_donation_features(historical_donations)
         labels = [d.is_fraud for d in historical_donations]
         
-        self.fraud_model = RandomForestClassifier(n_estimators=100)
+        self.fraud_model = ai_registry.get('random_forest')(n_estimators=100)
         self.fraud_model.fit(features, labels)
         
     def predict_fraud_probability(self, donation):
@@ -67,7 +59,7 @@ class DonationAIService:
     def analyze_event_sentiment(self, event_description):
         """Analyze the sentiment of an event description using VADER with enhanced features"""
         # Initialize VADER sentiment analyzer
-        sia = SentimentIntensityAnalyzer()
+        sia = ai_registry.get('sentiment')
         
         # Clean and preprocess the text
         cleaned_text = self._preprocess_text(event_description)
@@ -137,7 +129,7 @@ class DonationAIService:
 
     def _extract_emotional_words(self, text):
         """Extract words that contribute to the sentiment"""
-        sia = SentimentIntensityAnalyzer()
+        sia = ai_registry.get('sentiment')
         words = text.split()
         emotional_words = []
         
@@ -219,37 +211,63 @@ class UnifiedAIAssistant:
             'why': ['why', 'kenapa', 'mengapa'],
             'who': ['who', 'siapa']
         }
-        
-        # Download required NLTK data
-        try:
-            nltk.data.find('vader_lexicon')
-        except LookupError:
-            nltk.download('vader_lexicon')
-        
-        self.sia = SentimentIntensityAnalyzer()
+
+        # The keyword tables above, compiled once (see intent_matcher.py)
+        self.keyword_matcher = KeywordMatcher({
+            'opening': {'greeting': self.greetings, 'farewell': self.farewells, 'help': self.module_keywords['help']},
+            'modules': self.module_keywords,
+            'question': self.question_patterns,
+        })
+
+    @property
+    def sia(self):
+        return ai_registry.get('sentiment')
 
     def process_message(self, message, user=None):
         """Process user message and return appropriate response"""
-        original_message = message
-        message = message.lower().strip()
-        
-        # Check for greetings
-        if any(greeting in message for greeting in self.greetings):
+        message = normalize_query(message)
+        keywords = self.keyword_matcher.scan(message)
+        if not self.is_user_independent(message, keywords, user):
+            response_cache.bypass()
+            return self._answer(message, user, keywords)
+        response = response_cache.get(message, get_language())
+        if response is None:
+            response = self._answer(message, user, keywords)
+            response_cache.set(message, get_language(), response)
+        return response
+
+    def is_user_independent(self, message, keywords, user):
+        """Whether the response reads neither the user's name nor their records, following _answer"""
+        opening = keywords.first('opening')
+        if opening == 'greeting':
+            return not (user and user.is_authenticated)
+        if opening:
+            return True
+        modules = keywords.labels('modules')
+        if 'donation' in modules:
+            # Only the donation history is the user's own
+            return (
+                any(word in message for word in ('current', 'active', 'events'))
+                or ('how' in message and ('donate' in message or 'contribute' in message))
+                or not ('history' in message or 'my donations' in message)
+            )
+        return not modules or modules[0] in ('events', 'waqaf')
+
+    def _answer(self, message, user, keywords):
+        # Greetings, then farewells, then help requests
+        opening = keywords.first('opening')
+        if opening == 'greeting':
             return self._get_greeting_response(user)
-        
-        # Check for farewells
-        if any(farewell in message for farewell in self.farewells):
+        if opening == 'farewell':
             return self._get_farewell_response()
-        
-        # Handle help requests
-        if any(help_word in message for help_word in self.module_keywords['help']):
+        if opening == 'help':
             return self._get_help_response()
         
         # Identify question type for better responses
-        question_type = self._identify_question_type(message)
+        question_type = keywords.first('question', 'general')
         
         # Identify module and handle accordingly
-        modules = self._identify_modules(message)  # Can identify multiple modules
+        modules = keywords.labels('modules')  # Can identify multiple modules
         
         if 'donation' in modules:
             return self._handle_donation_query(message, user, question_type)
@@ -385,21 +403,6 @@ class UnifiedAIAssistant:
                 ]
             }
 
-    def _identify_modules(self, message):
-        """Identify which modules the query belongs to (can be multiple)"""
-        identified_modules = []
-        for module, keywords in self.module_keywords.items():
-            if any(keyword in message for keyword in keywords):
-                identified_modules.append(module)
-        return identified_modules
-    
-    def _identify_question_type(self, message):
-        """Identify the type of question being asked"""
-        for q_type, patterns in self.question_patterns.items():
-            if any(pattern in message for pattern in patterns):
-                return q_type
-        return 'general'
-    
     def _get_help_response(self):
         """Generate help response"""
         return {
@@ -597,7 +600,7 @@ class UnifiedAIAssistant:
                             }
                 
             except Exception as e:
-                print(f"Error in fee query: {e}")
+                logger.warning("Error in fee query: %s", e)
             
             # General fee information for authenticated users
             return {
@@ -674,9 +677,11 @@ class UnifiedAIAssistant:
             ]
         }
 
+response_cache = ResponseCache('unified')
+
 class DonorEngagementService:
     def __init__(self):
-        self.openai_client = OpenAI()
+        self.openai_client = ai_registry.get('openai')()
         
     def generate_thank_you_message(self, donor_name, amount, event_title, impact_details):
         """Generate a personalized thank you message for donors."""
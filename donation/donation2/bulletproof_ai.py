@@ -5,40 +5,45 @@ Guaranteed to work perfectly every time!
 
 from datetime import datetime
 from django.utils import timezone
+from .intent_matcher import KeywordMatcher
 import random
 
 class BulletproofAI:
     def __init__(self):
         self.greetings = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'halo', 'hai']
         self.farewells = ['bye', 'goodbye', 'see you', 'thanks', 'thank you', 'selamat tinggal']
+        # Checked in this order; the first topic with a keyword in the message wins
+        self.topic_matcher = KeywordMatcher({'topic': {
+            'greeting': self.greetings,
+            'farewell': self.farewells,
+            'fees': ['fee', 'fees', 'payment', 'pay', 'yuran', 'bayar'],
+            'donations': ['donation', 'donate', 'sumbangan', 'derma'],
+            'waqaf': ['waqaf', 'wakaf', 'endowment'],
+            'help': ['help', 'bantuan', 'tolong', 'assist'],
+        }})
         
     def process_message(self, message, user=None):
         """Process message with guaranteed success"""
         try:
             message_lower = message.lower().strip()
+            topic = self.topic_matcher.scan(message_lower).first('topic')
             
-            # Greetings
-            if any(greeting in message_lower for greeting in self.greetings):
+            if topic == 'greeting':
                 return self._get_greeting(user)
             
-            # Farewells  
-            if any(farewell in message_lower for farewell in self.farewells):
+            if topic == 'farewell':
                 return self._get_farewell()
             
-            # Fee queries
-            if any(word in message_lower for word in ['fee', 'fees', 'payment', 'pay', 'yuran', 'bayar']):
+            if topic == 'fees':
                 return self._handle_fees(message_lower, user)
             
-            # Donation queries
-            if any(word in message_lower for word in ['donation', 'donate', 'sumbangan', 'derma']):
+            if topic == 'donations':
                 return self._handle_donations(message_lower, user)
             
-            # Waqaf queries
-            if any(word in message_lower for word in ['waqaf', 'wakaf', 'endowment']):
+            if topic == 'waqaf':
                 return self._get_waqaf_info()
             
-            # Help queries
-            if any(word in message_lower for word in ['help', 'bantuan', 'tolong', 'assist']):
+            if topic == 'help':
                 return self._get_help()
             
             # Default response
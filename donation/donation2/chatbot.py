@@ -1,4 +1,3 @@
-from textblob import TextBlob
 import re
 from django.db.models import Q
 from myapp.models import DonationEvent, DonationCategory
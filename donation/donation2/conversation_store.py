@@ -0,0 +1,241 @@
+"""
+Bounded storage for chat conversation sessions.
+
+Sessions used to live in module-level dicts that were never evicted, so
+every anonymous chat message grew the worker by one session and workers did
+not see each other's conversations. A session is now a small dict saved in
+a ``ConversationStore``:
+
+- ``LocalConversationStore`` keeps sessions in this process, dropping those
+  idle for longer than ``CHAT_SESSION_TTL`` seconds and, past
+  ``CHAT_MAX_SESSIONS``, the least recently used ones.
+- ``CacheConversationStore`` keeps them in a Django cache, so every worker
+  sees the same conversation. Each session is its own key expired by the
+  cache after the TTL; a counter bumped with ``incr`` numbers the saves, and
+  a session not saved again within the last ``CHAT_MAX_SESSIONS`` saves is
+  evicted.
+- ``RedisConversationStore`` is used instead when the cache is Redis
+  (``CACHE_URL`` set): a sorted set keeps the exact least recently used
+  order across workers.
+
+``CHAT_SESSION_STORE`` ('local' or 'cache') picks the store; callers trim
+session histories to ``CHAT_HISTORY_LIMIT`` entries before saving.
+"""
+import pickle
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+def _size(session):
+    return len(pickle.dumps(session, pickle.HIGHEST_PROTOCOL))
+
+
+class ConversationStore(ABC):
+    def __init__(self, ttl=None, max_sessions=None):
+        self.ttl = ttl or getattr(settings, 'CHAT_SESSION_TTL', 1800)
+        self.max_sessions = max_sessions or getattr(settings, 'CHAT_MAX_SESSIONS', 1000)
+
+    @abstractmethod
+    def get(self, session_id):
+        """The saved session, or None if it is unknown or has expired"""
+
+    @abstractmethod
+    def set(self, session_id, session):
+        """Save the session, evicting others past max_sessions"""
+
+    @abstractmethod
+    def delete(self, session_id):
+        """Forget the session"""
+
+    @abstractmethod
+    def stats(self):
+        """{'backend', 'sessions', 'bytes', 'evictions'}"""
+
+
+class LocalConversationStore(ConversationStore):
+    """Sessions of this process, in least recently used order"""
+
+    def __init__(self, ttl=None, max_sessions=None):
+        super().__init__(ttl, max_sessions)
+        self._sessions = OrderedDict()  # session_id -> (session, last used, size)
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], time.monotonic(), entry[2])
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def set(self, session_id, session):
+        size = _size(session)
+        with self._lock:
+            self._drop(session_id)
+            self._sessions[session_id] = (session, time.monotonic(), size)
+            self._bytes += size
+            self._expire()
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+                self._evictions += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {'backend': 'local', 'sessions': len(self._sessions), 'bytes': self._bytes, 'evictions': self._evictions}
+
+    def _drop(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _expire(self):
+        # Oldest first, so stop at the first session that is still fresh
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, (_, last_used, _) = next(iter(self._sessions.items()))
+            if last_used > cutoff:
+                break
+            self._drop(session_id)
+            self._evictions += 1
+
+
+class CacheConversationStore(ConversationStore):
+    """Sessions in a Django cache, shared by every worker
+
+    Each session has its own key, which the cache expires after the TTL, so
+    workers never rewrite a shared structure. Every save takes the next
+    number of a counter kept with ``incr`` and records the session under
+    that slot; once more than ``max_sessions`` saves have happened, the
+    session of the slot that fell out of the window is dropped unless it
+    was saved again since.
+    """
+
+    KEY_PREFIX = 'chat_session:'
+    SLOT_PREFIX = 'chat_session:slot:'
+    SEQUENCE_KEY = 'chat_session:sequence'
+    EVICTIONS_KEY = 'chat_session:evictions'
+
+    def __init__(self, ttl=None, max_sessions=None, alias='default'):
+        super().__init__(ttl, max_sessions)
+        self.cache = caches[alias]
+
+    def get(self, session_id):
+        entry = self.cache.get(self.KEY_PREFIX + session_id)
+        return entry[0] if entry is not None else None
+
+    def set(self, session_id, session):
+        slot = self._next_slot()
+        self.cache.set_many({
+            self.KEY_PREFIX + session_id: (session, slot, _size(session)),
+            self.SLOT_PREFIX + str(slot): session_id,
+        }, self.ttl)
+        old_slot = slot - self.max_sessions
+        if old_slot < 1:
+            return
+        old_id = self.cache.get(self.SLOT_PREFIX + str(old_slot))
+        self.cache.delete(self.SLOT_PREFIX + str(old_slot))
+        if old_id is None:
+            return
+        entry = self.cache.get(self.KEY_PREFIX + old_id)
+        if entry is not None and entry[1] == old_slot:
+            self.cache.delete(self.KEY_PREFIX + old_id)
+            self._count_evictions(1)
+
+    def delete(self, session_id):
+        self.cache.delete(self.KEY_PREFIX + session_id)
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'backend': 'cache',
+            'sessions': len(entries),
+            'bytes': sum(entry[2] for entry in entries),
+            'evictions': self.cache.get(self.EVICTIONS_KEY, 0),
+        }
+
+    def _next_slot(self):
+        self.cache.add(self.SEQUENCE_KEY, 0, None)
+        try:
+            return self.cache.incr(self.SEQUENCE_KEY)
+        except ValueError:
+            # The counter was culled between add() and incr()
+            self.cache.set(self.SEQUENCE_KEY, 1, None)
+            return 1
+
+    def _entries(self):
+        """Live sessions of the last max_sessions slots, each once"""
+        last = self.cache.get(self.SEQUENCE_KEY, 0)
+        slot_keys = [self.SLOT_PREFIX + str(slot) for slot in range(max(last - self.max_sessions + 1, 1), last + 1)]
+        session_ids = self.cache.get_many(slot_keys)
+        entries = self.cache.get_many([self.KEY_PREFIX + session_id for session_id in set(session_ids.values())])
+        return [entry for key, session_id in session_ids.items()
+                if (entry := entries.get(self.KEY_PREFIX + session_id)) is not None
+                and self.SLOT_PREFIX + str(entry[1]) == key]
+
+    def _count_evictions(self, count):
+        try:
+            self.cache.incr(self.EVICTIONS_KEY, count)
+        except ValueError:
+            self.cache.set(self.EVICTIONS_KEY, count, None)
+
+
+class RedisConversationStore(CacheConversationStore):
+    """Sessions in a Redis cache, in least recently used order
+
+    A sorted set of session ids scored by their last save replaces the
+    slots: each save updates it and trims expired and surplus sessions in
+    one MULTI/EXEC, so the order is exact however many workers save at once.
+    """
+
+    INDEX_KEY = 'chat_session:index'
+
+    def set(self, session_id, session):
+        size = _size(session)
+        now = time.time()
+        self.cache.set(self.KEY_PREFIX + session_id, (session, None, size), self.ttl)
+        index = self.cache.make_and_validate_key(self.INDEX_KEY)
+        pipe = self.cache._cache.get_client(index, write=True).pipeline(transaction=True)
+        pipe.zadd(index, {session_id: now})
+        pipe.zremrangebyscore(index, '-inf', now - self.ttl)
+        pipe.zrange(index, 0, -self.max_sessions - 1)
+        pipe.zremrangebyrank(index, 0, -self.max_sessions - 1)
+        pipe.expire(index, self.ttl)
+        evicted = [old_id.decode() for old_id in pipe.execute()[2]]
+        if evicted:
+            self.cache.delete_many([self.KEY_PREFIX + old_id for old_id in evicted])
+            self._count_evictions(len(evicted))
+
+    def delete(self, session_id):
+        super().delete(session_id)
+        index = self.cache.make_and_validate_key(self.INDEX_KEY)
+        self.cache._cache.get_client(index, write=True).zrem(index, session_id)
+
+    def _entries(self):
+        index = self.cache.make_and_validate_key(self.INDEX_KEY)
+        client = self.cache._cache.get_client(index)
+        session_ids = [session_id.decode() for session_id in client.zrangebyscore(index, time.time() - self.ttl, '+inf')]
+        return list(self.cache.get_many([self.KEY_PREFIX + session_id for session_id in session_ids]).values())
+
+
+def get_conversation_store():
+    """The store picked by CHAT_SESSION_STORE"""
+    if getattr(settings, 'CHAT_SESSION_STORE', 'local') == 'cache':
+        if isinstance(caches['default'], RedisCache):
+            return RedisConversationStore()
+        return CacheConversationStore()
+    return LocalConversationStore()
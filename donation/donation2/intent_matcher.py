@@ -0,0 +1,162 @@
+"""
+Precompiled keyword and pattern matching for the chat assistants.
+
+The assistants used to test every keyword of their tables with its own
+``keyword in message`` scan and to run up to 15 regexes per message for the
+intent and entities. Both kinds of table are now compiled once, when the
+assistant is created:
+
+- ``KeywordMatcher`` turns all keywords into one trie-shaped alternation, so
+  a single ``finditer`` over the message finds every keyword that occurs in
+  it, with the same substring semantics as ``keyword in message``.
+- ``RuleSet`` keeps ordered regex rules precompiled and uses one keyword
+  scan to skip the rules whose leading words are not in the message, giving
+  the same answers as ``re.search`` on each rule in turn.
+"""
+import re
+from collections import defaultdict
+
+
+def _trie_pattern(words):
+    """A regex matching any of ``words``, preferring the longest at each position"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def pattern(node):
+        ends_here = '' in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if ends_here:
+            # Optional and greedy: the longer keyword wins, the shorter one still matches
+            return f'(?:{body})?' if len(branches) == 1 else body + '?'
+        return body
+
+    return pattern(trie)
+
+
+class KeywordHits:
+    """The keywords found in one message, grouped by table and label"""
+
+    def __init__(self, matcher, found):
+        self.matcher = matcher
+        self.found = found
+        self._labels = defaultdict(set)
+        for keyword in found:
+            for table, label in matcher.owners[keyword]:
+                self._labels[table].add(label)
+
+    def labels(self, table):
+        """Labels of ``table`` with at least one keyword in the message, in table order"""
+        hits = self._labels.get(table, ())
+        return [label for label in self.matcher.labels[table] if label in hits]
+
+    def first(self, table, default=None):
+        labels = self.labels(table)
+        return labels[0] if labels else default
+
+    def matched(self, table):
+        """Set of the labels of ``table`` with a keyword in the message"""
+        return self._labels.get(table, set())
+
+    def has(self, table, *labels):
+        hits = self._labels.get(table, ())
+        return any(label in hits for label in labels) if labels else bool(hits)
+
+
+class KeywordMatcher:
+    """
+    Finds which keywords of several tables occur in a message in one pass.
+
+    ``tables`` maps a table name to ``{label: [keyword, ...]}``; a keyword may
+    appear under several labels and tables.
+    """
+
+    def __init__(self, tables):
+        self.labels = {table: list(groups) for table, groups in tables.items()}
+        self.owners = defaultdict(list)
+        for table, groups in tables.items():
+            for label, keywords in groups.items():
+                for keyword in keywords:
+                    self.owners[keyword].append((table, label))
+        keywords = list(self.owners)
+        # The regex reports the longest keyword starting at each position; the
+        # shorter keywords it starts with occur there too
+        self.prefixes = {keyword: [k for k in keywords if keyword.startswith(k)] for keyword in keywords}
+        self.regex = re.compile(f'(?=({_trie_pattern(keywords)}))' if keywords else '(?!)')
+
+    def scan(self, message):
+        found = set()
+        for match in self.regex.finditer(message):
+            found.update(self.prefixes[match.group(1)])
+        return KeywordHits(self, found)
+
+
+_LEADING_GROUP = re.compile(r"(?:\\b)?\(([a-z][a-z '|]*)\)(?![?*{])", re.IGNORECASE)
+_LEADING_WORD = re.compile(r'[a-z]+(?![?*{])', re.IGNORECASE)
+
+
+def _required_words(pattern):
+    """Words one of which occurs in every match of ``pattern``, or None if unknown"""
+    depth = 0
+    chars = iter(pattern)
+    for char in chars:
+        if char == '\\':
+            next(chars, None)
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return None
+    match = _LEADING_GROUP.match(pattern) or _LEADING_WORD.match(pattern)
+    if not match:
+        return None
+    return (match.group(1) if match.groups() else match.group()).split('|')
+
+
+class RuleSet:
+    """
+    Ordered regex rules with a keyword prefilter.
+
+    ``tables`` maps a table name to a list of ``(label, pattern)`` rules;
+    ``first(message)`` returns, for each table, the ``(label, value)`` of the
+    first rule that matches anywhere in the message, where ``value`` is the
+    rule's first group (or the whole match if it has none). Patterns are
+    compiled once, and a rule that starts with a word or a group of words is
+    only searched when one of those words occurs in the message, which one
+    ``KeywordMatcher`` scan tells for all rules at once.
+    """
+
+    def __init__(self, tables, flags=re.IGNORECASE):
+        self.rules = []
+        self.unfiltered = set()
+        prerequisites = {}
+        self.ignore_case = bool(flags & re.IGNORECASE)
+        for table, rules in tables.items():
+            for label, pattern in rules:
+                index = len(self.rules)
+                self.rules.append((table, label, re.compile(pattern, flags)))
+                words = _required_words(pattern)
+                if words is None:
+                    self.unfiltered.add(index)
+                else:
+                    prerequisites[index] = [word.lower() for word in words] if self.ignore_case else words
+        self.prefilter = KeywordMatcher({'rules': prerequisites})
+
+    def first(self, message):
+        possible = self.prefilter.scan(message.lower() if self.ignore_case else message).matched('rules')
+        result = {}
+        for index in sorted(self.unfiltered.union(possible)):
+            table, label, regex = self.rules[index]
+            if table in result:
+                continue
+            match = regex.search(message)
+            if match:
+                result[table] = (label, match.group(1) if regex.groups else match.group())
+        return result
@@ -0,0 +1,159 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from donation2.advanced_ai_services import (
+    AMOUNT_PATTERNS, DATE_PATTERNS, FEE_TYPES, INTENT_PATTERNS, MALAY_WORDS, PAYMENT_METHODS, WorldClassAIAssistant,
+)
+from donation2.ai_services import UnifiedAIAssistant
+from donation2.bulletproof_ai import BulletproofAI
+
+# Messages sent to the chat widget: the assistants' suggestion buttons and typed questions
+CORPUS = [
+    'Check my fees', 'Show donation events', 'What is waqaf?', 'Upcoming events', 'Help me', 'Go to homepage',
+    'How to register?', 'Payment methods', 'Download receipt', 'Payment history', 'Contact admin',
+    'hi', 'hello there', 'good morning!', 'assalamualaikum, selamat pagi', 'hai, saya nak tanya pasal yuran',
+    'thanks a lot', 'terima kasih banyak', 'bye', 'ok see you tomorrow',
+    'how much do I owe for this month?', 'what is my payment status', 'check my fee balance please',
+    'I want to pay RM 150 by bank transfer', 'can I pay 200 ringgit in cash today?', 'how to pay tuition fees online',
+    'cara bayar yuran asrama', 'bagaimana nak buat bayaran?', 'saya nak bayar yuran pta',
+    'my payment is not working, there is an error', 'problem with credit card payment on 12/05/2024',
+    'masalah bayaran, tolong segera', 'I am confused, I don\'t understand the exams fee',
+    'where can I find the donation page?', 'take me to the waqaf assets', 'how to access student registration',
+    'tell me about waqaf and islamic endowment', 'what is the purpose of the ramadan campaign',
+    'I want to donate $50 to the mosque fund', 'how do I contribute to the fundraising event',
+    'show me current donation events', 'sumbangan untuk tabung masjid', 'apa itu wakaf?',
+    'student information and profile details', 'daftar pelajar baru', 'when is the next event?',
+    'is there any discount or waiver for registration fees', 'great, that was awesome, thank you!',
+    'urgent: fees overdue, need help asap', 'explain the dormitory fees for next month',
+]
+
+
+def legacy_world_class(assistant, message):
+    """WorldClassAIAssistant's per-keyword and per-pattern scans, as they were"""
+    language = 'ms' if sum(1 for word in MALAY_WORDS if word in message) > 0 else 'en'
+    emotion = 'neutral'
+    for name, data in assistant.emotional_responses.items():
+        if any(keyword in message for keyword in data['detection']):
+            emotion = name
+            break
+
+    def said(kind):
+        words = assistant.languages[language][kind] + assistant.languages['en'][kind]
+        return any(word in message for word in words)
+
+    intent = 'general'
+    for name, patterns in INTENT_PATTERNS.items():
+        if any(re.search(pattern, message, re.IGNORECASE) for pattern in patterns):
+            intent = name
+            break
+    entities = {'amount': None, 'date': None, 'student_name': None, 'fee_type': None, 'payment_method': None}
+    for pattern in AMOUNT_PATTERNS:
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            entities['amount'] = float(match.group(1))
+            break
+    for pattern in DATE_PATTERNS:
+        match = re.search(pattern, message, re.IGNORECASE)
+        if match:
+            entities['date'] = match.group(1)
+            break
+    entities['fee_type'] = next((fee_type for fee_type in FEE_TYPES if fee_type in message), None)
+    entities['payment_method'] = next((method for method in PAYMENT_METHODS if method in message), None)
+    modules = [
+        module for module, keywords in assistant.smart_keywords.items()
+        if any(keyword in message for keyword in keywords['primary'])
+    ]
+    return {
+        'language': language, 'emotion': emotion,
+        'greeting': said('greetings'), 'farewell': said('farewells'), 'thanks': said('thanks'),
+        'intent': intent, 'modules': modules, 'entities': entities,
+    }
+
+
+def legacy_unified(assistant, message):
+    opening = None
+    if any(word in message for word in assistant.greetings):
+        opening = 'greeting'
+    elif any(word in message for word in assistant.farewells):
+        opening = 'farewell'
+    elif any(word in message for word in assistant.module_keywords['help']):
+        opening = 'help'
+    question = next(
+        (q_type for q_type, patterns in assistant.question_patterns.items() if any(p in message for p in patterns)),
+        'general'
+    )
+    modules = [module for module, keywords in assistant.module_keywords.items() if any(k in message for k in keywords)]
+    return opening, question, modules
+
+
+def compiled_unified(assistant, message):
+    keywords = assistant.keyword_matcher.scan(message)
+    return keywords.first('opening'), keywords.first('question', 'general'), keywords.labels('modules')
+
+
+def legacy_bulletproof(assistant, message):
+    topics = [
+        ('greeting', assistant.greetings),
+        ('farewell', assistant.farewells),
+        ('fees', ['fee', 'fees', 'payment', 'pay', 'yuran', 'bayar']),
+        ('donations', ['donation', 'donate', 'sumbangan', 'derma']),
+        ('waqaf', ['waqaf', 'wakaf', 'endowment']),
+        ('help', ['help', 'bantuan', 'tolong', 'assist']),
+    ]
+    return next((topic for topic, words in topics if any(word in message for word in words)), None)
+
+
+class Command(BaseCommand):
+    help = "Compare the chat assistants' precompiled keyword/intent matching with the old per-keyword scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Passes over the corpus per measurement (default: 200)',
+        )
+        parser.add_argument(
+            '--corpus',
+            help='File with one chat message per line (default: the built-in sample)',
+        )
+
+    def handle(self, *args, **options):
+        corpus = CORPUS
+        if options['corpus']:
+            try:
+                with open(options['corpus'], encoding='utf-8') as f:
+                    corpus = [line.strip() for line in f if line.strip()]
+            except OSError as e:
+                raise CommandError(str(e))
+        messages = [message.lower().strip() for message in corpus]
+
+        world_class, unified, bulletproof = WorldClassAIAssistant(), UnifiedAIAssistant(), BulletproofAI()
+        cases = [
+            ('WorldClassAIAssistant', lambda m: legacy_world_class(world_class, m), world_class.analyze_message),
+            ('UnifiedAIAssistant', lambda m: legacy_unified(unified, m), lambda m: compiled_unified(unified, m)),
+            ('BulletproofAI', lambda m: legacy_bulletproof(bulletproof, m),
+             lambda m: bulletproof.topic_matcher.scan(m).first('topic')),
+        ]
+
+        self.stdout.write(f"{len(messages)} messages x {options['iterations']} iterations")
+        for name, legacy, compiled in cases:
+            for message in messages:
+                if legacy(message) != compiled(message):
+                    raise CommandError(f"{name}: results differ for {message!r}")
+            legacy_rate = self._rate(legacy, messages, options['iterations'])
+            compiled_rate = self._rate(compiled, messages, options['iterations'])
+            self.stdout.write(
+                f"  {name:<22} scans {legacy_rate:>9,.0f} msg/s   compiled {compiled_rate:>9,.0f} msg/s   "
+                f"x{compiled_rate / legacy_rate:.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS('Both approaches give identical results on every message'))
+
+    def _rate(self, analyze, messages, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for message in messages:
+                analyze(message)
+        return len(messages) * iterations / (time.perf_counter() - started)
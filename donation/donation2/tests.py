@@ -1,3 +1,197 @@
-from django.test import TestCase
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from donation.response_cache import reset_response_cache_stats, response_cache_stats
+from myapp.models import DonationCategory, DonationEvent
+from myapp.views import SystemChatbot
+
+from .advanced_ai_services import WorldClassAIAssistant, conversation_memory
+from .conversation_store import (
+    CacheConversationStore, ConversationStore, LocalConversationStore, RedisConversationStore,
+    get_conversation_store,
+)
+from .intent_matcher import KeywordMatcher, RuleSet
+
+
+class IntentMatcherTest(TestCase):
+    def test_keywords_match_like_substring_checks(self):
+        keywords = ['pay', 'payment', 'pa', 'ay', 'hi', 'this', 'see you', "don't understand"]
+        matcher = KeywordMatcher({'words': {keyword: [keyword] for keyword in keywords}})
+        for message in ['', 'this payment', "see you, i don't understand", 'paypay', 'nothing here']:
+            hits = matcher.scan(message)
+            self.assertEqual(hits.labels('words'), [keyword for keyword in keywords if keyword in message])
+
+    def test_rules_return_the_first_match_per_table(self):
+        rules = RuleSet({
+            'intent': [('status', r'\b(check|show)\b.*\b(fee)\b'), ('pay', r'\b(pay)\b')],
+            'amount': [('rm', r'RM\s*(\d+)'), ('ringgit', r'(\d+)\s*ringgit')],
+        })
+        self.assertEqual(rules.first('pay 20 ringgit, then check my fee RM 30'), {
+            'intent': ('status', 'check'), 'amount': ('rm', '30'),
+        })
+        self.assertEqual(rules.first('pay 20 ringgit'), {'intent': ('pay', 'pay'), 'amount': ('ringgit', '20')})
+        self.assertEqual(rules.first('hello'), {})
+
+    def test_world_class_analysis(self):
+        analysis = WorldClassAIAssistant().analyze_message('tolong, nak bayar rm 150 untuk asrama by bank transfer, segera')
+        self.assertEqual(analysis['language'], 'ms')
+        self.assertEqual(analysis['emotion'], 'urgent')
+        self.assertEqual(analysis['intent'], 'make_payment')
+        self.assertEqual(analysis['modules'], ['fees'])
+        self.assertEqual(analysis['entities']['amount'], 150.0)
+        self.assertEqual(analysis['entities']['payment_method'], 'bank transfer')
+        self.assertFalse(analysis['greeting'])
+
+    def test_benchmark_matches_the_old_scans(self):
+        out = StringIO()
+        call_command('benchmark_chat_matching', '--iterations', '1', stdout=out)
+        self.assertIn('identical results on every message', out.getvalue())
+
+
+class ConversationStoreTest(TestCase):
+    def test_local_store_expires_and_evicts(self):
+        store = LocalConversationStore(ttl=60, max_sessions=2)
+        with mock.patch('donation2.conversation_store.time.monotonic', return_value=1000):
+            store.set('a', {'history': ['hi']})
+            store.set('b', {'history': []})
+            store.get('a')
+            store.set('c', {'history': []})
+            # 'b' was the least recently used
+            self.assertIsNone(store.get('b'))
+            self.assertEqual(store.get('a'), {'history': ['hi']})
+            stats = store.stats()
+            self.assertEqual((stats['sessions'], stats['evictions']), (2, 1))
+            self.assertGreater(stats['bytes'], 0)
+        with mock.patch('donation2.conversation_store.time.monotonic', return_value=1061):
+            self.assertIsNone(store.get('a'))
+            self.assertEqual(store.stats(), {'backend': 'local', 'sessions': 0, 'bytes': 0, 'evictions': 3})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'chat-test'}})
+    def test_cache_store_is_shared_between_workers(self):
+        self.addCleanup(caches['default'].clear)
+        worker_a = CacheConversationStore(ttl=60, max_sessions=2)
+        worker_b = CacheConversationStore(ttl=60, max_sessions=2)
+        worker_a.set('a', {'history': ['hi']})
+        self.assertEqual(worker_b.get('a'), {'history': ['hi']})
+        worker_b.set('b', {'history': []})
+        worker_a.set('c', {'history': []})
+        self.assertIsNone(worker_b.get('a'))
+        stats = worker_b.stats()
+        self.assertEqual((stats['backend'], stats['sessions'], stats['evictions']), ('cache', 2, 1))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'chat-test'}})
+    def test_cache_store_keeps_sessions_saved_again(self):
+        self.addCleanup(caches['default'].clear)
+        store = CacheConversationStore(ttl=60, max_sessions=2)
+        store.set('a', {'history': []})
+        store.set('b', {'history': []})
+        store.set('a', {'history': ['again']})
+        store.set('c', {'history': []})
+        self.assertEqual(store.get('a'), {'history': ['again']})
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.stats()['sessions'], 2)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'chat-test', 'OPTIONS': {'MAX_ENTRIES': 1000},
+    }})
+    def test_concurrent_workers_do_not_lose_sessions(self):
+        self.addCleanup(caches['default'].clear)
+
+        def worker(name):
+            store = CacheConversationStore(ttl=60, max_sessions=1000)
+            for i in range(50):
+                store.set(f'{name}-{i}', {'history': []})
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in 'abcd']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = CacheConversationStore(ttl=60, max_sessions=1000).stats()
+        self.assertEqual((stats['sessions'], stats['evictions']), (200, 0))
+
+    def test_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ConversationStore()
+
+    @override_settings(CHAT_SESSION_STORE='cache', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'},
+    })
+    def test_redis_cache_uses_a_sorted_set(self):
+        self.assertIsInstance(get_conversation_store(), RedisConversationStore)
+
+
+@mock.patch.object(conversation_memory, 'store', new_callable=LocalConversationStore)
+class ChatMemoryTest(TestCase):
+    def chat(self, message, session_id=None):
+        data = {'message': message}
+        if session_id:
+            data['session_id'] = session_id
+        return self.client.post(reverse('chat_message'), data)
+
+    def test_one_session_per_conversation(self, store):
+        self.chat('hello')
+        self.chat('thank you')
+        self.assertEqual(store.stats()['sessions'], 0)
+
+        with mock.patch.object(conversation_memory, 'history_limit', 3):
+            for message in ['hello', 'what is waqaf?', 'thank you', 'hello again']:
+                self.assertEqual(self.chat(message, session_id='page1').status_code, 200)
+        session = store.get('anon:page1')
+        self.assertEqual(store.stats()['sessions'], 1)
+        self.assertEqual(len(session['history']), 3)
+        self.assertEqual([m['user_message'] for m in session['messages']], ['what is waqaf?', 'thank you', 'hello again'])
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_response_cache_stats()
+
+    def chat(self, message):
+        return self.client.post(reverse('chat_message'), {'message': message}).json()
+
+    def stats(self, assistant):
+        return next(row for row in response_cache_stats() if row['assistant'] == assistant)
+
+    def test_user_independent_answers_are_reused(self):
+        first = self.chat('What is waqaf?')
+        with mock.patch.object(WorldClassAIAssistant, 'sia') as sia:
+            self.assertEqual(self.chat('  what is   WAQAF ').get('message'), first['message'])
+        sia.polarity_scores.assert_not_called()
+        stats = self.stats('world_class')
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 50.0))
+
+    def test_user_dependent_answers_bypass_the_cache(self):
+        self.chat('check my fees')
+        self.chat('check my fees')
+        stats = self.stats('world_class')
+        self.assertEqual((stats['hits'], stats['misses'], stats['bypassed']), (0, 0, 2))
+
+    def test_event_changes_retire_cached_answers(self):
+        self.assertIn('No Active', self.chat('show donation events')['message'])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            DonationEvent.objects.create(
+                title='New Hall', description='Hall', target_amount=1000, category=DonationCategory.objects.create(name='Building'),
+                start_date=timezone.now().date(), end_date=timezone.now().date(), qr_code='event_qrcodes/x.png'
+            )
+            # Not retired before the event is committed
+            self.assertIn('No Active', self.chat('show donation events')['message'])
+        self.assertTrue(callbacks)
+        self.assertIn('New Hall', self.chat('show donation events')['message'])
+        # Answered by the unified assistant, which the chat view falls back to
+        self.assertEqual(self.stats('unified')['misses'], 2)
+
+    def test_system_chatbot_answers_are_cached(self):
+        answer = SystemChatbot().get_response('How to pay?')
+        with mock.patch.object(SystemChatbot, 'preprocess_text') as preprocess:
+            self.assertEqual(SystemChatbot().get_response('how to pay'), answer)
+        preprocess.assert_not_called()
+        self.assertEqual(self.stats('system_chatbot')['hits'], 1)
@@ -2,6 +2,7 @@ import pdfkit
 from django.shortcuts import render, redirect, get_object_or_404
 from .forms import DonationForm, DonationCategoryForm, DonationEventForm
 from myapp.models import DonationEvent, DonationCategory, Donation, PredefinedDonationAmount
+from myapp.rollup_services import EMPTY_EVENT_STATS, donation_event_stats, overall_donation_totals, target_reached_at
 from myapp.forms import DonationEventForm
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
@@ -33,6 +34,8 @@ bulletproof_ai = BulletproofAI()
 
 logger = logging.getLogger(__name__)
 
+MAX_CHAT_SESSION_ID_LENGTH = 64
+
 def donate(request):
     if request.method == 'POST':
         # Handle AJAX donation submission
@@ -76,10 +79,6 @@ def donate(request):
                     status='completed'
                 )
                 
-                # Update event current amount
-                event.current_amount += amount
-                event.save()
-                
                 return JsonResponse({
                     'success': True,
                     'message': 'Thank you for your donation!'
@@ -332,7 +331,11 @@ def chat_message(request):
     """Handle chat messages with world-class AI assistant"""
     try:
         message = request.POST.get('message', '').strip()
-        session_id = request.POST.get('session_id', f"user_{request.user.id if request.user.is_authenticated else 'anon'}_{datetime.now().timestamp()}")
+        # The widget sends one id per page load; scope it to the user so ids can't be borrowed.
+        # Without one, nothing is remembered rather than starting a session per message.
+        client_session = request.POST.get('session_id', '')[:MAX_CHAT_SESSION_ID_LENGTH]
+        owner = f"user_{request.user.id}" if request.user.is_authenticated else 'anon'
+        session_id = f"{owner}:{client_session}" if client_session else None
         
         if not message:
             return JsonResponse({
@@ -359,7 +362,8 @@ def chat_message(request):
         
         # Store conversation in memory (with error handling)
         try:
-            conversation_memory.add_message(session_id, message, response, user)
+            if session_id:
+                conversation_memory.add_message(session_id, message, response, user)
         except Exception as memory_error:
             logger.error(f"Memory error: {str(memory_error)}")
             # Continue without memory storage
@@ -517,19 +521,23 @@ def donation_analytics(request):
         events = events.filter(end_date__lte=end_date)
     
     analytics_data = []
+    # Totals, method breakdowns and daily trends of every event come from the daily rollups
+    event_list = list(events)
+    event_stats = donation_event_stats([event.id for event in event_list])
     
-    for event in events:
+    for event in event_list:
         # Get donations for this event - include all statuses for now
         donations = Donation.objects.filter(event=event)
+        stats = event_stats.get(event.id, EMPTY_EVENT_STATS)
         
-        # Debug: Print donation count for this event
-        print(f"Event: {event.title}, Donations found: {donations.count()}")
-        for donation in donations:
-            print(f"  - Donation: {donation.donor_name}, Amount: {donation.amount}, Status: {donation.status}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event: %s, Donations found: %s", event.title, donations.count())
+            for donation in donations:
+                logger.debug("  - Donation: %s, Amount: %s, Status: %s", donation.donor_name, donation.amount, donation.status)
         
         # Calculate analytics
-        total_donated = donations.aggregate(total=models.Sum('amount'))['total'] or 0
-        donor_count = donations.count()
+        total_donated = stats['total']
+        donor_count = stats['count']
         
         # Calculate target progress
         if event.target_amount > 0:
@@ -543,12 +551,7 @@ def donation_analytics(request):
         # Calculate date reached (when target was achieved)
         date_reached = None
         if target_reached and event.target_amount > 0:
-            cumulative_amount = 0
-            for donation in donations.order_by('created_at'):
-                cumulative_amount += donation.amount
-                if cumulative_amount >= event.target_amount:
-                    date_reached = donation.created_at
-                    break
+            date_reached = target_reached_at(event, stats['daily_donations'])
         
         # Calculate average donation amount
         avg_donation = 0
@@ -556,18 +559,10 @@ def donation_analytics(request):
             avg_donation = total_donated / donor_count
         
         # Get donation method breakdown
-        payment_methods = donations.values('payment_method').annotate(
-            count=models.Count('id'),
-            total=models.Sum('amount')
-        )
+        payment_methods = stats['payment_methods']
         
         # Get daily donation trends
-        daily_donations = donations.extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=models.Count('id'),
-            total=models.Sum('amount')
-        ).order_by('day')
+        daily_donations = stats['daily_donations']
         
         # Calculate days remaining or completed
         today = timezone.now().date()
@@ -602,17 +597,13 @@ def donation_analytics(request):
         })
     
     # Overall statistics - include all donations regardless of status
-    all_donations = Donation.objects.all()
-    if start_date:
-        all_donations = all_donations.filter(created_at__date__gte=start_date)
-    if end_date:
-        all_donations = all_donations.filter(created_at__date__lte=end_date)
+    all_donations = overall_donation_totals(start_date, end_date)
     
     overall_stats = {
         'total_events': events.count(),
-        'total_donations': all_donations.count(),
-        'total_amount': all_donations.aggregate(total=models.Sum('amount'))['total'] or 0,
-        'avg_donation': all_donations.aggregate(avg=models.Avg('amount'))['avg'] or 0,
+        'total_donations': all_donations['count'],
+        'total_amount': all_donations['total'],
+        'avg_donation': all_donations['average'],
         'active_events': events.filter(is_active=True).count(),
         'completed_events': events.filter(end_date__lt=today).count(),
     }
@@ -653,14 +644,15 @@ def donation_analytics_api(request):
         events = events.filter(end_date__lte=end_date)
     
     analytics_data = []
+    event_list = list(events)
+    event_stats = donation_event_stats([event.id for event in event_list], statuses=['completed'])
     
-    for event in events:
-        # Get donations for this event
-        donations = Donation.objects.filter(event=event, status='completed')
+    for event in event_list:
+        stats = event_stats.get(event.id, EMPTY_EVENT_STATS)
         
         # Calculate analytics
-        total_donated = donations.aggregate(total=models.Sum('amount'))['total'] or 0
-        donor_count = donations.count()
+        total_donated = stats['total']
+        donor_count = stats['count']
         
         # Calculate target progress
         if event.target_amount > 0:
@@ -674,39 +666,19 @@ def donation_analytics_api(request):
         # Calculate date reached (when target was achieved)
         date_reached = None
         if target_reached and event.target_amount > 0:
-            cumulative_amount = 0
-            for donation in donations.order_by('created_at'):
-                cumulative_amount += donation.amount
-                if cumulative_amount >= event.target_amount:
-                    date_reached = donation.created_at.isoformat()
-                    break
+            reached_at = target_reached_at(event, stats['daily_donations'], statuses=['completed'])
+            date_reached = reached_at.isoformat() if reached_at else None
         
         # Calculate average donation amount
         avg_donation = 0
         if donor_count > 0:
             avg_donation = float(total_donated / donor_count)
         
-        # Get donation method breakdown
-        payment_methods = list(donations.values('payment_method').annotate(
-            count=models.Count('id'),
-            total=models.Sum('amount')
-        ))
-        
-        # Convert Decimal to float for JSON serialization
-        for method in payment_methods:
-            method['total'] = float(method['total'])
+        # Get donation method breakdown, converting Decimal to float for JSON serialization
+        payment_methods = [{**method, 'total': float(method['total'])} for method in stats['payment_methods']]
         
         # Get daily donation trends
-        daily_donations = list(donations.extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=models.Count('id'),
-            total=models.Sum('amount')
-        ).order_by('day'))
-        
-        # Convert Decimal to float for JSON serialization
-        for day in daily_donations:
-            day['total'] = float(day['total'])
+        daily_donations = [{**day, 'total': float(day['total'])} for day in stats['daily_donations']]
         
         # Calculate days remaining or completed
         today = timezone.now().date()
@@ -748,17 +720,13 @@ def donation_analytics_api(request):
         })
     
     # Overall statistics - include all donations regardless of status
-    all_donations = Donation.objects.all()
-    if start_date:
-        all_donations = all_donations.filter(created_at__date__gte=start_date)
-    if end_date:
-        all_donations = all_donations.filter(created_at__date__lte=end_date)
+    all_donations = overall_donation_totals(start_date, end_date)
     
     overall_stats = {
         'total_events': events.count(),
-        'total_donations': all_donations.count(),
-        'total_amount': float(all_donations.aggregate(total=models.Sum('amount'))['total'] or 0),
-        'avg_donation': float(all_donations.aggregate(avg=models.Avg('amount'))['avg'] or 0),
+        'total_donations': all_donations['count'],
+        'total_amount': float(all_donations['total']),
+        'avg_donation': float(all_donations['average']),
         'active_events': events.filter(is_active=True).count(),
         'completed_events': events.filter(end_date__lt=today).count(),
     }
@@ -1130,9 +1098,6 @@ def checkout_cart(request):
                     status='completed',
                     message=item.message
                 )
-                # Update event current amount
-                item.event.current_amount += item.amount
-                item.event.save()
             else:
                 # For anonymous users, item is a dictionary
                 donation = Donation.objects.create(
@@ -1144,9 +1109,6 @@ def checkout_cart(request):
                     status='completed',
                     message=item['message']
                 )
-                # Update event current amount
-                item['event'].current_amount += item['amount']
-                item['event'].save()
             
             created_donations.append(donation)
         
@@ -0,0 +1,17 @@
+"""
+Gunicorn settings.
+
+The app is loaded in the master and the NLP/ML components are warmed there
+before the workers fork (see donation/ai_registry.py), so workers boot
+without re-importing them and share the loaded modules copy-on-write.
+Logging is configured in the master too; each worker starts its own log
+listener thread after the fork (see donation/logging_utils.py).
+"""
+preload_app = True
+
+
+def when_ready(server):
+    from donation import ai_registry
+
+    for timing in ai_registry.warm():
+        server.log.info('AI component %s %s in %.1f ms', timing.name, timing.status, timing.seconds * 1000)
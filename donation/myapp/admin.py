@@ -4,7 +4,8 @@ from django import forms
 from .models import (
     Student, Parent, FeeCategory, FeeStructure, Payment,
     PaymentReceipt, Invoice, FeeDiscount, PaymentReminder, SchoolBankAccount, DonationEvent, DonationCategory, IndividualStudentFee,
-    PibgDonationSettings, PibgDonation, PredefinedDonationAmount, UserProfile, ModulePermission, SchoolFeesLevelAdmin
+    PibgDonationSettings, PibgDonation, PredefinedDonationAmount, UserProfile, ModulePermission, SchoolFeesLevelAdmin,
+    StudentFeeLedger, OutboundEmail, ReminderCampaign, ReportExport, RollupCheckpoint
 )
 
 
@@ -206,6 +207,19 @@ class FeeStructureAdmin(admin.ModelAdmin):
     list_display = ('category', 'form', 'amount', 'frequency', 'is_active')
     list_filter = ('category', 'form', 'frequency', 'is_active')
     search_fields = ('category__name', 'form')
+    actions = ['generate_monthly_payments', 'preview_monthly_payments']
+    
+    def generate_monthly_payments(self, request, queryset):
+        """Create monthly payment records for every student of the selected structures"""
+        result = FeeStructure.generate_monthly_payments(queryset)
+        self.message_user(request, f"Created {result['created']} monthly payment records ({result['existing']} already existed).")
+    generate_monthly_payments.short_description = "Generate monthly payment records"
+    
+    def preview_monthly_payments(self, request, queryset):
+        """Dry run of generate_monthly_payments"""
+        result = FeeStructure.generate_monthly_payments(queryset, dry_run=True)
+        self.message_user(request, f"Dry run: {result['planned'] - result['existing']} monthly payment records would be created ({result['existing']} already exist).")
+    preview_monthly_payments.short_description = "Preview monthly payment generation (dry run)"
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -214,6 +228,64 @@ class PaymentAdmin(admin.ModelAdmin):
     search_fields = ('student__first_name', 'student__last_name', 'receipt_number')
     date_hierarchy = 'payment_date'
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('recipient', 'subject', 'idempotency_key')
+    readonly_fields = ('idempotency_key', 'attempts', 'last_error', 'sent_at', 'created_at', 'updated_at')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """Put failed or waiting emails back at the front of the queue"""
+        from django.utils import timezone
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now(), attempts=0)
+        self.message_user(request, f"{updated} email(s) queued for immediate retry.")
+    retry_now.short_description = "Retry selected emails now"
+
+@admin.register(ReminderCampaign)
+class ReminderCampaignAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'processed_families', 'skipped_families', 'total_families', 'queued_emails', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('total_families', 'processed_families', 'skipped_families', 'queued_emails', 'reminded_fees',
+                       'last_family_key', 'error', 'started_at', 'heartbeat_at', 'finished_at', 'created_at')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        """Let run_reminder_campaigns pick failed campaigns up again from their checkpoint"""
+        updated = queryset.filter(status='failed').update(status='queued')
+        self.message_user(request, f"{updated} campaign(s) queued to resume.")
+    requeue.short_description = "Resume selected failed campaigns"
+
+@admin.register(ReportExport)
+class ReportExportAdmin(admin.ModelAdmin):
+    list_display = ('report', 'filename', 'status', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'report')
+    readonly_fields = ('report', 'params', 'filename', 'file', 'error', 'requested_by', 'created_at', 'finished_at')
+
+@admin.register(RollupCheckpoint)
+class RollupCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'high_water_mark', 'last_run_at', 'days_refreshed')
+    readonly_fields = ('name', 'high_water_mark', 'last_run_at', 'days_refreshed')
+    actions = ['rebuild']
+
+    def rebuild(self, request, queryset):
+        from .rollup_services import sync_rollups
+        results = sync_rollups([checkpoint.name for checkpoint in queryset], full=True)
+        self.message_user(request, f"Rebuilt {sum(results.values())} day(s) of rollups.")
+    rebuild.short_description = "Rebuild selected rollup tables from scratch"
+
+@admin.register(StudentFeeLedger)
+class StudentFeeLedgerAdmin(admin.ModelAdmin):
+    list_display = ('student', 'outstanding_amount', 'individual_outstanding_amount', 'overdue_amount', 'discounted_amount', 'paid_amount', 'last_payment_at', 'updated_at')
+    search_fields = ('student__student_id', 'student__first_name', 'student__last_name')
+    list_select_related = ('student',)
+    readonly_fields = [field.name for field in StudentFeeLedger._meta.fields]
+
+    def has_add_permission(self, request):
+        # Ledger rows are maintained automatically
+        return False
+
 @admin.register(PaymentReceipt)
 class PaymentReceiptAdmin(admin.ModelAdmin):
     list_display = ('payment', 'generated_at', 'sent_at')
@@ -2,12 +2,12 @@ from django.db.models import Sum, Count, Avg, F
 from django.utils import timezone
 from datetime import timedelta
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from donation import ai_registry
 from .models import Payment, FeeStatus, FeeStructure
 
 class PaymentPredictionService:
     def __init__(self):
-        self.model = LinearRegression()
+        self.model = ai_registry.get('linear_regression')()
 
     def prepare_training_data(self):
         """Prepare historical payment data for training"""
@@ -0,0 +1,284 @@
+"""
+Checkout pipeline shared by the student and parent carts.
+
+Everything a checkout writes (payments, fee statuses, individual fees, the
+optional PIBG donation and, if asked for, paid invoices) is done set-based
+inside a single transaction, with
+the selected FeeStatus rows locked so a double submit cannot pay them twice.
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .fee_report_services import invalidate_fee_report_cache
+from .models import (
+    FeeStatus, FeeStructure, IndividualStudentFee, Invoice, Payment, PibgDonation,
+    PibgDonationSettings, StudentFeeLedger
+)
+from .rollup_services import PAYMENTS, schedule_refresh as schedule_rollup_refresh
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    """Raised when a checkout request cannot be processed; nothing is written"""
+
+
+class CheckoutService:
+    """
+    Pay for the contents of a session cart.
+
+    ``students`` limits which students the cart may pay for (the student
+    themselves, or a parent's children); items for anyone else are skipped.
+    With ``invoices`` set, each payment gets an invoice in the same transaction.
+    """
+
+    # Days from checkout until an invoice falls due
+    INVOICE_DUE_DAYS = 30
+
+    def __init__(self, students, payment_method='online', parent=None, receipt_prefix=None, invoices=False):
+        self.students = list(students)
+        self.student_ids = {student.id for student in self.students}
+        self.payment_method = payment_method
+        self.parent = parent
+        self.receipt_prefix = receipt_prefix
+        self.invoices = invoices
+        self.timings = {}
+
+    @property
+    def is_cash(self):
+        return self.payment_method == 'cash'
+
+    def checkout(self, cart, donation_amount='0', custom_donation_amount=''):
+        """
+        Process the cart and return a dict with the created payments, invoices
+        and PIBG donations, the number of skipped items and per-stage timings (ms).
+        """
+        started = time.perf_counter()
+        donation = self._parse_donation(donation_amount, custom_donation_amount)
+        self._now = timezone.now()
+        today = self._now.date()
+        self._payments = []
+        self._paid_statuses = []
+        self._new_statuses = []
+        self._touched_students = set()
+        skipped = 0
+
+        with transaction.atomic():
+            with self._timed('lock'):
+                fee_statuses = list(
+                    FeeStatus.objects.select_for_update(of=('self',))
+                    .filter(id__in=cart.get('fee_statuses', []))
+                    .select_related('student', 'fee_structure__category')
+                    .order_by('id')
+                )
+                individual_fees = list(
+                    IndividualStudentFee.objects.select_for_update(of=('self',))
+                    .filter(id__in=cart.get('individual_fees', []))
+                    .select_related('student')
+                    .order_by('id')
+                )
+                regular_fees = list(
+                    FeeStructure.objects.filter(id__in=cart.get('fees', [])).select_related('category')
+                )
+
+            with self._timed('discounts'):
+                FeeStatus.resolve_discounts(fee_statuses, today=today)
+
+            with self._timed('plan'):
+                for fee_status in fee_statuses:
+                    # Already paid (e.g. a double submit) or not this user's student
+                    if fee_status.student_id not in self.student_ids or fee_status.status == 'paid':
+                        skipped += 1
+                        continue
+                    self._add_payment(fee_status.student, fee_status.fee_structure, fee_status.get_discounted_amount(), today)
+                    if not self.is_cash:
+                        self._mark_paid([fee_status])
+
+                regular_students = self._plan_regular_fees(regular_fees, today)
+                if len(regular_students) < len(regular_fees):
+                    skipped += len(regular_fees) - len(regular_students)
+
+                paid_individual_fees = []
+                for individual_fee in individual_fees:
+                    if individual_fee.student_id not in self.student_ids or individual_fee.is_paid:
+                        skipped += 1
+                        continue
+                    self._add_payment(individual_fee.student, None, individual_fee.amount, today)
+                    if not self.is_cash:
+                        individual_fee.is_paid = True
+                        individual_fee.updated_at = self._now
+                        paid_individual_fees.append(individual_fee)
+
+            with self._timed('write'):
+                payments = Payment.objects.bulk_create(self._payments)
+                if self._new_statuses:
+                    FeeStatus.objects.bulk_create(self._new_statuses)
+                if self._paid_statuses:
+                    FeeStatus.objects.bulk_update(self._paid_statuses, ['status', 'updated_at'])
+                if paid_individual_fees:
+                    IndividualStudentFee.objects.bulk_update(paid_individual_fees, ['is_paid', 'updated_at'])
+
+            invoices = []
+            if self.invoices and payments:
+                with self._timed('invoices'):
+                    invoices = Invoice.objects.bulk_create(self._build_invoices(payments, today))
+
+            pibg_donations = []
+            if donation:
+                with self._timed('donation'):
+                    student = next(
+                        (payment.student for payment in payments),
+                        self.students[0] if self.students else None
+                    )
+                    if student is not None:
+                        pibg_donations.append(PibgDonation.objects.create(
+                            student=student,
+                            parent=self.parent,
+                            amount=donation,
+                            payment_method=self.payment_method,
+                            status='pending' if self.is_cash else 'completed'
+                        ))
+
+            # bulk writes skip post_save, so refresh the ledger, rollups and fee reports explicitly
+            StudentFeeLedger.schedule_refresh(self._touched_students)
+            schedule_rollup_refresh(PAYMENTS, {payment.payment_date for payment in payments})
+            transaction.on_commit(invalidate_fee_report_cache)
+
+        self.timings['total'] = self._elapsed_ms(started)
+        logger.info(
+            "Checkout of %s payments (%s skipped) in %.1fms: %s",
+            len(payments), skipped, self.timings['total'], self.timings
+        )
+        return {
+            'payments': payments,
+            'invoices': invoices,
+            'pibg_donations': pibg_donations,
+            'skipped': skipped,
+            'timings': self.timings,
+        }
+
+    def _parse_donation(self, donation_amount, custom_donation_amount):
+        """Validate the PIBG donation choice before anything is written"""
+        if not donation_amount or donation_amount == '0':
+            return None
+        raw = custom_donation_amount if donation_amount == 'custom' else donation_amount
+        try:
+            amount = Decimal(raw or '0')
+        except InvalidOperation:
+            raise CheckoutError('Invalid donation amount.')
+        if amount <= 0:
+            return None
+        if donation_amount == 'custom':
+            settings = PibgDonationSettings.get_settings()
+            if amount < settings.minimum_custom_amount or amount > settings.maximum_custom_amount:
+                raise CheckoutError(
+                    f'Custom donation amount must be between RM {settings.minimum_custom_amount} '
+                    f'and RM {settings.maximum_custom_amount}'
+                )
+        return amount
+
+    def _plan_regular_fees(self, regular_fees, today):
+        """Payments and FeeStatus rows for whole fee structures placed in the cart"""
+        paid_for = []
+        pairs = []
+        for fee in regular_fees:
+            student = next((s for s in self.students if fee.applies_to(s)), None)
+            if student is None:
+                logger.debug("No student in cart scope for fee structure %s (%s)", fee.id, fee.form)
+                continue
+            pairs.append((student, fee))
+            paid_for.append(student)
+        if not pairs:
+            return paid_for
+
+        existing = {}
+        for fee_status in FeeStatus.objects.select_for_update(of=('self',)).filter(
+            student_id__in={student.id for student, _ in pairs},
+            fee_structure_id__in={fee.id for _, fee in pairs}
+        ):
+            existing.setdefault((fee_status.student_id, fee_status.fee_structure_id), []).append(fee_status)
+
+        status = 'pending' if self.is_cash else 'paid'
+        for student, fee in pairs:
+            self._add_payment(student, fee, fee.amount, today)
+            statuses = existing.get((student.id, fee.id), [])
+            if fee.frequency == 'monthly' and fee.monthly_duration:
+                due_dates = {today + timedelta(days=30 * month) for month in range(fee.monthly_duration)}
+                open_statuses = [fs for fs in statuses if fs.status in ('pending', 'overdue')]
+                if not statuses:
+                    # No plan yet: create the whole monthly plan
+                    self._new_statuses.extend(
+                        FeeStatus(student=student, fee_structure=fee, amount=fee.get_monthly_amount(),
+                                  due_date=due_date, status=status)
+                        for due_date in sorted(due_dates)
+                    )
+                elif not self.is_cash:
+                    self._mark_paid(open_statuses)
+            elif statuses:
+                if not self.is_cash:
+                    self._mark_paid(statuses[:1])
+            else:
+                self._new_statuses.append(FeeStatus(
+                    student=student, fee_structure=fee, amount=fee.amount or 0, due_date=today, status=status
+                ))
+        return paid_for
+
+    def _build_invoices(self, payments, today):
+        """A paid invoice per payment, numbered on from the latest invoice"""
+        numbers = Invoice.next_invoice_numbers(len(payments))
+        return [
+            Invoice(
+                invoice_number=number,
+                student=payment.student,
+                payment=payment,
+                amount=payment.amount,
+                total_amount=payment.amount,
+                due_date=today + timedelta(days=self.INVOICE_DUE_DAYS),
+                status='paid',
+                notes=f'Invoice for {payment.fee_structure.category.name if payment.fee_structure else "Individual Fee"}',
+                terms_conditions='Payment completed successfully. Thank you!',
+            )
+            for number, payment in zip(numbers, payments)
+        ]
+
+    def _mark_paid(self, fee_statuses):
+        for fee_status in fee_statuses:
+            fee_status.status = 'paid'
+            fee_status.updated_at = self._now
+            self._paid_statuses.append(fee_status)
+
+    def _add_payment(self, student, fee_structure, amount, today):
+        self._touched_students.add(student.id)
+        self._payments.append(Payment(
+            student=student,
+            fee_structure=fee_structure,
+            amount=amount,
+            payment_date=today,
+            payment_method=self.payment_method,
+            status='pending' if self.is_cash else 'completed',
+            receipt_number=self._receipt_number(),
+        ))
+
+    def _receipt_number(self):
+        if not self.receipt_prefix:
+            return None
+        return f'{self.receipt_prefix}{timezone.now().strftime("%Y%m%d%H%M%S")}{uuid.uuid4().hex[:6].upper()}'
+
+    @contextmanager
+    def _timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self._elapsed_ms(started)
+
+    @staticmethod
+    def _elapsed_ms(started):
+        return round((time.perf_counter() - started) * 1000, 2)
@@ -1,6 +1,8 @@
 """
 Context processors for the myapp app
 """
+from accounts.principal import get_principal
+
 
 def user_roles(request):
     """
@@ -15,21 +17,29 @@ def user_roles(request):
     }
     
     if request.user.is_authenticated:
-        try:
-            # Get user profile
-            profile = getattr(request.user, 'profile', None)
-            if profile:
-                context['is_waqaf_admin'] = profile.is_waqaf_admin()
-                context['is_donation_admin'] = profile.is_donation_admin()
-                context['is_form1_admin'] = profile.is_form1_admin()
-                context['is_form3_admin'] = profile.is_form3_admin()
-                context['can_access_main_admin'] = (
-                    request.user.is_superuser or 
-                    request.user.is_staff or 
-                    profile.is_admin()
-                )
-        except Exception:
-            # If there's any error getting profile, use defaults
-            pass
+        profile = get_principal(request).profile
+        if profile:
+            context['is_waqaf_admin'] = profile.is_waqaf_admin()
+            context['is_donation_admin'] = profile.is_donation_admin()
+            context['is_form1_admin'] = profile.is_form1_admin()
+            context['is_form3_admin'] = profile.is_form3_admin()
+            context['can_access_main_admin'] = (
+                request.user.is_superuser or 
+                request.user.is_staff or 
+                profile.is_admin()
+            )
     
     return context
+
+
+def fee_cart(request):
+    """
+    Expose the user's fee cart for the header badge. The lookup is lazy, so
+    only pages that render the badge pay for the (single row) query.
+    """
+    from django.utils.functional import SimpleLazyObject
+    from .models import ParentCart
+
+    if not request.user.is_authenticated:
+        return {}
+    return {'fee_cart': SimpleLazyObject(lambda: ParentCart.for_user(request.user))}
@@ -2,13 +2,15 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from functools import wraps
 
+from accounts.principal import get_principal
+
 def role_required(allowed_roles):
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 return redirect('login')
-            user_profile = getattr(request.user, 'myapp_profile', None)
+            user_profile = get_principal(request).myapp_profile
             if user_profile and user_profile.role in allowed_roles:
                 return view_func(request, *args, **kwargs)
             messages.error(request, 'You do not have permission to access this page.')
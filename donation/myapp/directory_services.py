@@ -0,0 +1,153 @@
+"""
+Student directory search and keyset pagination.
+
+Searches match every term of the query against ``Student.search_text``, a
+normalized copy of the name, ids, phone, level and batch kept up to date by
+``Student.save``. On PostgreSQL the column has a pg_trgm GIN index (see
+migration 0042), so ``LIKE '%term%'`` is answered from the index; elsewhere
+it is a scan of one narrow column instead of six ``icontains`` ORs.
+
+Listings are paginated by keyset: the cursor carries the sort field, its
+value and the id of the last row shown, and the next page is read with ``WHERE (col, id) >
+(value, id) ORDER BY col, id LIMIT n``, so deep pages cost the same as the
+first one and rows don't shift between pages while data changes.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+from .models import Student, normalize_search_text
+
+SORT_FIELDS = ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+SUGGESTION_LIMIT = 10
+# Shorter queries match too much of the directory to be useful as suggestions
+SUGGESTION_MIN_LENGTH = 2
+
+
+def search_students(students, query):
+    """Students whose search text contains every term of ``query``"""
+    for term in normalize_search_text(query).split():
+        students = students.filter(search_text__contains=term)
+    return students
+
+
+def filter_students(show='active', search=''):
+    """The directory's base queryset: active (or all) students matching ``search``"""
+    students = Student.objects.all() if show == 'all' else Student.objects.filter(is_active=True)
+    return search_students(students, search)
+
+
+def sort_field(sort_by):
+    return sort_by if sort_by in SORT_FIELDS else 'first_name'
+
+
+def ordering(field, descending=False):
+    """(field, id) ordering; NULLs sort last ascending and first descending so the order reverses cleanly"""
+    if descending:
+        return [F(field).desc(nulls_first=True), '-id']
+    return [F(field).asc(nulls_last=True), 'id']
+
+
+def _after(field, value, pk, descending):
+    """Rows that come after (value, pk) in ``ordering(field, descending)``"""
+    nullable = Student._meta.get_field(field).null
+    if value is None:
+        if descending:
+            return Q(**{f'{field}__isnull': True, 'id__lt': pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__isnull': True, 'id__gt': pk})
+    op = 'lt' if descending else 'gt'
+    after = Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+    if nullable and not descending:
+        after |= Q(**{f'{field}__isnull': True})
+    return after
+
+
+def encode_cursor(field, value, pk, backwards=False):
+    payload = json.dumps([field, value, pk, backwards], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """
+    (value, pk, backwards) from a cursor, or None (the first page) if it is
+    missing, malformed or was made for another sort field
+    """
+    if not cursor:
+        return None
+    try:
+        cursor_field, value, pk, backwards = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if cursor_field != field or not isinstance(pk, int):
+            return None
+        value = Student._meta.get_field(field).to_python(value)
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+    return value, pk, bool(backwards)
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of the pages around it"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def keyset_page(students, sort_by='first_name', descending=False, cursor=None, page_size=PAGE_SIZE):
+    """The page of ``students`` after (or, for a backwards cursor, before) ``cursor``"""
+    field = sort_field(sort_by)
+    position = decode_cursor(cursor, field)
+    backwards = bool(position and position[2])
+    # A backwards page is read in reverse order and flipped afterwards
+    reverse = descending != backwards
+    rows = students.order_by(*ordering(field, reverse))
+    if position:
+        rows = rows.filter(_after(field, position[0], position[1], reverse))
+    rows = list(rows[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    has_next, has_previous = (True, more) if backwards else (more, position is not None)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(field, getattr(rows[-1], field), rows[-1].pk) if has_next else None,
+        previous_cursor=encode_cursor(field, getattr(rows[0], field), rows[0].pk, backwards=True) if has_previous else None,
+    )
+
+
+def suggest_students(query, limit=SUGGESTION_LIMIT):
+    """Type-ahead matches among active students, as small dicts"""
+    query = normalize_search_text(query)
+    if len(query) < SUGGESTION_MIN_LENGTH:
+        return []
+    return list(
+        search_students(Student.objects.filter(is_active=True), query)
+        .order_by('first_name', 'id')
+        .values('id', 'student_id', 'first_name', 'last_name', 'level_custom', 'class_name')[:limit]
+    )
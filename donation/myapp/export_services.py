@@ -0,0 +1,220 @@
+"""
+Streaming CSV/XLSX exports.
+
+Exports read their rows with ``values_list(...).iterator()`` so no model
+instances or result cache are built. ``csv_response`` writes CSV straight into
+a ``StreamingHttpResponse`` in buffered chunks; ``xlsx_response`` fills an
+openpyxl write-only workbook (rows go to disk as they are appended) and saves
+it into a spooled temporary file. Both log the row count, size and duration
+of every export.
+
+All payment exports parse their query string with ``parse_export_filters`` and
+apply it with ``filter_payments``, after limiting the rows to what the user may
+see with ``scope_to_user``.
+"""
+import csv
+import io
+import logging
+import tempfile
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from accounts.principal import get_principal
+
+logger = logging.getLogger(__name__)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Queryset rows fetched per round trip, and CSV characters buffered per chunk sent
+ITERATOR_CHUNK_SIZE = 2000
+CSV_FLUSH_SIZE = 64 * 1024
+
+
+class Sheet:
+    """A header row plus an iterable of data rows, counted as they are consumed"""
+
+    def __init__(self, title, headers, rows, widths=None):
+        self.title = title
+        self.headers = headers
+        self.rows = rows
+        self.widths = widths
+        self.row_count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.row_count += 1
+            yield row
+
+
+def iter_values(queryset, fields, chunk_size=ITERATOR_CHUNK_SIZE):
+    """Stream ``fields`` tuples without caching the queryset"""
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _log_export(name, fmt, rows, size, started):
+    logger.info(
+        "Export %s (%s): %s rows, %s bytes in %.0f ms",
+        name, fmt, rows, size, (time.perf_counter() - started) * 1000
+    )
+
+
+def csv_response(name, sheet, filename):
+    """Stream ``sheet`` as CSV; the export is logged once the last chunk is sent"""
+    started = time.perf_counter()
+
+    def stream():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        size = 0
+        try:
+            writer.writerow(sheet.headers)
+            for row in sheet:
+                writer.writerow(row)
+                if buffer.tell() >= CSV_FLUSH_SIZE:
+                    chunk = buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+                    size += len(chunk)
+                    yield chunk
+            chunk = buffer.getvalue().encode('utf-8')
+            size += len(chunk)
+            yield chunk
+        finally:
+            _log_export(name, 'csv', sheet.row_count, size, started)
+
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(name, sheets, filename):
+    """Write ``sheets`` into a write-only workbook and send it from a spooled file"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    started = time.perf_counter()
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    rows = 0
+    for sheet in sheets:
+        worksheet = workbook.create_sheet(sheet.title)
+        # Write-only sheets can't be measured afterwards, so widths are fixed up front
+        for index, width in enumerate(sheet.widths or [], 1):
+            worksheet.column_dimensions[get_column_letter(index)].width = width
+        header = []
+        for value in sheet.headers:
+            cell = WriteOnlyCell(worksheet, value=value)
+            cell.font = header_font
+            cell.fill = header_fill
+            header.append(cell)
+        worksheet.append(header)
+        for row in sheet:
+            worksheet.append(row)
+        rows += sheet.row_count
+
+    spool = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'EXPORT_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+    workbook.save(spool)
+    size = spool.tell()
+    spool.seek(0)
+    _log_export(name, 'xlsx', rows, size, started)
+    return FileResponse(spool, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def _positive_int(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _date(value):
+    try:
+        return parse_date((value or '').strip())
+    except ValueError:
+        return None
+
+
+def parse_export_filters(params):
+    """
+    Filters shared by all payment exports. Both the ``date_from``/``date_to``
+    and ``start_date``/``end_date`` spellings are accepted; values that don't
+    parse are ignored.
+    """
+    return {
+        'date_from': _date(params.get('date_from') or params.get('start_date')),
+        'date_to': _date(params.get('date_to') or params.get('end_date')),
+        'student': _positive_int(params.get('student')),
+        'class_name': (params.get('class') or '').strip(),
+        'batch': _positive_int(params.get('batch')),
+        'category': _positive_int(params.get('category')),
+        'search': (params.get('search') or '').strip(),
+        'payment_method': (params.get('payment_method') or '').strip(),
+        'status': (params.get('status') or '').strip(),
+        'month': _positive_int(params.get('month')),
+        'year': _positive_int(params.get('year')),
+        'format': (params.get('format') or 'csv').strip().lower(),
+    }
+
+
+def scope_to_user(request, queryset, student_field='student'):
+    """Limit rows to the user's own student record, or to their children for a parent"""
+    principal = get_principal(request)
+    if principal.is_student:
+        return queryset.filter(**{student_field: principal.student}) if principal.student else queryset.none()
+    if principal.is_parent:
+        return queryset.filter(**{f'{student_field}__parents': principal.parent}) if principal.parent else queryset.none()
+    return queryset
+
+
+# The filter each payment analytics view narrows by; the others are ignored
+ANALYTICS_VIEW_FILTERS = {'student': 'student', 'class': 'class_name', 'batch': 'batch', 'category': 'category'}
+
+
+def filters_for_view(filters, view_type):
+    """
+    ``filters`` for a payment analytics view: of the student, class, batch
+    and category filters only the one the view is about applies, so a value
+    left over from another view does not narrow the export.
+    """
+    selected = ANALYTICS_VIEW_FILTERS.get(view_type)
+    return {
+        key: value if key == selected or key not in ANALYTICS_VIEW_FILTERS.values() else None
+        for key, value in filters.items()
+    }
+
+
+def filter_payments(payments, filters):
+    if filters['date_from']:
+        payments = payments.filter(payment_date__gte=filters['date_from'])
+    if filters['date_to']:
+        payments = payments.filter(payment_date__lte=filters['date_to'])
+    if filters['student']:
+        payments = payments.filter(student_id=filters['student'])
+    if filters['class_name']:
+        payments = payments.filter(student__class_name=filters['class_name'])
+    if filters['batch']:
+        payments = payments.filter(student__year_batch=filters['batch'])
+    if filters['category']:
+        payments = payments.filter(fee_structure__category_id=filters['category'])
+    if filters['search']:
+        search = filters['search']
+        payments = payments.filter(
+            Q(student__first_name__icontains=search) |
+            Q(student__last_name__icontains=search) |
+            Q(student__student_id__icontains=search) |
+            Q(payment_method__icontains=search) |
+            Q(receipt_number__icontains=search)
+        )
+    if filters['payment_method']:
+        payments = payments.filter(payment_method=filters['payment_method'])
+    if filters['status']:
+        payments = payments.filter(status=filters['status'])
+    if filters['month']:
+        payments = payments.filter(payment_date__month=filters['month'])
+    if filters['year']:
+        payments = payments.filter(payment_date__year=filters['year'])
+    return payments
@@ -0,0 +1,133 @@
+"""
+Fee report figures.
+
+``fee_report_summary`` computes the totals and per-category summary of the fee
+report from one grouped aggregate over payments, one map of average payment
+per category and one pass over the waivers, instead of a few queries per
+category and per waiver. ``cached_fee_report_summary`` keeps the result per
+date range in the cache; the key carries a generation token that is replaced
+once a write to a payment, waiver, fee structure or category commits, so a
+worker never serves figures from before a committed change.
+
+That guarantee needs a cache every worker shares (``SHARED_CACHE``). With the
+per-process default cache a new token would only reach the worker that made
+the write, so the summary is then computed on every request instead.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Sum
+
+from .models import FeeCategory, FeeWaiver, Payment
+
+GENERATION_CACHE_KEY = 'fee_report:generation'
+
+
+def invalidate_fee_report_cache():
+    """
+    Retire every cached fee report by moving to a new generation. Call it
+    through ``transaction.on_commit``: a report computed between an early
+    invalidation and the commit would be cached under the new generation.
+    """
+    cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def report_payments(start_date=None, end_date=None):
+    payments = Payment.objects.all()
+    if start_date:
+        payments = payments.filter(payment_date__gte=start_date)
+    if end_date:
+        payments = payments.filter(payment_date__lte=end_date)
+    return payments
+
+
+def report_waivers(start_date=None, end_date=None):
+    waivers = FeeWaiver.objects.filter(status='approved')
+    if start_date:
+        waivers = waivers.filter(start_date__gte=start_date)
+    if end_date:
+        waivers = waivers.filter(end_date__lte=end_date)
+    return waivers
+
+
+def fee_report_summary(payments, waivers):
+    """
+    Totals, counts and per-category rows for ``payments`` and approved
+    ``waivers``. A percentage waiver is valued at that percentage of the
+    average payment in its category, across all payments.
+    """
+    totals = {}
+    for category_id, status, total, count in (
+        payments.filter(status__in=['completed', 'pending'])
+        .values_list('fee_structure__category', 'status')
+        .annotate(total=Sum('amount'), count=Count('id'))
+        .order_by()
+    ):
+        entry = totals.setdefault(status, {'total': 0, 'count': 0, 'by_category': {}})
+        entry['total'] += total
+        entry['count'] += count
+        entry['by_category'][category_id] = total
+
+    average_fee = dict(
+        Payment.objects.values_list('fee_structure__category')
+        .annotate(avg=Avg('amount'))
+        .order_by()
+    )
+
+    total_waived = 0
+    waived_by_category = {}
+    waived_count = 0
+    for category_id, amount, percentage in waivers.values_list('category_id', 'amount', 'percentage'):
+        if percentage:
+            waived = (average_fee.get(category_id) or 0) * percentage / 100
+        else:
+            waived = amount or 0
+        total_waived += waived
+        waived_by_category[category_id] = waived_by_category.get(category_id, 0) + waived
+        waived_count += 1
+
+    collected = totals.get('completed', {'total': 0, 'count': 0, 'by_category': {}})
+    pending = totals.get('pending', {'total': 0, 'count': 0, 'by_category': {}})
+    category_summary = []
+    for category_id, name in FeeCategory.objects.values_list('id', 'name'):
+        category_collected = collected['by_category'].get(category_id, 0)
+        category_pending = pending['by_category'].get(category_id, 0)
+        category_waived = waived_by_category.get(category_id, 0)
+        category_summary.append({
+            'name': name,
+            'collected': category_collected,
+            'pending': category_pending,
+            'waived': category_waived,
+            'total': category_collected + category_pending + category_waived,
+        })
+
+    return {
+        'total_collected': collected['total'],
+        'total_pending': pending['total'],
+        'total_waived': total_waived,
+        'collected_count': collected['count'],
+        'pending_count': pending['count'],
+        'waived_count': waived_count,
+        'category_summary': category_summary,
+    }
+
+
+def cached_fee_report_summary(start_date=None, end_date=None):
+    """``fee_report_summary`` for a date range, cached until fee data changes"""
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return fee_report_summary(report_payments(start_date, end_date), report_waivers(start_date, end_date))
+    key = 'fee_report:{}:{}:{}'.format(
+        _generation(),
+        start_date.isoformat() if start_date else '',
+        end_date.isoformat() if end_date else '',
+    )
+    summary = cache.get(key)
+    if summary is None:
+        summary = fee_report_summary(report_payments(start_date, end_date), report_waivers(start_date, end_date))
+        cache.set(key, summary, getattr(settings, 'FEE_REPORT_CACHE_TIMEOUT', 300))
+    return summary
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from donation import ai_registry
+
+
+class Command(BaseCommand):
+    help = 'Load the NLP/ML components (and the URLconf) and report how long each one takes to import and boot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--download',
+            action='store_true',
+            help='First fetch the NLTK data packages into NLTK_DATA_DIR (run at build time)',
+        )
+        parser.add_argument(
+            'components',
+            nargs='*',
+            help='Only load these components (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['components']) - set(ai_registry.names())
+        if unknown:
+            raise CommandError(f"Unknown component(s): {', '.join(sorted(unknown))}. Known: {', '.join(ai_registry.names())}")
+
+        if options['download']:
+            self.stdout.write(f"Downloading NLTK data into {ai_registry.nltk_data_dir()}")
+            try:
+                downloaded = ai_registry.download_nltk_data()
+            except ImportError:
+                self.stdout.write(self.style.WARNING("  nltk is not installed, nothing to download"))
+            else:
+                for package, ok in downloaded.items():
+                    self.stdout.write(f"  {package}: {'ok' if ok else 'FAILED'}")
+
+        started = time.perf_counter()
+        timings = ai_registry.warm(options['components'] or None)
+        total = time.perf_counter() - started
+
+        for timing in timings:
+            line = f"  {timing.name:<18} {timing.status:<12} {timing.seconds * 1000:8.1f} ms"
+            if timing.error:
+                line += f"  ({timing.error})"
+            style = self.style.SUCCESS if timing.status == 'loaded' else self.style.WARNING
+            self.stdout.write(style(line))
+        self.stdout.write(f"Warm-up took {total * 1000:.1f} ms (NLTK data: {ai_registry.nltk_data_dir()})")
@@ -0,0 +1,82 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from myapp.report_services import PdfReport, chunked_tables, report_styles, table_style
+
+
+class Command(BaseCommand):
+    help = 'Time PDF generation of a large synthetic student listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Number of rows in the listing (default: 10000)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows per table flowable (default: 500)',
+        )
+        parser.add_argument(
+            '--trace-memory',
+            action='store_true',
+            help='Report peak Python memory (slows generation down considerably)',
+        )
+        parser.add_argument(
+            '--single-table',
+            action='store_true',
+            help='Also time the same listing as one unchunked table, for comparison',
+        )
+
+    def handle(self, *args, **options):
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.platypus import Paragraph, Table
+
+        rows = [
+            [f'STU{i:06d}', f'Student {i} Name', f'{i:012d}', f'01{i % 10**8:08d}', 'A', 'Program', '2024', 'Active', '2024-01-01']
+            for i in range(options['rows'])
+        ]
+        header = ['Student ID', 'Name', 'NRIC', 'Phone', 'Class', 'Program', 'Year Batch', 'Status', 'Created']
+        col_widths = [70, 150, 85, 80, 45, 70, 55, 50, 65]
+
+        started = time.perf_counter()
+        report_styles.cache_clear()
+        table_style.cache_clear()
+        report_styles()
+        style = table_style('banded', font_size=8, align='LEFT', padding=3)
+        first_lookup = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(100):
+            report_styles()
+            table_style('banded', font_size=8, align='LEFT', padding=3)
+        cached_lookup = (time.perf_counter() - started) / 100
+        self.stdout.write(f'Styles: {first_lookup * 1000:.2f} ms to build, {cached_lookup * 1000000:.1f} us cached')
+
+        def run(label, make_tables):
+            if options['trace_memory']:
+                tracemalloc.start()
+            started = time.perf_counter()
+            report = PdfReport('benchmark.pdf', pagesize=landscape(A4), margins=(36, 36, 36, 36))
+            report.build([Paragraph('Benchmark listing', report_styles()['title'])] + list(make_tables()))
+            elapsed = time.perf_counter() - started
+            line = f'{label}: {elapsed:.2f} s, {elapsed / len(rows) * 1000000:.0f} us/row'
+            if options['trace_memory']:
+                line += f', peak {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB'
+                tracemalloc.stop()
+            line += f', {report.file.seek(0, 2) / 1024:.0f} KB'
+            report.file.close()
+            self.stdout.write(line)
+
+        run(
+            f"{len(rows)} rows in chunks of {options['chunk_size']}",
+            lambda: chunked_tables(header, rows, style, col_widths, chunk_size=options['chunk_size'])
+        )
+        if options['single_table']:
+            run(
+                f'{len(rows)} rows in one table',
+                lambda: [Table([header] + rows, colWidths=col_widths, style=style, repeatRows=1)]
+            )
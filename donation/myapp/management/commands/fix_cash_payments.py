@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
-from myapp.models import Payment
+from myapp.fee_report_services import invalidate_fee_report_cache
+from myapp.models import Payment, StudentFeeLedger
+from myapp.rollup_services import PAYMENTS, refresh_days
 
 class Command(BaseCommand):
     help = 'Fix existing cash payments that may have incorrect status'
@@ -44,7 +46,13 @@ class Command(BaseCommand):
             # Ask for confirmation
             confirm = input("\nDo you want to set all non-completed cash payments to 'pending' status? (y/N): ")
             if confirm.lower() == 'y':
-                updated = cash_payments.exclude(status='completed').update(status='pending')
+                to_update = cash_payments.exclude(status='completed')
+                student_ids = set(to_update.values_list('student_id', flat=True))
+                days = set(to_update.values_list('payment_date', flat=True))
+                updated = to_update.update(status='pending')
+                StudentFeeLedger.refresh_students(student_ids)
+                refresh_days(PAYMENTS, days)
+                invalidate_fee_report_cache()
                 self.stdout.write(f"Updated {updated} cash payments to 'pending' status")
             else:
                 self.stdout.write("No changes made")
@@ -16,7 +16,9 @@ class Command(BaseCommand):
         if problematic_students.exists():
             with transaction.atomic():
                 # Set default year_batch to 2024 for null values
+                student_ids = list(problematic_students.values_list('id', flat=True))
                 updated_count = problematic_students.update(year_batch=2024)
+                Student.refresh_search_text(Student.objects.filter(id__in=student_ids))
                 self.stdout.write(f"✅ Updated {updated_count} students with year_batch=2024")
         
         # Check for any remaining issues
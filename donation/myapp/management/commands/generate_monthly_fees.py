@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from myapp.models import FeeStructure
+
+
+class Command(BaseCommand):
+    help = 'Generate monthly FeeStatus records for all students of auto-generating monthly fee structures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--structure',
+            type=int,
+            action='append',
+            dest='structure_ids',
+            help='Only generate for this fee structure id (can be repeated)',
+        )
+        parser.add_argument(
+            '--form',
+            help='Only generate for fee structures of this form (e.g. "Form 1" or "1")',
+        )
+        parser.add_argument(
+            '--start-date',
+            help='Due date of the first month, YYYY-MM-DD (default: today)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows per INSERT (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be created without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['start_date']:
+            try:
+                start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--start-date must be in YYYY-MM-DD format')
+
+        if options['form']:
+            fee_structures = FeeStructure.for_form(options['form'])
+        else:
+            fee_structures = FeeStructure.objects.filter(is_active=True)
+        if options['structure_ids']:
+            fee_structures = fee_structures.filter(id__in=options['structure_ids'])
+        fee_structures = list(fee_structures.filter(
+            frequency='monthly', auto_generate_payments=True
+        ).select_related('category'))
+
+        if not fee_structures:
+            self.stdout.write(self.style.WARNING('No monthly fee structures with auto-generate enabled'))
+            return
+
+        self.stdout.write(f"Generating monthly payments for {len(fee_structures)} fee structures...")
+        result = FeeStructure.generate_monthly_payments(
+            fee_structures,
+            start_date=start_date,
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+
+        self.stdout.write(f"  Planned: {result['planned']}")
+        self.stdout.write(f"  Already existing: {result['existing']}")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"[DRY RUN] Would create {result['planned'] - result['existing']} payment records"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Created {result['created']} payment records"))
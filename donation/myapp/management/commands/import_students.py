@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.student_import_services import StudentImportError, import_students, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import students (and optional parent accounts) from an .xlsx or .csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .xlsx or .csv file')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only validate the rows, without adding anything',
+        )
+        parser.add_argument(
+            '--no-accounts',
+            action='store_true',
+            help='Do not create student user accounts',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the per-row report as CSV to this path',
+        )
+        parser.add_argument(
+            '--base-url',
+            help='Site URL (e.g. https://fees.example.com); adds set-password links to the report and emails them to parents',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as upload:
+                result = import_students(
+                    read_rows(upload), create_accounts=not options['no_accounts'], dry_run=options['dry_run']
+                )
+        except (OSError, StudentImportError) as e:
+            raise CommandError(str(e))
+
+        build_url = None
+        if options['base_url'] and result.is_valid and not result.dry_run:
+            base_url = options['base_url'].rstrip('/')
+            build_url = lambda path: base_url + path
+            invited = result.queue_invitations(build_url)
+            self.stdout.write(f"Queued set-password emails for {invited} parents")
+
+        if options['report']:
+            with open(options['report'], 'w', newline='', encoding='utf-8') as report:
+                report.write(result.report_csv(build_url))
+
+        for row in result.error_rows:
+            self.stdout.write(self.style.ERROR(f"Row {row.row_number}: {'; '.join(row.errors)}"))
+        if not result.is_valid:
+            raise CommandError(f"{len(result.error_rows)} of {len(result.rows)} rows have errors; nothing was imported")
+        if result.dry_run:
+            self.stdout.write(self.style.SUCCESS(f"All {len(result.rows)} rows are valid"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.students_created} students, {result.accounts_created} accounts, "
+            f"{result.parents_created} parents and {result.fee_statuses_created} fee records"
+        ))
+        if (result.accounts_created or result.parents_created) and not build_url:
+            self.stdout.write(self.style.WARNING(
+                'New accounts have no password yet; their owners set one through the password reset page '
+                '(pass --base-url to get set-password links in the report)'
+            ))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from myapp.outbox_services import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails (reminders, receipts, account emails)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of emails claimed per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of sending threads (default: 4)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new emails instead of exiting once the queue is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds between polls with --loop (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], workers=options['workers'])
+        totals = {'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        try:
+            while True:
+                result = worker.run_once()
+                for key, value in result.items():
+                    totals[key] += value
+                if any(result.values()):
+                    self.stdout.write(
+                        f"Sent {result['sent']}, retrying {result['retried']}, "
+                        f"failed {result['failed']}, rate-limited {result['deferred']}"
+                    )
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox done: {totals['sent']} sent, {totals['retried']} to retry, "
+            f"{totals['failed']} failed, {totals['deferred']} rate-limited"
+        ))
@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from myapp.models import FeeStatus, Student, StudentFeeLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild and/or verify the denormalized per-student fee ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Compare stored ledger rows against freshly computed totals without writing',
+        )
+        parser.add_argument(
+            '--mark-overdue',
+            action='store_true',
+            help='First mark pending fees past their due date as overdue (for the daily run)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of students to process per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        batch_size = options['batch_size']
+        if options['mark_overdue'] and not verify:
+            marked = FeeStatus.objects.filter(
+                status='pending', due_date__lt=timezone.now().date()
+            ).update(status='overdue')
+            self.stdout.write(f"Marked {marked} past-due fees as overdue")
+
+        student_ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+
+        if verify:
+            self.stdout.write(f"Verifying fee ledger for {len(student_ids)} students...")
+        else:
+            self.stdout.write(f"Rebuilding fee ledger for {len(student_ids)} students...")
+
+        processed = 0
+        mismatches = 0
+        for start in range(0, len(student_ids), batch_size):
+            batch = student_ids[start:start + batch_size]
+            if verify:
+                mismatches += self._verify_batch(batch)
+            else:
+                StudentFeeLedger.refresh_students(batch)
+            processed += len(batch)
+            self.stdout.write(f"  {processed}/{len(student_ids)} students processed")
+
+        if not verify:
+            # Drop ledger rows whose student no longer exists
+            StudentFeeLedger.objects.exclude(student_id__in=student_ids).delete()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt ledger for {processed} students"))
+        elif mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} ledger rows are missing or out of date"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Fee ledger is up to date"))
+
+    def _verify_batch(self, student_ids):
+        expected = StudentFeeLedger.compute_totals(student_ids)
+        stored = {
+            ledger.student_id: ledger
+            for ledger in StudentFeeLedger.objects.filter(student_id__in=student_ids)
+        }
+        mismatches = 0
+        for student_id, values in expected.items():
+            ledger = stored.get(student_id)
+            if ledger is None:
+                self.stdout.write(self.style.WARNING(f"  Student {student_id}: ledger row missing"))
+                mismatches += 1
+                continue
+            differences = [
+                f"{field}={getattr(ledger, field)} (expected {value})"
+                for field, value in values.items()
+                if getattr(ledger, field) != value
+            ]
+            if differences:
+                self.stdout.write(self.style.WARNING(f"  Student {student_id}: {', '.join(differences)}"))
+                mismatches += 1
+        return mismatches
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from myapp.models import Donation, DonationEvent
+
+
+class Command(BaseCommand):
+    help = "Recompute each donation event's raised total (current_amount) from its completed donations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the events whose total is out of step',
+        )
+
+    def handle(self, *args, **options):
+        totals = dict(
+            Donation.objects.filter(status='completed')
+            .values_list('event')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        fixed = 0
+        for event in DonationEvent.objects.only('id', 'title', 'current_amount'):
+            expected = totals.get(event.id) or 0
+            if event.current_amount == expected:
+                continue
+            recorded = event.current_amount
+            if not options['dry_run']:
+                # Recomputed under a row lock, so donations made meanwhile are not lost
+                expected = event.recalculate_current_amount()
+            self.stdout.write(f"  {event.title}: RM {recorded} -> RM {expected}")
+            fixed += 1
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{fixed} event(s) out of step (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} event(s)"))
@@ -0,0 +1,137 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from myapp.models import ReminderCampaign
+from myapp.outbox_services import OutboxWorker
+from myapp.reminder_services import ReminderCampaignRunner
+
+
+class Command(BaseCommand):
+    help = 'Run queued payment-reminder campaigns and resume interrupted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign',
+            type=int,
+            help='Run (or resume) only this campaign',
+        )
+        parser.add_argument(
+            '--create',
+            action='store_true',
+            help='Queue a new campaign before running',
+        )
+        parser.add_argument(
+            '--upcoming-days',
+            type=int,
+            default=7,
+            help='With --create: also remind fees due within this many days (default: 7)',
+        )
+        parser.add_argument(
+            '--no-overdue',
+            action='store_true',
+            help='With --create: skip fees that are already overdue',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Families rendered and checkpointed per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to wait between batches (default: 0)',
+        )
+        parser.add_argument(
+            '--stale-minutes',
+            type=int,
+            default=10,
+            help='Resume running campaigns without a heartbeat for this long (default: 10)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for campaigns queued from the admin page instead of exiting',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds between polls with --loop (default: 30)',
+        )
+        parser.add_argument(
+            '--send',
+            action='store_true',
+            help='Drain the outbox afterwards instead of leaving it to process_outbox',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Sending threads with --send (default: 4)',
+        )
+
+    def handle(self, *args, **options):
+        if options['create']:
+            campaign = ReminderCampaign.objects.create(
+                name=f"Payment reminders {timezone.now():%Y-%m-%d %H:%M}",
+                include_overdue=not options['no_overdue'],
+                upcoming_days=options['upcoming_days'],
+            )
+            self.stdout.write(f'Queued campaign {campaign.id}')
+
+        if options['campaign']:
+            if options['loop']:
+                raise CommandError('--loop runs every queued campaign; it cannot be combined with --campaign')
+            try:
+                campaigns = [ReminderCampaign.objects.get(id=options['campaign'])]
+            except ReminderCampaign.DoesNotExist:
+                raise CommandError(f"Campaign {options['campaign']} does not exist")
+            self.run_campaigns(campaigns, options)
+            return
+
+        try:
+            while True:
+                campaigns = list(ReminderCampaignRunner.resumable(self.stale_after(options)))
+                if campaigns or not options['loop']:
+                    self.run_campaigns(campaigns, options)
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def stale_after(self, options):
+        return timedelta(minutes=options['stale_minutes'])
+
+    def run_campaigns(self, campaigns, options):
+        if not campaigns:
+            self.stdout.write('No campaigns to run')
+        for campaign in campaigns:
+            runner = ReminderCampaignRunner(
+                campaign, batch_size=options['batch_size'], pause=options['pause'], stale_after=self.stale_after(options)
+            )
+            try:
+                if runner.run() is None:
+                    self.stdout.write(self.style.WARNING(f'Campaign {campaign.id} is already being run by another process'))
+                    continue
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Campaign {campaign.id} failed: {e}'))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'Campaign {campaign.id}: {campaign.processed_families} families reminded, '
+                f'{campaign.skipped_families} without email, {campaign.queued_emails} emails queued'
+            ))
+
+        if options['send']:
+            worker = OutboxWorker(workers=options['workers'])
+            sent = 0
+            while True:
+                result = worker.run_once()
+                sent += result['sent']
+                if not result['sent'] and not result['retried'] and not result['failed']:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails'))
@@ -229,11 +229,8 @@ class Command(BaseCommand):
             
             if auto_generate and frequency == 'monthly':
                 self.stdout.write('  Auto-generating monthly payments...')
-                generated_count = 0
-                
-                for student in students_in_form:
-                    payments = fee_structure.generate_monthly_payments_for_student(student)
-                    generated_count += len(payments)
+                result = FeeStructure.generate_monthly_payments([fee_structure], students=students_in_form)
+                generated_count = result['created']
                 
                 self.stdout.write(
                     self.style.SUCCESS(f'Generated {generated_count} monthly payment records')
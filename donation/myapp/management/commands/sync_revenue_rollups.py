@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from myapp.rollup_services import SOURCES, rollup_status, sync_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold payments and donations changed since the last run into the daily revenue rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            choices=sorted(SOURCES),
+            action='append',
+            help='Only sync this rollup table (may be repeated; default: all)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every day instead of only the days changed since the high-water mark',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Show the high-water mark and size of each rollup table without syncing',
+        )
+
+    def handle(self, *args, **options):
+        if not options['status']:
+            results = sync_rollups(options['source'], full=options['full'])
+            for name, days in results.items():
+                self.stdout.write(self.style.SUCCESS(f"{name}: rebuilt {days} day(s)"))
+
+        for name, status in rollup_status().items():
+            self.stdout.write(
+                f"  {name}: {status['rows']} rows ({status['first_day'] or '-'} to {status['last_day'] or '-'}), "
+                f"synced up to {status['high_water_mark'] or 'never'}"
+            )
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0034_alter_donation_payment_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentFeeLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, help_text='Sum of pending/overdue fee statuses', max_digits=12)),
+                ('outstanding_count', models.IntegerField(default=0)),
+                ('individual_outstanding_amount', models.DecimalField(decimal_places=2, default=0, help_text='Sum of unpaid active individual fees', max_digits=12)),
+                ('individual_outstanding_count', models.IntegerField(default=0)),
+                ('overdue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overdue_count', models.IntegerField(default=0)),
+                ('discounted_amount', models.DecimalField(decimal_places=2, default=0, help_text='Outstanding fee statuses after approved waivers are applied', max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, help_text='Sum of completed payments', max_digits=12)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('completed_payment_count', models.IntegerField(default=0)),
+                ('pending_payment_count', models.IntegerField(default=0)),
+                ('pending_payment_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_payment_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fee_ledger', to='myapp.student')),
+            ],
+            options={
+                'verbose_name': 'Student Fee Ledger',
+                'verbose_name_plural': 'Student Fee Ledgers',
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:59
+
+from django.db import migrations, models
+
+
+def normalize_form_level(value):
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if text.startswith('form'):
+        text = text[len('form'):].strip()
+    return int(text) if text.isdigit() else None
+
+
+def populate_form_level(apps, schema_editor):
+    Student = apps.get_model('myapp', 'Student')
+    FeeStructure = apps.get_model('myapp', 'FeeStructure')
+
+    students = []
+    for student in Student.objects.filter(level__in=['form', 'others']).only('id', 'level_custom').iterator():
+        student.form_level = normalize_form_level(student.level_custom)
+        students.append(student)
+    Student.objects.bulk_update(students, ['form_level'], batch_size=500)
+
+    structures = []
+    for structure in FeeStructure.objects.only('id', 'form').iterator():
+        structure.form_level = normalize_form_level(structure.form)
+        structures.append(structure)
+    FeeStructure.objects.bulk_update(structures, ['form_level'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0035_studentfeeledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feestructure',
+            name='form_level',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='Normalized form number derived from form', null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='form_level',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='Normalized form number derived from level/level_custom', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='feestructure',
+            index=models.Index(fields=['form_level', 'is_active', 'category'], name='feestructure_form_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['form_level', 'is_active', 'class_name'], name='student_form_active_class_idx'),
+        ),
+        migrations.RunPython(populate_form_level, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('myapp', '0038_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('include_overdue', models.BooleanField(default=True)),
+                ('upcoming_days', models.PositiveIntegerField(default=7, help_text='Also remind fees due within this many days (0 for none)')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('total_families', models.PositiveIntegerField(default=0)),
+                ('processed_families', models.PositiveIntegerField(default=0)),
+                ('skipped_families', models.PositiveIntegerField(default=0)),
+                ('queued_emails', models.PositiveIntegerField(default=0)),
+                ('reminded_fees', models.PositiveIntegerField(default=0)),
+                ('last_family_key', models.CharField(blank=True, max_length=50)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reminder Campaign',
+                'verbose_name_plural': 'Reminder Campaigns',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:46
+
+from django.db import migrations, models, transaction
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch')
+
+
+def populate_search_text(apps, schema_editor):
+    Student = apps.get_model('myapp', 'Student')
+
+    students = []
+    for student in Student.objects.only('id', *SEARCH_FIELDS).iterator(chunk_size=2000):
+        values = (getattr(student, field) for field in SEARCH_FIELDS)
+        student.search_text = ' '.join(' '.join(str(value) for value in values if value not in (None, '')).lower().split())
+        students.append(student)
+    Student.objects.bulk_update(students, ['search_text'], batch_size=500)
+
+
+def add_trigram_index(apps, schema_editor):
+    """On PostgreSQL, index search_text for substring (LIKE '%term%') matching"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except Exception:
+        # Without the extension searches still work, they just scan the column
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS student_search_text_trgm_idx '
+        'ON myapp_student USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS student_search_text_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0041_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Normalized name, ids, phone, level and batch searched by the student directory', max_length=320),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['first_name', 'id'], name='student_first_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['last_name', 'id'], name='student_last_name_id_idx'),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_trigram_index, drop_trigram_index),
+    ]
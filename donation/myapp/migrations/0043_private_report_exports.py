@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:27
+
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.db import migrations, models
+
+import donation.storage
+import myapp.models
+
+
+def move_exports_out_of_media(apps, schema_editor):
+    """Exports used to be written under MEDIA_ROOT, where /media/ served them to anyone"""
+    ReportExport = apps.get_model('myapp', 'ReportExport')
+    storage = donation.storage.private_storage
+    for export in ReportExport.objects.exclude(file=''):
+        public_path = os.path.join(settings.MEDIA_ROOT, export.file.name)
+        if not os.path.isfile(public_path):
+            continue
+        with open(public_path, 'rb') as f:
+            name = storage.save(f"report_exports/{uuid.uuid4().hex}{os.path.splitext(public_path)[1]}", File(f))
+        os.remove(public_path)
+        ReportExport.objects.filter(pk=export.pk).update(file=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0042_student_directory_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportexport',
+            name='file',
+            field=models.FileField(blank=True, storage=donation.storage.PrivateStorage(), upload_to=myapp.models.report_export_path),
+        ),
+        migrations.RunPython(move_exports_out_of_media, migrations.RunPython.noop),
+    ]
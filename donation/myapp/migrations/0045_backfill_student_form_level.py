@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:05
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def normalize_form_level(value):
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if text.startswith('form'):
+        text = text[len('form'):].strip()
+    return int(text) if text.isdigit() else None
+
+
+def no_level(Student):
+    return Student.objects.filter(Q(level__isnull=True) | Q(level='')).exclude(level_custom__isnull=True).exclude(level_custom='')
+
+
+def backfill_form_level(apps, schema_editor):
+    """
+    Student.compute_form_level now also reads level_custom when no level is
+    set, as the form listings did before form_level; derive it for the
+    students saved before that.
+    """
+    Student = apps.get_model('myapp', 'Student')
+
+    students = []
+    for student in no_level(Student).only('id', 'level_custom').iterator():
+        student.form_level = normalize_form_level(student.level_custom)
+        if student.form_level is not None:
+            students.append(student)
+    Student.objects.bulk_update(students, ['form_level'], batch_size=500)
+
+
+def clear_form_level(apps, schema_editor):
+    Student = apps.get_model('myapp', 'Student')
+    no_level(Student).update(form_level=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0044_report_export_started_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_form_level, clear_form_level),
+    ]
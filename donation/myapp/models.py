@@ -8,9 +8,15 @@ from io import BytesIO
 from django.core.files.base import File
 from django.urls import reverse
 from django.conf import settings
+from donation.storage import private_storage
+import logging
+import os
+import uuid
 import random
 import string
 
+logger = logging.getLogger(__name__)
+
 # At the top of your models.py
 PAYMENT_METHODS = [
     ('cash', 'Cash'),
@@ -23,6 +29,19 @@ PAYMENT_STATUS = [
     ('failed', 'Failed'),
 ]
 
+def normalize_form_level(value):
+    """Return the numeric form level for values like 'Form 3', 'form3' or '3', otherwise None"""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if text.startswith('form'):
+        text = text[len('form'):].strip()
+    return int(text) if text.isdigit() else None
+
+def normalize_search_text(value):
+    """Lower-case ``value`` and collapse its whitespace, for directory search"""
+    return ' '.join(str(value or '').lower().split())
+
 class Student(models.Model):
     LEVEL_CHOICES = [
         ('year', 'Year'),
@@ -41,22 +60,67 @@ class Student(models.Model):
     level_custom = models.CharField(max_length=50, blank=True, null=True, help_text="Custom level value when 'others' is selected")
     year_batch = models.IntegerField(null=True, blank=True)  # e.g., 2024
     phone_number = models.CharField(max_length=15, blank=True, null=True, help_text="Student's phone number")
+    form_level = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, help_text="Normalized form number derived from level/level_custom")
+    search_text = models.CharField(max_length=320, blank=True, default='', editable=False, help_text="Normalized name, ids, phone, level and batch searched by the student directory")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    SEARCH_FIELDS = ('first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['form_level', 'is_active', 'class_name'], name='student_form_active_class_idx'),
+            # Keyset pagination of the student directory sorts on (column, id)
+            models.Index(fields=['first_name', 'id'], name='student_first_name_id_idx'),
+            models.Index(fields=['last_name', 'id'], name='student_last_name_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.student_id})"
     
+    def compute_form_level(self):
+        """Numeric form level for students whose level is 'form', 'others' or not set"""
+        if self.level in ['form', 'others', None, '']:
+            return normalize_form_level(self.level_custom)
+        return None
+    
+    def compute_search_text(self):
+        """Normalized text the student directory matches search terms against"""
+        return normalize_search_text(' '.join(
+            str(value) for value in (getattr(self, field) for field in self.SEARCH_FIELDS) if value not in (None, '')
+        ))
+    
+    @classmethod
+    def refresh_search_text(cls, students):
+        """Recompute ``search_text`` after writes that bypass save(), e.g. queryset.update()"""
+        changed = []
+        for student in students.only('id', 'search_text', *cls.SEARCH_FIELDS).iterator(chunk_size=2000):
+            search_text = student.compute_search_text()
+            if search_text != student.search_text:
+                student.search_text = search_text
+                changed.append(student)
+        cls.objects.bulk_update(changed, ['search_text'], batch_size=500)
+        return len(changed)
+    
+    def save(self, *args, **kwargs):
+        self.form_level = self.compute_form_level()
+        self.search_text = self.compute_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = set()
+            if {'level', 'level_custom'} & set(update_fields):
+                extra.add('form_level')
+            if set(self.SEARCH_FIELDS) & set(update_fields):
+                extra.add('search_text')
+            if extra:
+                kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
+    
     def get_level_display_value(self):
         """Return the display value for level, including custom value if 'form' or 'others' is selected"""
-        print(f"DEBUG: get_level_display_value called for student {self.id}")
-        print(f"DEBUG: level={self.level}, level_custom={self.level_custom}")
-        
         if self.level in ['form', 'others'] and self.level_custom:
-            print(f"DEBUG: Returning level_custom: {self.level_custom}")
             return self.level_custom
-        print(f"DEBUG: Returning get_level_display: {self.get_level_display()}")
         return self.get_level_display()
 
 class Parent(models.Model):
@@ -150,6 +214,7 @@ class FeeStructure(models.Model):
         default=False,
         help_text="Automatically generate monthly payment records for students"
     )
+    form_level = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, help_text="Normalized form number derived from form")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -157,6 +222,16 @@ class FeeStructure(models.Model):
     class Meta:
         unique_together = ['category', 'form']  # Ensure one fee structure per category per form
         ordering = ['category__name', 'form']
+        indexes = [
+            models.Index(fields=['form_level', 'is_active', 'category'], name='feestructure_form_active_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.form_level = normalize_form_level(self.form)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'form' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'form_level'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         if self.frequency == 'monthly' and self.monthly_duration:
@@ -171,20 +246,45 @@ class FeeStructure(models.Model):
             return monthly_amount
         return self.amount or 0
     
+    @classmethod
+    def for_form(cls, form):
+        """Active fee structures for a form value such as 'Form 3' or '3'"""
+        form_level = normalize_form_level(form)
+        if form_level is None:
+            return cls.objects.filter(form__iexact=str(form or '').strip(), is_active=True)
+        return cls.objects.filter(form_level=form_level, is_active=True)
+    
+    @classmethod
+    def for_student(cls, student):
+        """Active fee structures that apply to a student's form/grade level"""
+        if student.form_level is not None:
+            return cls.objects.filter(form_level=student.form_level, is_active=True)
+        # Non-numeric levels (e.g. 'Year') still match on the display value
+        return cls.objects.filter(form__iexact=student.get_level_display_value(), is_active=True)
+    
+    def matching_students(self):
+        """Active students in this fee structure's form/grade level"""
+        if self.form_level is not None:
+            return Student.objects.filter(form_level=self.form_level, is_active=True)
+        return Student.objects.filter(
+            level__in=['form', 'others'],
+            level_custom__iexact=self.form,
+            is_active=True
+        )
+    
+    def applies_to(self, student):
+        """Whether this fee structure is for the student's form/grade level"""
+        if student.form_level is not None or self.form_level is not None:
+            return student.form_level == self.form_level
+        return self.form.lower() == (student.get_level_display_value() or '').lower()
+    
     @classmethod
     def get_for_student(cls, student, category=None):
         """
         Get the appropriate fee structure for a student based on their form/grade level.
         This ensures all students in the same form pay the same amount.
         """
-        # Get the student's form/grade level
-        student_level = student.get_level_display_value()
-        
-        # Filter by student's level and optionally by category
-        queryset = cls.objects.filter(
-            form__iexact=student_level,  # Case-insensitive match
-            is_active=True
-        )
+        queryset = cls.for_student(student)
         
         if category:
             queryset = queryset.filter(category=category)
@@ -193,32 +293,74 @@ class FeeStructure(models.Model):
     
     def generate_monthly_payments_for_student(self, student, start_date=None):
         """Generate monthly payment records for a specific student"""
-        if not self.auto_generate_payments or self.frequency != 'monthly':
-            return []
+        result = FeeStructure.generate_monthly_payments([self], students=[student], start_date=start_date)
+        return result['fee_statuses']
+    
+    @classmethod
+    def generate_monthly_payments(cls, fee_structures, students=None, start_date=None, dry_run=False, batch_size=500):
+        """
+        Create the monthly FeeStatus plan for many students at once.
+        Rows are computed in memory; students who already have fee rows for a
+        structure keep that plan and are skipped for it, so running this
+        again on a later day (a new start_date) does not add a second plan.
+        The rest are written with bulk_create in one transaction. Only monthly structures with
+        auto_generate_payments are considered; students default to each
+        structure's matching_students().
+        Returns a dict with planned/existing/created counts and the created rows.
+        """
+        from datetime import timedelta
+        from django.db import transaction
         
         if not start_date:
-            from django.utils import timezone
             start_date = timezone.now().date()
+        structures = [
+            fs for fs in fee_structures
+            if fs.auto_generate_payments and fs.frequency == 'monthly' and fs.monthly_duration
+        ]
+        if students is not None:
+            students = list(students)
         
-        payments = []
-        monthly_amount = self.get_monthly_amount()
+        planned = []
+        student_ids = set()
+        for fee_structure in structures:
+            if students is None:
+                structure_students = fee_structure.matching_students()
+            else:
+                structure_students = students
+            monthly_amount = fee_structure.get_monthly_amount()
+            due_dates = [start_date + timedelta(days=30 * month) for month in range(fee_structure.monthly_duration)]
+            for student in structure_students:
+                student_ids.add(student.id)
+                for due_date in due_dates:
+                    planned.append(FeeStatus(
+                        student=student,
+                        fee_structure=fee_structure,
+                        amount=monthly_amount,
+                        due_date=due_date,
+                        status='pending'
+                    ))
         
-        for month in range(self.monthly_duration):
-            from datetime import timedelta
-            due_date = start_date + timedelta(days=30 * month)
-            
-            # Create FeeStatus record
-            fee_status = FeeStatus.objects.create(
-                student=student,
-                fee_structure=self,
-                amount=monthly_amount,
-                due_date=due_date,
-                status='pending'
-            )
-            
-            payments.append(fee_status)
+        result = {'planned': len(planned), 'existing': 0, 'created': 0, 'fee_statuses': []}
+        if not planned:
+            return result
         
-        return payments
+        with transaction.atomic():
+            with_plan = set(FeeStatus.objects.filter(
+                fee_structure__in=structures,
+                student_id__in=student_ids
+            ).values_list('student_id', 'fee_structure_id').distinct())
+            to_create = [
+                fee_status for fee_status in planned
+                if (fee_status.student_id, fee_status.fee_structure_id) not in with_plan
+            ]
+            result['existing'] = len(planned) - len(to_create)
+            if dry_run or not to_create:
+                return result
+            result['fee_statuses'] = FeeStatus.objects.bulk_create(to_create, batch_size=batch_size)
+            result['created'] = len(to_create)
+            # bulk_create skips post_save, so update the ledger explicitly
+            StudentFeeLedger.schedule_refresh({fee_status.student_id for fee_status in to_create})
+        return result
 
 class Payment(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='payments')
@@ -269,15 +411,18 @@ class Invoice(models.Model):
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.student}"
     
+    @classmethod
+    def next_invoice_numbers(cls, count=1):
+        """The next ``count`` invoice numbers after the latest invoice"""
+        last_invoice = cls.objects.exclude(invoice_number=None).order_by('-id').first()
+        last_number = 0
+        if last_invoice and '-' in last_invoice.invoice_number:
+            last_number = int(last_invoice.invoice_number.split('-')[1])
+        return [f"INV-{number:06d}" for number in range(last_number + 1, last_number + count + 1)]
+    
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            # Generate invoice number
-            last_invoice = Invoice.objects.order_by('-id').first()
-            if last_invoice:
-                last_number = int(last_invoice.invoice_number.split('-')[1]) if '-' in last_invoice.invoice_number else 0
-                self.invoice_number = f"INV-{last_number + 1:06d}"
-            else:
-                self.invoice_number = "INV-000001"
+            self.invoice_number = Invoice.next_invoice_numbers()[0]
         
         # Calculate total amount - ensure both are Decimal
         from decimal import Decimal
@@ -406,21 +551,40 @@ class DonationEvent(models.Model):
         return reverse('donation_event_detail', args=[self.id])
 
     def generate_qr_code(self):
-        print(f"[DEBUG] Generating QR code for event {self.id} ({self.title})")
+        logger.debug("Generating QR code for event %s (%s)", self.id, self.title)
         random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
         qr = qrcode.make(random_str)
         buffer = BytesIO()
         qr.save(buffer, format='PNG')
         filename = f'event_{self.id}_qr.png'
-        print(f"[DEBUG] Saving QR code to: {filename}")
+        logger.debug("Saving QR code to: %s", filename)
         self.qr_code.save(filename, File(buffer), save=False)
 
     def save(self, *args, **kwargs):
-        print(f"[DEBUG] Saving DonationEvent: {self.id} ({self.title})")
+        logger.debug("Saving DonationEvent: %s (%s)", self.id, self.title)
         super().save(*args, **kwargs)  # Save first to get an ID
-        self.generate_qr_code()
-        super().save(*args, **kwargs)  # Save again with QR code
-        print(f"[DEBUG] DonationEvent saved: {self.id} ({self.title})")
+        if not self.qr_code:
+            self.generate_qr_code()
+            super().save(update_fields=['qr_code'])  # Save again with QR code
+        logger.debug("DonationEvent saved: %s (%s)", self.id, self.title)
+
+    @classmethod
+    def adjust_current_amount(cls, event_id, amount):
+        """Add ``amount`` to an event's raised total in the database, without reading it first"""
+        from django.db.models import F
+        if event_id and amount:
+            cls.objects.filter(pk=event_id).update(current_amount=F('current_amount') + amount, updated_at=timezone.now())
+
+    def recalculate_current_amount(self):
+        """Recompute the raised total from the event's completed donations"""
+        from django.db import transaction
+        with transaction.atomic():
+            DonationEvent.objects.select_for_update().filter(pk=self.pk).first()
+            self.current_amount = self.donations.filter(status='completed').aggregate(
+                total=models.Sum('amount')
+            )['total'] or 0
+            DonationEvent.objects.filter(pk=self.pk).update(current_amount=self.current_amount)
+        return self.current_amount
 
     class Meta:
         ordering = ['-created_at']
@@ -458,15 +622,30 @@ class Donation(models.Model):
     def __str__(self):
         return f"{self.donor_name} - {self.amount} - {self.event.title}"
 
+    def _stored_counted(self):
+        stored = Donation.objects.filter(pk=self.pk).values_list('event_id', 'amount', 'status').first() if self.pk else None
+        if stored is None:
+            return None, 0
+        event_id, amount, status = stored
+        return event_id, amount if status == 'completed' else 0
+
+    def counted_amount(self):
+        """What this donation adds to its event's ``current_amount``: completed donations count"""
+        return self.amount if self.status == 'completed' else 0
+
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        super().save(*args, **kwargs)
-        if is_new:
-            self.event.current_amount += self.amount
-            self.event.save()
-        elif self.status == 'completed':
-            self.event.current_amount += self.amount
-            self.event.save()
+        from django.db import transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Move the event total by the change since the donation was loaded, so
+            # concurrent donations to the same event never overwrite each other
+            counted_event_id, counted = self._counted if self._counted is not None else self._stored_counted()
+            if counted_event_id == self.event_id:
+                DonationEvent.adjust_current_amount(self.event_id, self.counted_amount() - counted)
+            else:
+                DonationEvent.adjust_current_amount(counted_event_id, -counted)
+                DonationEvent.adjust_current_amount(self.event_id, self.counted_amount())
+        self._counted = (self.event_id, self.counted_amount())
 
 # PIBG Muafakat Donation Models
 class PibgDonationSettings(models.Model):
@@ -560,9 +739,15 @@ class PibgDonation(models.Model):
             self.receipt_number = f'PIBG{timezone.now().strftime("%Y%m%d%H%M%S")}{int(time.time() * 1000000) % 1000:03d}'
         super().save(*args, **kwargs)
 
-# Temporary placeholder models to prevent migration issues
 class ParentCart(models.Model):
-    parent = models.OneToOneField('Parent', on_delete=models.CASCADE, related_name='cart')
+    """
+    Fee cart of a parent or a student. ``total_amount`` and ``item_count`` are
+    kept up to date on every add/remove so badges and dashboards read one row.
+    """
+    parent = models.OneToOneField('Parent', on_delete=models.CASCADE, related_name='cart', null=True, blank=True)
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='cart', null=True, blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -570,6 +755,126 @@ class ParentCart(models.Model):
         verbose_name = 'Parent Cart'
         verbose_name_plural = 'Parent Carts'
 
+    def __str__(self):
+        owner = self.parent or self.student
+        return f"Cart of {owner} ({self.item_count} items, RM {self.total_amount})"
+
+    @classmethod
+    def for_parent(cls, parent):
+        cart, _ = cls.objects.get_or_create(parent=parent)
+        return cart
+
+    @classmethod
+    def for_student(cls, student):
+        if student is None:
+            # get_or_create(student=None) would hand back a parent's cart
+            raise ValueError('A student cart needs a student')
+        cart, _ = cls.objects.get_or_create(student=student)
+        return cart
+
+    @classmethod
+    def for_user(cls, user):
+        """Cart of a parent or student user in one query; an empty unsaved cart if there is none yet"""
+        from django.db.models import Q
+        cart = cls.objects.filter(Q(parent__user=user) | Q(student__user_profile__user=user)).first()
+        return cart or cls()
+
+    def add_item(self, student, fee_status=None, fee_structure=None, individual_fee=None):
+        """Add a fee to the cart; returns False if it is already in it"""
+        from django.db import transaction
+        if fee_status is not None:
+            FeeStatus.resolve_discounts([fee_status])
+            amount = fee_status.get_discounted_amount()
+            description = f"{fee_status.fee_structure.category.name} - {fee_status.due_date}"
+        elif fee_structure is not None:
+            amount = fee_structure.amount
+            description = fee_structure.category.name
+        else:
+            amount = individual_fee.amount
+            description = individual_fee.name
+
+        with transaction.atomic():
+            _, created = self.items.get_or_create(
+                student=student,
+                fee_status=fee_status,
+                fee_structure=fee_structure,
+                individual_fee=individual_fee,
+                defaults={'amount': amount, 'description': description[:200]},
+            )
+            if created:
+                self._adjust_totals(amount, 1)
+        return created
+
+    def remove_item(self, fee_status_id=None, fee_structure_id=None, individual_fee_id=None):
+        """Remove a fee from the cart; returns False if it was not in it"""
+        from django.db import transaction
+        if fee_status_id:
+            lookup = {'fee_status_id': fee_status_id}
+        elif fee_structure_id:
+            lookup = {'fee_structure_id': fee_structure_id, 'fee_status__isnull': True}
+        elif individual_fee_id:
+            lookup = {'individual_fee_id': individual_fee_id}
+        else:
+            return False
+
+        with transaction.atomic():
+            items = list(self.items.select_for_update().filter(**lookup))
+            if not items:
+                return False
+            self.items.filter(id__in=[item.id for item in items]).delete()
+            self._adjust_totals(-sum(item.amount for item in items), -len(items))
+        return True
+
+    def clear(self):
+        self.items.all().delete()
+        ParentCart.objects.filter(pk=self.pk).update(total_amount=0, item_count=0, updated_at=timezone.now())
+        self.total_amount = 0
+        self.item_count = 0
+
+    def recalculate(self):
+        """Rebuild the cached totals from the items"""
+        from django.db.models import Count, Sum
+        totals = self.items.aggregate(total=Sum('amount'), count=Count('id'))
+        self.total_amount = totals['total'] or 0
+        self.item_count = totals['count']
+        ParentCart.objects.filter(pk=self.pk).update(
+            total_amount=self.total_amount, item_count=self.item_count, updated_at=timezone.now()
+        )
+
+    def as_checkout_cart(self):
+        """The cart as id lists, the format ``CheckoutService.checkout`` expects"""
+        cart = {'fees': [], 'fee_statuses': [], 'individual_fees': []}
+        for fee_status_id, fee_structure_id, individual_fee_id in self.items.values_list(
+            'fee_status_id', 'fee_structure_id', 'individual_fee_id'
+        ).order_by('added_at'):
+            if fee_status_id:
+                cart['fee_statuses'].append(fee_status_id)
+            elif fee_structure_id:
+                cart['fees'].append(fee_structure_id)
+            elif individual_fee_id:
+                cart['individual_fees'].append(individual_fee_id)
+        return cart
+
+    @classmethod
+    def discard(cls, **lookup):
+        """Remove matching items (e.g. a fee paid elsewhere) from every cart; returns the number removed"""
+        cart_ids = set(ParentCartItem.objects.filter(**lookup).values_list('cart_id', flat=True))
+        if not cart_ids:
+            return 0
+        removed, _ = ParentCartItem.objects.filter(**lookup).delete()
+        for cart in cls.objects.filter(id__in=cart_ids):
+            cart.recalculate()
+        return removed
+
+    def _adjust_totals(self, amount, count):
+        from django.db.models import F
+        ParentCart.objects.filter(pk=self.pk).update(
+            total_amount=F('total_amount') + amount,
+            item_count=F('item_count') + count,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=['total_amount', 'item_count'])
+
 class ParentCartItem(models.Model):
     cart = models.ForeignKey(ParentCart, on_delete=models.CASCADE, related_name='items')
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -648,13 +953,14 @@ class FeeStatus(models.Model):
         """Ensure the amount is always consistent with the fee structure for the student's form level"""
         if self.fee_structure:
             # Get the correct amount from the fee structure for this student's form level
-            student_level = self.student.get_level_display_value()
-            if self.fee_structure.form.lower() == student_level.lower():
+            if self.fee_structure.applies_to(self.student):
                 # Use the fee structure amount to ensure consistency
                 if self.fee_structure.frequency == 'monthly' and self.fee_structure.monthly_duration:
                     self.amount = self.fee_structure.get_monthly_amount()
                 else:
                     self.amount = self.fee_structure.amount or 0
+        # Any resolved discount was computed for the previous amount
+        self._discount_info = None
         super().save(*args, **kwargs)
     
     def get_original_amount(self):
@@ -663,80 +969,98 @@ class FeeStatus(models.Model):
     
     def get_discounted_amount(self):
         """Calculate the discounted amount based on approved waivers"""
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        # Get all active approved waivers for this student and fee category
-        active_waivers = FeeWaiver.objects.filter(
-            student=self.student,
-            category=self.fee_structure.category,
-            status='approved',
-            start_date__lte=today,
-            end_date__gte=today
-        )
-        
-        if not active_waivers.exists():
-            return self.amount
+        return self.get_discount_info()['discounted_amount']
+    
+    def get_discount_info(self):
+        """Get information about applied discounts"""
+        if getattr(self, '_discount_info', None) is None:
+            FeeStatus.resolve_discounts([self])
+        return self._discount_info
+    
+    @classmethod
+    def resolve_discounts(cls, fee_statuses, today=None):
+        """
+        Resolve discounts for many fee statuses at once.
+        Fetches every active approved waiver for the (student, category) pairs in a
+        single query and attaches the discount info to each row, so that
+        get_discounted_amount() and get_discount_info() no longer query per row.
+        Accepts a queryset or a list and returns it unchanged (a queryset keeps
+        its evaluated, resolved rows in its result cache).
+        """
+        if today is None:
+            today = timezone.now().date()
         
-        # Calculate total discount
-        total_discount = 0
-        original_amount = self.amount
+        rows = list(fee_statuses)
+        if not rows:
+            return fee_statuses
         
-        for waiver in active_waivers:
-            if waiver.percentage:
-                # Percentage-based discount
-                discount_amount = (original_amount * waiver.percentage) / 100
-                total_discount += discount_amount
+        # Map fee structures to categories without touching rows that already have it loaded
+        category_by_structure = {}
+        missing_structure_ids = set()
+        for fee_status in rows:
+            if FeeStatus.fee_structure.is_cached(fee_status):
+                category_by_structure[fee_status.fee_structure_id] = fee_status.fee_structure.category_id
             else:
-                # Fixed amount discount
-                total_discount += waiver.amount
+                missing_structure_ids.add(fee_status.fee_structure_id)
+        missing_structure_ids -= set(category_by_structure)
+        if missing_structure_ids:
+            category_by_structure.update(
+                FeeStructure.objects.filter(id__in=missing_structure_ids).values_list('id', 'category_id')
+            )
         
-        # Ensure discount doesn't exceed original amount
-        discounted_amount = max(0, original_amount - total_discount)
-        return discounted_amount
-    
-    def get_discount_info(self):
-        """Get information about applied discounts"""
-        from django.utils import timezone
-        today = timezone.now().date()
+        student_ids = {fee_status.student_id for fee_status in rows}
+        category_ids = set(category_by_structure.values())
         
+        waivers_by_pair = {}
         active_waivers = FeeWaiver.objects.filter(
-            student=self.student,
-            category=self.fee_structure.category,
+            student_id__in=student_ids,
+            category_id__in=category_ids,
             status='approved',
             start_date__lte=today,
             end_date__gte=today
         )
+        for waiver in active_waivers:
+            waivers_by_pair.setdefault((waiver.student_id, waiver.category_id), []).append(waiver)
+        
+        for fee_status in rows:
+            category_id = category_by_structure.get(fee_status.fee_structure_id)
+            waivers = waivers_by_pair.get((fee_status.student_id, category_id), [])
+            fee_status._discount_info = cls._build_discount_info(fee_status.amount, waivers)
         
+        return fee_statuses
+    
+    @staticmethod
+    def _build_discount_info(amount, waivers):
+        """Build the discount info dictionary for an amount and its active waivers"""
         discount_info = {
             'has_discount': False,
-            'original_amount': self.amount,
-            'discounted_amount': self.amount,
+            'original_amount': amount,
+            'discounted_amount': amount,
             'total_discount': 0,
             'waivers': []
         }
         
-        if active_waivers.exists():
+        if waivers:
             discount_info['has_discount'] = True
             total_discount = 0
             
-            for waiver in active_waivers:
+            for waiver in waivers:
                 waiver_info = {
                     'type': waiver.get_waiver_type_display(),
                     'reason': waiver.reason,
                     'amount': waiver.amount,
                     'percentage': waiver.percentage,
-                    'discount_amount': waiver.calculate_discount_amount(self.amount)
+                    'discount_amount': waiver.calculate_discount_amount(amount)
                 }
                 discount_info['waivers'].append(waiver_info)
                 
                 if waiver.percentage:
-                    total_discount += (self.amount * waiver.percentage) / 100
+                    total_discount += (amount * waiver.percentage) / 100
                 else:
                     total_discount += waiver.amount
             
             discount_info['total_discount'] = total_discount
-            discount_info['discounted_amount'] = max(0, self.amount - total_discount)
+            discount_info['discounted_amount'] = max(0, amount - total_discount)
         
         return discount_info
 
@@ -784,6 +1108,207 @@ class FeeWaiver(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class StudentFeeLedger(models.Model):
+    """
+    Denormalized per-student fee totals, kept current by the save/delete hooks on
+    FeeStatus, Payment, IndividualStudentFee and FeeWaiver (see the receivers at the
+    bottom of this module). Queryset .update() calls bypass those hooks and must call
+    StudentFeeLedger.refresh_students() themselves.
+
+    The overdue figures and discounted_amount also change with the date (fees fall
+    due, waivers start and end) without any write, so deployments run
+    ``rebuild_fee_ledger --mark-overdue`` daily to bring them up to date.
+    """
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='fee_ledger')
+    outstanding_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of pending/overdue fee statuses")
+    outstanding_count = models.IntegerField(default=0)
+    individual_outstanding_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of unpaid active individual fees")
+    individual_outstanding_count = models.IntegerField(default=0)
+    overdue_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overdue_count = models.IntegerField(default=0)
+    discounted_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Outstanding fee statuses after approved waivers are applied")
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Sum of completed payments")
+    payment_count = models.IntegerField(default=0)
+    completed_payment_count = models.IntegerField(default=0)
+    pending_payment_count = models.IntegerField(default=0)
+    pending_payment_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Student Fee Ledger'
+        verbose_name_plural = 'Student Fee Ledgers'
+
+    def __str__(self):
+        return f"Ledger for {self.student} (outstanding RM {self.total_outstanding_amount})"
+
+    @property
+    def total_outstanding_amount(self):
+        return self.outstanding_amount + self.individual_outstanding_amount
+
+    @property
+    def total_outstanding_count(self):
+        return self.outstanding_count + self.individual_outstanding_count
+
+    @classmethod
+    def compute_totals(cls, student_ids):
+        """Compute ledger values for the given students with grouped aggregate queries"""
+        from decimal import Decimal
+        from django.db.models import Sum, Count, Max, Q
+
+        zero = Decimal('0.00')
+        student_ids = list(student_ids)
+        totals = {
+            student_id: {
+                'outstanding_amount': zero,
+                'outstanding_count': 0,
+                'individual_outstanding_amount': zero,
+                'individual_outstanding_count': 0,
+                'overdue_amount': zero,
+                'overdue_count': 0,
+                'discounted_amount': zero,
+                'paid_amount': zero,
+                'payment_count': 0,
+                'completed_payment_count': 0,
+                'pending_payment_count': 0,
+                'pending_payment_amount': zero,
+                'last_payment_at': None,
+            }
+            for student_id in student_ids
+        }
+        if not totals:
+            return totals
+
+        outstanding_statuses = FeeStatus.objects.filter(
+            student_id__in=student_ids,
+            status__in=['pending', 'overdue']
+        ).select_related('fee_structure')
+        for fee_status in FeeStatus.resolve_discounts(outstanding_statuses):
+            row = totals[fee_status.student_id]
+            row['outstanding_amount'] += fee_status.amount
+            row['outstanding_count'] += 1
+            row['discounted_amount'] += fee_status.get_discounted_amount()
+            if fee_status.status == 'overdue':
+                row['overdue_amount'] += fee_status.amount
+                row['overdue_count'] += 1
+
+        individual_totals = IndividualStudentFee.objects.filter(
+            student_id__in=student_ids,
+            is_paid=False,
+            is_active=True
+        ).values('student_id').annotate(total=Sum('amount'), count=Count('id')).order_by()
+        for item in individual_totals:
+            row = totals[item['student_id']]
+            row['individual_outstanding_amount'] = item['total'] or zero
+            row['individual_outstanding_count'] = item['count']
+
+        payment_totals = Payment.objects.filter(
+            student_id__in=student_ids
+        ).values('student_id').annotate(
+            count=Count('id'),
+            completed_count=Count('id', filter=Q(status='completed')),
+            completed_total=Sum('amount', filter=Q(status='completed')),
+            pending_count=Count('id', filter=Q(status='pending')),
+            pending_total=Sum('amount', filter=Q(status='pending')),
+            last_payment_at=Max('created_at', filter=Q(status='completed')),
+        ).order_by()
+        for item in payment_totals:
+            row = totals[item['student_id']]
+            row['payment_count'] = item['count']
+            row['completed_payment_count'] = item['completed_count']
+            row['paid_amount'] = item['completed_total'] or zero
+            row['pending_payment_count'] = item['pending_count']
+            row['pending_payment_amount'] = item['pending_total'] or zero
+            row['last_payment_at'] = item['last_payment_at']
+
+        cent = Decimal('0.01')
+        for row in totals.values():
+            for field, value in row.items():
+                if isinstance(value, Decimal):
+                    row[field] = value.quantize(cent)
+        return totals
+
+    @classmethod
+    def refresh_students(cls, student_ids):
+        """Recompute and store the ledger rows for the given students"""
+        from django.db import transaction
+
+        student_ids = set(Student.objects.filter(id__in=set(student_ids)).values_list('id', flat=True))
+        if not student_ids:
+            return 0
+
+        totals = cls.compute_totals(student_ids)
+        fields = list(next(iter(totals.values())).keys())
+        with transaction.atomic():
+            existing = {
+                ledger.student_id: ledger
+                for ledger in cls.objects.select_for_update().filter(student_id__in=student_ids)
+            }
+            to_create = []
+            now = timezone.now()
+            for student_id, values in totals.items():
+                ledger = existing.get(student_id) or cls(student_id=student_id)
+                for field, value in values.items():
+                    setattr(ledger, field, value)
+                ledger.updated_at = now
+                if student_id not in existing:
+                    to_create.append(ledger)
+            if to_create:
+                cls.objects.bulk_create(to_create)
+            if existing:
+                cls.objects.bulk_update(list(existing.values()), fields + ['updated_at'])
+        return len(totals)
+
+    @classmethod
+    def for_students(cls, students):
+        """
+        Return {student_id: ledger} for the given students, building any missing rows.
+        Students loaded with select_related('fee_ledger') cost no extra queries.
+        """
+        ledgers = {}
+        missing_ids = []
+        for student in students:
+            try:
+                ledgers[student.id] = student.fee_ledger
+            except cls.DoesNotExist:
+                missing_ids.append(student.id)
+        if missing_ids:
+            cls.refresh_students(missing_ids)
+            ledgers.update({ledger.student_id: ledger for ledger in cls.objects.filter(student_id__in=missing_ids)})
+        return ledgers
+
+    @classmethod
+    def refresh_missing(cls, students=None):
+        """Build ledger rows for students (all by default) that do not have one yet"""
+        if students is None:
+            students = Student.objects.all()
+        missing_ids = list(students.filter(fee_ledger__isnull=True).values_list('id', flat=True))
+        if missing_ids:
+            cls.refresh_students(missing_ids)
+        return len(missing_ids)
+
+    @classmethod
+    def schedule_refresh(cls, student_ids):
+        """
+        Refresh the given students once the current transaction commits.
+        Ids scheduled within the same transaction are merged into a single refresh.
+        """
+        from django.db import connection, transaction
+
+        pending = getattr(connection, '_fee_ledger_pending', None)
+        if pending is None:
+            pending = connection._fee_ledger_pending = set()
+        pending.update(student_id for student_id in student_ids if student_id)
+
+        def run():
+            # The first callback to run refreshes everything scheduled so far
+            ids = set(pending)
+            pending.clear()
+            if ids:
+                cls.refresh_students(ids)
+
+        transaction.on_commit(run)
+
 class FeeSettings(models.Model):
     fee_mode = models.CharField(
         max_length=10,
@@ -1000,5 +1525,308 @@ class PredefinedDonationAmount(models.Model):
         return f"RM{self.amount:,.2f}"
 
 
+class OutboundEmail(models.Model):
+    """
+    Outbox row for one email to one recipient. Views enqueue and return; the
+    ``process_outbox`` command sends the rows (see ``myapp.outbox_services``).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    idempotency_key = models.CharField(max_length=200, unique=True)
+    recipient = models.EmailField(db_index=True)
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+            models.Index(fields=['recipient', 'sent_at'], name='outbox_recipient_sent_idx'),
+        ]
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
 
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.status})"
 
+    @classmethod
+    def enqueue(cls, recipients, subject, body, html_body='', from_email=None, idempotency_key=None):
+        """
+        Queue one email per recipient and return how many were newly queued.
+
+        With an ``idempotency_key`` a repeated call (double click, retried
+        request) queues nothing for recipients that already have that message.
+        """
+        return cls.enqueue_many([{
+            'recipients': recipients,
+            'subject': subject,
+            'body': body,
+            'html_body': html_body,
+            'from_email': from_email,
+            'idempotency_key': idempotency_key,
+        }])
+
+    @classmethod
+    def enqueue_many(cls, messages):
+        """Bulk version of ``enqueue`` taking dicts of its arguments; one lookup and one insert"""
+        import uuid
+        rows = {}
+        for message in messages:
+            key = message.get('idempotency_key') or uuid.uuid4().hex
+            for recipient in dict.fromkeys(r for r in message['recipients'] if r):
+                row_key = f'{key}:{recipient}'[:200]
+                rows[row_key] = cls(
+                    idempotency_key=row_key,
+                    recipient=recipient,
+                    from_email=message.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+                    subject=message['subject'][:255],
+                    body=message['body'],
+                    html_body=message.get('html_body') or '',
+                )
+        existing = set(cls.objects.filter(idempotency_key__in=rows).values_list('idempotency_key', flat=True))
+        new_rows = [row for row_key, row in rows.items() if row_key not in existing]
+        cls.objects.bulk_create(new_rows, batch_size=500, ignore_conflicts=True)
+        return len(new_rows)
+
+
+class ReminderCampaign(models.Model):
+    """
+    One bulk run of payment reminders: every family with outstanding fees gets
+    a single consolidated email through the outbox. Progress is checkpointed per
+    batch (``last_family_key``) so an interrupted run resumes where it stopped.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    include_overdue = models.BooleanField(default=True)
+    upcoming_days = models.PositiveIntegerField(default=7, help_text="Also remind fees due within this many days (0 for none)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total_families = models.PositiveIntegerField(default=0)
+    processed_families = models.PositiveIntegerField(default=0)
+    skipped_families = models.PositiveIntegerField(default=0)
+    queued_emails = models.PositiveIntegerField(default=0)
+    reminded_fees = models.PositiveIntegerField(default=0)
+    last_family_key = models.CharField(max_length=50, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Reminder Campaign'
+        verbose_name_plural = 'Reminder Campaigns'
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+    @property
+    def progress_percent(self):
+        if not self.total_families:
+            return 100 if self.status == 'completed' else 0
+        return int((self.processed_families + self.skipped_families) * 100 / self.total_families)
+
+    def as_progress_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total_families': self.total_families,
+            'processed_families': self.processed_families,
+            'skipped_families': self.skipped_families,
+            'queued_emails': self.queued_emails,
+            'reminded_fees': self.reminded_fees,
+            'progress_percent': self.progress_percent,
+            'error': self.error,
+        }
+
+def report_export_path(instance, filename):
+    """A random name, so an export can't be found from its report name and time"""
+    return f"report_exports/{uuid.uuid4().hex}{os.path.splitext(filename)[1]}"
+
+
+class ReportExport(models.Model):
+    """A PDF report generated in the background and kept for download"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    report = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    filename = models.CharField(max_length=255, blank=True)
+    file = models.FileField(upload_to=report_export_path, storage=private_storage, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_exports')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Report Export'
+        verbose_name_plural = 'Report Exports'
+
+    def __str__(self):
+        return f"{self.filename or self.report} ({self.get_status_display()})"
+
+class PaymentDailyRollup(models.Model):
+    """
+    Payment totals per day, fee category, form level, payment method and status.
+    Rows are rebuilt a whole day at a time by ``myapp.rollup_services``.
+    """
+    day = models.DateField()
+    category = models.ForeignKey(FeeCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    form_level = models.PositiveSmallIntegerField(null=True, blank=True)
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        indexes = [models.Index(fields=['day', 'status'], name='payment_rollup_day_status_idx')]
+        verbose_name = 'Payment Daily Rollup'
+        verbose_name_plural = 'Payment Daily Rollups'
+
+    def __str__(self):
+        return f"{self.day} {self.status} {self.payment_method}: {self.total_amount}"
+
+
+class DonationDailyRollup(models.Model):
+    """Donation totals per day, event, payment method and status"""
+    day = models.DateField()
+    event = models.ForeignKey(DonationEvent, on_delete=models.CASCADE, related_name='daily_rollups')
+    payment_method = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        indexes = [models.Index(fields=['event', 'day'], name='donation_rollup_event_day_idx')]
+        verbose_name = 'Donation Daily Rollup'
+        verbose_name_plural = 'Donation Daily Rollups'
+
+    def __str__(self):
+        return f"{self.event_id} {self.day} {self.status}: {self.total_amount}"
+
+
+class RollupCheckpoint(models.Model):
+    """High-water mark of the source rows already folded into a rollup table"""
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    days_refreshed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water_mark}"
+
+# Keep StudentFeeLedger in sync with the rows it summarizes
+from django.db.models.signals import post_init, post_save, post_delete, post_migrate, pre_delete
+from django.dispatch import receiver
+
+
+@receiver(post_save, sender=FeeStatus)
+@receiver(post_delete, sender=FeeStatus)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=IndividualStudentFee)
+@receiver(post_delete, sender=IndividualStudentFee)
+@receiver(post_save, sender=FeeWaiver)
+@receiver(post_delete, sender=FeeWaiver)
+def refresh_student_fee_ledger(sender, instance, **kwargs):
+    """Schedule a ledger refresh for the student whose fees or payments changed"""
+    StudentFeeLedger.schedule_refresh([instance.student_id])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=FeeWaiver)
+@receiver(post_delete, sender=FeeWaiver)
+@receiver(post_save, sender=FeeStructure)
+@receiver(post_delete, sender=FeeStructure)
+@receiver(post_save, sender=FeeCategory)
+@receiver(post_delete, sender=FeeCategory)
+def invalidate_fee_reports(sender, **kwargs):
+    """Cached fee report figures are stale once a change to any row they are computed from commits"""
+    from django.db import transaction
+    from .fee_report_services import invalidate_fee_report_cache
+    transaction.on_commit(invalidate_fee_report_cache)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_rollup_day(sender, instance, **kwargs):
+    """Keep the loaded payment date so a moved payment also refreshes its old day"""
+    instance._rollup_day = instance.payment_date
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_payment_rollups(sender, instance, **kwargs):
+    from .rollup_services import PAYMENTS, schedule_refresh
+    schedule_refresh(PAYMENTS, {instance.payment_date, getattr(instance, '_rollup_day', None)})
+    instance._rollup_day = instance.payment_date
+
+
+@receiver(post_init, sender=Donation)
+def remember_counted_donation(sender, instance, **kwargs):
+    """Keep what the loaded donation adds to its event, so saves only apply the change"""
+    if not instance.pk:
+        instance._counted = (None, 0)
+    elif {'event_id', 'amount', 'status'} & instance.get_deferred_fields():
+        # Read lazily in save() rather than loading deferred fields for every row
+        instance._counted = None
+    else:
+        instance._counted = (instance.event_id, instance.counted_amount())
+
+
+@receiver(pre_delete, sender=Donation)
+def release_donation_amount(sender, instance, **kwargs):
+    """Take a deleted donation off its event's total, in the same transaction as the delete"""
+    event_id, counted = instance._counted if instance._counted is not None else instance._stored_counted()
+    DonationEvent.adjust_current_amount(event_id, -counted)
+
+
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def refresh_donation_rollups(sender, instance, **kwargs):
+    from .rollup_services import DONATIONS, schedule_refresh
+    if instance.created_at:
+        schedule_refresh(DONATIONS, [timezone.localdate(instance.created_at)])
+
+
+@receiver(post_save, sender=DonationEvent)
+@receiver(post_delete, sender=DonationEvent)
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+@receiver(post_migrate)
+def invalidate_cached_chat_responses(sender, **kwargs):
+    """Cached chat answers list events and their totals; a migration also means new code"""
+    from django.db import transaction
+    from donation.response_cache import invalidate_chat_responses
+    transaction.on_commit(invalidate_chat_responses)
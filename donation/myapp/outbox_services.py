@@ -0,0 +1,160 @@
+"""
+Delivery of queued ``OutboundEmail`` rows.
+
+``OutboxWorker.run_once`` claims a batch of due rows, spreads them over a thread
+pool (one SMTP connection per thread) and records the outcome of each. Failed
+sends are retried with exponential backoff until ``max_attempts``; recipients
+over the per-recipient rate limit are deferred rather than sent.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Send due outbox rows; see ``process_outbox`` for the command-line entry point"""
+
+    def __init__(self, batch_size=50, workers=4):
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.base_delay = getattr(settings, 'OUTBOX_RETRY_BASE_DELAY', 60)
+        self.max_delay = getattr(settings, 'OUTBOX_RETRY_MAX_DELAY', 3600)
+        self.rate_limit = getattr(settings, 'OUTBOX_RATE_LIMIT', 10)
+        self.rate_window = timedelta(seconds=getattr(settings, 'OUTBOX_RATE_WINDOW', 3600))
+        # Rows left in 'sending' this long belong to a crashed worker and are picked up again
+        self.sending_timeout = timedelta(seconds=getattr(settings, 'OUTBOX_SENDING_TIMEOUT', 600))
+
+    def run_once(self):
+        """Process one batch and return counts of sent, retried, failed and deferred rows"""
+        result = {'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+        rows = self._claim()
+        if not rows:
+            return result
+
+        now = timezone.now()
+        rows, deferred = self._apply_rate_limit(rows, now)
+        for row in deferred:
+            row.status = 'pending'
+            row.updated_at = now
+        result['deferred'] = len(deferred)
+
+        chunks = [rows[i::self.workers] for i in range(self.workers) if rows[i::self.workers]]
+        with ThreadPoolExecutor(max_workers=len(chunks) or 1) as pool:
+            outcomes = [outcome for chunk_outcomes in pool.map(self._send_chunk, chunks) for outcome in chunk_outcomes]
+
+        now = timezone.now()
+        for row, error in outcomes:
+            row.attempts += 1
+            row.updated_at = now
+            if error is None:
+                row.status = 'sent'
+                row.sent_at = now
+                row.last_error = ''
+                result['sent'] += 1
+            elif row.attempts >= row.max_attempts:
+                row.status = 'failed'
+                row.last_error = str(error)
+                result['failed'] += 1
+                logger.warning("Giving up on email %s to %s after %s attempts: %s", row.id, row.recipient, row.attempts, error)
+            else:
+                row.status = 'pending'
+                row.last_error = str(error)
+                row.next_attempt_at = now + self.backoff(row.attempts)
+                result['retried'] += 1
+                logger.info("Email %s to %s failed (attempt %s), retrying at %s", row.id, row.recipient, row.attempts, row.next_attempt_at)
+
+        OutboundEmail.objects.bulk_update(
+            [row for row, _ in outcomes] + deferred,
+            ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'updated_at'],
+        )
+        return result
+
+    def backoff(self, attempts):
+        return timedelta(seconds=min(self.base_delay * 2 ** (attempts - 1), self.max_delay))
+
+    def _claim(self):
+        """Mark a batch of due rows as 'sending' so concurrent workers skip them"""
+        now = timezone.now()
+        with transaction.atomic():
+            rows = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+                    Q(status='pending', next_attempt_at__lte=now) |
+                    Q(status='sending', updated_at__lt=now - self.sending_timeout)
+                ).order_by('next_attempt_at', 'id')[:self.batch_size]
+            )
+            if rows:
+                OutboundEmail.objects.filter(id__in=[row.id for row in rows]).update(status='sending', updated_at=now)
+        return rows
+
+    def _apply_rate_limit(self, rows, now):
+        """
+        Split rows into those that may be sent now and those deferred by the
+        rate limit. Rows other workers have claimed ('sending') count against
+        the limit too; of those only the ones with a lower id than the row at
+        hand, so two workers never defer each other's rows at the same time.
+        """
+        window_start = now - self.rate_window
+        recipients = {row.recipient for row in rows}
+        recent = {
+            entry['recipient']: entry
+            for entry in OutboundEmail.objects.filter(
+                recipient__in=recipients, status='sent', sent_at__gte=window_start
+            ).values('recipient').annotate(count=Count('id'), oldest=Min('sent_at'))
+        }
+        in_flight = {}
+        for recipient, row_id in OutboundEmail.objects.filter(
+            recipient__in=recipients, status='sending', updated_at__gte=now - self.sending_timeout
+        ).exclude(id__in=[row.id for row in rows]).values_list('recipient', 'id'):
+            in_flight.setdefault(recipient, []).append(row_id)
+
+        allowed, deferred = [], []
+        counts = {recipient: entry['count'] for recipient, entry in recent.items()}
+        for row in rows:
+            count = counts.get(row.recipient, 0)
+            if count >= self.rate_limit:
+                oldest = recent.get(row.recipient, {}).get('oldest') or now
+                row.next_attempt_at = max(oldest + self.rate_window, now + timedelta(seconds=1))
+                deferred.append(row)
+                continue
+            if count + sum(1 for row_id in in_flight.get(row.recipient, ()) if row_id < row.id) >= self.rate_limit:
+                # Look again once the other worker's sends are recorded
+                row.next_attempt_at = now + timedelta(seconds=self.base_delay)
+                deferred.append(row)
+                continue
+            counts[row.recipient] = count + 1
+            allowed.append(row)
+        return allowed, deferred
+
+    def _send_chunk(self, rows):
+        """Send rows over one connection; runs in a pool thread and does not touch the DB"""
+        try:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+        except Exception as e:
+            return [(row, e) for row in rows]
+        outcomes = []
+        try:
+            for row in rows:
+                message = EmailMultiAlternatives(
+                    row.subject, row.body, row.from_email, [row.recipient], connection=connection
+                )
+                if row.html_body:
+                    message.attach_alternative(row.html_body, 'text/html')
+                try:
+                    message.send()
+                    outcomes.append((row, None))
+                except Exception as e:
+                    outcomes.append((row, e))
+        finally:
+            connection.close()
+        return outcomes
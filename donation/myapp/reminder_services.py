@@ -0,0 +1,217 @@
+"""
+Bulk payment-reminder campaigns.
+
+``ReminderCampaignRunner`` loads every outstanding fee in scope with one
+annotated query, groups the fees per family (a student's parent, or the
+student when no parent is linked), renders one consolidated email per family
+in batches and queues them in the outbox, where ``process_outbox`` sends them
+through its thread pool under the per-recipient rate limit. Each batch commits
+its emails, its ``PaymentReminder`` records and the campaign checkpoint
+together, so a crashed run resumes after the last committed family without
+sending anything twice. A runner claims its campaign with one conditional
+UPDATE first, so two polling processes never run the same campaign.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Min, Q
+from django.db.models.functions import Coalesce
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import FeeStatus, OutboundEmail, PaymentReminder, ReminderCampaign
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderCampaignRunner:
+    """Run (or resume) one ``ReminderCampaign``"""
+
+    template_name = 'myapp/email/family_reminder_email.html'
+
+    def __init__(self, campaign, batch_size=200, pause=0, stale_after=timedelta(minutes=10)):
+        self.campaign = campaign
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stale_after = stale_after
+
+    @staticmethod
+    def _stale(stale_after):
+        """Running campaigns whose worker stopped sending heartbeats"""
+        return Q(status='running', heartbeat_at__lt=timezone.now() - stale_after)
+
+    @classmethod
+    def resumable(cls, stale_after=timedelta(minutes=10)):
+        """Queued campaigns plus running ones whose worker stopped sending heartbeats"""
+        return ReminderCampaign.objects.filter(Q(status='queued') | cls._stale(stale_after)).order_by('created_at')
+
+    def claim(self):
+        """
+        Mark the campaign running for this runner. Failed and finished
+        campaigns can be claimed again (to resume from their checkpoint);
+        one another runner is working on cannot. Returns whether it was claimed.
+        """
+        now = timezone.now()
+        claimed = ReminderCampaign.objects.filter(
+            Q(status__in=['queued', 'failed', 'completed']) | self._stale(self.stale_after), id=self.campaign.id
+        ).update(status='running', started_at=Coalesce('started_at', now), heartbeat_at=now, error='')
+        if claimed:
+            # Pick up the checkpoint of whichever worker ran it last
+            self.campaign.refresh_from_db()
+        return bool(claimed)
+
+    def fee_statuses(self, today):
+        """Outstanding fees in the campaign's scope, annotated with their family"""
+        scope = Q()
+        if self.campaign.include_overdue:
+            scope |= Q(due_date__lt=today)
+        if self.campaign.upcoming_days:
+            scope |= Q(due_date__gte=today, due_date__lte=today + timedelta(days=self.campaign.upcoming_days))
+        if not scope:
+            return FeeStatus.objects.none()
+        return (
+            FeeStatus.objects.filter(scope, status__in=['pending', 'overdue'], student__is_active=True)
+            .select_related('student', 'fee_structure__category')
+            .annotate(
+                family_parent_id=Min('student__parents__id'),
+                parent_email=Min('student__parents__user__email'),
+                student_email=Min('student__user_profile__user__email'),
+            )
+            .order_by('id')
+        )
+
+    def collect_families(self, today):
+        """Family key -> recipient and fees; keys sort stably so they can be checkpointed"""
+        families = {}
+        for fee_status in self.fee_statuses(today):
+            if fee_status.family_parent_id:
+                key = f'p{fee_status.family_parent_id:010d}'
+            else:
+                key = f's{fee_status.student_id:010d}'
+            family = families.setdefault(key, {'recipient': None, 'fee_statuses': []})
+            family['recipient'] = family['recipient'] or fee_status.parent_email or fee_status.student_email
+            family['fee_statuses'].append(fee_status)
+        return families
+
+    def run(self):
+        """Run the campaign; returns None without running when another runner has it"""
+        campaign = self.campaign
+        if not self.claim():
+            logger.info("Reminder campaign %s is already being run", campaign.id)
+            return None
+        today = timezone.now().date()
+        families = self.collect_families(today)
+        pending_keys = sorted(key for key in families if key > campaign.last_family_key)
+        # Families handled before an interruption still count towards the total
+        campaign.total_families = campaign.processed_families + campaign.skipped_families + len(pending_keys)
+        campaign.heartbeat_at = timezone.now()
+        campaign.save(update_fields=['total_families', 'heartbeat_at'])
+
+        template = get_template(self.template_name)
+        logger.info("Reminder campaign %s: %s families to process", campaign.id, len(pending_keys))
+        try:
+            for start in range(0, len(pending_keys), self.batch_size):
+                self._process_batch(pending_keys[start:start + self.batch_size], families, template, today)
+                if self.pause:
+                    time.sleep(self.pause)
+        except Exception as e:
+            logger.exception("Reminder campaign %s failed", campaign.id)
+            campaign.status = 'failed'
+            campaign.error = str(e)
+            campaign.save(update_fields=['status', 'error'])
+            raise
+
+        campaign.status = 'completed'
+        campaign.finished_at = timezone.now()
+        campaign.save(update_fields=['status', 'finished_at'])
+        return campaign
+
+    def _process_batch(self, keys, families, template, today):
+        campaign = self.campaign
+        FeeStatus.resolve_discounts(
+            [fee_status for key in keys for fee_status in families[key]['fee_statuses']], today=today
+        )
+
+        emails = []
+        reminded = []
+        skipped = 0
+        for key in keys:
+            family = families[key]
+            if not family['recipient']:
+                skipped += 1
+                continue
+            items = [
+                {
+                    'fee_status': fee_status,
+                    'amount_to_pay': fee_status.get_discounted_amount(),
+                    'is_overdue': fee_status.due_date < today,
+                }
+                for fee_status in family['fee_statuses']
+            ]
+            html_message = template.render({
+                'items': items,
+                'students': list({item['fee_status'].student_id: item['fee_status'].student for item in items}.values()),
+                'total_amount': sum(item['amount_to_pay'] for item in items),
+                'has_overdue': any(item['is_overdue'] for item in items),
+                'now': today,
+            })
+            emails.append({
+                'recipients': [family['recipient']],
+                'subject': f'Payment Reminder - {len(items)} outstanding fee(s)',
+                'body': strip_tags(html_message),
+                'html_body': html_message,
+                'idempotency_key': f'reminder-campaign:{campaign.id}:{key}',
+            })
+            reminded.extend(family['fee_statuses'])
+
+        with transaction.atomic():
+            queued = OutboundEmail.enqueue_many(emails)
+            self._record_reminders(reminded)
+            campaign.processed_families += len(keys) - skipped
+            campaign.skipped_families += skipped
+            campaign.queued_emails += queued
+            campaign.reminded_fees += len(reminded)
+            campaign.last_family_key = keys[-1]
+            campaign.heartbeat_at = timezone.now()
+            campaign.save(update_fields=[
+                'processed_families', 'skipped_families', 'queued_emails', 'reminded_fees',
+                'last_family_key', 'heartbeat_at',
+            ])
+
+    def _record_reminders(self, fee_statuses):
+        """Create or bump the PaymentReminder row of each reminded fee"""
+        if not fee_statuses:
+            return
+        now = timezone.now()
+        existing = {
+            (reminder.student_id, reminder.fee_structure_id, reminder.due_date): reminder
+            for reminder in PaymentReminder.objects.filter(
+                student_id__in={fs.student_id for fs in fee_statuses},
+                fee_structure_id__in={fs.fee_structure_id for fs in fee_statuses},
+            )
+        }
+        to_update, to_create = [], []
+        for fee_status in fee_statuses:
+            reminder = existing.get((fee_status.student_id, fee_status.fee_structure_id, fee_status.due_date))
+            if reminder is None:
+                to_create.append(PaymentReminder(
+                    student_id=fee_status.student_id,
+                    fee_structure_id=fee_status.fee_structure_id,
+                    due_date=fee_status.due_date,
+                    status='sent',
+                    reminder_count=1,
+                    last_reminder_sent=now,
+                ))
+            else:
+                reminder.status = 'sent'
+                reminder.reminder_count += 1
+                reminder.last_reminder_sent = now
+                reminder.updated_at = now
+                to_update.append(reminder)
+        PaymentReminder.objects.bulk_create(to_create, batch_size=500)
+        PaymentReminder.objects.bulk_update(
+            to_update, ['status', 'reminder_count', 'last_reminder_sent', 'updated_at'], batch_size=500
+        )
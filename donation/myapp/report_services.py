@@ -0,0 +1,337 @@
+"""
+Shared PDF report engine.
+
+Paragraph and table styles are built once per process (``report_styles`` and
+``table_style``) instead of on every download. Long listings are split into
+row-chunked tables (``chunked_tables``) so reportlab never has to measure and
+re-split one huge table across pages. ``PdfReport`` writes the document into
+a temporary file that is streamed back with ``FileResponse``, so the worker
+does not hold a second copy of the PDF in memory.
+
+Large reports can also be produced in the background: ``start_export`` records
+a ``ReportExport``, builds it on a small thread pool after the request commits
+and emails the requester a download link when the file is ready. Files are
+kept in private storage under random names (see ``donation/storage.py``) and
+only served by ``report_export_download``. The pool lives in the web worker,
+so a restart loses its jobs; ``resume_stale_exports`` starts exports left
+queued or running for ``REPORT_EXPORT_STALE_MINUTES`` again, and ``run_export``
+claims its row first so an export is never built twice at once.
+"""
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import FileResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .directory_services import filter_students
+from .models import OutboundEmail, ReportExport
+
+logger = logging.getLogger(__name__)
+
+# Rows per table flowable in chunked listings
+ROW_CHUNK = 500
+
+_reports = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def report_styles():
+    """Paragraph styles shared by all reports"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    return {
+        'normal': styles['Normal'],
+        'title': ParagraphStyle(
+            'ReportTitle', parent=styles['Heading1'], fontSize=18, spaceAfter=30,
+            alignment=TA_CENTER, textColor=colors.darkblue
+        ),
+        'header': ParagraphStyle(
+            'ReportHeader', parent=styles['Heading2'], fontSize=14, spaceAfter=12,
+            alignment=TA_LEFT, textColor=colors.darkblue
+        ),
+        'subheader': ParagraphStyle(
+            'ReportSubHeader', parent=styles['Heading3'], fontSize=12, spaceAfter=8,
+            alignment=TA_LEFT, textColor=colors.darkblue
+        ),
+    }
+
+
+@lru_cache(maxsize=None)
+def table_style(kind='grid', font_size=10, body_font_size=None, align='CENTER', padding=6):
+    """
+    Table style shared by all tables of the same look.
+
+    ``grid`` has a grey header over a beige body, ``banded`` (and
+    ``banded_green``) a dark blue (green) header over alternating rows.
+    """
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    body_font_size = body_font_size or font_size
+    if kind == 'grid':
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), align),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), font_size),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), body_font_size),
+        ])
+    if kind in ('banded', 'banded_green'):
+        header_color, row_color = (colors.darkblue, colors.beige) if kind == 'banded' else (colors.darkgreen, colors.lightgreen)
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), header_color),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), align),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, 0), font_size),
+            ('FONTSIZE', (0, 1), (-1, -1), body_font_size),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), padding),
+            ('TOPPADDING', (0, 0), (-1, -1), padding),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [row_color, colors.white]),
+        ])
+    raise ValueError(f'Unknown table style: {kind}')
+
+
+def chunked_tables(header, rows, style, col_widths=None, chunk_size=ROW_CHUNK):
+    """Yield tables of at most ``chunk_size`` rows, each repeating ``header``"""
+    from reportlab.platypus import Table
+
+    chunk = [header]
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) > chunk_size:
+            yield Table(chunk, colWidths=col_widths, style=style, repeatRows=1)
+            chunk = [header]
+    if len(chunk) > 1:
+        yield Table(chunk, colWidths=col_widths, style=style, repeatRows=1)
+
+
+class PdfReport:
+    """A PDF written to a temporary file and streamed back as a download"""
+
+    def __init__(self, filename, pagesize=None, margins=(72, 72, 72, 18)):
+        from reportlab.lib.pagesizes import A4
+
+        self.filename = filename
+        self.pagesize = pagesize or A4
+        self.margins = margins
+        self.file = tempfile.TemporaryFile(suffix='.pdf')
+
+    def build(self, story):
+        """Lay out ``story`` (a list of flowables) into the file"""
+        from reportlab.platypus import SimpleDocTemplate
+
+        right, left, top, bottom = self.margins
+        doc = SimpleDocTemplate(
+            self.file, pagesize=self.pagesize,
+            rightMargin=right, leftMargin=left, topMargin=top, bottomMargin=bottom
+        )
+        doc.build(story)
+        return self
+
+    def canvas(self):
+        """A canvas drawing into the file, for hand-positioned documents"""
+        from reportlab.pdfgen import canvas
+
+        return canvas.Canvas(self.file, pagesize=self.pagesize)
+
+    def response(self):
+        """Stream the file back; FileResponse closes (and so deletes) it when done"""
+        self.file.seek(0)
+        return FileResponse(self.file, as_attachment=True, filename=self.filename, content_type='application/pdf')
+
+
+def register_report(name):
+    """Make a report builder ``builder(params, user) -> PdfReport`` available to ``start_export``"""
+    def decorator(builder):
+        _reports[name] = builder
+        return builder
+    return decorator
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REPORT_EXPORT_WORKERS', 2),
+                thread_name_prefix='report-export',
+            )
+    return _executor
+
+
+def _download_url(request, export_id):
+    return request.build_absolute_uri(reverse('myapp:report_export_download', args=[export_id]))
+
+
+def start_export(request, report, params):
+    """Queue ``report`` for background generation and return its ReportExport"""
+    if report not in _reports:
+        raise ValueError(f'Unknown report: {report}')
+    export = ReportExport.objects.create(report=report, params=params, requested_by=request.user)
+    download_url = _download_url(request, export.id)
+    transaction.on_commit(lambda: _get_executor().submit(_run_export_in_thread, export.id, download_url))
+    return export
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(minutes=getattr(settings, 'REPORT_EXPORT_STALE_MINUTES', 30))
+
+
+def _claimable(cutoff):
+    """Exports a worker may start: queued, or running since before ``cutoff``"""
+    return Q(status='queued') | Q(status='running', started_at__lt=cutoff) | Q(status='running', started_at__isnull=True)
+
+
+def stale_exports():
+    """Exports a restarted worker left queued or running past ``REPORT_EXPORT_STALE_MINUTES``"""
+    cutoff = _stale_cutoff()
+    return ReportExport.objects.filter(_claimable(cutoff)).exclude(status='queued', created_at__gte=cutoff)
+
+
+def resume_stale_exports(request):
+    """Start the user's stale exports again; returns how many were resubmitted"""
+    export_ids = list(stale_exports().filter(requested_by=request.user).values_list('id', flat=True))
+    for export_id in export_ids:
+        _get_executor().submit(_run_export_in_thread, export_id, _download_url(request, export_id))
+    return len(export_ids)
+
+
+def _run_export_in_thread(export_id, download_url):
+    try:
+        run_export(export_id, download_url)
+    except Exception:
+        logger.exception("Report export %s could not be run", export_id)
+    finally:
+        # Pool threads keep their own connection; don't leave it open between exports
+        connection.close()
+
+
+def run_export(export_id, download_url=''):
+    """
+    Build a queued export into storage and notify the requester. Returns
+    None without building when another worker is already building it.
+    """
+    # One conditional UPDATE, so of two workers picking up the same export only one wins
+    if not ReportExport.objects.filter(_claimable(_stale_cutoff()), id=export_id).update(
+        status='running', started_at=timezone.now()
+    ):
+        logger.info("Report export %s is already being built", export_id)
+        return None
+    export = ReportExport.objects.select_related('requested_by').get(id=export_id)
+    try:
+        report = _reports[export.report](export.params, export.requested_by)
+        export.filename = report.filename
+        with report.file:
+            report.file.seek(0)
+            export.file.save(report.filename, File(report.file), save=False)
+    except Exception as e:
+        logger.exception("Report export %s failed", export.id)
+        export.status = 'failed'
+        export.error = str(e)
+    else:
+        export.status = 'ready'
+    export.finished_at = timezone.now()
+    export.save()
+
+    user = export.requested_by
+    if export.status == 'ready' and user.email:
+        OutboundEmail.enqueue(
+            [user.email],
+            f'Your report is ready: {export.filename}',
+            f'Dear {user.get_full_name() or user.username},\n\n'
+            f'The report you requested has been generated. Download it here:\n{download_url}\n',
+            idempotency_key=f'report-export:{export.id}',
+        )
+    return export
+
+
+@register_report('students')
+def build_students_report(params, user):
+    """Student information listing, filtered and sorted like the students page"""
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import Paragraph, Spacer
+
+    show = params.get('show', 'active')
+    search_query = params.get('search', '').strip()
+    sort_by = params.get('sort', 'first_name')
+    sort_order = params.get('order', 'asc')
+
+    students = filter_students(show, search_query)
+
+    # Rows are grouped under a header per level, so the level always sorts first
+    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'year_batch', 'is_active', 'created_at']:
+        students = students.order_by('level_custom', f'-{sort_by}' if sort_order == 'desc' else sort_by, 'id')
+    else:
+        students = students.order_by('level_custom', 'class_name', 'first_name', 'id')
+
+    filename_parts = ['students']
+    if search_query:
+        clean_search = ''.join(c for c in search_query if c.isalnum() or c in (' ', '-', '_')).strip()
+        filename_parts.append(f"search_{clean_search.replace(' ', '_')}")
+    filename_parts.append('all' if show == 'all' else 'active')
+    filename_parts.append(timezone.now().strftime('%Y%m%d_%H%M%S'))
+
+    styles = report_styles()
+    if search_query:
+        title = f"STUDENT INFORMATION REPORT - SEARCH: {search_query.upper()}"
+    elif show == 'all':
+        title = "COMPLETE STUDENT INFORMATION REPORT - ALL STUDENTS"
+    else:
+        title = "STUDENT INFORMATION REPORT - ACTIVE STUDENTS"
+    story = [
+        Paragraph(title, styles['title']),
+        Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['normal']),
+    ]
+    if search_query:
+        story.append(Paragraph(f"Search Query: {search_query}", styles['normal']))
+    story.append(Paragraph(f"Status Filter: {'All Students' if show == 'all' else 'Active Students Only'}", styles['normal']))
+    if sort_by != 'first_name' or sort_order != 'asc':
+        story.append(Paragraph(f"Sorted by: {sort_by.replace('_', ' ').title()} ({sort_order.upper()})", styles['normal']))
+    story.append(Paragraph(f"Total Students Found: {students.count()}", styles['normal']))
+    story.append(Spacer(1, 20))
+
+    header = ['Student ID', 'Name', 'NRIC', 'Phone', 'Class', 'Program', 'Year Batch', 'Status', 'Created']
+    col_widths = [70, 150, 85, 80, 45, 70, 55, 50, 65]
+    style = table_style('banded', font_size=8, align='LEFT', padding=3)
+    rows = students.values_list(
+        'level_custom', 'student_id', 'first_name', 'last_name', 'nric', 'phone_number',
+        'class_name', 'program', 'year_batch', 'is_active', 'created_at'
+    ).iterator(chunk_size=2000)
+
+    def table_row(row):
+        _, student_id, first_name, last_name, nric, phone, class_name, program, year_batch, is_active, created_at = row
+        return [
+            student_id, f"{first_name} {last_name}", nric or 'N/A', phone or 'N/A', class_name or 'N/A',
+            program or 'N/A', year_batch or 'N/A', 'Active' if is_active else 'Inactive',
+            created_at.strftime('%Y-%m-%d') if created_at else 'N/A',
+        ]
+
+    for level, level_rows in groupby(rows, key=itemgetter(0)):
+        story.append(Paragraph(f"<b>{level or 'Not Specified'} Students</b>", styles['subheader']))
+        story.extend(chunked_tables(header, map(table_row, level_rows), style, col_widths))
+        story.append(Spacer(1, 15))
+
+    return PdfReport('_'.join(filename_parts) + '.pdf', pagesize=landscape(A4), margins=(36, 36, 36, 36)).build(story)
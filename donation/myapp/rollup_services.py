@@ -0,0 +1,240 @@
+"""
+Daily revenue rollups for the analytics dashboards.
+
+``PaymentDailyRollup`` and ``DonationDailyRollup`` hold one row per day and
+dimension combination, so month-by-month charts read a few rows per day
+instead of scanning every payment or donation ever made. A day is always
+rebuilt as a whole from its source rows, which makes every refresh
+idempotent:
+
+* ``sync_rollups`` (the ``sync_revenue_rollups`` command) rebuilds the days
+  of rows changed since the source's high-water mark, or every day with
+  ``full=True``;
+* saves and deletes schedule their day (and a payment's previous day when its
+  date moved) through ``schedule_refresh``, so same-day figures are current
+  without waiting for the next sync.
+
+The form level of a payment is the student's form when its day was last
+rebuilt; run a full sync after promoting students to restate history.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Donation, DonationDailyRollup, Payment, PaymentDailyRollup, RollupCheckpoint
+
+logger = logging.getLogger(__name__)
+
+PAYMENTS = 'payments'
+DONATIONS = 'donations'
+# Days rebuilt per transaction
+DAY_CHUNK = 31
+# Rows committed shortly before the previous sync may carry an older updated_at
+SYNC_OVERLAP = timedelta(minutes=5)
+# Stats of an event without any donations
+EMPTY_EVENT_STATS = {'total': 0, 'count': 0, 'payment_methods': [], 'daily_donations': []}
+
+
+def _payment_days(rows):
+    return rows.values_list('payment_date', flat=True)
+
+
+def _build_payment_rollups(days):
+    return [
+        PaymentDailyRollup(
+            day=day, category_id=category_id, form_level=form_level, payment_method=method or '',
+            status=status or '', total_amount=total, payment_count=count
+        )
+        for day, category_id, form_level, method, status, total, count in (
+            Payment.objects.filter(payment_date__in=days)
+            .values_list('payment_date', 'fee_structure__category', 'student__form_level', 'payment_method', 'status')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by()
+        )
+    ]
+
+
+def _donation_days(rows):
+    return rows.annotate(day=TruncDate('created_at')).values_list('day', flat=True)
+
+
+def _build_donation_rollups(days):
+    return [
+        DonationDailyRollup(
+            day=day, event_id=event_id, payment_method=method or '', status=status or '',
+            total_amount=total, donation_count=count
+        )
+        for day, event_id, method, status, total, count in (
+            Donation.objects.filter(created_at__date__in=days)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('day', 'event', 'payment_method', 'status')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by()
+        )
+    ]
+
+
+SOURCES = {
+    PAYMENTS: (Payment, PaymentDailyRollup, _payment_days, _build_payment_rollups),
+    DONATIONS: (Donation, DonationDailyRollup, _donation_days, _build_donation_rollups),
+}
+
+
+def refresh_days(name, days):
+    """Rebuild the rollup rows of ``days`` from the source table; returns the number of days"""
+    _, rollup_model, _, build = SOURCES[name]
+    days = sorted({day for day in days if day})
+    if not days:
+        return 0
+    RollupCheckpoint.objects.get_or_create(name=name)
+    for start in range(0, len(days), DAY_CHUNK):
+        chunk = days[start:start + DAY_CHUNK]
+        with transaction.atomic():
+            # Serializes rebuilds of the same table so two of them never interleave their rows
+            RollupCheckpoint.objects.select_for_update().get(name=name)
+            rollup_model.objects.filter(day__in=chunk).delete()
+            rollup_model.objects.bulk_create(build(chunk), batch_size=500)
+    return len(days)
+
+
+def sync_rollups(names=None, full=False):
+    """
+    Fold rows changed since each source's high-water mark into its rollups.
+    Returns the number of days rebuilt per source.
+    """
+    results = {}
+    for name in names or SOURCES:
+        source_model, rollup_model, day_values, _ = SOURCES[name]
+        checkpoint, _ = RollupCheckpoint.objects.get_or_create(name=name)
+        started = timezone.now()
+        rows = source_model.objects.all()
+        if not full and checkpoint.high_water_mark:
+            rows = rows.filter(updated_at__gt=checkpoint.high_water_mark - SYNC_OVERLAP)
+        days = set(day_values(rows.order_by()).distinct())
+        if full:
+            # Days whose source rows are all gone still need their rollups cleared
+            days.update(rollup_model.objects.values_list('day', flat=True).distinct())
+        refreshed = refresh_days(name, days)
+        checkpoint.high_water_mark = started
+        checkpoint.last_run_at = timezone.now()
+        checkpoint.days_refreshed = refreshed
+        checkpoint.save()
+        logger.info("Rollup sync %s: %s days rebuilt%s", name, refreshed, ' (full)' if full else '')
+        results[name] = refreshed
+    return results
+
+
+def ensure_rollups(name):
+    """Build a rollup table from scratch the first time it is read"""
+    if not RollupCheckpoint.objects.filter(name=name, high_water_mark__isnull=False).exists():
+        sync_rollups([name], full=True)
+
+
+def schedule_refresh(name, days):
+    """
+    Rebuild ``days`` once the current transaction commits. Days scheduled
+    within the same transaction are merged into a single refresh.
+    """
+    pending = getattr(connection, '_rollup_pending', None)
+    if pending is None:
+        pending = connection._rollup_pending = defaultdict(set)
+    pending[name].update(day for day in days if day)
+
+    def run():
+        # The first callback to run refreshes everything scheduled so far
+        scheduled = {key: set(value) for key, value in pending.items() if value}
+        pending.clear()
+        for key, scheduled_days in scheduled.items():
+            refresh_days(key, scheduled_days)
+
+    transaction.on_commit(run)
+
+
+def payment_rollups():
+    ensure_rollups(PAYMENTS)
+    return PaymentDailyRollup.objects.all()
+
+
+def donation_rollups():
+    ensure_rollups(DONATIONS)
+    return DonationDailyRollup.objects.all()
+
+
+def donation_event_stats(event_ids, statuses=None):
+    """
+    Totals, payment-method breakdown and daily trend per event, read from the
+    rollups in one query. ``statuses`` limits the donations counted.
+    """
+    rollups = donation_rollups().filter(event_id__in=event_ids)
+    if statuses:
+        rollups = rollups.filter(status__in=statuses)
+    stats = defaultdict(lambda: {'total': 0, 'count': 0, 'methods': {}, 'days': {}})
+    for event_id, day, method, total, count in rollups.values_list(
+        'event_id', 'day', 'payment_method', 'total_amount', 'donation_count'
+    ).order_by('day'):
+        event = stats[event_id]
+        event['total'] += total
+        event['count'] += count
+        for key, bucket in ((method, event['methods']), (day, event['days'])):
+            entry = bucket.setdefault(key, {'count': 0, 'total': 0})
+            entry['count'] += count
+            entry['total'] += total
+    return {
+        event_id: {
+            'total': event['total'],
+            'count': event['count'],
+            'payment_methods': [{'payment_method': key, **value} for key, value in event['methods'].items()],
+            'daily_donations': [{'day': key, **value} for key, value in event['days'].items()],
+        }
+        for event_id, event in stats.items()
+    }
+
+
+def overall_donation_totals(start_date=None, end_date=None):
+    """Count, total and average of all donations made between two dates"""
+    rollups = donation_rollups()
+    if start_date:
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(day__lte=end_date)
+    totals = rollups.aggregate(count=Sum('donation_count'), total=Sum('total_amount'))
+    count, total = totals['count'] or 0, totals['total'] or 0
+    return {'count': count, 'total': total, 'average': total / count if count else 0}
+
+
+def target_reached_at(event, daily_donations, statuses=None):
+    """
+    When the donations of ``event`` first added up to its target. The daily
+    totals locate the day, so only that day's donations are read.
+    """
+    cumulative = 0
+    for entry in daily_donations:
+        if cumulative + entry['total'] >= event.target_amount:
+            donations = Donation.objects.filter(event=event, created_at__date=entry['day'])
+            if statuses:
+                donations = donations.filter(status__in=statuses)
+            for created_at, amount in donations.order_by('created_at').values_list('created_at', 'amount'):
+                cumulative += amount
+                if cumulative >= event.target_amount:
+                    return created_at
+            return None
+        cumulative += entry['total']
+    return None
+
+
+def rollup_status():
+    """Checkpoint and size of each rollup table, for the sync command's report"""
+    status = {}
+    for name, (_, rollup_model, _, _) in SOURCES.items():
+        checkpoint = RollupCheckpoint.objects.filter(name=name).first()
+        status[name] = {
+            'high_water_mark': checkpoint.high_water_mark if checkpoint else None,
+            'rows': rollup_model.objects.count(),
+            **rollup_model.objects.aggregate(first_day=Min('day'), last_day=Max('day')),
+        }
+    return status
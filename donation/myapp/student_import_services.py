@@ -0,0 +1,466 @@
+"""
+Bulk student import from an XLSX/CSV upload or the bulk-add form.
+
+Rows are streamed from the file (openpyxl read-only mode for XLSX) and
+validated in memory; the student ids, NRICs and usernames already taken are
+fetched with a few ``__in`` queries for the whole upload instead of several
+queries per row. Only when every row is valid are the students, their user
+accounts, optional parent accounts and form-based ``FeeStatus`` rows written
+with ``bulk_create`` in one transaction, so a bad row never leaves half an
+intake behind. New accounts get an unusable password instead of a hashed
+default one (hashing costs ~0.3s per account); each account holder sets a
+password through a password-reset link, listed in the per-row report and
+emailed to parents who gave an address. The report is saved as a private
+``ReportExport`` for download.
+"""
+import csv
+import io
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from accounts.models import UserProfile as AccountProfile
+
+from .models import FeeStatus, FeeStructure, OutboundEmail, Parent, ReportExport, Student, StudentFeeLedger, UserProfile
+
+COLUMNS = [
+    'student_id', 'nric', 'first_name', 'last_name', 'year_batch', 'class_name', 'program', 'level',
+    'level_custom', 'phone_number', 'is_active',
+    'parent_name', 'parent_nric', 'parent_phone', 'parent_email', 'parent_address',
+]
+REQUIRED_COLUMNS = ['student_id', 'nric', 'first_name', 'last_name', 'year_batch']
+STUDENT_TEXT_COLUMNS = ['student_id', 'nric', 'first_name', 'last_name', 'class_name', 'program', 'level_custom', 'phone_number']
+# Parent accounts are created for rows that fill in parent_nric
+PARENT_REQUIRED_COLUMNS = ['parent_name', 'parent_phone']
+LEVELS = {value for value, _ in Student.LEVEL_CHOICES}
+TRUE_VALUES = {'1', 'y', 'yes', 'true', 'on', 'active'}
+FALSE_VALUES = {'0', 'n', 'no', 'false', 'off', 'inactive'}
+# Days until the first fee falls due, by fee frequency
+DUE_IN_DAYS = {'termly': 90}
+DEFAULT_DUE_IN_DAYS = 30
+# Values per ``__in`` lookup when checking what already exists
+LOOKUP_CHUNK = 500
+
+
+class StudentImportError(Exception):
+    """The upload cannot be read at all (unknown format, corrupt file, missing columns) or saved"""
+
+
+def password_link(user, build_url=str):
+    """Link where ``user`` sets a password; valid until used or PASSWORD_RESET_TIMEOUT passes"""
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    return build_url(reverse('accounts:password_reset_confirm', args=[uid, token]))
+
+
+def _header(value):
+    return '_'.join(str(value or '').strip().lower().split())
+
+
+def _check_header(header):
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise StudentImportError(f"Missing required columns: {', '.join(missing)}")
+
+
+def _read_xlsx(uploaded_file):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise StudentImportError('Excel import requires openpyxl library. Please upload a CSV file instead.')
+
+    try:
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_header(value) for value in next(rows, ())]
+            _check_header(header)
+            for row_number, values in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    yield row_number, dict(zip(header, values))
+        finally:
+            workbook.close()
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, ValueError) as e:
+        raise StudentImportError(f'The file is not a readable .xlsx workbook ({e}).')
+
+
+def _read_csv(uploaded_file):
+    reader = csv.reader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''))
+    try:
+        header = [_header(value) for value in next(reader, [])]
+        _check_header(header)
+        for row_number, values in enumerate(reader, start=2):
+            if any(value.strip() for value in values):
+                yield row_number, dict(zip(header, values))
+    except UnicodeDecodeError:
+        raise StudentImportError('The CSV file is not UTF-8 text. Save it as "CSV UTF-8" and upload it again.')
+    except csv.Error as e:
+        raise StudentImportError(f'The CSV file could not be read ({e}).')
+
+
+def read_rows(uploaded_file):
+    """(row number, values by column) for each non-empty row of an XLSX or CSV upload"""
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    if name.endswith('.xlsx'):
+        return _read_xlsx(uploaded_file)
+    if name.endswith('.csv'):
+        return _read_csv(uploaded_file)
+    raise StudentImportError('Please upload an .xlsx or .csv file.')
+
+
+def form_rows(data):
+    """Rows of the bulk-add form, whose inputs are named ``<column>_<entry number>``"""
+    entries = {}
+    for key in data:
+        column, _, number = key.rpartition('_')
+        if column in COLUMNS and number.isdigit():
+            entries.setdefault(int(number), {})[column] = data.get(key)
+    for number, values in sorted(entries.items()):
+        # An unticked checkbox is not posted at all
+        values['is_active'] = 'on' if values.get('is_active') == 'on' else 'off'
+        yield number, values
+
+
+class ImportRow:
+    """One row of an upload: its cleaned values and what is wrong with it"""
+
+    def __init__(self, row_number, values):
+        self.row_number = row_number
+        self.values = values
+        self.errors = []
+        self.student = None
+        # User accounts created for this row (student and/or a new parent)
+        self.accounts = []
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+
+class StudentImportResult:
+    def __init__(self, rows, dry_run=False):
+        self.rows = rows
+        self.dry_run = dry_run
+        self.students_created = 0
+        self.accounts_created = 0
+        self.parents_created = 0
+        self.fee_statuses_created = 0
+        # New parent accounts with an email address from the upload
+        self.invited_users = []
+
+    @property
+    def error_rows(self):
+        return [row for row in self.rows if not row.is_valid]
+
+    @property
+    def is_valid(self):
+        return bool(self.rows) and not self.error_rows
+
+    def report_csv(self, build_url=None):
+        """
+        The per-row import report as CSV text. With ``build_url`` (turning a
+        path into an absolute URL) it adds each new account's set-password link.
+        """
+        output = io.StringIO()
+        writer = csv.writer(output)
+        header = ['Row', 'Student ID', 'NRIC', 'Name', 'Status', 'Errors']
+        writer.writerow(header + ['Accounts'] if build_url else header)
+        for row in self.rows:
+            values = row.values
+            if row.errors:
+                status = 'error'
+            elif self.is_valid and not self.dry_run:
+                status = 'imported'
+            else:
+                status = 'ok'
+            line = [
+                row.row_number, values.get('student_id', ''), values.get('nric', ''),
+                f"{values.get('first_name', '')} {values.get('last_name', '')}".strip(), status, '; '.join(row.errors),
+            ]
+            if build_url:
+                line.append('; '.join(f"{account.username} {password_link(account, build_url)}" for account in row.accounts))
+            writer.writerow(line)
+        return output.getvalue()
+
+    def queue_invitations(self, build_url):
+        """Email new parents who gave an address their set-password link"""
+        days = settings.PASSWORD_RESET_TIMEOUT // 86400
+        OutboundEmail.enqueue_many([{
+            'recipients': [user.email],
+            'subject': 'Your school fees account',
+            'body': (
+                f"Hello {user.get_full_name() or user.username},\n\n"
+                f"An account has been created for you with the username {user.username}.\n"
+                f"Set your password here within {days} days:\n{password_link(user, build_url)}\n"
+            ),
+            'idempotency_key': f'account-invite:{user.pk}',
+        } for user in self.invited_users])
+        return len(self.invited_users)
+
+    def save_report(self, user, build_url=None):
+        """Keep the report as a ready ``ReportExport`` the user can download"""
+        filename = f"student_import_{timezone.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        export = ReportExport(
+            report='student_import', requested_by=user, status='ready', filename=filename,
+            params={'rows': len(self.rows), 'errors': len(self.error_rows)}, finished_at=timezone.now()
+        )
+        export.file.save(filename, ContentFile(self.report_csv(build_url).encode('utf-8')), save=False)
+        export.save()
+        return export
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores numeric ids and years as floats
+        value = int(value)
+    return ' '.join(str(value).split())
+
+
+def _clean(row):
+    values = {column: _text(row.values.get(column)) for column in COLUMNS}
+    for column in ('nric', 'parent_nric'):
+        # NRICs are stored without the dashes of the printed form (123456-78-9012)
+        values[column] = values[column].replace('-', '')
+    for column in REQUIRED_COLUMNS:
+        if not values[column]:
+            row.errors.append(f"Missing {column}")
+
+    for column in STUDENT_TEXT_COLUMNS:
+        max_length = Student._meta.get_field(column).max_length
+        if len(values[column]) > max_length:
+            row.errors.append(f"{column} is longer than {max_length} characters")
+
+    if values['year_batch']:
+        # Spreadsheets saved as CSV may write years as '2024.0'
+        year = values['year_batch'].removesuffix('.0')
+        if year.isdigit():
+            values['year_batch'] = int(year)
+        else:
+            row.errors.append(f"year_batch must be a year, not '{values['year_batch']}'")
+
+    values['level'] = values['level'].lower() or 'form'
+    if values['level'] not in LEVELS:
+        row.errors.append(f"level must be one of {', '.join(sorted(LEVELS))}")
+    if values['level'] == 'form' and not values['level_custom']:
+        values['level_custom'] = 'Form 1'
+
+    active = values['is_active'].lower()
+    if active and active not in TRUE_VALUES | FALSE_VALUES:
+        row.errors.append(f"is_active must be yes or no, not '{values['is_active']}'")
+    values['is_active'] = active not in FALSE_VALUES
+
+    if values['parent_nric']:
+        for column in PARENT_REQUIRED_COLUMNS:
+            if not values[column]:
+                row.errors.append(f"Missing {column} for parent {values['parent_nric']}")
+        for column, field in (('parent_nric', 'nric'), ('parent_phone', 'phone_number')):
+            max_length = Parent._meta.get_field(field).max_length
+            if len(values[column]) > max_length:
+                row.errors.append(f"{column} is longer than {max_length} characters")
+    row.values = values
+
+
+def _existing(model, field, values):
+    """The subset of ``values`` already present in ``model.field``"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        found.update(model.objects.filter(**{f'{field}__in': values[start:start + LOOKUP_CHUNK]}).values_list(field, flat=True))
+    return found
+
+
+def _student_username(student_id):
+    return f"student_{student_id.lower()}"
+
+
+def _parent_username(nric):
+    return f"parent_{nric.lower()}"
+
+
+def _validate(rows):
+    for row in rows:
+        _clean(row)
+
+    seen = {'student_id': {}, 'nric': {}}
+    for row in rows:
+        for column, first_rows in seen.items():
+            value = row.values[column]
+            if not value:
+                continue
+            if value in first_rows:
+                row.errors.append(f"{column} {value} is repeated (first on row {first_rows[value]})")
+            else:
+                first_rows[value] = row.row_number
+
+    taken_ids = _existing(Student, 'student_id', seen['student_id'])
+    taken_nrics = _existing(Student, 'nric', seen['nric'])
+    parent_nrics = {row.values['parent_nric'] for row in rows if row.values['parent_nric']}
+    existing_parents = _existing(Parent, 'nric', parent_nrics)
+    taken_parent_usernames = _existing(
+        User, 'username', [_parent_username(nric) for nric in parent_nrics - existing_parents]
+    )
+    for row in rows:
+        values = row.values
+        if values['student_id'] in taken_ids:
+            row.errors.append(f"Student ID {values['student_id']} already exists")
+        if values['nric'] in taken_nrics:
+            row.errors.append(f"NRIC {values['nric']} already exists")
+        if values['parent_nric'] and _parent_username(values['parent_nric']) in taken_parent_usernames:
+            row.errors.append(f"Username {_parent_username(values['parent_nric'])} is already taken")
+
+
+def _due_date(fee_structure, today):
+    return today + timedelta(days=DUE_IN_DAYS.get(fee_structure.frequency, DEFAULT_DUE_IN_DAYS))
+
+
+def _create(rows, result, create_accounts, batch_size):
+    students = []
+    for row in rows:
+        values = row.values
+        row.student = Student(
+            student_id=values['student_id'], nric=values['nric'], first_name=values['first_name'],
+            last_name=values['last_name'], year_batch=values['year_batch'], class_name=values['class_name'],
+            program=values['program'], level=values['level'], level_custom=values['level_custom'],
+            phone_number=values['phone_number'] or None, is_active=values['is_active'],
+        )
+        # bulk_create skips save(), which normally derives these
+        row.student.form_level = row.student.compute_form_level()
+        row.student.search_text = row.student.compute_search_text()
+        students.append(row.student)
+    Student.objects.bulk_create(students, batch_size=batch_size)
+    result.students_created = len(students)
+
+    users = []
+    profiles = []
+    if create_accounts:
+        taken = _existing(User, 'username', [_student_username(student.student_id) for student in students])
+        for row in rows:
+            student = row.student
+            username = _student_username(student.student_id)
+            if username in taken:
+                continue
+            # make_password(None) is an unusable password and costs no hashing
+            user = User(
+                username=username, email=f"{username}@school.com", first_name=student.first_name,
+                last_name=student.last_name, password=make_password(None)
+            )
+            users.append(user)
+            row.accounts.append(user)
+            profiles.append(UserProfile(role='student', student=student))
+        result.accounts_created = len(users)
+
+    parents = {}
+    links = []
+    new_parents = {}
+    parent_rows = [row for row in rows if row.values['parent_nric']]
+    if parent_rows:
+        parents = {parent.nric: parent for parent in Parent.objects.filter(
+            nric__in={row.values['parent_nric'] for row in parent_rows}
+        )}
+        for row in parent_rows:
+            values = row.values
+            nric = values['parent_nric']
+            if nric not in parents:
+                # Siblings in the same upload share the parent of their first row
+                first_name, _, last_name = values['parent_name'].partition(' ')
+                username = _parent_username(nric)
+                user = User(
+                    username=username, email=values['parent_email'] or f"{username}@example.com",
+                    first_name=first_name, last_name=last_name, password=make_password(None)
+                )
+                users.append(user)
+                row.accounts.append(user)
+                if values['parent_email']:
+                    result.invited_users.append(user)
+                profiles.append(UserProfile(role='parent', phone_number=values['parent_phone']))
+                parents[nric] = new_parents[nric] = Parent(
+                    user=user, nric=nric, phone_number=values['parent_phone'], address=values['parent_address']
+                )
+            links.append((parents[nric], row.student))
+
+    if users:
+        User.objects.bulk_create(users, batch_size=batch_size)
+        for user, profile in zip(users, profiles):
+            profile.user = user
+        UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+        # The accounts app gives every user a profile from post_save, which bulk_create skips
+        AccountProfile.objects.bulk_create([AccountProfile(user=user) for user in users], batch_size=batch_size)
+    if new_parents:
+        Parent.objects.bulk_create(new_parents.values(), batch_size=batch_size)
+        result.parents_created = len(new_parents)
+    if links:
+        Parent.students.through.objects.bulk_create(
+            [Parent.students.through(parent_id=parent.id, student_id=student.id) for parent, student in links],
+            batch_size=batch_size, ignore_conflicts=True
+        )
+
+    fee_statuses = _fee_statuses(students)
+    FeeStatus.objects.bulk_create(fee_statuses, batch_size=batch_size)
+    result.fee_statuses_created = len(fee_statuses)
+    # bulk_create skips post_save, so update the ledger explicitly
+    StudentFeeLedger.schedule_refresh([student.id for student in students])
+
+
+def _fee_statuses(students):
+    """A pending ``FeeStatus`` per active fee structure of each form-level student"""
+    by_level = {}
+    by_form = {}
+    for fee_structure in FeeStructure.objects.filter(is_active=True):
+        if fee_structure.form_level is not None:
+            by_level.setdefault(fee_structure.form_level, []).append(fee_structure)
+        by_form.setdefault(fee_structure.form.lower(), []).append(fee_structure)
+
+    today = timezone.now().date()
+    fee_statuses = []
+    for student in students:
+        if student.level != 'form' or not student.level_custom:
+            continue
+        if student.form_level is not None:
+            structures = by_level.get(student.form_level, [])
+        else:
+            structures = by_form.get((student.get_level_display_value() or '').lower(), [])
+        fee_statuses.extend(
+            FeeStatus(
+                student=student, fee_structure=fee_structure, amount=fee_structure.amount or 0,
+                due_date=_due_date(fee_structure, today), status='pending'
+            )
+            for fee_structure in structures
+        )
+    return fee_statuses
+
+
+def import_students(rows, create_accounts=True, dry_run=False, batch_size=500):
+    """
+    Validate every row of ``rows`` ((row number, values) pairs) and, if all
+    of them are valid, create the students and everything that comes with
+    them in one transaction. Nothing is written when any row has errors;
+    StudentImportError is raised if the rows clash with data written
+    meanwhile.
+    """
+    result = StudentImportResult([ImportRow(row_number, values) for row_number, values in rows], dry_run=dry_run)
+    _validate(result.rows)
+    if not result.is_valid or dry_run:
+        return result
+    try:
+        with transaction.atomic():
+            _create(result.rows, result, create_accounts, batch_size)
+    except IntegrityError:
+        # Another import or edit took one of these ids between _validate and _create
+        raise StudentImportError(
+            'Some of these students or accounts were added by someone else while importing, so nothing was imported. '
+            'Please upload the file again.'
+        )
+    return result
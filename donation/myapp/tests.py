@@ -1,3 +1,1905 @@
-from django.test import TestCase
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.db.models import Sum
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.views.static import serve
+
+from donation import ai_registry
+from donation.instrumentation import QueryBudgetExceeded, reset_view_stats, view_stats
+from donation.logging_utils import LogSamplingMiddleware, QueueHandler, RequestContextFilter
+
+from . import views
+from .checkout_services import CheckoutError, CheckoutService
+from .directory_services import encode_cursor, filter_students, keyset_page
+from .outbox_services import OutboxWorker
+from .reminder_services import ReminderCampaignRunner
+from .report_services import chunked_tables, run_export, table_style
+from .export_services import parse_export_filters
+from .fee_report_services import GENERATION_CACHE_KEY, cached_fee_report_summary
+from .rollup_services import sync_rollups
+from .student_import_services import import_students, read_rows
+from .models import (
+    Student, Parent, FeeCategory, FeeStructure, FeeStatus, FeeWaiver, Payment,
+    IndividualStudentFee, Invoice, StudentFeeLedger, PibgDonation, ParentCart, UserProfile, OutboundEmail,
+    PaymentReminder, ReminderCampaign, ReportExport, PaymentDailyRollup, DonationCategory, DonationEvent, Donation,
+    normalize_form_level
+)
+
+
+class FeeFixtureTestCase(TestCase):
+    """Starts from today's date and a 'Tuition' category, with helpers for fees and form students"""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tuition = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self._nrics = itertools.count(100000)
+
+    def create_fee(self, form, amount, frequency='monthly', category=None):
+        return FeeStructure.objects.create(
+            category=category or self.tuition, form=form, amount=Decimal(amount), frequency=frequency
+        )
+
+    def create_students(self, prefix, forms, first_name='Student', start=0, **fields):
+        """One student per form level, numbered prefix000, prefix001... and named first_name0, first_name1..."""
+        fields.setdefault('last_name', 'Test')
+        return [
+            Student.objects.create(
+                student_id=f'{prefix}{i:03d}', nric=f'{next(self._nrics):012d}', first_name=f'{first_name}{i}',
+                level='form', level_custom=form, **fields
+            )
+            for i, form in enumerate(forms, start)
+        ]
+
+
+class FeeStatusDiscountResolutionTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tuition = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self.books = FeeCategory.objects.create(name='Books', description='Book fee')
+        self.tuition_fee = FeeStructure.objects.create(
+            category=self.tuition, form='Form 1', amount=Decimal('100.00'), frequency='yearly'
+        )
+        self.books_fee = FeeStructure.objects.create(
+            category=self.books, form='Form 1', amount=Decimal('50.00'), frequency='yearly'
+        )
+        self.students = [
+            Student.objects.create(
+                student_id=f'S{i:03d}', nric=f'0000000000{i:02d}', first_name='Student', last_name=str(i),
+                level='form', level_custom='Form 1'
+            )
+            for i in range(5)
+        ]
+        for student in self.students:
+            for structure in (self.tuition_fee, self.books_fee):
+                FeeStatus.objects.create(
+                    student=student, fee_structure=structure, amount=structure.amount,
+                    due_date=self.today + timedelta(days=30)
+                )
+
+        # 50% tuition scholarship for the first student, RM 10 book discount for the second
+        FeeWaiver.objects.create(
+            student=self.students[0], waiver_type='scholarship', category=self.tuition,
+            amount=Decimal('0.00'), percentage=Decimal('50.00'), reason='Merit',
+            start_date=self.today - timedelta(days=1), end_date=self.today + timedelta(days=1),
+            status='approved'
+        )
+        FeeWaiver.objects.create(
+            student=self.students[1], waiver_type='discount', category=self.books,
+            amount=Decimal('10.00'), reason='Sibling',
+            start_date=self.today - timedelta(days=1), end_date=self.today + timedelta(days=1),
+            status='approved'
+        )
+        # Pending and expired waivers must be ignored
+        FeeWaiver.objects.create(
+            student=self.students[2], waiver_type='waiver', category=self.tuition,
+            amount=Decimal('100.00'), reason='Pending review',
+            start_date=self.today - timedelta(days=1), end_date=self.today + timedelta(days=1),
+            status='pending'
+        )
+        FeeWaiver.objects.create(
+            student=self.students[3], waiver_type='waiver', category=self.tuition,
+            amount=Decimal('100.00'), reason='Last year',
+            start_date=self.today - timedelta(days=400), end_date=self.today - timedelta(days=1),
+            status='approved'
+        )
+
+    def test_bulk_resolution_matches_per_row_results(self):
+        expected = {
+            fee_status.id: fee_status.get_discount_info()
+            for fee_status in FeeStatus.objects.all()
+        }
+
+        fee_statuses = FeeStatus.resolve_discounts(FeeStatus.objects.all())
+        for fee_status in fee_statuses:
+            self.assertEqual(fee_status.get_discount_info(), expected[fee_status.id])
+
+        discounted = {
+            (fs.student_id, fs.fee_structure_id): fs.get_discounted_amount() for fs in fee_statuses
+        }
+        self.assertEqual(discounted[(self.students[0].id, self.tuition_fee.id)], Decimal('50.00'))
+        self.assertEqual(discounted[(self.students[1].id, self.books_fee.id)], Decimal('40.00'))
+        self.assertEqual(discounted[(self.students[2].id, self.tuition_fee.id)], Decimal('100.00'))
+        self.assertEqual(discounted[(self.students[3].id, self.tuition_fee.id)], Decimal('100.00'))
+
+    def test_bulk_resolution_uses_constant_queries(self):
+        fee_statuses = FeeStatus.objects.select_related('fee_structure')
+        # One query for the fee statuses and one for all waivers
+        with self.assertNumQueries(2):
+            FeeStatus.resolve_discounts(fee_statuses)
+            total = sum(fs.get_discounted_amount() for fs in fee_statuses)
+            has_discount = [fs.get_discount_info()['has_discount'] for fs in fee_statuses]
+        self.assertEqual(total, Decimal('690.00'))
+        self.assertEqual(has_discount.count(True), 2)
+
+    def test_saving_clears_resolved_discount(self):
+        fee_status = FeeStatus.objects.get(student=self.students[0], fee_structure=self.tuition_fee)
+        FeeStatus.resolve_discounts([fee_status])
+        self.assertEqual(fee_status.get_discounted_amount(), Decimal('50.00'))
+        fee_status.status = 'paid'
+        fee_status.save()
+        self.assertIsNone(fee_status._discount_info)
+
+
+class StudentFeeLedgerTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.category = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self.structure = FeeStructure.objects.create(
+            category=self.category, form='Form 2', amount=Decimal('120.00'), frequency='yearly'
+        )
+        self.student = Student.objects.create(
+            student_id='L001', nric='111111111111', first_name='Ledger', last_name='Student',
+            level='form', level_custom='Form 2'
+        )
+
+    def create_fee_status(self, status='pending'):
+        return FeeStatus.objects.create(
+            student=self.student, fee_structure=self.structure, amount=self.structure.amount,
+            due_date=self.today, status=status
+        )
+
+    def test_ledger_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fee_status = self.create_fee_status()
+            self.create_fee_status(status='overdue')
+            IndividualStudentFee.objects.create(
+                student=self.student, category=self.category, name='Overtime',
+                description='Late pickup', amount=Decimal('15.00'), due_date=self.today
+            )
+        ledger = StudentFeeLedger.objects.get(student=self.student)
+        self.assertEqual(ledger.outstanding_amount, Decimal('240.00'))
+        self.assertEqual(ledger.outstanding_count, 2)
+        self.assertEqual(ledger.overdue_amount, Decimal('120.00'))
+        self.assertEqual(ledger.total_outstanding_amount, Decimal('255.00'))
+        self.assertEqual(ledger.total_outstanding_count, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                student=self.student, fee_structure=self.structure, amount=Decimal('120.00'),
+                payment_date=self.today, payment_method='cash', status='completed'
+            )
+            fee_status.status = 'paid'
+            fee_status.save()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.outstanding_amount, Decimal('120.00'))
+        self.assertEqual(ledger.paid_amount, Decimal('120.00'))
+        self.assertEqual(ledger.completed_payment_count, 1)
+        self.assertIsNotNone(ledger.last_payment_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FeeWaiver.objects.create(
+                student=self.student, waiver_type='scholarship', category=self.category,
+                amount=Decimal('0.00'), percentage=Decimal('25.00'), reason='Merit',
+                start_date=self.today, end_date=self.today, status='approved'
+            )
+            Payment.objects.filter(student=self.student).delete()
+        ledger.refresh_from_db()
+        self.assertEqual(ledger.discounted_amount, Decimal('90.00'))
+        self.assertEqual(ledger.paid_amount, Decimal('0.00'))
+        self.assertIsNone(ledger.last_payment_at)
+
+    def test_deleting_student_removes_ledger(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_fee_status()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.delete()
+        self.assertFalse(StudentFeeLedger.objects.exists())
+
+    def test_rebuild_command_repairs_bulk_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_fee_status()
+        # Queryset updates bypass the save hooks
+        FeeStatus.objects.filter(student=self.student).update(status='paid')
+
+        out = StringIO()
+        call_command('rebuild_fee_ledger', '--verify', stdout=out)
+        self.assertIn('1 ledger rows are missing or out of date', out.getvalue())
+
+        call_command('rebuild_fee_ledger', stdout=StringIO())
+        self.assertEqual(StudentFeeLedger.objects.get(student=self.student).outstanding_amount, Decimal('0.00'))
+
+        out = StringIO()
+        call_command('rebuild_fee_ledger', '--verify', stdout=out)
+        self.assertIn('Fee ledger is up to date', out.getvalue())
+
+    def test_daily_rebuild_marks_fees_that_fell_due(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fee_status = self.create_fee_status()
+            FeeStatus.objects.filter(pk=fee_status.pk).update(due_date=self.today - timedelta(days=1))
+            self.create_fee_status()
+        self.assertEqual(StudentFeeLedger.objects.get(student=self.student).overdue_count, 0)
+
+        out = StringIO()
+        call_command('rebuild_fee_ledger', '--mark-overdue', stdout=out)
+        self.assertIn('Marked 1 past-due fees as overdue', out.getvalue())
+        fee_status.refresh_from_db()
+        self.assertEqual(fee_status.status, 'overdue')
+        ledger = StudentFeeLedger.objects.get(student=self.student)
+        self.assertEqual((ledger.overdue_count, ledger.overdue_amount, ledger.outstanding_count), (1, Decimal('120.00'), 2))
+
+
+class FormLevelTest(TestCase):
+    def setUp(self):
+        self.category = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+
+    def make_student(self, student_id, level, level_custom):
+        return Student.objects.create(
+            student_id=student_id, nric=student_id.rjust(12, '0'), first_name='Ali', last_name='Test',
+            level=level, level_custom=level_custom, class_name='A'
+        )
+
+    def test_normalize_form_level(self):
+        self.assertEqual(normalize_form_level('Form 3'), 3)
+        self.assertEqual(normalize_form_level(' form3 '), 3)
+        self.assertEqual(normalize_form_level('3'), 3)
+        self.assertIsNone(normalize_form_level('Year 3'))
+        self.assertIsNone(normalize_form_level(''))
+        self.assertIsNone(normalize_form_level(None))
+
+    def test_form_level_follows_saves(self):
+        student = self.make_student('F001', 'form', 'Form 2')
+        structure = FeeStructure.objects.create(
+            category=self.category, form='2', amount=Decimal('10.00'), frequency='yearly'
+        )
+        self.assertEqual(Student.objects.get(pk=student.pk).form_level, 2)
+        self.assertEqual(FeeStructure.objects.get(pk=structure.pk).form_level, 2)
+
+        student.level_custom = '4'
+        student.save(update_fields=['level_custom'])
+        self.assertEqual(Student.objects.get(pk=student.pk).form_level, 4)
+
+        student.level = 'year'
+        student.save()
+        self.assertIsNone(Student.objects.get(pk=student.pk).form_level)
+
+    def test_lookups_match_either_spelling(self):
+        numeric = self.make_student('F002', 'form', '3')
+        named = self.make_student('F003', 'others', 'Form 3')
+        self.make_student('F004', 'form', 'Form 1')
+        structure = FeeStructure.objects.create(
+            category=self.category, form='Form 3', amount=Decimal('10.00'), frequency='yearly'
+        )
+
+        self.assertEqual(list(FeeStructure.for_student(numeric)), [structure])
+        self.assertEqual(FeeStructure.get_for_student(named, self.category), structure)
+        self.assertEqual(list(FeeStructure.for_form('form3')), [structure])
+        self.assertTrue(structure.applies_to(numeric))
+        self.assertCountEqual(structure.matching_students(), [numeric, named])
+
+    def test_students_without_a_level_take_their_form_from_level_custom(self):
+        no_level = self.make_student('F005', None, 'Form 3')
+        blank_level = self.make_student('F006', '', '3')
+        year = self.make_student('F007', 'year', '3')
+        structure = FeeStructure.objects.create(
+            category=self.category, form='Form 3', amount=Decimal('10.00'), frequency='yearly'
+        )
+        self.assertCountEqual(structure.matching_students(), [no_level, blank_level])
+        self.assertEqual((year.level, year.form_level), ('year', None))
+        self.assertEqual(list(FeeStructure.for_student(year)), [])
+
+    def test_migration_backfills_form_level_only(self):
+        from importlib import import_module
+        from django.apps import apps
+        backfill = import_module('myapp.migrations.0045_backfill_student_form_level').backfill_form_level
+
+        no_level = self.make_student('F005', None, 'Form 3')
+        year = self.make_student('F006', 'year', '3')
+        # Saved before compute_form_level read level_custom without a level
+        Student.objects.update(form_level=None)
+
+        backfill(apps, None)
+        no_level.refresh_from_db()
+        year.refresh_from_db()
+        self.assertEqual((no_level.level, no_level.form_level), (None, 3))
+        self.assertEqual((year.level, year.form_level), ('year', None))
+
+
+
+
+class MonthlyPaymentGenerationTest(TestCase):
+    def setUp(self):
+        self.category = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self.structure = FeeStructure.objects.create(
+            category=self.category, form='Form 1', frequency='monthly', monthly_duration=10,
+            total_amount=Decimal('1000.00'), auto_generate_payments=True
+        )
+        self.start = timezone.now().date()
+
+    def add_students(self, count, offset=0):
+        return [
+            Student.objects.create(
+                student_id=f'M{i:04d}', nric=f'{i:012d}', first_name='Ali', last_name='Test',
+                level='form', level_custom=['1', 'Form 1'][i % 2], class_name='A'
+            )
+            for i in range(offset, offset + count)
+        ]
+
+    def test_generates_full_plan_for_matching_students(self):
+        students = self.add_students(3)
+        self.add_students(1, offset=3)[0].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = FeeStructure.generate_monthly_payments([self.structure], start_date=self.start)
+
+        self.assertEqual((result['planned'], result['existing'], result['created']), (30, 0, 30))
+        statuses = FeeStatus.objects.filter(fee_structure=self.structure)
+        self.assertEqual(statuses.count(), 30)
+        self.assertEqual(set(statuses.values_list('amount', flat=True)), {Decimal('100.00')})
+        self.assertEqual(statuses.filter(due_date=self.start + timedelta(days=270)).count(), 3)
+        self.assertEqual(StudentFeeLedger.objects.get(student=students[0]).outstanding_amount, Decimal('1000.00'))
+
+    def test_rerun_and_dry_run_do_not_duplicate(self):
+        students = self.add_students(2)
+        self.structure.generate_monthly_payments_for_student(students[0], start_date=self.start)
+
+        preview = FeeStructure.generate_monthly_payments([self.structure], start_date=self.start, dry_run=True)
+        self.assertEqual((preview['planned'], preview['existing'], preview['created']), (20, 10, 0))
+        self.assertEqual(FeeStatus.objects.count(), 10)
+
+        result = FeeStructure.generate_monthly_payments([self.structure], start_date=self.start)
+        self.assertEqual(result['created'], 10)
+        again = FeeStructure.generate_monthly_payments([self.structure], start_date=self.start)
+        self.assertEqual((again['existing'], again['created']), (20, 0))
+        self.assertEqual(FeeStatus.objects.count(), 20)
+
+    def test_rerun_on_a_later_day_does_not_add_a_second_plan(self):
+        students = self.add_students(2)
+        FeeStructure.generate_monthly_payments([self.structure])
+        self.add_students(1, offset=2)
+        later = timezone.now() + timedelta(days=3)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            result = FeeStructure.generate_monthly_payments([self.structure])
+        self.assertEqual((result['planned'], result['existing'], result['created']), (30, 20, 10))
+        self.assertEqual(FeeStatus.objects.filter(student__in=students).count(), 20)
+        self.assertEqual(
+            FeeStatus.objects.filter(fee_structure=self.structure).order_by('due_date').last().due_date,
+            later.date() + timedelta(days=270)
+        )
+
+    def test_query_count_does_not_grow_with_students(self):
+        # 140 rows still fit in a single INSERT on SQLite
+        self.add_students(2)
+        with CaptureQueriesContext(connection) as small:
+            FeeStructure.generate_monthly_payments([self.structure], start_date=self.start)
+        self.add_students(12, offset=2)
+        with CaptureQueriesContext(connection) as large:
+            FeeStructure.generate_monthly_payments([self.structure], start_date=self.start + timedelta(days=1))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_command_dry_run(self):
+        self.add_students(2)
+        out = StringIO()
+        call_command('generate_monthly_fees', '--form', '1', '--dry-run', stdout=out)
+        self.assertIn('Would create 20 payment records', out.getvalue())
+        self.assertFalse(FeeStatus.objects.exists())
+
+        call_command('generate_monthly_fees', '--start-date', str(self.start), stdout=out)
+        self.assertIn('Created 20 payment records', out.getvalue())
+
+
+
+class CheckoutServiceTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tuition = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self.overtime = FeeCategory.objects.create(name='Overtime', description='Overtime fee', category_type='individual')
+        self.student = self.make_student('C001')
+        self.sibling = self.make_student('C002')
+        self.structures = [
+            FeeStructure.objects.create(
+                category=FeeCategory.objects.create(name=f'Fee {i}', description='Fee'),
+                form='Form 2', amount=Decimal('40.00'), frequency='yearly'
+            )
+            for i in range(6)
+        ]
+        FeeWaiver.objects.create(
+            student=self.student, waiver_type='discount', category=self.structures[0].category,
+            amount=Decimal('15.00'), reason='Sibling', status='approved',
+            start_date=self.today - timedelta(days=1), end_date=self.today + timedelta(days=1)
+        )
+
+    def make_student(self, student_id):
+        return Student.objects.create(
+            student_id=student_id, nric=student_id.rjust(12, '0'), first_name='Ali', last_name='Test',
+            level='form', level_custom='Form 2', class_name='A'
+        )
+
+    def make_cart(self, student, count):
+        statuses = [
+            FeeStatus.objects.create(
+                student=student, fee_structure=structure, amount=structure.amount, due_date=self.today
+            )
+            for structure in self.structures[:count]
+        ]
+        individual = IndividualStudentFee.objects.create(
+            student=student, category=self.overtime, name='Overtime', description='Late pickup',
+            amount=Decimal('5.00'), due_date=self.today
+        )
+        return {'fee_statuses': [fs.id for fs in statuses], 'fees': [], 'individual_fees': [individual.id]}
+
+    def test_online_checkout_pays_everything(self):
+        cart = self.make_cart(self.student, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = CheckoutService([self.student]).checkout(cart, donation_amount='20')
+
+        self.assertEqual(
+            sorted(payment.amount for payment in result['payments']),
+            [Decimal('5.00'), Decimal('25.00'), Decimal('40.00')]
+        )
+        self.assertEqual(Payment.objects.filter(student=self.student, status='completed').count(), 3)
+        self.assertFalse(FeeStatus.objects.filter(id__in=cart['fee_statuses']).exclude(status='paid').exists())
+        self.assertTrue(IndividualStudentFee.objects.get(id=cart['individual_fees'][0]).is_paid)
+        self.assertEqual(PibgDonation.objects.get().amount, Decimal('20.00'))
+        self.assertEqual(StudentFeeLedger.objects.get(student=self.student).paid_amount, Decimal('70.00'))
+        self.assertIn('total', result['timings'])
+
+    def test_cash_checkout_leaves_fees_pending(self):
+        cart = self.make_cart(self.student, 1)
+        result = CheckoutService([self.student], payment_method='cash').checkout(cart, donation_amount='10')
+        self.assertEqual({payment.status for payment in result['payments']}, {'pending'})
+        self.assertEqual(FeeStatus.objects.get(id=cart['fee_statuses'][0]).status, 'pending')
+        self.assertFalse(IndividualStudentFee.objects.get(id=cart['individual_fees'][0]).is_paid)
+        self.assertEqual(PibgDonation.objects.get().status, 'pending')
+
+    def test_repeat_checkout_and_foreign_items_are_skipped(self):
+        cart = self.make_cart(self.student, 2)
+        CheckoutService([self.student]).checkout(cart)
+        again = CheckoutService([self.student]).checkout(cart)
+        self.assertEqual((len(again['payments']), again['skipped']), (0, 3))
+
+        other_cart = self.make_cart(self.sibling, 1)
+        result = CheckoutService([self.student]).checkout(other_cart)
+        self.assertEqual((len(result['payments']), result['skipped']), (0, 2))
+        self.assertEqual(Payment.objects.count(), 3)
+
+    def test_invalid_donation_writes_nothing(self):
+        cart = self.make_cart(self.student, 1)
+        with self.assertRaises(CheckoutError):
+            CheckoutService([self.student]).checkout(cart, donation_amount='custom', custom_donation_amount='1')
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(FeeStatus.objects.get(id=cart['fee_statuses'][0]).status, 'pending')
+
+    def test_invoices_are_written_with_the_payments(self):
+        Invoice.objects.create(
+            student=self.sibling, payment=Payment.objects.create(
+                student=self.sibling, amount=Decimal('1.00'), payment_date=self.today, payment_method='cash', status='completed'
+            ), amount=Decimal('1.00'), due_date=self.today
+        )
+        cart = self.make_cart(self.student, 2)
+        result = CheckoutService([self.student], invoices=True).checkout(cart)
+        self.assertEqual(
+            sorted(invoice.invoice_number for invoice in Invoice.objects.filter(student=self.student)),
+            ['INV-000002', 'INV-000003', 'INV-000004']
+        )
+        self.assertEqual({invoice.payment_id for invoice in result['invoices']}, {payment.id for payment in result['payments']})
+        self.assertEqual(Invoice.objects.get(payment=result['payments'][0]).total_amount, result['payments'][0].amount)
+
+        # A failed invoice write rolls the payments back with it
+        cart = self.make_cart(self.sibling, 1)
+        with mock.patch.object(Invoice, 'next_invoice_numbers', return_value=['INV-000002', 'INV-000002']):
+            with self.assertRaises(IntegrityError):
+                CheckoutService([self.sibling], invoices=True).checkout(cart)
+        self.assertEqual(Payment.objects.filter(student=self.sibling).count(), 1)
+
+    def test_parent_checkout_uses_receipts_and_regular_fees(self):
+        user = User.objects.create_user('checkout_parent', 'parent@example.com', 'password123')
+        parent = Parent.objects.create(user=user, nric='900101010101', phone_number='0123', address='KL')
+        parent.students.add(self.student, self.sibling)
+        monthly = FeeStructure.objects.create(
+            category=self.tuition, form='2', frequency='monthly', monthly_duration=10,
+            total_amount=Decimal('500.00'), amount=Decimal('50.00')
+        )
+        cart = self.make_cart(self.sibling, 1)
+        cart['fees'] = [monthly.id]
+
+        result = CheckoutService(parent.students.all(), parent=parent, receipt_prefix='PAR').checkout(cart)
+        self.assertEqual(len(result['payments']), 3)
+        self.assertTrue(all(payment.receipt_number.startswith('PAR') for payment in result['payments']))
+        self.assertEqual(FeeStatus.objects.filter(fee_structure=monthly, status='paid').count(), 10)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small_cart = self.make_cart(self.student, 1)
+        with CaptureQueriesContext(connection) as small:
+            CheckoutService([self.student]).checkout(small_cart)
+        large_cart = self.make_cart(self.sibling, 6)
+        with CaptureQueriesContext(connection) as large:
+            CheckoutService([self.sibling]).checkout(large_cart)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+class ParentCartTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tuition = FeeCategory.objects.create(name='Tuition', description='Tuition fee')
+        self.overtime = FeeCategory.objects.create(name='Overtime', description='Overtime fee', category_type='individual')
+        self.fee = FeeStructure.objects.create(
+            category=self.tuition, form='Form 2', amount=Decimal('40.00'), frequency='yearly'
+        )
+        self.student = Student.objects.create(
+            student_id='K001', nric='000000000901', first_name='Ali', last_name='Test',
+            level='form', level_custom='Form 2', class_name='A'
+        )
+        self.fee_status = FeeStatus.objects.create(
+            student=self.student, fee_structure=self.fee, amount=Decimal('40.00'), due_date=self.today
+        )
+        self.individual_fee = IndividualStudentFee.objects.create(
+            student=self.student, category=self.overtime, name='Overtime', description='Late pickup',
+            amount=Decimal('5.00'), due_date=self.today
+        )
+        FeeWaiver.objects.create(
+            student=self.student, waiver_type='discount', category=self.tuition,
+            amount=Decimal('15.00'), reason='Sibling', status='approved',
+            start_date=self.today - timedelta(days=1), end_date=self.today + timedelta(days=1)
+        )
+        self.user = User.objects.create_user('cart_parent', 'cart@example.com', 'password123')
+        UserProfile.objects.create(user=self.user, role='parent')
+        self.parent = Parent.objects.create(user=self.user, nric='900101010102', phone_number='0123', address='KL')
+        self.parent.students.add(self.student)
+
+    def test_totals_follow_add_and_remove(self):
+        cart = ParentCart.for_parent(self.parent)
+        self.assertTrue(cart.add_item(self.student, fee_status=self.fee_status))
+        self.assertFalse(cart.add_item(self.student, fee_status=self.fee_status))
+        self.assertTrue(cart.add_item(self.student, individual_fee=self.individual_fee))
+
+        cart = ParentCart.objects.get(pk=cart.pk)
+        self.assertEqual(cart.item_count, 2)
+        self.assertEqual(cart.total_amount, Decimal('30.00'))  # 40 - 15 discount + 5
+        self.assertEqual(
+            cart.as_checkout_cart(),
+            {'fees': [], 'fee_statuses': [self.fee_status.id], 'individual_fees': [self.individual_fee.id]}
+        )
+
+        self.assertTrue(cart.remove_item(fee_status_id=self.fee_status.id))
+        self.assertFalse(cart.remove_item(fee_status_id=self.fee_status.id))
+        cart = ParentCart.objects.get(pk=cart.pk)
+        self.assertEqual((cart.item_count, cart.total_amount), (1, Decimal('5.00')))
+
+        cart.clear()
+        cart = ParentCart.objects.get(pk=cart.pk)
+        self.assertEqual((cart.item_count, cart.total_amount), (0, Decimal('0.00')))
+        self.assertFalse(cart.items.exists())
+
+    def test_discard_recalculates_every_cart(self):
+        parent_cart = ParentCart.for_parent(self.parent)
+        student_cart = ParentCart.for_student(self.student)
+        for cart in (parent_cart, student_cart):
+            cart.add_item(self.student, fee_structure=self.fee)
+            cart.add_item(self.student, individual_fee=self.individual_fee)
+
+        self.assertEqual(ParentCart.discard(individual_fee=self.individual_fee), 2)
+        for cart in ParentCart.objects.all():
+            self.assertEqual((cart.item_count, cart.total_amount), (1, Decimal('40.00')))
+
+    def test_for_user_reads_one_row(self):
+        ParentCart.for_parent(self.parent).add_item(self.student, fee_structure=self.fee)
+        with self.assertNumQueries(1):
+            cart = ParentCart.for_user(self.user)
+            self.assertEqual(cart.item_count, 1)
+        stranger = User.objects.create_user('no_cart', 'none@example.com', 'password123')
+        self.assertEqual(ParentCart.for_user(stranger).item_count, 0)
+
+    def test_parent_views_use_db_cart(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('myapp:parent_add_to_cart'), {'fee_status_id': self.fee_status.id})
+        self.client.post(reverse('myapp:parent_add_to_cart'), {'individual_fee_id': self.individual_fee.id})
+        self.assertNotIn('cart', self.client.session)
+
+        response = self.client.get(reverse('myapp:parent_dashboard'))
+        self.assertEqual(response.context['cart_items_count'], 2)
+        self.assertEqual(response.context['cart_total'], Decimal('30.00'))
+
+        self.client.post(reverse('myapp:parent_remove_from_cart'), {'individual_fee_id': self.individual_fee.id})
+        self.assertEqual(ParentCart.for_parent(self.parent).item_count, 1)
+
+        self.client.post(reverse('myapp:parent_checkout_cart'), {'payment_method': 'online'})
+        cart = ParentCart.for_parent(self.parent)
+        self.assertEqual((cart.item_count, cart.items.count()), (0, 0))
+        self.fee_status.refresh_from_db()
+        self.assertEqual(self.fee_status.status, 'paid')
+        self.assertEqual(Invoice.objects.get(student=self.student).status, 'paid')
+
+
+    def test_student_without_record_gets_no_cart(self):
+        with self.assertRaises(ValueError):
+            ParentCart.for_student(None)
+        ParentCart.for_parent(self.parent).add_item(self.student, fee_structure=self.fee)
+
+        user = User.objects.create_user('unlinked_student', 'unlinked@example.com', 'password123')
+        UserProfile.objects.create(user=user, role='student')
+        self.client.force_login(user)
+        for name, data in (
+            ('myapp:add_to_cart', {'fee_id': self.fee.id}),
+            ('myapp:remove_from_cart', {'fee_id': self.fee.id}),
+            ('myapp:checkout_cart', {'payment_method': 'online'}),
+        ):
+            response = self.client.post(reverse(name), data)
+            self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        response = self.client.get(reverse('myapp:view_cart'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertIn('not linked to a student record', str(list(get_messages(response.wsgi_request))[-1]))
+
+        cart = ParentCart.for_parent(self.parent)
+        self.assertEqual((cart.item_count, cart.items.count()), (1, 1))
+        self.assertEqual(ParentCart.objects.count(), 1)
+
+class _SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every command and keeps DATA bodies"""
+
+    def handle(self):
+        self.reply('220 localhost SMTP stand-in')
+        data = None
+        for raw in self.rfile:
+            line = raw.decode().rstrip('\r\n')
+            if data is not None:
+                if line == '.':
+                    self.server.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line[1:] if line.startswith('..') else line)
+                continue
+            command = line[:4].upper()
+            if command == 'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('250 OK')
+
+    def reply(self, text):
+        self.wfile.write(f'{text}\r\n'.encode())
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPStandInHandler)
+        self.messages = []
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.worker = OutboxWorker(batch_size=50, workers=3)
+
+    def test_enqueue_is_idempotent(self):
+        self.assertEqual(OutboundEmail.enqueue(['a@example.com', 'b@example.com', 'a@example.com'], 'Hi', 'Body', idempotency_key='k1'), 2)
+        self.assertEqual(OutboundEmail.enqueue(['a@example.com', 'c@example.com'], 'Hi', 'Body', idempotency_key='k1'), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 3)
+        self.assertEqual(mail.outbox, [])
+
+    def test_worker_sends_with_locmem_backend(self):
+        OutboundEmail.enqueue(['a@example.com'], 'Receipt', 'Plain', html_body='<p>Html</p>')
+        OutboundEmail.enqueue(['b@example.com', 'c@example.com'], 'Reminder', 'Plain')
+
+        self.assertEqual(self.worker.run_once(), {'sent': 3, 'retried': 0, 'failed': 0, 'deferred': 0})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@example.com', 'b@example.com', 'c@example.com'])
+        receipt = next(message for message in mail.outbox if message.subject == 'Receipt')
+        self.assertEqual(receipt.alternatives, [('<p>Html</p>', 'text/html')])
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        # Nothing is due any more
+        self.assertEqual(self.worker.run_once()['sent'], 0)
+
+    def test_retries_with_backoff_then_gives_up(self):
+        OutboundEmail.enqueue(['a@example.com'], 'Hi', 'Body')
+        email = OutboundEmail.objects.get()
+        email.max_attempts = 2
+        email.save()
+
+        with SMTPStandIn() as server:
+            port = server.server_address[1]
+        # Nothing listens on the port any more, so the connection is refused
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                               EMAIL_HOST='127.0.0.1', EMAIL_PORT=port, EMAIL_USE_TLS=False, EMAIL_TIMEOUT=2):
+            before = timezone.now()
+            self.assertEqual(self.worker.run_once()['retried'], 1)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreaterEqual(email.next_attempt_at, before + timedelta(seconds=60))
+            self.assertEqual(self.worker.backoff(3), timedelta(seconds=240))
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(self.worker.run_once()['failed'], 1)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('failed', 2))
+            self.assertTrue(email.last_error)
+
+    def test_worker_sends_through_smtp(self):
+        OutboundEmail.enqueue(['a@example.com', 'b@example.com'], 'Payment Receipt', 'Thank you for your payment!')
+        with SMTPStandIn() as server:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                                   EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1],
+                                   EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+                self.assertEqual(self.worker.run_once()['sent'], 2)
+        self.assertEqual(len(server.messages), 2)
+        self.assertTrue(all('Subject: Payment Receipt' in message for message in server.messages))
+
+    @override_settings(OUTBOX_RATE_LIMIT=2)
+    def test_rate_limit_defers_extra_emails(self):
+        worker = OutboxWorker()
+        for i in range(3):
+            OutboundEmail.enqueue(['busy@example.com'], f'Reminder {i}', 'Body')
+        OutboundEmail.enqueue(['quiet@example.com'], 'Reminder', 'Body')
+
+        self.assertEqual(worker.run_once(), {'sent': 3, 'retried': 0, 'failed': 0, 'deferred': 1})
+        deferred = OutboundEmail.objects.get(status='pending')
+        self.assertEqual(deferred.recipient, 'busy@example.com')
+        self.assertGreater(deferred.next_attempt_at, timezone.now() + timedelta(minutes=59))
+
+    @override_settings(OUTBOX_RATE_LIMIT=2)
+    def test_rate_limit_counts_rows_other_workers_are_sending(self):
+        for i in range(4):
+            OutboundEmail.enqueue(['busy@example.com'], f'Reminder {i}', 'Body')
+        first, second, third, fourth = OutboundEmail.objects.order_by('id')
+        # Another worker claimed the two oldest rows and is still sending them
+        OutboundEmail.objects.filter(id__in=[first.id, second.id]).update(status='sending', updated_at=timezone.now())
+
+        self.assertEqual(OutboxWorker().run_once(), {'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 2})
+        third.refresh_from_db()
+        self.assertEqual(third.status, 'pending')
+        self.assertLess(third.next_attempt_at, timezone.now() + timedelta(minutes=2))
+
+        # The other worker holds newer rows only: the older ones go first
+        OutboundEmail.objects.filter(id__in=[first.id, second.id]).update(status='pending', next_attempt_at=timezone.now())
+        OutboundEmail.objects.filter(id__in=[third.id, fourth.id]).update(status='sending', updated_at=timezone.now())
+        self.assertEqual(OutboxWorker().run_once()['sent'], 2)
+
+    def test_email_receipt_view_enqueues(self):
+        admin = User.objects.create_superuser('outbox_admin', 'admin@admin.com', 'password123')
+        self.client.force_login(admin)
+        student = Student.objects.create(
+            student_id='O001', nric='000000000888', first_name='Ali', last_name='Test',
+            level='form', level_custom='Form 1'
+        )
+        payment = Payment.objects.create(
+            student=student, amount=Decimal('10.00'), payment_date=timezone.now().date(),
+            payment_method='cash', status='completed'
+        )
+        receipts = OutboundEmail.objects.filter(idempotency_key__startswith=f'payment-receipt:{payment.id}:')
+        token = self.client.get(reverse('myapp:payment_receipts')).context['send_token']
+        for _ in range(2):
+            self.client.get(reverse('myapp:email_receipt', args=[payment.id]), {'send': token})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(receipts.count(), 1)
+
+        call_command('process_outbox', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Reloading the receipts page gives a fresh token, so the receipt can be sent again
+        token = self.client.get(reverse('myapp:payment_receipts')).context['send_token']
+        self.client.get(reverse('myapp:email_receipt', args=[payment.id]), {'send': token})
+        self.assertEqual(receipts.count(), 2)
+
+
+class ReminderCampaignTest(FeeFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fee = self.create_fee('Form 1', '50.00')
+        self.students = self.create_students('R', ['Form 1'] * 4, first_name='Kid', class_name='A')
+        # Two siblings share a parent; one student has a login of their own; one has no email at all
+        parent_user = User.objects.create_user('rem_parent', 'parent@example.com', 'password123')
+        parent = Parent.objects.create(user=parent_user, nric='900101010109', phone_number='0123', address='KL')
+        parent.students.add(self.students[0], self.students[1])
+        student_user = User.objects.create_user('rem_student', 'kid2@example.com', 'password123')
+        UserProfile.objects.create(user=student_user, role='student', student=self.students[2])
+
+        self.make_fee(self.students[0], -10)
+        self.make_fee(self.students[1], 3)
+        self.make_fee(self.students[2], -1)
+        self.make_fee(self.students[3], -5)
+        # Out of scope: too far ahead, or already paid
+        self.make_fee(self.students[0], 30)
+        self.make_fee(self.students[1], -20, status='paid')
+
+    def make_fee(self, student, days, status='pending'):
+        return FeeStatus.objects.create(
+            student=student, fee_structure=self.fee, amount=Decimal('50.00'),
+            due_date=self.today + timedelta(days=days), status=status
+        )
+
+    def test_one_consolidated_email_per_family(self):
+        campaign = ReminderCampaign.objects.create(name='Test')
+        ReminderCampaignRunner(campaign, batch_size=2).run()
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(
+            (campaign.total_families, campaign.processed_families, campaign.skipped_families,
+             campaign.queued_emails, campaign.reminded_fees),
+            (3, 2, 1, 2, 3)
+        )
+        self.assertEqual(campaign.progress_percent, 100)
+        emails = {email.recipient: email for email in OutboundEmail.objects.all()}
+        self.assertEqual(set(emails), {'parent@example.com', 'kid2@example.com'})
+        self.assertIn('Kid0', emails['parent@example.com'].html_body)
+        self.assertIn('Kid1', emails['parent@example.com'].html_body)
+        self.assertIn('RM 100.00', emails['parent@example.com'].body)
+        self.assertEqual(PaymentReminder.objects.filter(status='sent', reminder_count=1).count(), 3)
+
+        # A later campaign bumps the existing reminder rows instead of adding more
+        ReminderCampaignRunner(ReminderCampaign.objects.create(name='Again')).run()
+        self.assertEqual(PaymentReminder.objects.count(), 3)
+        self.assertEqual(set(PaymentReminder.objects.values_list('reminder_count', flat=True)), {2})
+
+    def test_resumes_from_checkpoint_after_crash(self):
+        campaign = ReminderCampaign.objects.create(name='Crash')
+        original = OutboundEmail.enqueue_many
+        calls = []
+
+        def flaky(messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise RuntimeError('SMTP relay down')
+            return original(messages)
+
+        with mock.patch.object(OutboundEmail, 'enqueue_many', side_effect=flaky):
+            with self.assertRaises(RuntimeError), self.assertLogs('myapp.reminder_services', 'ERROR'):
+                ReminderCampaignRunner(campaign, batch_size=1).run()
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.processed_families), ('failed', 1))
+        self.assertEqual(campaign.error, 'SMTP relay down')
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+        ReminderCampaignRunner(campaign, batch_size=1).run()
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual((campaign.total_families, campaign.processed_families, campaign.queued_emails), (3, 2, 2))
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertEqual(set(PaymentReminder.objects.values_list('reminder_count', flat=True)), {1})
+
+    def test_a_campaign_is_run_by_one_runner_at_a_time(self):
+        campaign = ReminderCampaign.objects.create(name='Claimed')
+        # Both polling processes picked it up; the first one claims it
+        first, second = ReminderCampaignRunner(campaign), ReminderCampaignRunner(ReminderCampaign.objects.get(id=campaign.id))
+        self.assertTrue(first.claim())
+        self.assertIsNone(second.run())
+        self.assertFalse(OutboundEmail.objects.exists())
+
+        # Until its heartbeat goes stale
+        ReminderCampaign.objects.filter(id=campaign.id).update(heartbeat_at=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(second.run().status, 'completed')
+        self.assertEqual(PaymentReminder.objects.count(), 3)
+
+    def test_campaign_pages(self):
+        staff = User.objects.create_user('rem_staff', 'staff@example.com', 'password123', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(reverse('myapp:reminder_campaigns'), {'upcoming_days': '0', 'include_overdue': 'on'})
+        self.assertRedirects(response, reverse('myapp:reminder_campaigns'), fetch_redirect_response=False)
+        campaign = ReminderCampaign.objects.get()
+        self.assertEqual((campaign.status, campaign.upcoming_days, campaign.created_by), ('queued', 0, staff))
+
+        # The deployed reminders process polls with --loop; stop it after one pass
+        out = StringIO()
+        with mock.patch('myapp.management.commands.run_reminder_campaigns.time.sleep',
+                        side_effect=KeyboardInterrupt) as sleep:
+            call_command('run_reminder_campaigns', '--loop', stdout=out)
+        sleep.assert_called_once_with(30)
+        self.assertIn('2 families reminded', out.getvalue())
+        progress = self.client.get(reverse('myapp:reminder_campaign_progress', args=[campaign.id])).json()
+        self.assertEqual((progress['status'], progress['processed_families'], progress['progress_percent']), ('completed', 2, 100))
+        self.assertContains(self.client.get(reverse('myapp:reminder_campaigns')), 'Completed')
+
+        self.client.force_login(User.objects.get(username='rem_parent'))
+        self.assertEqual(self.client.get(reverse('myapp:reminder_campaign_progress', args=[campaign.id])).status_code, 403)
+
+
+class PdfReportTest(FeeFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('pdf_admin', 'pdf_admin@example.com', 'password123')
+        self.create_students('P', ['Form 1', 'Form 1', 'Form 2'], first_name='Pdf', class_name='A')
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.client.force_login(self.admin)
+
+    def test_chunked_tables_repeat_header(self):
+        header = ['Id', 'Name']
+        tables = list(chunked_tables(header, ([str(i), 'x'] for i in range(1201)), table_style('banded'), chunk_size=500))
+        self.assertEqual([len(table._cellvalues) for table in tables], [501, 501, 202])
+        self.assertTrue(all(table._cellvalues[0] == header for table in tables))
+        self.assertIs(table_style('banded'), table_style('banded'))
+
+    def test_pdf_downloads_stream_from_file(self):
+        response = self.client.get(reverse('myapp:download_all_students_pdf'), {'show': 'all'})
+        self.assertTrue(response.streaming)
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="students_all_\d+_\d+\.pdf"')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        response = self.client.get(reverse('myapp:admin_fee_dashboard_pdf'))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_background_export(self):
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root), \
+                mock.patch('myapp.report_services._get_executor') as executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('myapp:download_all_students_pdf'), {'background': '1', 'search': 'Pdf1'})
+        self.assertRedirects(response, reverse('myapp:report_exports'), fetch_redirect_response=False)
+        export = ReportExport.objects.get()
+        self.assertEqual((export.status, export.params['search']), ('queued', 'Pdf1'))
+        _, export_id, download_url = executor.return_value.submit.call_args.args
+        self.assertTrue(download_url.endswith(reverse('myapp:report_export_download', args=[export.id])))
+
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            run_export(export_id, download_url)
+            export.refresh_from_db()
+            self.assertEqual(export.status, 'ready')
+            self.assertTrue(export.filename.startswith('students_search_Pdf1_active_'))
+            response = self.client.get(reverse('myapp:report_export_download', args=[export.id]))
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+            response.close()
+        email = OutboundEmail.objects.get(idempotency_key__startswith=f'report-export:{export.id}:')
+        self.assertEqual(email.recipient, 'pdf_admin@example.com')
+        self.assertIn(download_url, email.body)
+        self.assertContains(self.client.get(reverse('myapp:report_exports')), export.filename)
+
+    def test_exports_are_not_public_media(self):
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            export = ReportExport.objects.create(report='students', requested_by=self.admin)
+            run_export(export.id)
+            export.refresh_from_db()
+            self.assertRegex(export.file.name, r'^report_exports/[0-9a-f]{32}\.pdf$')
+            self.assertTrue(export.file.path.startswith(self.media_root))
+            self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, export.file.name)))
+            with self.assertRaises(ValueError):
+                export.file.url
+
+            # What urls.py mounts on /media/ while DEBUG is on
+            self.client.logout()
+            with self.assertRaises(Http404):
+                serve(RequestFactory().get('/'), export.file.name, document_root=settings.MEDIA_ROOT)
+            response = self.client.get(settings.MEDIA_URL + export.file.name)
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(reverse('myapp:report_export_download', args=[export.id]))
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(response.streaming)
+
+    def test_interrupted_exports_are_started_again(self):
+        long_ago = timezone.now() - timedelta(hours=2)
+        lost_running = ReportExport.objects.create(report='students', requested_by=self.admin, status='running')
+        lost_queued = ReportExport.objects.create(report='students', requested_by=self.admin)
+        ReportExport.objects.filter(id__in=[lost_running.id, lost_queued.id]).update(created_at=long_ago, started_at=long_ago)
+        ReportExport.objects.create(report='students', requested_by=self.admin)
+        busy = ReportExport.objects.create(report='students', requested_by=self.admin, status='running', started_at=timezone.now())
+
+        with mock.patch('myapp.report_services._get_executor') as executor:
+            self.client.get(reverse('myapp:report_exports'))
+        resubmitted = {call.args[1] for call in executor.return_value.submit.call_args_list}
+        self.assertEqual(resubmitted, {lost_running.id, lost_queued.id})
+
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            self.assertIsNone(run_export(busy.id))
+            run_export(lost_running.id)
+            self.assertIsNone(run_export(lost_running.id))
+        lost_running.refresh_from_db()
+        self.assertEqual(lost_running.status, 'ready')
+        self.assertGreater(lost_running.started_at, long_ago)
+
+
+class PaymentExportTest(FeeFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        fee = self.create_fee('Form 1', '30.00')
+        self.students = self.create_students('X', ['Form 1'] * 2, first_name='Exp', class_name='A')
+        for days, student, status in [(0, 0, 'completed'), (40, 0, 'pending'), (5, 1, 'completed')]:
+            Payment.objects.create(
+                student=self.students[student], fee_structure=fee, amount=Decimal('30.00'),
+                payment_date=self.today - timedelta(days=days), payment_method='cash', status=status
+            )
+        self.admin = User.objects.create_superuser('exp_admin', 'exp_admin@example.com', 'password123')
+
+    def csv_rows(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_filters_are_parsed_leniently(self):
+        filters = parse_export_filters({'start_date': '2024-01-31', 'date_to': '2024-02-30', 'student': 'x', 'month': '3'})
+        self.assertEqual((str(filters['date_from']), filters['date_to'], filters['student'], filters['month']), ('2024-01-31', None, None, 3))
+
+    def test_csv_streams_filtered_rows_and_logs_metrics(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('myapp.export_services', 'INFO') as logs:
+            rows = self.csv_rows(self.client.get(reverse('myapp:download_payment_data'), {'status': 'completed'}))
+        self.assertEqual(rows[0][:3], ['Payment ID', 'Student ID', 'Student Name'])
+        self.assertEqual(sorted(row[1] for row in rows[1:]), ['X000', 'X001'])
+        self.assertEqual({row[6] for row in rows[1:]}, {'Completed'})
+        self.assertRegex(logs.output[0], r'Export payment_data \(csv\): 2 rows, \d+ bytes')
+
+        rows = self.csv_rows(self.client.get(reverse('myapp:payment_analytics_export'), {
+            'date_from': str(self.today - timedelta(days=10)), 'date_to': 'not-a-date', 'class': 'A',
+        }))
+        self.assertEqual(len(rows), 3)
+
+        # Only the filter of the selected view applies; a leftover student= does not narrow the school view
+        export = reverse('myapp:payment_analytics_export')
+        student = str(self.students[1].id)
+        self.assertEqual(len(self.csv_rows(self.client.get(export, {'view': 'school', 'student': student}))), 4)
+        rows = self.csv_rows(self.client.get(export, {'view': 'student', 'student': student, 'class': 'B'}))
+        self.assertEqual([row[1] for row in rows[1:]], ['X001'])
+
+    def test_student_only_exports_own_payments(self):
+        user = User.objects.create_user('exp_student', 'exp_student@example.com', 'password123')
+        UserProfile.objects.create(user=user, role='student', student=self.students[1])
+        self.client.force_login(user)
+        rows = self.csv_rows(self.client.get(reverse('myapp:download_payment_data')))
+        self.assertEqual([row[1] for row in rows[1:]], ['X001'])
+
+    def test_xlsx_exports(self):
+        from openpyxl import load_workbook
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('myapp:download_payment_data'), {'format': 'excel'})
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook['Payment Data'].max_row, 4)
+
+        response = self.client.get(reverse('myapp:export_fee_report'), {'start_date': str(self.today - timedelta(days=10))})
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.sheetnames, ['Summary', 'Collected Payments', 'Pending Payments', 'Waived Fees'])
+        self.assertEqual(workbook['Collected Payments'].max_row, 3)
+        self.assertEqual(workbook['Pending Payments'].max_row, 1)
+        self.assertEqual([cell.value for cell in workbook['Summary'][2]], ['Tuition', 60, 0, 0, 60])
+
+
+@override_settings(SHARED_CACHE=True)
+class FeeReportSummaryTest(FeeFixtureTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.sports = FeeCategory.objects.create(name='Sports', description='Sports fee')
+        tuition_fee = self.create_fee('Form 1', '100.00')
+        sports_fee = self.create_fee('Form 1', '20.00', 'yearly', category=self.sports)
+        self.student, = self.create_students('R', ['Form 1'], first_name='Rep')
+        for fee, amount, status, days in [
+            (tuition_fee, '100.00', 'completed', 1), (tuition_fee, '60.00', 'completed', 30),
+            (tuition_fee, '80.00', 'pending', 2), (sports_fee, '20.00', 'completed', 3),
+        ]:
+            Payment.objects.create(
+                student=self.student, fee_structure=fee, amount=Decimal(amount),
+                payment_date=self.today - timedelta(days=days), payment_method='cash', status=status
+            )
+        for category, amount, percentage in [(self.tuition, '0', '50'), (self.sports, '15.00', None), (None, '5.00', None)]:
+            FeeWaiver.objects.create(
+                student=self.student, waiver_type='discount', category=category, amount=Decimal(amount),
+                percentage=Decimal(percentage) if percentage else None, reason='Test', status='approved',
+                start_date=self.today, end_date=self.today + timedelta(days=30)
+            )
+        self.admin = User.objects.create_superuser('rep_admin', 'rep_admin@example.com', 'password123')
+
+    def test_summary_figures(self):
+        summary = cached_fee_report_summary()
+        self.assertEqual(
+            (summary['total_collected'], summary['total_pending'], summary['total_waived']),
+            (Decimal('180.00'), Decimal('80.00'), Decimal('60.00'))
+        )
+        self.assertEqual((summary['collected_count'], summary['pending_count'], summary['waived_count']), (3, 1, 3))
+        # 50% of the 80.00 average tuition payment, plus the fixed sports waiver
+        self.assertEqual(summary['category_summary'], [
+            {'name': 'Tuition', 'collected': Decimal('160.00'), 'pending': Decimal('80.00'), 'waived': Decimal('40.00'), 'total': Decimal('280.00')},
+            {'name': 'Sports', 'collected': Decimal('20.00'), 'pending': 0, 'waived': Decimal('15.00'), 'total': Decimal('35.00')},
+        ])
+
+        summary = cached_fee_report_summary(start_date=self.today - timedelta(days=10))
+        self.assertEqual((summary['total_collected'], summary['collected_count']), (Decimal('120.00'), 2))
+
+    def test_view_uses_constant_queries_and_cache(self):
+        self.client.force_login(self.admin)
+        url = reverse('myapp:fee_reports')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url, {'start_date': 'not-a-date'})
+        self.assertEqual(response.context['total_collected'], Decimal('180.00'))
+        for i in range(5):
+            FeeCategory.objects.create(name=f'Extra {i}', description='Extra')
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(url)
+        self.assertLessEqual(len(second), len(first))
+
+        with CaptureQueriesContext(connection) as cached:
+            self.assertEqual(cached_fee_report_summary()['total_collected'], Decimal('180.00'))
+        self.assertEqual(len(cached), 0)
+
+        # Invalidated only once the delete commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(status='pending').get().delete()
+            self.assertEqual(cached_fee_report_summary()['total_pending'], Decimal('80.00'))
+        self.assertEqual(cached_fee_report_summary()['total_pending'], 0)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_not_cached_without_shared_cache(self):
+        cached_fee_report_summary()
+        with CaptureQueriesContext(connection) as queries:
+            cached_fee_report_summary()
+        self.assertGreater(len(queries), 0)
+        self.assertIsNone(cache.get(GENERATION_CACHE_KEY))
+
+
+class RevenueRollupTest(FeeFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fee = self.create_fee('Form 2', '50.00')
+        self.student, = self.create_students('RU', ['Form 2'], first_name='Roll', last_name='Up')
+        self.admin = User.objects.create_superuser('rollup_admin', 'rollup_admin@example.com', 'password123')
+
+    def pay(self, amount, days_ago=0, status='completed', method='cash'):
+        return Payment.objects.create(
+            student=self.student, fee_structure=self.fee, amount=Decimal(amount),
+            payment_date=self.today - timedelta(days=days_ago), payment_method=method, status=status
+        )
+
+    def rollup_rows(self):
+        return sorted(PaymentDailyRollup.objects.values_list('day', 'category', 'form_level', 'status', 'total_amount', 'payment_count'))
+
+    def test_sync_signals_and_high_water_mark(self):
+        self.pay('50.00')
+        self.pay('20.00')
+        self.pay('30.00', days_ago=3, status='pending')
+        self.assertEqual(sync_rollups(['payments'], full=True), {'payments': 2})
+        self.assertEqual(self.rollup_rows(), [
+            (self.today - timedelta(days=3), self.tuition.id, 2, 'pending', Decimal('30.00'), 1),
+            (self.today, self.tuition.id, 2, 'completed', Decimal('70.00'), 2),
+        ])
+
+        # Saves refresh their day, and a moved payment also clears its old day
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = Payment.objects.get(status='pending')
+            moved.payment_date = self.today
+            moved.status = 'completed'
+            moved.save()
+        self.assertEqual(self.rollup_rows(), [(self.today, self.tuition.id, 2, 'completed', Decimal('100.00'), 3)])
+
+        # Writes that skip signals are picked up by the next incremental sync
+        Payment.objects.filter(id=moved.id).update(amount=Decimal('40.00'), updated_at=timezone.now())
+        with redirect_stdout(StringIO()):
+            call_command('sync_revenue_rollups', source=['payments'], stdout=StringIO())
+        self.assertEqual(self.rollup_rows()[0][4], Decimal('110.00'))
+
+    def test_dashboards_read_rollups(self):
+        self.client.force_login(self.admin)
+        self.pay('50.00')
+        self.pay('25.00', days_ago=1, status='pending')
+        url = reverse('myapp:school_fees_dashboard')
+        with CaptureQueriesContext(connection) as first:
+            chart = json.loads(self.client.get(url).context['monthly_chart_data'])
+        self.assertEqual((sum(chart['amounts']), sum(chart['counts'])), (50.0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(10):
+                self.pay('10.00')
+        with CaptureQueriesContext(connection) as second:
+            chart = json.loads(self.client.get(url).context['monthly_chart_data'])
+        self.assertEqual((sum(chart['amounts']), sum(chart['counts'])), (150.0, 11))
+        self.assertLessEqual(len(second), len(first))
+
+        request = RequestFactory().get('/', {'start_date': str(self.today - timedelta(days=7))})
+        request.user = self.admin
+        with mock.patch('myapp.views.render') as render:
+            views.fee_analytics_dashboard(request)
+        context = render.call_args[0][2]
+        self.assertEqual((context['total_collected'], context['total_pending'], context['paid_count']), (Decimal('150.00'), Decimal('25.00'), 11))
+        self.assertEqual((context['category_collected'], context['category_pending']), ([150.0], [25.0]))
+
+    def test_donation_analytics_from_rollups(self):
+        category = DonationCategory.objects.create(name='Building', description='Building fund')
+        event = DonationEvent.objects.bulk_create([DonationEvent(
+            title='Library', description='New library', target_amount=Decimal('100.00'), category=category,
+            start_date=self.today - timedelta(days=5), end_date=self.today + timedelta(days=5)
+        )])[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            for amount, status in [('60.00', 'completed'), ('15.00', 'failed'), ('50.00', 'completed')]:
+                Donation.objects.create(
+                    event=event, donor_name='Donor', donor_email='donor@example.com',
+                    amount=Decimal(amount), payment_method='bank_transfer', status=status
+                )
+        self.client.force_login(self.admin)
+        data = self.client.get(reverse('donation_analytics_api')).json()
+        event_data = data['analytics_data'][0]
+        self.assertEqual((event_data['total_donated'], event_data['donor_count']), (110.0, 2))
+        self.assertEqual(event_data['payment_methods'], [{'payment_method': 'bank_transfer', 'count': 2, 'total': 110.0}])
+        self.assertEqual(event_data['date_reached'], Donation.objects.get(amount=Decimal('50.00')).created_at.isoformat())
+        self.assertEqual((data['overall_stats']['total_donations'], data['overall_stats']['total_amount']), (3, 125.0))
+
+
+class ParentDashboardQueryTest(FeeFixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.structures = [self.create_fee('Form 4', '30.00')]
+        user = User.objects.create_user('dash_parent', 'dash_parent@example.com', 'password123')
+        UserProfile.objects.create(user=user, role='parent')
+        self.parent = Parent.objects.create(user=user, nric='900101010120', phone_number='0123', address='KL')
+        self.client.force_login(user)
+        self.add_children(1)
+
+    def add_children(self, count):
+        offset = self.parent.students.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_children(offset, count)
+
+    def create_children(self, start, count):
+        for child in self.create_students('PD', ['Form 4'] * count, first_name='Kid', start=start):
+            self.parent.students.add(child)
+            FeeStatus.objects.create(
+                student=child, fee_structure=self.structures[0], amount=Decimal('30.00'), due_date=self.today, status='pending'
+            )
+            Payment.objects.create(
+                student=child, fee_structure=self.structures[0], amount=Decimal('10.00'),
+                payment_date=self.today, payment_method='cash', status='completed'
+            )
+
+    def test_dashboard_queries_do_not_grow_with_children(self):
+        url = reverse('myapp:parent_dashboard')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one_child:
+            self.client.get(url)
+        self.add_children(4)
+        with CaptureQueriesContext(connection) as five_children:
+            response = self.client.get(url)
+        self.assertEqual(len(five_children), len(one_child))
+        self.assertEqual((response.context['total_outstanding'], response.context['total_paid']), (Decimal('150.00'), Decimal('50.00')))
+
+    def test_child_fees_filter_paid_structures_in_one_query(self):
+        child = self.parent.students.get()
+        url = reverse('myapp:parent_child_fees', args=[child.id])
+        with CaptureQueriesContext(connection) as one_structure:
+            self.client.get(url)
+        for amount, status in [('20.00', 'paid'), ('25.00', 'overdue'), ('15.00', None)]:
+            category = FeeCategory.objects.create(name=f'Extra {amount}', description='Extra fee')
+            structure = FeeStructure.objects.create(category=category, form='Form 4', amount=Decimal(amount), frequency='yearly')
+            self.structures.append(structure)
+            if status:
+                FeeStatus.objects.create(student=child, fee_structure=structure, amount=structure.amount, due_date=self.today, status=status)
+        with CaptureQueriesContext(connection) as four_structures:
+            response = self.client.get(url)
+        self.assertEqual(len(four_structures), len(one_structure))
+        self.assertEqual(
+            sorted(fee.amount for fee in response.context['available_fees']),
+            [Decimal('15.00'), Decimal('25.00'), Decimal('30.00')]
+        )
+
+
+class StudentDirectoryTest(TestCase):
+    def setUp(self):
+        names = ['Aisyah', 'Ahmad', 'Farid', 'Nurul', 'Siti', 'Zainab', 'Hafiz']
+        self.students = [
+            Student.objects.create(
+                student_id=f'DIR{i:03d}', nric=f'00000000{i:04d}', first_name=names[i % len(names)],
+                last_name=f'Bin Ali {i}', level='form', level_custom='Form 3',
+                year_batch=2020 + i % 3 if i % 4 else None
+            )
+            for i in range(23)
+        ]
+        self.admin = User.objects.create_superuser('directory_admin', 'directory_admin@example.com', 'password123')
+
+    def walk(self, sort_by, descending=False, page_size=5):
+        """Ids of every page, following next cursors and then previous cursors back"""
+        students = filter_students('all')
+        pages = [keyset_page(students, sort_by, descending, page_size=page_size)]
+        while pages[-1].has_next:
+            pages.append(keyset_page(students, sort_by, descending, pages[-1].next_cursor, page_size))
+        backwards = [pages[-1]]
+        while backwards[-1].has_previous:
+            backwards.append(keyset_page(students, sort_by, descending, backwards[-1].previous_cursor, page_size))
+        return [[s.id for s in page] for page in pages], [[s.id for s in page] for page in reversed(backwards)]
+
+    def test_search_text_is_maintained_and_matches_every_term(self):
+        student = self.students[0]
+        self.assertIn('aisyah', student.search_text)
+        student.first_name = 'Safiyyah'
+        student.save(update_fields=['first_name'])
+        student.refresh_from_db()
+        self.assertIn('safiyyah', student.search_text)
+
+        self.assertEqual(list(filter_students('all', 'safiyyah bin ali 0').values_list('id', flat=True)), [student.id])
+        self.assertEqual(filter_students('all', 'SITI form 3').count(), 3)
+        self.assertEqual(filter_students('all', 'DIR01').count(), 10)
+        self.assertFalse(filter_students('all', 'siti farid').exists())
+
+    def test_keyset_pages_cover_every_row_once_in_both_directions(self):
+        for sort_by, descending in [('first_name', False), ('first_name', True), ('year_batch', False), ('year_batch', True)]:
+            forward, backward = self.walk(sort_by, descending)
+            ids = [pk for page in forward for pk in page]
+            # NULLs sort last ascending and first descending
+            expected = sorted(
+                self.students,
+                key=lambda s: (getattr(s, sort_by) is None, getattr(s, sort_by) or '', s.id),
+                reverse=descending
+            )
+            self.assertEqual(ids, [s.id for s in expected], (sort_by, descending))
+            self.assertEqual(forward, backward, (sort_by, descending))
+
+        # A malformed cursor falls back to the first page
+        first = keyset_page(filter_students('all'), 'first_name', page_size=5)
+        self.assertEqual(
+            [s.id for s in keyset_page(filter_students('all'), 'first_name', cursor='not-a-cursor', page_size=5)],
+            [s.id for s in first]
+        )
+        self.assertFalse(first.has_previous)
+
+    def test_stale_or_crafted_cursors_start_from_the_first_page(self):
+        url = reverse('myapp:students_no_auth')
+        stale = keyset_page(filter_students('all'), 'first_name', page_size=5).next_cursor
+        for sort_by, cursor in [
+            ('year_batch', stale),
+            ('year_batch', encode_cursor('year_batch', 'not-a-year', 1)),
+            ('created_at', encode_cursor('created_at', '2024-13-45T99:00:00', 1)),
+            ('is_active', encode_cursor('is_active', 'maybe', 1)),
+        ]:
+            response = self.client.get(url, {'show': 'all', 'sort': sort_by, 'cursor': cursor})
+            self.assertEqual(response.status_code, 200, sort_by)
+            first = keyset_page(filter_students('all'), sort_by, cursor=cursor, page_size=5)
+            self.assertFalse(first.has_previous, sort_by)
+
+    def test_directory_and_search_endpoints(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('myapp:student_directory_api'), {'show': 'all', 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertIsNone(first['previous_cursor'])
+
+        response = self.client.get(reverse('myapp:student_directory_api'), {'show': 'all', 'limit': 10, 'cursor': first['next_cursor']})
+        second = response.json()
+        self.assertFalse({r['id'] for r in first['results']} & {r['id'] for r in second['results']})
+        self.assertIsNotNone(second['previous_cursor'])
+
+        response = self.client.get(reverse('myapp:student_search_api'), {'q': 'nurul'})
+        self.assertEqual({r['first_name'] for r in response.json()['results']}, {'Nurul'})
+        self.assertEqual(self.client.get(reverse('myapp:student_search_api'), {'q': 'n'}).json()['results'], [])
+
+        response = self.client.get(reverse('myapp:student_list'), {'show': 'all'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Showing 23 of 23 students')
+
+        user = User.objects.create_user('directory_user', 'directory_user@example.com', 'password123')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('myapp:student_search_api'), {'q': 'nurul'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('myapp:student_directory_api')).status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StudentImportTest(FeeFixtureTestCase):
+    HEADER = ['Student ID', 'NRIC', 'First Name', 'Last Name', 'Year Batch', 'Level', 'Level Custom', 'Parent NRIC', 'Parent Name', 'Parent Phone']
+
+    def setUp(self):
+        super().setUp()
+        self.activity = FeeCategory.objects.create(name='Activity', description='Activity fee')
+        self.create_fee('Form 2', '100.00', 'yearly')
+        self.create_fee('Form 2', '30.00', 'termly', category=self.activity)
+        Student.objects.create(student_id='EX001', nric='000000009001', first_name='Existing', last_name='Student')
+        self.admin = User.objects.create_superuser('import_admin', 'import_admin@example.com', 'password123')
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def rows(self, count, prefix='IM'):
+        # Every two students share a parent
+        return [
+            [f'{prefix}{i:03d}', f'{prefix}{i:010d}', f'Import{i}', 'Student', 2024.0, 'form', 'Form 2',
+             f'P{prefix}{i // 2:09d}', f'Parent {i // 2}', '0123456789']
+            for i in range(count)
+        ]
+
+    def xlsx(self, rows):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(self.HEADER)
+        for row in rows:
+            sheet.append(row)
+        output = BytesIO()
+        workbook.save(output)
+        return SimpleUploadedFile('students.xlsx', output.getvalue())
+
+    def csv(self, rows):
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(self.HEADER)
+        writer.writerows(rows)
+        return SimpleUploadedFile('students.csv', output.getvalue().encode())
+
+    def test_xlsx_import_creates_students_accounts_parents_and_fees(self):
+        self.client.force_login(self.admin)
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            response = self.client.post(reverse('myapp:bulk_add_students_form'), {'file': self.xlsx(self.rows(6))})
+            self.assertContains(response, 'All 6 students were added')
+            report = response.context['report']
+            with report.file.open('rb') as report_file:
+                lines = report_file.read().decode().splitlines()
+
+        students = Student.objects.filter(student_id__startswith='IM')
+        self.assertEqual(students.count(), 6)
+        student = students.get(student_id='IM003')
+        self.assertEqual((student.year_batch, student.form_level), (2024, 2))
+        self.assertIn('import3', student.search_text)
+        self.assertEqual(FeeStatus.objects.filter(student__in=students).count(), 12)
+        self.assertEqual(
+            FeeStatus.objects.get(student=student, fee_structure__category=self.activity).due_date,
+            timezone.now().date() + timedelta(days=90)
+        )
+        self.assertEqual(UserProfile.objects.get(user__username='student_im003').student, student)
+
+        # Accounts start without a password; the report has a link to set one
+        account = User.objects.get(username='student_im003')
+        self.assertFalse(account.has_usable_password())
+        self.assertEqual(lines[0], 'Row,Student ID,NRIC,Name,Status,Errors,Accounts')
+        accounts = dict(entry.split(' ') for entry in lines[4].split(',')[-1].split('; '))
+        self.assertEqual(set(accounts), {'student_im003'})
+        self.assertIn('parent_pim000000001', lines[3])
+        self.client.logout()
+        self.client.post(accounts['student_im003'], {'new_password1': 'Fresh-pass-123', 'new_password2': 'Fresh-pass-123'})
+        self.assertTrue(self.client.login(username='student_im003', password='Fresh-pass-123'))
+
+        parent = Parent.objects.get(nric='PIM000000001')
+        self.assertEqual(sorted(parent.students.values_list('student_id', flat=True)), ['IM002', 'IM003'])
+        self.assertEqual(parent.user.myapp_profile.role, 'parent')
+        self.assertTrue(hasattr(parent.user, 'profile'))
+        self.assertEqual(Parent.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        counts = []
+        for count, prefix in ((4, 'QA'), (40, 'QB')):
+            upload = self.csv(self.rows(count, prefix))
+            with CaptureQueriesContext(connection) as queries:
+                result = import_students(read_rows(upload))
+            self.assertTrue(result.is_valid, [row.errors for row in result.error_rows])
+            self.assertEqual(result.students_created, count)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bad_rows_import_nothing_and_are_reported(self):
+        rows = self.rows(4)
+        rows[1][0] = rows[0][0]
+        rows[2][1] = '000000009001'
+        rows[3][2] = ''
+        rows[3][4] = 'next year'
+        self.client.force_login(self.admin)
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            response = self.client.post(reverse('myapp:bulk_add_students_form'), {'file': self.csv(rows)})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(Student.objects.filter(student_id__startswith='IM').exists())
+            self.assertFalse(Parent.objects.exists())
+            self.assertContains(response, 'student_id IM000 is repeated (first on row 2)')
+            self.assertContains(response, 'NRIC 000000009001 already exists')
+
+            report = ReportExport.objects.get(report='student_import')
+            self.assertEqual(report.params, {'rows': 4, 'errors': 3})
+            download = self.client.get(reverse('myapp:report_export_download', args=[report.id]))
+            lines = b''.join(download.streaming_content).decode().splitlines()
+            download.close()
+        self.assertEqual(lines[1], '2,IM000,IM0000000000,Import0 Student,ok,')
+        self.assertIn("Missing first_name; year_batch must be a year, not 'next year'", lines[4])
+
+        response = self.client.post(reverse('myapp:bulk_add_students_form'), {'file': SimpleUploadedFile('students.txt', b'x')})
+        self.assertContains(response, 'Please upload an .xlsx or .csv file.')
+
+    def test_manual_form_entries(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('myapp:bulk_add_students_form'), {
+            'student_id_1': 'MF001', 'nric_1': '000000008001', 'first_name_1': 'Manual', 'last_name_1': 'One',
+            'year_batch_1': '2025', 'level_1': 'form', 'level_custom_1': '', 'is_active_1': 'on',
+            'student_id_2': 'MF002', 'nric_2': '000000008002', 'first_name_2': 'Manual', 'last_name_2': 'Two',
+            'year_batch_2': '2025', 'level_2': 'year', 'level_custom_2': '', 'create_accounts': 'off',
+        })
+        self.assertRedirects(response, reverse('myapp:student_list'), fetch_redirect_response=False)
+        first, second = Student.objects.filter(student_id__startswith='MF').order_by('student_id')
+        self.assertEqual((first.level_custom, first.form_level, first.is_active), ('Form 1', 1, True))
+        self.assertEqual((second.level, second.is_active), ('year', False))
+        self.assertFalse(User.objects.filter(username__startswith='student_mf').exists())
+
+    def test_parents_with_email_get_a_password_link(self):
+        self.client.force_login(self.admin)
+        with override_settings(PRIVATE_MEDIA_ROOT=self.media_root):
+            self.client.post(reverse('myapp:bulk_add_students_form'), {
+                'student_id_1': 'MF003', 'nric_1': '000000008003', 'first_name_1': 'Manual', 'last_name_1': 'Three',
+                'year_batch_1': '2025', 'parent_nric_1': '800101010101', 'parent_name_1': 'Siti Aminah',
+                'parent_phone_1': '0123456789', 'parent_email_1': 'siti@example.org',
+            })
+        parent = User.objects.get(username='parent_800101010101')
+        self.assertFalse(parent.has_usable_password())
+        invite = OutboundEmail.objects.get(recipient='siti@example.org')
+        self.assertIn('http://testserver/accounts/password-reset-confirm/', invite.body)
+        self.assertFalse(OutboundEmail.objects.filter(recipient__endswith='@school.com').exists())
+
+    def test_unreadable_files_and_clashing_rows_fail_the_import(self):
+        self.client.force_login(self.admin)
+        url = reverse('myapp:bulk_add_students_form')
+        latin1 = ','.join(self.HEADER).encode() + '\nIM000,\xe9\n'.encode('latin-1')
+        for upload, message in [
+            (SimpleUploadedFile('students.xlsx', b'not a workbook'), 'The file is not a readable .xlsx workbook'),
+            (SimpleUploadedFile('students.csv', latin1), 'The CSV file is not UTF-8 text'),
+        ]:
+            response = self.client.post(url, {'file': upload})
+            self.assertContains(response, message)
+
+        # A student added after the rows were checked makes bulk_create fail
+        with mock.patch('myapp.student_import_services._existing', return_value=set()):
+            rows = self.rows(2)
+            rows[1][0] = 'EX001'
+            response = self.client.post(url, {'file': self.csv(rows)})
+        self.assertContains(response, 'nothing was imported')
+        self.assertFalse(Student.objects.filter(student_id__startswith='IM').exists())
+
+        upload = os.path.join(self.media_root, 'students.csv')
+        with open(upload, 'wb') as f:
+            f.write(latin1)
+        with self.assertRaisesMessage(CommandError, 'The CSV file is not UTF-8 text'):
+            call_command('import_students', upload, stdout=StringIO())
+
+    def test_only_staff_can_import(self):
+        parent = User.objects.create_user('import_parent', 'import_parent@example.com', 'password123')
+        UserProfile.objects.create(user=parent, role='parent')
+        self.client.force_login(parent)
+        response = self.client.post(reverse('myapp:bulk_add_students_form'), {'file': self.csv(self.rows(2))})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertFalse(Student.objects.filter(student_id__startswith='IM').exists())
+
+
+def run_in_threads(action, threads=4, repeat=1):
+    """
+    Run ``action`` ``repeat`` times in each of ``threads`` threads started
+    together, each on its own database connection; returns the errors raised.
+    The SQLite test database reports a write conflict as "locked" instead of
+    waiting, so those attempts are retried.
+    """
+    from django.db import OperationalError
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def work():
+        try:
+            barrier.wait()
+            for _ in range(repeat):
+                while True:
+                    try:
+                        action()
+                        break
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return errors
+
+
+class DonationEventTotalTest(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        category = DonationCategory.objects.create(name='Building', description='Building fund')
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.event = DonationEvent.objects.create(
+                title='New Hall', description='Hall', target_amount=Decimal('1000.00'), category=category,
+                start_date=timezone.now().date(), end_date=timezone.now().date() + timedelta(days=30)
+            )
+        self.other = DonationEvent.objects.create(
+            title='Library', description='Books', target_amount=Decimal('500.00'), category=category,
+            start_date=timezone.now().date(), end_date=timezone.now().date() + timedelta(days=30), qr_code='event_qrcodes/x.png'
+        )
+
+    def donate(self, amount, status='completed', event=None):
+        return Donation.objects.create(
+            event=event or self.event, donor_name='Donor', donor_email='donor@example.com', amount=Decimal(amount),
+            payment_method='bank_transfer', status=status
+        )
+
+    def current(self, event=None):
+        return (event or self.event).__class__.objects.get(pk=(event or self.event).pk).current_amount
+
+    def test_status_changes_moves_and_deletes(self):
+        qr_code = self.event.qr_code.name
+        pending = self.donate('40.00', status='pending')
+        self.donate('25.00')
+        self.assertEqual(self.current(), Decimal('25.00'))
+
+        pending.status = 'completed'
+        pending.save()
+        pending.save()
+        self.assertEqual(self.current(), Decimal('65.00'))
+
+        pending = Donation.objects.get(pk=pending.pk)
+        pending.event = self.other
+        pending.amount = Decimal('30.00')
+        pending.save()
+        self.assertEqual((self.current(), self.current(self.other)), (Decimal('25.00'), Decimal('30.00')))
+
+        Donation.objects.get(pk=pending.pk).delete()
+        self.assertEqual(self.current(self.other), 0)
+
+        # Saving the event keeps its QR code
+        self.event.refresh_from_db()
+        self.event.save()
+        self.assertEqual(self.event.qr_code.name, qr_code)
+
+    def test_concurrent_donations_are_all_counted(self):
+        self.assertEqual(run_in_threads(lambda: self.donate('10.00'), threads=4, repeat=5), [])
+        # A retried attempt may already have committed its donation, so compare with what is stored
+        total = Donation.objects.filter(event=self.event).aggregate(total=Sum('amount'))['total']
+        self.assertGreaterEqual(total, Decimal('200.00'))
+        self.assertEqual(self.current(), total)
+
+        DonationEvent.objects.filter(pk=self.event.pk).update(current_amount=Decimal('5.00'))
+        out = StringIO()
+        call_command('reconcile_donation_totals', stdout=out)
+        self.assertIn(f'New Hall: RM 5.00 -> RM {total}', out.getvalue())
+        self.assertEqual(self.current(), total)
+
+
+class AdminFeeDashboardQueryTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.admin = User.objects.create_superuser('dashboard_admin', 'admin@admin.com', 'password123')
+        self.category = FeeCategory.objects.create(name='PTA', description='PTA fee')
+        self.structures = {
+            form: FeeStructure.objects.create(
+                category=self.category, form=form, amount=Decimal('100.00'), frequency='yearly'
+            )
+            for form in ['1', 'Form 2', '3']
+        }
+
+    def add_students(self, count, offset=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(offset, offset + count):
+                form = ['1', '2', '3'][i % 3]
+                student = Student.objects.create(
+                    student_id=f'D{i:04d}', nric=f'{i:012d}', first_name=['Ahmad', 'Siti'][i % 2],
+                    last_name='Test', level='form', level_custom=form, class_name='ABC'[i % 3]
+                )
+                structure = self.structures.get(form) or self.structures['Form 2']
+                FeeStatus.objects.create(
+                    student=student, fee_structure=structure, amount=structure.amount,
+                    due_date=self.today, status='pending' if i % 2 else 'paid'
+                )
+                if i % 2 == 0:
+                    Payment.objects.create(
+                        student=student, fee_structure=structure, amount=structure.amount,
+                        payment_date=self.today, payment_method='cash', status='completed'
+                    )
+
+    def test_dashboard_values(self):
+        self.add_students(12)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('myapp:admin_fee_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        self.assertEqual(context['expected_amount'], Decimal('1200.00'))
+        self.assertEqual(context['actual_collection'], Decimal('600.00'))
+        self.assertEqual(context['outstanding_amount'], Decimal('600.00'))
+        self.assertEqual(context['total_students'], 12)
+
+        row = next(item for item in context['form_class_data'] if item['form'] == 1 and item['class'] == 'A')
+        self.assertEqual(row['total'], 4)
+        self.assertEqual(row['expected'], 400.0)
+        self.assertEqual(row['paid'], 200.0)
+        status_row = next(item for item in context['payment_status_data'] if item['grade'] == 1 and item['class'] == 'A')
+        self.assertEqual(status_row['males_paid'] + status_row['females_paid'], 2)
+        self.assertEqual(status_row['males_not_paid'] + status_row['females_not_paid'], 2)
+
+    def test_query_count_does_not_grow_with_students(self):
+        self.client.force_login(self.admin)
+        self.add_students(6)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('myapp:admin_fee_dashboard'))
+        self.add_students(60, offset=6)
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.client.get(reverse('myapp:admin_fee_dashboard'))
+        # Session, user and role lookups plus the dashboard's grouped queries; the
+        # session query disappears with SHARED_CACHE, where sessions use cached_db
+        expected = 14 if settings.SESSION_ENGINE.endswith('cached_db') else 15
+        self.assertEqual(len(small.captured_queries), expected)
+
+
+class StructuredLoggingTest(TestCase):
+    def setUp(self):
+        self.stream = StringIO()
+        self.handler = QueueHandler(stream=self.stream)
+        self.handler.addFilter(RequestContextFilter())
+        self.handler.setFormatter(logging.Formatter('%(levelname)s request_id=%(request_id)s %(message)s'))
+        self.logger = logging.getLogger('myapp.tests.structured')
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+
+    def output(self):
+        self.handler.stop()
+        return self.stream.getvalue()
+
+    def get_through_middleware(self, **headers):
+        def view(request):
+            self.logger.debug('debug for %s', request.path)
+            self.logger.warning('warning for %s', request.path)
+            return HttpResponse()
+        return LogSamplingMiddleware(view)(RequestFactory().get('/fees/', **headers))
+
+    def test_model_hot_paths_do_not_print(self):
+        student = Student(first_name='Ali', last_name='Test', level='form', level_custom='Form 2')
+        out = StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(student.get_level_display_value(), 'Form 2')
+        self.assertEqual(out.getvalue(), '')
+
+    def test_queue_handler_formats_lazily_with_request_id(self):
+        self.logger.debug('outside %s', 'request')
+        self.get_through_middleware(HTTP_X_REQUEST_ID='abc123')
+        lines = self.output().splitlines()
+        self.assertEqual(lines, [
+            'DEBUG request_id=- outside request',
+            'DEBUG request_id=abc123 debug for /fees/',
+            'WARNING request_id=abc123 warning for /fees/',
+        ])
+
+    @override_settings(LOG_SAMPLE_RATE=0)
+    def test_unsampled_requests_only_keep_warnings(self):
+        self.get_through_middleware(HTTP_X_REQUEST_ID='abc123')
+        self.assertEqual(self.output().splitlines(), ['WARNING request_id=abc123 warning for /fees/'])
+
+    def test_forked_child_gets_its_own_listener(self):
+        log_file = tempfile.NamedTemporaryFile('w+', suffix='.log')
+        self.addCleanup(log_file.close)
+        handler = QueueHandler(stream=log_file)
+        self.addCleanup(handler.close)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                alive = handler.listener._thread is not None and handler.listener._thread.is_alive()
+                handler.handle(logging.LogRecord('fork', logging.INFO, __file__, 1, 'from %d', (os.getpid(),), None))
+                handler.stop()
+                handler.target.flush()
+            finally:
+                os._exit(0 if alive else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        log_file.seek(0)
+        self.assertEqual(log_file.read(), f'from {pid}\n')
+
+
+class ViewInstrumentationTest(TestCase):
+    def setUp(self):
+        reset_view_stats()
+        self.admin = User.objects.create_superuser('perf_admin', 'perf@admin.com', 'password123')
+        self.client.force_login(self.admin)
+
+    def test_samples_and_server_timing(self):
+        for _ in range(3):
+            response = self.client.get(reverse('myapp:admin_fee_dashboard'))
+        self.assertIn('db;desc=', response['Server-Timing'])
+
+        stats = {row['url_name']: row for row in view_stats()}
+        row = stats['myapp:admin_fee_dashboard']
+        self.assertEqual(row['count'], 3)
+        self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+        self.assertGreater(row['max_queries'], 0)
+
+        response = self.client.get(reverse('accounts:performance_dashboard'))
+        self.assertContains(response, 'myapp:admin_fee_dashboard')
+
+    def test_performance_page_is_superuser_only(self):
+        User.objects.create_user('perf_user', 'user@example.com', 'password123')
+        self.client.login(username='perf_user', password='password123')
+        response = self.client.get(reverse('accounts:performance_dashboard'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_query_budget(self):
+        from . import views
+        with mock.patch.object(views.admin_fee_dashboard, 'query_budget', 1):
+            with self.assertLogs('donation.instrumentation', 'WARNING') as logs:
+                self.client.get(reverse('myapp:admin_fee_dashboard'))
+            self.assertIn('over its budget of 1', logs.output[0])
+
+            with override_settings(QUERY_BUDGET_STRICT=True), self.assertLogs('django.request', 'ERROR'):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse('myapp:admin_fee_dashboard'))
+
+        # The real budget holds
+        with override_settings(QUERY_BUDGET_STRICT=True):
+            self.assertEqual(self.client.get(reverse('myapp:admin_fee_dashboard')).status_code, 200)
+
+
+class AIComponentRegistryTest(TestCase):
+    def setUp(self):
+        nltk_data = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, nltk_data)
+        settings_override = override_settings(NLTK_DATA_DIR=nltk_data)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ai_registry.reset()
+        self.addCleanup(ai_registry.reset)
+
+    def test_components_load_once_on_first_use(self):
+        calls = []
+
+        def broken():
+            calls.append('broken')
+            raise ImportError('No module named broken')
+
+        loaders = {'probe': (lambda: calls.append('probe') or object(), None), 'broken': (broken, None)}
+        with mock.patch.dict(ai_registry._loaders, loaders):
+            self.assertEqual(calls, [])
+            self.assertIs(ai_registry.get('probe'), ai_registry.get('probe'))
+            with self.assertLogs('donation.ai_registry', 'WARNING'):
+                with self.assertRaises(ai_registry.ComponentUnavailable):
+                    ai_registry.get('broken')
+            with self.assertRaises(ai_registry.ComponentUnavailable):
+                ai_registry.get('broken')
+            self.assertEqual(calls, ['probe', 'broken'])
+            self.assertEqual(
+                {t.name: t.status for t in ai_registry.timings()}, {'probe': 'loaded', 'broken': 'unavailable'}
+            )
+
+    def test_missing_nltk_data_falls_back_without_downloading(self):
+        with mock.patch('urllib.request.urlopen') as urlopen, self.assertLogs('donation.ai_registry', 'WARNING'):
+            chatbot = views.SystemChatbot()
+            sentiment = ai_registry.get('sentiment').polarity_scores('What a wonderful school')
+        urlopen.assert_not_called()
+
+        self.assertEqual(sentiment['compound'], 0.0)
+        self.assertEqual(chatbot.preprocess_text('Payment, please!'), ['payment', 'please'])
+        self.assertIn('cash, bank transfer', chatbot.get_response('How do I pay my fees?'))
+
+    def test_command_reports_timings(self):
+        out = StringIO()
+        with self.assertLogs('donation.ai_registry', 'WARNING'):
+            call_command('ai_components', 'stopwords', stdout=out)
+        self.assertRegex(out.getvalue(), r'stopwords\s+fallback\s+[\d.]+ ms')
+        self.assertIn('Warm-up took', out.getvalue())
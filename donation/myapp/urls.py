@@ -27,9 +27,13 @@ urlpatterns = [
     path('students-public/', views.public_student_list, name='public_student_list'),
     path('students-demo/', views.school_fees_student_demo, name='school_fees_student_demo'),
     path('students-no-auth/', views.students_no_auth, name='students_no_auth'),
+    path('students/directory/', views.student_directory_api, name='student_directory_api'),
+    path('students/search/', views.student_search_api, name='student_search_api'),
     path('search-demo/', views.search_demo_links, name='search_demo_links'),
     path('students/<int:id>/', views.student_detail, name='student_detail'),
     path('students/download-pdf/', views.download_all_students_pdf, name='download_all_students_pdf'),
+    path('reports/exports/', views.report_exports, name='report_exports'),
+    path('reports/exports/<int:export_id>/download/', views.report_export_download, name='report_export_download'),
     path('students/add/', views.add_student, name='add_student'),
     path('students/<int:id>/edit/', views.edit_student, name='edit_student'),
     path('students/bulk-add/', views.bulk_add_students_form, name='bulk_add_students_form'),
@@ -102,6 +106,8 @@ urlpatterns = [
     path('bank-accounts/add/', views.add_bank_account, name='add_bank_account'),
     path('test-donation-amounts/', views.test_donation_amounts, name='test_donation_amounts'),
     path('reminders/', views.payment_reminders, name='payment_reminders'),
+    path('reminders/campaigns/', views.reminder_campaigns, name='reminder_campaigns'),
+    path('reminders/campaigns/<int:campaign_id>/progress/', views.reminder_campaign_progress, name='reminder_campaign_progress'),
     path('reminders/<int:payment_id>/send/', views.send_payment_reminder, name='send_payment_reminder'),
     path('reminders/<int:payment_id>/letter/', views.generate_reminder_letter, name='generate_reminder_letter'),
     path('reminders/<int:payment_id>/options/', views.reminder_options, name='reminder_options'),
@@ -7,19 +7,23 @@ from .models import (
     Student, Parent, FeeCategory, FeeStructure, Payment,
     PaymentReceipt, FeeDiscount, PaymentReminder, SchoolBankAccount,
     DonationCategory, DonationEvent, Donation, EmailPreferences, FeeStatus,
-    FeeWaiver, FeeSettings, AcademicTerm, IndividualStudentFee, UserProfile
+    FeeWaiver, FeeSettings, AcademicTerm, IndividualStudentFee, UserProfile,
+    OutboundEmail, ParentCart, ReminderCampaign, ReportExport, StudentFeeLedger, normalize_form_level
 )
 from .serializers import PaymentSerializer
+from .directory_services import PAGE_SIZE, MAX_PAGE_SIZE, filter_students, keyset_page, sort_field, suggest_students
+from donation.instrumentation import query_budget
 import requests
 import hashlib
+import uuid
 import json
 from django.conf import settings
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from django.contrib import messages
 from django.db.models import Sum, Count, Avg, Q
-from django.db.models.functions import TruncMonth
-from django.http import JsonResponse, HttpResponse
+from django.db.models.functions import ExtractMonth, TruncMonth
+from django.http import FileResponse, JsonResponse, HttpResponse
 from .forms import (
     StudentForm, ParentForm, FeeCategoryForm, FeeStructureForm,
     PaymentForm, FeeDiscountForm, SchoolBankAccountForm, PaymentSearchForm,
@@ -32,22 +36,16 @@ from io import BytesIO
 from django.core.files.base import ContentFile
 from django.contrib.auth.models import User
 from django.template.loader import get_template, render_to_string
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from datetime import datetime, timezone
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.utils.html import strip_tags
+import logging
 
 
 from .ai_services import PaymentPredictionService
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from donation import ai_registry
+from donation.response_cache import ResponseCache, normalize_query
+from django.utils.translation import get_language
 import re
 from django.views.decorators.http import require_GET
 
@@ -56,15 +54,16 @@ try:
 except ImportError:
     Workbook = None
 
-# Download required NLTK data
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
+logger = logging.getLogger(__name__)
 
 class SystemChatbot:
+    # Answers come from the knowledge base alone, so every one is cached
+    response_cache = ResponseCache('system_chatbot')
+
     def __init__(self):
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
+        self.tokenize = ai_registry.get('tokenizer')
+        self.lemmatize = ai_registry.get('lemmatizer')
+        self.stop_words = ai_registry.get('stopwords')
         
         # Define system knowledge base
         self.knowledge_base = {
@@ -117,9 +116,9 @@ class SystemChatbot:
         # Remove special characters
         text = re.sub(r'[^\w\s]', '', text)
         # Tokenize
-        tokens = word_tokenize(text)
+        tokens = self.tokenize(text)
         # Remove stopwords and lemmatize
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens if token not in self.stop_words]
+        tokens = [self.lemmatize(token) for token in tokens if token not in self.stop_words]
         return tokens
 
     def find_relevant_category(self, tokens):
@@ -135,6 +134,14 @@ class SystemChatbot:
         return best_category
 
     def get_response(self, query):
+        query = normalize_query(query)
+        response = self.response_cache.get(query, get_language())
+        if response is None:
+            response = self._answer(query)
+            self.response_cache.set(query, get_language(), response)
+        return response
+
+    def _answer(self, query):
         # Preprocess the query
         tokens = self.preprocess_text(query)
         
@@ -408,10 +415,7 @@ def school_fees(request):
             
             # Get fee structures that are appropriate for this student's form/grade level
             student_level = student.get_level_display_value()
-            available_fees = FeeStructure.objects.filter(
-                form__iexact=student_level,
-                is_active=True
-            ).select_related('category')
+            available_fees = FeeStructure.for_student(student).select_related('category')
             
             # Filter out fees that are completely paid
             fees_to_show = []
@@ -438,6 +442,7 @@ def school_fees(request):
                 individual_fees = []
             
             # Calculate discount information for each fee status
+            FeeStatus.resolve_discounts(fee_statuses)
             for fee_status in fee_statuses:
                 fee_status.discount_info = fee_status.get_discount_info()
             
@@ -484,21 +489,20 @@ def school_fees(request):
             student=student, 
             status__in=['pending', 'overdue']
         ).select_related('fee_structure')
-        print(f"DEBUG: views.school_fees - Student {student.first_name} has {len(fee_statuses)} unpaid fee statuses")
-        print(f"DEBUG: Fee statuses: {[(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("views.school_fees - Student %s has %s unpaid fee statuses", student.first_name, len(fee_statuses))
+            logger.debug("Fee statuses: %s", [(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]])
         
         # Get fee structures that are appropriate for this student's form/grade level
         # This ensures all students in the same form pay the same amount
         student_level = student.get_level_display_value()
-        print(f"DEBUG: Student {student.first_name} is in {student_level}")
+        logger.debug("Student %s is in %s", student.first_name, student_level)
         
         # Get all active fee structures for this student's form level
-        available_fees = FeeStructure.objects.filter(
-            form__iexact=student_level,  # Case-insensitive match
-            is_active=True
-        ).select_related('category')
+        available_fees = FeeStructure.for_student(student).select_related('category')
         
-        print(f"DEBUG: Found {available_fees.count()} fee structures for {student_level}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Found %s fee structures for %s", available_fees.count(), student_level)
         
         # Filter out fees that are completely paid
         fees_to_show = []
@@ -530,6 +534,7 @@ def school_fees(request):
             individual_fees = []
         
         # Calculate discount information for each fee status (only unpaid ones)
+        FeeStatus.resolve_discounts(fee_statuses)
         for fee_status in fee_statuses:
             fee_status.discount_info = fee_status.get_discount_info()
         
@@ -629,17 +634,36 @@ def school_fees_dashboard(request):
     class_chart_labels = [item['student__class_name'] or 'N/A' for item in class_chart_data]
     class_chart_values = [float(item['total']) for item in class_chart_data]
     
-    # 3. Monthly Trends (Line Chart)
+    # 3. Monthly Trends (Line Chart), read from the daily revenue rollups unless
+    # the payments are filtered by student or class, which the rollups don't keep
     six_months_ago = datetime.now() - timedelta(days=180)
-    monthly_data = payments.filter(
-        status='completed',
-        payment_date__gte=six_months_ago
-    ).annotate(
-        month=TruncMonth('payment_date')
-    ).values('month').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('month')
+    if filter_value and filter_type in ('student', 'class'):
+        monthly_data = payments.filter(
+            status='completed',
+            payment_date__gte=six_months_ago
+        ).annotate(
+            month=TruncMonth('payment_date')
+        ).values('month').annotate(
+            total=Sum('amount'),
+            count=Count('id')
+        ).order_by('month')
+    else:
+        from .rollup_services import payment_rollups
+        rollups = payment_rollups().filter(status='completed', day__gte=six_months_ago.date())
+        if filter_type == 'category' and filter_value:
+            rollups = rollups.filter(category__name__icontains=filter_value)
+        if status_filter == 'pending':
+            rollups = rollups.none()
+        if date_from:
+            rollups = rollups.filter(day__gte=date_from)
+        if date_to:
+            rollups = rollups.filter(day__lte=date_to)
+        monthly_data = rollups.annotate(
+            month=TruncMonth('day')
+        ).values('month').annotate(
+            total=Sum('total_amount'),
+            count=Sum('payment_count')
+        ).order_by('month')
     
     monthly_labels = [data['month'].strftime('%b %Y') for data in monthly_data]
     monthly_amounts = [float(data['total']) for data in monthly_data]
@@ -731,6 +755,7 @@ def school_fees_dashboard(request):
     
     return render(request, 'myapp/school_fees_dashboard.html', context)
 
+@query_budget(20)
 @login_required
 def admin_fee_dashboard(request):
     """Comprehensive Student Fee Collection Admin Dashboard"""
@@ -746,74 +771,53 @@ def admin_fee_dashboard(request):
     category_filter = request.GET.get('category', '')
     
     # 1. MAIN SUMMARY DATA (Real-time from database)
-    # Calculate expected amount from all fee structures
+    # Everything below is computed from a handful of grouped queries keyed on
+    # the normalized form_level, so 'Form 3' and '3' land in the same bucket.
     total_fee_structures = FeeStructure.objects.filter(is_active=True)
     expected_amount = 0
     
     # If no active fee structures, try to activate some or use a fallback calculation
-    if total_fee_structures.count() == 0:
+    if not total_fee_structures.exists():
         # Try to activate fee structures or create a basic calculation
-        all_fee_structures = FeeStructure.objects.all()
-        if all_fee_structures.exists():
+        first_fs = FeeStructure.objects.first()
+        if first_fs:
             # Activate the first fee structure as a fallback
-            first_fs = all_fee_structures.first()
             first_fs.is_active = True
             first_fs.save()
-            total_fee_structures = FeeStructure.objects.filter(is_active=True)
     
-    for fee_structure in total_fee_structures:
-        # Count students for each form - handle different form formats
-        form_value = fee_structure.form
-        
-        # Try different form matching strategies
-        student_count = 0
-        
-        # Strategy 1: Direct match
-        student_count = Student.objects.filter(
-            level_custom=form_value,
-            is_active=True
-        ).count()
-        
-        # Strategy 2: If no match, try extracting number from form name
-        if student_count == 0 and 'Form' in str(form_value):
-            form_number = str(form_value).replace('Form', '').strip()
-            student_count = Student.objects.filter(
-                level_custom=form_number,
-                is_active=True
-            ).count()
-        
-        # Strategy 3: If still no match, try reverse (number to Form X)
-        if student_count == 0 and str(form_value).isdigit():
-            form_name = f"Form {form_value}"
-            student_count = Student.objects.filter(
-                level_custom=form_name,
-                is_active=True
-            ).count()
-        
-        expected_amount += fee_structure.amount * student_count
+    active_structures = list(FeeStructure.objects.filter(is_active=True).select_related('category'))
+    
+    # Active students grouped by form level
+    active_students_by_level = {
+        row['form_level']: row['count']
+        for row in Student.objects.filter(is_active=True).values('form_level').annotate(count=Count('id')).order_by()
+    }
+    
+    for fee_structure in active_structures:
+        if fee_structure.form_level is not None:
+            expected_amount += fee_structure.amount * active_students_by_level.get(fee_structure.form_level, 0)
+    
+    # Actual collection and outstanding amount from the per-student fee ledger
+    StudentFeeLedger.refresh_missing()
+    ledger_totals = StudentFeeLedger.objects.aggregate(
+        paid=Sum('paid_amount'),
+        outstanding=Sum('outstanding_amount'),
+    )
+    actual_collection = ledger_totals['paid'] or 0
+    outstanding_amount = ledger_totals['outstanding'] or 0
+    
+    # Total active students
+    total_students_registered = sum(active_students_by_level.values())
     
     # Fallback calculation if no fee structures or no matches
     if expected_amount == 0:
         # Calculate based on actual payments and outstanding amounts
-        actual_collection = Payment.objects.filter(status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
-        outstanding_amount = FeeStatus.objects.filter(
-            status__in=['pending', 'overdue']
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
         expected_amount = actual_collection + outstanding_amount
         
         # If still 0, use a basic calculation based on student count
         if expected_amount == 0:
-            total_students = Student.objects.filter(is_active=True).count()
             # Assume average fee of RM 100 per student as fallback
-            expected_amount = total_students * 100
-    
-    # Actual collection from completed payments
-    actual_collection = Payment.objects.filter(status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    # Outstanding amount from pending and overdue fee statuses
-    outstanding_amount = FeeStatus.objects.filter(
-        status__in=['pending', 'overdue']
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+            expected_amount = total_students_registered * 100
     
     # Achievement percentage - ensure it's properly calculated and capped at 100%
     if expected_amount > 0:
@@ -822,9 +826,6 @@ def admin_fee_dashboard(request):
     else:
         achievement_percentage = 0.0
     
-    # Total active students
-    total_students_registered = Student.objects.filter(is_active=True).count()
-    
     # 2. REPORT BY FORM & CLASS (Real-time from database)
     form_class_data = []
     forms = ['1', '2', '3', '4', '5']
@@ -835,6 +836,7 @@ def admin_fee_dashboard(request):
         forms = [form_filter]
     if class_filter:
         classes = [class_filter]
+    form_levels = {form: normalize_form_level(form) for form in forms}
     
     # Handle report_by filter
     if report_by == 'form':
@@ -847,84 +849,85 @@ def admin_fee_dashboard(request):
         # This will be handled in the fee categories section
         pass
     
+    # Count by gender (assuming names ending with certain letters are female)
+    # This is a simplified approach - in real system, you'd have a gender field
+    male_names = [
+        'Ahmad', 'Ali', 'Hassan', 'Ibrahim', 'Ismail', 'Muhammad', 'Omar', 'Yusuf',
+        'Adam', 'Daniel', 'David', 'James', 'John', 'Michael', 'Peter', 'Robert',
+        'Chen', 'Lee', 'Lim', 'Tan', 'Wong', 'Ng', 'Ong', 'Teo'
+    ]
+    
+    # Active students per (form, class), split by gender
+    grid_students = Student.objects.filter(
+        form_level__in=[level for level in form_levels.values() if level is not None],
+        class_name__in=classes,
+        is_active=True
+    )
+    student_counts = {
+        (row['form_level'], row['class_name']): row
+        for row in grid_students.values('form_level', 'class_name').annotate(
+            total=Count('id'),
+            boys=Count('id', filter=Q(first_name__in=male_names)),
+        ).order_by()
+    }
+    
+    # Paid/outstanding per (form, class), read once from the ledger
+    ledger_by_form_class = {
+        (row['student__form_level'], row['student__class_name']): row
+        for row in StudentFeeLedger.objects.filter(
+            student__form_level__in=[level for level in form_levels.values() if level is not None],
+            student__class_name__in=classes
+        ).values(
+            'student__form_level', 'student__class_name'
+        ).annotate(
+            paid=Sum('paid_amount'),
+            outstanding=Sum('outstanding_amount'),
+        ).order_by()
+    }
+    
+    # Average completed payment per (form, class), only loaded if a form has no fee structure
+    average_payments = None
+    
     for form in forms:
+        level = form_levels[form]
         for class_name in classes:
-            # Get students for this form and class
-            students_query = Student.objects.filter(
-                level_custom=form,
-                class_name=class_name,
-                is_active=True
-            )
-            
-            # Count by gender (assuming names ending with certain letters are female)
-            # This is a simplified approach - in real system, you'd have a gender field
-            male_students = students_query.filter(
-                first_name__in=[
-                    'Ahmad', 'Ali', 'Hassan', 'Ibrahim', 'Ismail', 'Muhammad', 'Omar', 'Yusuf',
-                    'Adam', 'Daniel', 'David', 'James', 'John', 'Michael', 'Peter', 'Robert',
-                    'Chen', 'Lee', 'Lim', 'Tan', 'Wong', 'Ng', 'Ong', 'Teo'
-                ]
-            ).count()
-            
-            total_students = students_query.count()
-            female_students = total_students - male_students
+            counts = student_counts.get((level, class_name))
+            total_students = counts['total'] if counts else 0
             
             if total_students > 0:  # Only include classes with students
-                # Calculate expected amount for this form/class
-                # Try different form matching strategies for fee structures
-                form_fee_structures = FeeStructure.objects.filter(
-                    form=form,
-                    is_active=True
-                )
+                male_students = counts['boys']
+                female_students = total_students - male_students
                 
-                # If no direct match, try with "Form X" format
-                if not form_fee_structures.exists():
-                    form_fee_structures = FeeStructure.objects.filter(
-                        form=f"Form {form}",
-                        is_active=True
-                    )
-                
-                # If still no match, try extracting number from form field
-                if not form_fee_structures.exists():
-                    for fs in FeeStructure.objects.filter(is_active=True):
-                        if str(form) in str(fs.form) or str(fs.form).replace('Form', '').strip() == str(form):
-                            form_fee_structures = FeeStructure.objects.filter(id=fs.id)
-                            break
+                # Calculate expected amount for this form/class
+                form_fee_structures = [fs for fs in active_structures if fs.form_level == level]
                 
                 # If we found matching fee structures, calculate expected total
-                if form_fee_structures.exists():
+                if form_fee_structures:
                     expected_total = sum(fs.amount for fs in form_fee_structures) * total_students
                 else:
                     # Fallback: Use average payment amount per student for this form/class
-                    avg_payment = Payment.objects.filter(
-                        student__level_custom=form,
-                        student__class_name=class_name,
-                        status='completed'
-                    ).aggregate(avg=models.Avg('amount'))['avg'] or 0
+                    if average_payments is None:
+                        average_payments = {
+                            (row['student__form_level'], row['student__class_name']): row['avg']
+                            for row in Payment.objects.filter(status='completed').values(
+                                'student__form_level', 'student__class_name'
+                            ).annotate(avg=Avg('amount')).order_by()
+                        }
+                    avg_payment = average_payments.get((level, class_name)) or 0
                     
                     if avg_payment > 0:
                         expected_total = avg_payment * total_students
                     else:
                         # Final fallback: Use the existing fee structure amount as base
-                        base_amount = FeeStructure.objects.filter(is_active=True).first()
-                        if base_amount:
-                            expected_total = base_amount.amount * total_students
+                        if active_structures:
+                            expected_total = active_structures[0].amount * total_students
                         else:
                             expected_total = 1000 * total_students  # Default RM 1000 per student
                 
-                # Calculate paid amount
-                paid_total = Payment.objects.filter(
-                    student__level_custom=form,
-                    student__class_name=class_name,
-                    status='completed'
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-                
-                # Calculate outstanding amount
-                outstanding_total = FeeStatus.objects.filter(
-                    student__level_custom=form,
-                    student__class_name=class_name,
-                    status__in=['pending', 'overdue']
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
+                # Paid and outstanding amounts from the ledger
+                ledger_row = ledger_by_form_class.get((level, class_name), {})
+                paid_total = ledger_row.get('paid') or 0
+                outstanding_total = ledger_row.get('outstanding') or 0
                 
                 # Calculate achievement percentage - ensure it's properly capped at 100%
                 if expected_total > 0:
@@ -934,7 +937,7 @@ def admin_fee_dashboard(request):
                     achievement_rate = 0.0
                 
                 form_class_data.append({
-                    'form': int(form),
+                    'form': level,
                     'class': class_name,
                     'boys': male_students,
                     'girls': female_students,
@@ -955,26 +958,22 @@ def admin_fee_dashboard(request):
         'Dormitory': 'info'
     }
     
+    paid_by_category = {
+        row['fee_structure__category']: row['total']
+        for row in Payment.objects.filter(status='completed').values('fee_structure__category').annotate(
+            total=Sum('amount')
+        ).order_by()
+    }
+    
     for category in categories:
         # Calculate total expected amount for this category
-        category_fee_structures = FeeStructure.objects.filter(
-            category=category,
-            is_active=True
-        )
-        
         total_expected = 0
-        for fs in category_fee_structures:
-            student_count = Student.objects.filter(
-                level_custom=fs.form,
-                is_active=True
-            ).count()
-            total_expected += fs.amount * student_count
+        for fs in active_structures:
+            if fs.category_id == category.id and fs.form_level is not None:
+                total_expected += fs.amount * active_students_by_level.get(fs.form_level, 0)
         
         # Calculate total paid for this category
-        total_paid = Payment.objects.filter(
-            fee_structure__category=category,
-            status='completed'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        total_paid = paid_by_category.get(category.id) or 0
         
         # Calculate achievement percentage - ensure it's properly capped at 100%
         if total_expected > 0:
@@ -994,54 +993,41 @@ def admin_fee_dashboard(request):
     # 4. PAYMENT STATUS BY GRADE (Real-time from database)
     payment_status_data = []
     
+    # Students who have made payments (completed status)
+    paid_counts = {
+        (row['form_level'], row['class_name']): row
+        for row in grid_students.filter(payments__status='completed').values('form_level', 'class_name').annotate(
+            total=Count('id', distinct=True),
+            males=Count('id', distinct=True, filter=Q(first_name__in=male_names)),
+        ).order_by()
+    }
+    
+    # Students who haven't paid (have pending/overdue fee statuses)
+    not_paid_counts = {
+        (row['form_level'], row['class_name']): row
+        for row in grid_students.filter(fee_statuses__status__in=['pending', 'overdue']).values('form_level', 'class_name').annotate(
+            total=Count('id', distinct=True),
+            males=Count('id', distinct=True, filter=Q(first_name__in=male_names)),
+        ).order_by()
+    }
+    
     for form in forms:
+        level = form_levels[form]
         for class_name in classes:
-            # Get all students for this form and class
-            students_query = Student.objects.filter(
-                level_custom=form,
-                class_name=class_name,
-                is_active=True
-            )
+            counts = student_counts.get((level, class_name))
             
-            if students_query.count() > 0:
-                # Separate male and female students (using name-based approximation)
-                male_names = [
-                    'Ahmad', 'Ali', 'Hassan', 'Ibrahim', 'Ismail', 'Muhammad', 'Omar', 'Yusuf',
-                    'Adam', 'Daniel', 'David', 'James', 'John', 'Michael', 'Peter', 'Robert',
-                    'Chen', 'Lee', 'Lim', 'Tan', 'Wong', 'Ng', 'Ong', 'Teo'
-                ]
-                
-                male_students = students_query.filter(first_name__in=male_names)
-                female_students = students_query.exclude(first_name__in=male_names)
-                
-                # Count students who have made payments (completed status)
-                males_paid = male_students.filter(
-                    payments__status='completed'
-                ).distinct().count()
-                
-                females_paid = female_students.filter(
-                    payments__status='completed'
-                ).distinct().count()
-                
-                # Count students who haven't paid (have pending/overdue fee statuses)
-                males_not_paid = male_students.filter(
-                    fee_statuses__status__in=['pending', 'overdue']
-                ).distinct().count()
-                
-                females_not_paid = female_students.filter(
-                    fee_statuses__status__in=['pending', 'overdue']
-                ).distinct().count()
-                
-                class_total_students = students_query.count()
+            if counts and counts['total'] > 0:
+                paid = paid_counts.get((level, class_name), {'total': 0, 'males': 0})
+                not_paid = not_paid_counts.get((level, class_name), {'total': 0, 'males': 0})
                 
                 payment_status_data.append({
-                    'grade': int(form),
+                    'grade': level,
                     'class': class_name,
-                    'males_paid': males_paid,
-                    'females_paid': females_paid,
-                    'males_not_paid': males_not_paid,
-                    'females_not_paid': females_not_paid,
-                    'total': class_total_students
+                    'males_paid': paid['males'],
+                    'females_paid': paid['total'] - paid['males'],
+                    'males_not_paid': not_paid['males'],
+                    'females_not_paid': not_paid['total'] - not_paid['males'],
+                    'total': counts['total']
                 })
     
     # Calculate totals for payment status
@@ -1181,17 +1167,9 @@ def admin_fee_dashboard_pdf(request):
         messages.error(request, 'Access denied. Admin privileges required.')
         return redirect('myapp:admin_fee_dashboard')
     
-    from django.http import HttpResponse
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+    from reportlab.platypus import Table, Paragraph, Spacer
     from django.utils import timezone
-    from io import BytesIO
-    from datetime import datetime, timedelta
-    import json
+    from .report_services import PdfReport, report_styles, table_style
     
     # Get all the same data as the dashboard
     from django.db.models import Sum, Count, Q, Avg, Case, When, IntegerField
@@ -1336,49 +1314,17 @@ def admin_fee_dashboard_pdf(request):
         ]
         form_class_data.extend(dummy_rows)
     
-    # Create PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="admin_dashboard_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    
-    # Create PDF document
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
-    
-    subheader_style = ParagraphStyle(
-        'CustomSubHeader',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceAfter=8,
-        alignment=TA_LEFT,
-        textColor=colors.darkgreen
-    )
+    report = PdfReport(f'admin_dashboard_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf')
+    styles = report_styles()
+    title_style = styles['title']
+    header_style = styles['header']
     
     # Build PDF content
     story = []
     
     # Title
     story.append(Paragraph("Student Fee Collection Admin Dashboard", title_style))
-    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
+    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['normal']))
     story.append(Spacer(1, 20))
     
     # Summary Statistics
@@ -1393,17 +1339,7 @@ def admin_fee_dashboard_pdf(request):
         ['Achievement Percentage (%)', f"{achievement_percentage:.1f}%"],
     ]
     
-    summary_table = Table(summary_data)
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    summary_table = Table(summary_data, style=table_style('grid', font_size=12, body_font_size=10))
     
     story.append(summary_table)
     story.append(Spacer(1, 20))
@@ -1428,18 +1364,7 @@ def admin_fee_dashboard_pdf(request):
                 f"{data['achievement']:.1f}%"
             ])
         
-        form_class_table = Table(table_data)
-        form_class_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ]))
+        form_class_table = Table(table_data, style=table_style('grid', font_size=10, body_font_size=8))
         
         story.append(form_class_table)
         story.append(Spacer(1, 20))
@@ -1458,250 +1383,61 @@ def admin_fee_dashboard_pdf(request):
                 payment.status.title()
             ])
         
-        payment_table = Table(payment_data)
-        payment_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ]))
+        payment_table = Table(payment_data, style=table_style('grid', font_size=10, body_font_size=8))
         
         story.append(payment_table)
         story.append(Spacer(1, 20))
     
     # Footer
-    story.append(Paragraph("This report was generated automatically by the School Management System.", styles['Normal']))
-    story.append(Paragraph(f"Report generated by: {request.user.get_full_name() or request.user.username}", styles['Normal']))
-    
-    # Build PDF
-    doc.build(story)
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
+    story.append(Paragraph("This report was generated automatically by the School Management System.", styles['normal']))
+    story.append(Paragraph(f"Report generated by: {request.user.get_full_name() or request.user.username}", styles['normal']))
     
-    return response
+    return report.build(story).response()
 
-def student_list(request):
-    """Main student list view - accessible to all users"""
-    from django.db.models import Q
-    
-    # Get filter parameters from the request
+def _student_directory_context(request, page_size=PAGE_SIZE, paginate=True):
+    """Filters, one keyset page of students and the dropdown values shared by the student list views"""
     show = request.GET.get('show', 'active')
     search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
+    sort_by = sort_field(request.GET.get('sort', 'first_name'))
     sort_order = request.GET.get('order', 'asc')
-    
-    # Base queryset
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            # If search_query is not numeric, skip year_batch search
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting
-        students = students.order_by('first_name')
-    
+
+    students = filter_students(show, search_query)
+    cursor = request.GET.get('cursor') if paginate else None
+    page = keyset_page(students, sort_by, sort_order == 'desc', cursor, page_size=page_size)
+
     # Get unique values for filter dropdowns
     all_levels = Student.objects.values_list('level_custom', flat=True).distinct().exclude(level_custom__isnull=True).exclude(level_custom='')
-    # Handle year_batch filtering more carefully since it's an IntegerField
     all_batches = Student.objects.exclude(year_batch__isnull=True).values_list('year_batch', flat=True).distinct().order_by('-year_batch')
-    
-    context = {
-        'students': students,
+
+    return {
+        'students': page,
+        'paginate': paginate,
         'search_query': search_query,
-        'sort_by': sort_by.replace('-', '') if sort_by.startswith('-') else sort_by,
+        'sort_by': sort_by,
         'sort_order': sort_order,
         'show': show,
         'all_levels': sorted(all_levels),
         'all_batches': list(all_batches),  # Already sorted by year_batch desc
         'total_students': students.count(),
     }
-    
-    return render(request, 'myapp/student_list.html', context)
+
+def student_list(request):
+    """Main student list view - accessible to all users"""
+    return render(request, 'myapp/student_list.html', _student_directory_context(request))
 
 def public_student_list(request):
     """Public version of student list for testing search functionality"""
-    from django.db.models import Q
-    
-    # Get filter parameters from the request
-    show = request.GET.get('show', 'active')
-    search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
-    sort_order = request.GET.get('order', 'asc')
-    
-    # Base queryset
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting
-        students = students.order_by('first_name')
-    
     # Limit to first 20 students for demo (after all filtering and sorting)
-    students = students[:20]
-    
-    # Get unique values for filter dropdowns
-    all_levels = Student.objects.values_list('level_custom', flat=True).distinct().exclude(level_custom__isnull=True).exclude(level_custom='')
-    all_batches = Student.objects.exclude(year_batch__isnull=True).values_list('year_batch', flat=True).distinct().order_by('-year_batch')
-    
-    context = {
-        'students': students,
-        'search_query': search_query,
-        'sort_by': sort_by.replace('-', '') if sort_by.startswith('-') else sort_by,
-        'sort_order': sort_order,
-        'show': show,
-        'all_levels': sorted(all_levels),
-        'all_batches': list(all_batches),
-        'total_students': students.count(),
-        'is_public': True,  # Flag to show this is public version
-    }
-    
+    context = _student_directory_context(request, page_size=20, paginate=False)
+    context['is_public'] = True  # Flag to show this is public version
     return render(request, 'myapp/student_list.html', context)
 
 def school_fees_student_demo(request):
     """School fees specific demo version of student list - no login required"""
-    from django.db.models import Q
-    
-    # Get filter parameters from the request
-    show = request.GET.get('show', 'active')
-    search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
-    sort_order = request.GET.get('order', 'asc')
-    
-    # Base queryset
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting
-        students = students.order_by('first_name')
-    
     # Limit to first 20 students for demo (after all filtering and sorting)
-    students = students[:20]
-    
-    # Get unique values for filter dropdowns
-    all_levels = Student.objects.values_list('level_custom', flat=True).distinct().exclude(level_custom__isnull=True).exclude(level_custom='')
-    all_batches = Student.objects.exclude(year_batch__isnull=True).values_list('year_batch', flat=True).distinct().order_by('-year_batch')
-    
-    context = {
-        'students': students,
-        'search_query': search_query,
-        'sort_by': sort_by.replace('-', '') if sort_by.startswith('-') else sort_by,
-        'sort_order': sort_order,
-        'show': show,
-        'all_levels': sorted(all_levels),
-        'all_batches': list(all_batches),
-        'total_students': students.count(),
-        'is_public': True,
-        'is_school_fees': True,  # Flag to show this is school fees version
-    }
-    
+    context = _student_directory_context(request, page_size=20, paginate=False)
+    context['is_public'] = True
+    context['is_school_fees'] = True  # Flag to show this is school fees version
     return render(request, 'myapp/student_list.html', context)
 
 def search_demo_links(request):
@@ -1710,351 +1446,97 @@ def search_demo_links(request):
 
 def students_page(request):
     """Dedicated students page that works for all users - no authentication issues"""
-    from django.db.models import Q
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    
-    # Get filter parameters from the request
-    show = request.GET.get('show', 'active')
-    search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
-    sort_order = request.GET.get('order', 'asc')
-    page = request.GET.get('page', 1)
-    
-    # Base queryset
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            # If search_query is not numeric, skip year_batch search
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting
-        students = students.order_by('first_name')
-    
-    # Get total count before pagination
-    total_students = students.count()
-    
-    # Implement pagination - 50 students per page
-    paginator = Paginator(students, 50)
-    
-    try:
-        students_page = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page
-        students_page = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page
-        students_page = paginator.page(paginator.num_pages)
-    
-    # Get unique values for filter dropdowns
-    all_levels = Student.objects.values_list('level_custom', flat=True).distinct().exclude(level_custom__isnull=True).exclude(level_custom='')
-    all_batches = Student.objects.exclude(year_batch__isnull=True).values_list('year_batch', flat=True).distinct().order_by('-year_batch')
-    
-    context = {
-        'students': students_page,
-        'search_query': search_query,
-        'sort_by': sort_by.replace('-', '') if sort_by.startswith('-') else sort_by,
-        'sort_order': sort_order,
-        'show': show,
-        'all_levels': sorted(all_levels),
-        'all_batches': list(all_batches),  # Already sorted by year_batch desc
-        'total_students': total_students,
-    }
-    
-    return render(request, 'myapp/student_list.html', context)
+    # Keyset pagination - 50 students per page
+    return render(request, 'myapp/student_list.html', _student_directory_context(request))
 
 @login_required
 def download_all_students_pdf(request):
     """Download students information in PDF format based on current filters - Superuser only"""
     # Check if user is superuser (moaaj)
     if not request.user.is_superuser:
-        from django.contrib import messages
         messages.error(request, 'Access denied. Only superusers can download student data.')
         return redirect('myapp:student_list')
-    
-    from django.http import HttpResponse
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT
-    from django.utils import timezone
-    from io import BytesIO
-    from django.db.models import Q
-    
-    # Get filter parameters from the request (same as students_page view)
-    show = request.GET.get('show', 'active')
-    search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
-    sort_order = request.GET.get('order', 'asc')
-    
-    # Apply the same filtering logic as students_page view
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            # If search_query is not numeric, skip year_batch search
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting for PDF (group by level for better organization)
-        students = students.order_by('level_custom', 'class_name', 'first_name')
-    
-    # Generate filename based on filters
-    filename_parts = ["students"]
-    if search_query:
-        # Clean search query for filename
-        clean_search = "".join(c for c in search_query if c.isalnum() or c in (' ', '-', '_')).strip()
-        filename_parts.append(f"search_{clean_search.replace(' ', '_')}")
-    if show == 'all':
-        filename_parts.append("all")
-    else:
-        filename_parts.append("active")
-    filename_parts.append(timezone.now().strftime("%Y%m%d_%H%M%S"))
-    filename = "_".join(filename_parts) + ".pdf"
-    
-    # Create PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Create PDF document
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading2'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
-    
-    # Build PDF content
-    story = []
-    
-    # Dynamic title based on filters
-    if search_query:
-        title = f"STUDENT INFORMATION REPORT - SEARCH: {search_query.upper()}"
-    elif show == 'all':
-        title = "COMPLETE STUDENT INFORMATION REPORT - ALL STUDENTS"
-    else:
-        title = "STUDENT INFORMATION REPORT - ACTIVE STUDENTS"
-    
-    story.append(Paragraph(title, title_style))
-    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-    
-    # Add filter information
-    filter_info = []
-    if search_query:
-        filter_info.append(f"Search Query: {search_query}")
-    filter_info.append(f"Status Filter: {'All Students' if show == 'all' else 'Active Students Only'}")
-    if sort_by != 'first_name' or sort_order != 'asc':
-        sort_display = sort_by.replace('_', ' ').title()
-        filter_info.append(f"Sorted by: {sort_display} ({sort_order.upper()})")
-    
-    for info in filter_info:
-        story.append(Paragraph(info, styles['Normal']))
-    
-    story.append(Paragraph(f"Total Students Found: {students.count()}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Group students by level
-    current_level = None
-    students_per_page = 25  # Limit students per page to avoid overcrowding
-    student_count = 0
-    
-    for student in students:
-        # Check if we need a new page
-        if student_count > 0 and student_count % students_per_page == 0:
-            story.append(PageBreak())
-        
-        # Add level header if level changed
-        if current_level != student.level_custom:
-            current_level = student.level_custom
-            story.append(Paragraph(f"<b>{current_level} Students</b>", header_style))
-            story.append(Spacer(1, 10))
-        
-        # Student information table
-        student_data = [
-            ['Student ID:', student.student_id, 'Name:', f"{student.first_name} {student.last_name}"],
-            ['NRIC:', student.nric or 'N/A', 'Phone:', student.phone_number or 'N/A'],
-            ['Class:', student.class_name or 'N/A', 'Program:', student.program or 'N/A'],
-            ['Year Batch:', student.year_batch or 'N/A', 'Status:', 'Active' if student.is_active else 'Inactive'],
-            ['Created:', student.created_at.strftime('%Y-%m-%d') if student.created_at else 'N/A', '', '']
-        ]
-        
-        student_table = Table(student_data, colWidths=[1.2*inch, 2*inch, 1*inch, 2*inch])
-        student_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(student_table)
-        story.append(Spacer(1, 15))
-        student_count += 1
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Get PDF content
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Return PDF response
-    response.write(pdf_content)
-    return response
+
+    from .report_services import build_students_report, start_export
+
+    # Same filters as the students page
+    params = {
+        'show': request.GET.get('show', 'active'),
+        'search': request.GET.get('search', '').strip(),
+        'sort': request.GET.get('sort', 'first_name'),
+        'order': request.GET.get('order', 'asc'),
+    }
+    if request.GET.get('background'):
+        start_export(request, 'students', params)
+        messages.success(request, 'Your report is being generated. It will appear under Report Exports and you will be emailed when it is ready.')
+        return redirect('myapp:report_exports')
+
+    return build_students_report(params, request.user).response()
+
+@login_required
+def report_exports(request):
+    """Reports the user asked to have generated in the background"""
+    from .report_services import resume_stale_exports
+    if resume_stale_exports(request):
+        messages.info(request, 'Some of your reports were interrupted and are being generated again.')
+    exports = ReportExport.objects.filter(requested_by=request.user)[:20]
+    return render(request, 'myapp/report_exports.html', {'exports': exports})
+
+@login_required
+def report_export_download(request, export_id):
+    export = get_object_or_404(ReportExport, id=export_id, status='ready')
+    if export.requested_by_id != request.user.id and not request.user.is_superuser:
+        messages.error(request, 'Access denied.')
+        return redirect('myapp:report_exports')
+    return FileResponse(export.file.open('rb'), as_attachment=True, filename=export.filename)
 
 def students_no_auth(request):
     """Completely isolated students page - no authentication, no context processors"""
-    from django.db.models import Q
-    
-    # Get filter parameters from the request
-    show = request.GET.get('show', 'active')
-    search_query = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'first_name')
-    sort_order = request.GET.get('order', 'asc')
-    
-    # Base queryset
-    if show == 'all':
-        students = Student.objects.all()
-    else:
-        students = Student.objects.filter(is_active=True)
-    
-    # Apply search filter
-    if search_query:
-        search_filters = Q(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(nric__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(level_custom__icontains=search_query)
-        )
-        
-        # Only add year_batch search if search_query is numeric
-        try:
-            int(search_query)
-            search_filters |= Q(year_batch__icontains=search_query)
-        except ValueError:
-            # If search_query is not numeric, skip year_batch search
-            pass
-            
-        students = students.filter(search_filters)
-    
-    # Apply sorting
-    if sort_by in ['first_name', 'last_name', 'student_id', 'nric', 'phone_number', 'level_custom', 'year_batch', 'is_active', 'created_at']:
-        if sort_by == 'year_batch':
-            # Handle year_batch sorting with null values
-            if sort_order == 'desc':
-                students = students.order_by('-year_batch', 'first_name')
-            else:
-                students = students.order_by('year_batch', 'first_name')
-        else:
-            if sort_order == 'desc':
-                sort_by = f'-{sort_by}'
-            students = students.order_by(sort_by)
-    else:
-        # Default sorting
-        students = students.order_by('first_name')
-    
-    # Get unique values for filter dropdowns
-    all_levels = Student.objects.values_list('level_custom', flat=True).distinct().exclude(level_custom__isnull=True).exclude(level_custom='')
-    all_batches = Student.objects.exclude(year_batch__isnull=True).values_list('year_batch', flat=True).distinct().order_by('-year_batch')
-    
-    context = {
-        'students': students,
-        'search_query': search_query,
-        'sort_by': sort_by.replace('-', '') if sort_by.startswith('-') else sort_by,
-        'sort_order': sort_order,
-        'show': show,
-        'all_levels': sorted(all_levels),
-        'all_batches': list(all_batches),  # Already sorted by year_batch desc
-        'total_students': students.count(),
-    }
-    
-    return render(request, 'myapp/student_list.html', context)
+    return render(request, 'myapp/student_list.html', _student_directory_context(request))
+
+@login_required
+@require_GET
+def student_directory_api(request):
+    """Keyset-paginated student listing as JSON; follow ``next_cursor`` for the next page"""
+    if not (request.user.is_superuser or request.user.is_staff):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    try:
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    students = filter_students(request.GET.get('show', 'active'), request.GET.get('search', '')).only(
+        'id', 'student_id', 'first_name', 'last_name', 'level_custom', 'class_name', 'year_batch',
+        'phone_number', 'nric', 'is_active', 'created_at'
+    )
+    page = keyset_page(
+        students, request.GET.get('sort', 'first_name'), request.GET.get('order') == 'desc',
+        request.GET.get('cursor'), page_size=limit
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'id': student.id,
+                'student_id': student.student_id,
+                'first_name': student.first_name,
+                'last_name': student.last_name,
+                'level': student.level_custom,
+                'class_name': student.class_name,
+                'year_batch': student.year_batch,
+                'is_active': student.is_active,
+            }
+            for student in page
+        ],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+@login_required
+@require_GET
+def student_search_api(request):
+    """Type-ahead suggestions for the student directory search box"""
+    if not (request.user.is_superuser or request.user.is_staff):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    return JsonResponse({'results': suggest_students(request.GET.get('q', ''))})
 
 @login_required
 def student_detail(request, id):
@@ -2081,18 +1563,18 @@ def student_detail(request, id):
 @login_required
 def add_student(request):
     if request.method == 'POST':
-        print(f"DEBUG: add_student POST request received")
-        print(f"DEBUG: POST data: {request.POST}")
+        logger.debug("add_student POST request received")
+        logger.debug("POST data: %s", request.POST)
         
         form = StudentForm(request.POST)
-        print(f"DEBUG: Form is_valid: {form.is_valid()}")
+        logger.debug("Form is_valid: %s", form.is_valid())
         
         if not form.is_valid():
-            print(f"DEBUG: Form errors: {form.errors}")
-            print(f"DEBUG: Form non_field_errors: {form.non_field_errors()}")
+            logger.debug("Form errors: %s", form.errors)
+            logger.debug("Form non_field_errors: %s", form.non_field_errors())
         
         if form.is_valid():
-            print(f"DEBUG: Form is valid, saving student...")
+            logger.debug("Form is valid, saving student...")
             student = form.save(commit=False)
             # Make new students active by default, unless explicitly unchecked
             student.is_active = request.POST.get('is_active') != 'off'
@@ -2100,12 +1582,12 @@ def add_student(request):
             # Auto-assign form number if level is 'form' but no form number is selected
             if student.level == 'form' and not student.level_custom:
                 student.level_custom = 'Form 1'  # Default to Form 1
-                print(f"DEBUG: Auto-assigned form number: {student.level_custom}")
+                logger.debug("Auto-assigned form number: %s", student.level_custom)
             
-            print(f"DEBUG: Student is_active: {student.is_active}")
-            print(f"DEBUG: Student level: {student.level}, level_custom: {student.level_custom}")
+            logger.debug("Student is_active: %s", student.is_active)
+            logger.debug("Student level: %s, level_custom: %s", student.level, student.level_custom)
             student.save()
-            print(f"DEBUG: Student saved with ID: {student.id}")
+            logger.debug("Student saved with ID: %s", student.id)
             
             # Automatically create user account for the student
             try:
@@ -2114,7 +1596,7 @@ def add_student(request):
                 
                 # Check if user already exists
                 if User.objects.filter(username=username).exists():
-                    print(f"DEBUG: User account already exists for username: {username}")
+                    logger.debug("User account already exists for username: %s", username)
                     messages.info(request, f'Student added successfully! User account already exists with username: {username}')
                 else:
                     # Generate password (you can modify this logic)
@@ -2137,14 +1619,14 @@ def add_student(request):
                         student=student
                     )
                     
-                    print(f"DEBUG: User account created - Username: {username}, Password: {password}")
+                    logger.debug("User account created - Username: %s", username)
                     
                     # Add success message with login credentials
                     form_info = f" and assigned to {student.level_custom}" if student.level_custom else ""
                     messages.success(request, f'Student added successfully{form_info}! User account created with username: {username} and password: {password}')
                 
             except Exception as e:
-                print(f"DEBUG: Error creating user account: {e}")
+                logger.warning("Error creating user account: %s", e)
                 messages.warning(request, f'Student added successfully, but there was an issue creating the user account: {str(e)}')
             
             # If student is assigned to a form level, automatically generate fee statuses
@@ -2153,10 +1635,7 @@ def add_student(request):
                 from datetime import date, timedelta
                 
                 # Get fee structures for this form level
-                form_fees = FeeStructure.objects.filter(
-                    form__iexact=student.level_custom,
-                    is_active=True
-                )
+                form_fees = FeeStructure.for_student(student)
                 
                 generated_count = 0
                 for fee_structure in form_fees:
@@ -2211,13 +1690,10 @@ def fee_structure_list(request):
     if is_student:
         student = user.myapp_profile.student
         student_level = student.get_level_display_value()
-        print(f"DEBUG: Student {student.first_name} is in {student_level}")
+        logger.debug("Student %s is in %s", student.first_name, student_level)
         
         # Get fee structures for this student's form level only
-        fee_structures = FeeStructure.objects.filter(
-            form__iexact=student_level,  # Case-insensitive match
-            is_active=True
-        ).select_related('category')
+        fee_structures = FeeStructure.for_student(student).select_related('category')
         
         # Special logic for tamim123: only show due fees
         if is_tamim:
@@ -2253,7 +1729,8 @@ def fee_structure_list(request):
         except:
             recent_individual_fees = []
     
-    print(f"DEBUG: username={user.username}, is_student={is_student}, fee_structures_count={fee_structures.count()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("username=%s, is_student=%s, fee_structures_count=%s", user.username, is_student, fee_structures.count())
     return render(request, 'myapp/fee_structure_list.html', {
         'fee_structures': fee_structures,
         'recent_individual_fees': recent_individual_fees,
@@ -2272,21 +1749,14 @@ def add_fee_structure(request):
             from .models import Student
             from datetime import date, timedelta
             
-            matching_students = Student.objects.filter(
-                is_active=True
-            ).filter(
-                # Match by level_custom if it's 'others', or by level if it's 'form'
-                Q(level='form', level_custom__iexact=fee_structure.form) |
-                Q(level='others', level_custom__iexact=fee_structure.form)
-            )
+            matching_students = fee_structure.matching_students()
             
             generated_count = 0
             
             # Handle monthly payments with auto_generate_payments
             if fee_structure.auto_generate_payments and fee_structure.frequency == 'monthly':
-                for student in matching_students:
-                    payments = fee_structure.generate_monthly_payments_for_student(student)
-                    generated_count += len(payments)
+                result = FeeStructure.generate_monthly_payments([fee_structure], students=matching_students)
+                generated_count += result['created']
             else:
                 # For all other frequencies (termly, yearly), create FeeStatus records
                 for student in matching_students:
@@ -2326,7 +1796,7 @@ def add_fee_structure(request):
             return redirect('myapp:fee_structure_list')
         else:
             # Form validation failed
-            print(f"DEBUG: Form validation failed. Errors: {form.errors}")
+            logger.debug("Form validation failed. Errors: %s", form.errors)
             messages.error(request, 'Please correct the errors below.')
     else:
         form = FeeStructureForm()
@@ -2355,99 +1825,17 @@ def delete_fee_structure(request, structure_id):
     return render(request, 'myapp/delete_fee_structure.html', {'fee_structure': fee_structure})
 
 @login_required
-def payment_list(request):
-    form = PaymentSearchForm(request.GET)
-    payments = Payment.objects.select_related('student', 'fee_structure')
-    
-    # Role-based filtering
-    if hasattr(request.user, 'myapp_profile') and request.user.myapp_profile.role == 'student':
-        # Students can only see their own payments
-        student = request.user.myapp_profile.student
-        payments = payments.filter(student=student)
-    elif hasattr(request.user, 'myapp_profile') and request.user.myapp_profile.role == 'parent':
-        # Parents can see payments for their children
-        try:
-            parent = Parent.objects.get(user=request.user)
-            student_ids = parent.students.values_list('id', flat=True)
-            payments = payments.filter(student_id__in=student_ids)
-        except Parent.DoesNotExist:
-            payments = Payment.objects.none()
-    
-    if form.is_valid():
-        # Filter by specific student
-        if form.cleaned_data.get('student'):
-            payments = payments.filter(student=form.cleaned_data['student'])
-        
-        # Filter by search term (student name, payment ID, etc.)
-        if form.cleaned_data.get('search'):
-            search_term = form.cleaned_data['search']
-            payments = payments.filter(
-                Q(student__first_name__icontains=search_term) |
-                Q(student__last_name__icontains=search_term) |
-                Q(student__student_id__icontains=search_term) |
-                Q(payment_method__icontains=search_term) |
-                Q(receipt_number__icontains=search_term)
-            )
-        
-        # Filter by payment method
-        if form.cleaned_data.get('payment_method'):
-            payments = payments.filter(payment_method=form.cleaned_data['payment_method'])
-        
-        # Filter by status
-        if form.cleaned_data.get('status'):
-            payments = payments.filter(status=form.cleaned_data['status'])
-        
-        # Filter by month
-        if form.cleaned_data.get('month'):
-            payments = payments.filter(payment_date__month=form.cleaned_data['month'])
-        
-        # Filter by year
-        if form.cleaned_data.get('year'):
-            payments = payments.filter(payment_date__year=form.cleaned_data['year'])
-    
-    # Order by most recent first
-    payments = payments.order_by('-payment_date', '-created_at')
-    
-    # Add pagination and additional context
-    from django.core.paginator import Paginator
-    paginator = Paginator(payments, 25)  # Show 25 payments per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Calculate summary statistics
-    total_payments = payments.count()
-    total_amount = payments.aggregate(Sum('amount'))['amount__sum'] or 0
-    completed_payments = payments.filter(status='completed').count()
-    
-    context = {
-        'payments': page_obj,
-        'form': form,
-        'total_payments': total_payments,
-        'total_amount': total_amount,
-        'completed_payments': completed_payments,
-        'page_obj': page_obj,
-        'filtered_payments': payments,  # For download functionality
-    }
-    
-    return render(request, 'myapp/payment_list.html', context)
-
-@login_required
-def download_payment_data(request):
-    """Download filtered payment data as CSV or Excel"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    from django.db.models import Q
-    
-    # Get the same filters as payment_list
+def payment_list(request):
     form = PaymentSearchForm(request.GET)
     payments = Payment.objects.select_related('student', 'fee_structure')
     
-    # Role-based filtering (same as payment_list)
+    # Role-based filtering
     if hasattr(request.user, 'myapp_profile') and request.user.myapp_profile.role == 'student':
+        # Students can only see their own payments
         student = request.user.myapp_profile.student
         payments = payments.filter(student=student)
     elif hasattr(request.user, 'myapp_profile') and request.user.myapp_profile.role == 'parent':
+        # Parents can see payments for their children
         try:
             parent = Parent.objects.get(user=request.user)
             student_ids = parent.students.values_list('id', flat=True)
@@ -2455,11 +1843,12 @@ def download_payment_data(request):
         except Parent.DoesNotExist:
             payments = Payment.objects.none()
     
-    # Apply the same filters as payment_list
     if form.is_valid():
+        # Filter by specific student
         if form.cleaned_data.get('student'):
             payments = payments.filter(student=form.cleaned_data['student'])
         
+        # Filter by search term (student name, payment ID, etc.)
         if form.cleaned_data.get('search'):
             search_term = form.cleaned_data['search']
             payments = payments.filter(
@@ -2470,121 +1859,97 @@ def download_payment_data(request):
                 Q(receipt_number__icontains=search_term)
             )
         
+        # Filter by payment method
         if form.cleaned_data.get('payment_method'):
             payments = payments.filter(payment_method=form.cleaned_data['payment_method'])
         
+        # Filter by status
         if form.cleaned_data.get('status'):
             payments = payments.filter(status=form.cleaned_data['status'])
         
+        # Filter by month
         if form.cleaned_data.get('month'):
             payments = payments.filter(payment_date__month=form.cleaned_data['month'])
         
+        # Filter by year
         if form.cleaned_data.get('year'):
             payments = payments.filter(payment_date__year=form.cleaned_data['year'])
     
     # Order by most recent first
     payments = payments.order_by('-payment_date', '-created_at')
     
-    # Determine file format
-    file_format = request.GET.get('format', 'csv').lower()
+    # Add pagination and additional context
+    from django.core.paginator import Paginator
+    paginator = Paginator(payments, 25)  # Show 25 payments per page
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
     
-    if file_format == 'excel':
-        # Excel download
-        try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, PatternFill
-            
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Payment Data"
-            
-            # Headers
-            headers = [
-                'Payment ID', 'Student ID', 'Student Name', 'Fee Category', 
-                'Amount (RM)', 'Payment Method', 'Status', 'Payment Date', 
-                'Receipt Number', 'Created Date'
-            ]
-            
-            # Style headers
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.font = header_font
-                cell.fill = header_fill
-            
-            # Data rows
-            for row, payment in enumerate(payments, 2):
-                ws.cell(row=row, column=1, value=payment.id)
-                ws.cell(row=row, column=2, value=payment.student.student_id)
-                ws.cell(row=row, column=3, value=f"{payment.student.first_name} {payment.student.last_name}")
-                ws.cell(row=row, column=4, value=payment.fee_structure.category.name if payment.fee_structure else 'N/A')
-                ws.cell(row=row, column=5, value=float(payment.amount))
-                ws.cell(row=row, column=6, value=payment.payment_method)
-                ws.cell(row=row, column=7, value=payment.get_status_display())
-                ws.cell(row=row, column=8, value=payment.payment_date.strftime('%Y-%m-%d') if payment.payment_date else 'N/A')
-                ws.cell(row=row, column=9, value=payment.receipt_number or 'N/A')
-                ws.cell(row=row, column=10, value=payment.created_at.strftime('%Y-%m-%d %H:%M'))
-            
-            # Auto-adjust column widths
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # Create response
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            response['Content-Disposition'] = f'attachment; filename="payment_data_{timestamp}.xlsx"'
-            
-            wb.save(response)
-            return response
-            
-        except ImportError:
-            # Fall back to CSV if openpyxl is not available
-            file_format = 'csv'
+    # Calculate summary statistics
+    total_payments = payments.count()
+    total_amount = payments.aggregate(Sum('amount'))['amount__sum'] or 0
+    completed_payments = payments.filter(status='completed').count()
     
-    if file_format == 'csv':
-        # CSV download
-        response = HttpResponse(content_type='text/csv')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        response['Content-Disposition'] = f'attachment; filename="payment_data_{timestamp}.csv"'
-        
-        writer = csv.writer(response)
-        
-        # Headers
-        writer.writerow([
-            'Payment ID', 'Student ID', 'Student Name', 'Fee Category', 
-            'Amount (RM)', 'Payment Method', 'Status', 'Payment Date', 
-            'Receipt Number', 'Created Date'
-        ])
-        
-        # Data rows
-        for payment in payments:
-            writer.writerow([
-                payment.id,
-                payment.student.student_id,
-                f"{payment.student.first_name} {payment.student.last_name}",
-                payment.fee_structure.category.name if payment.fee_structure else 'N/A',
-                payment.amount,
-                payment.payment_method,
-                payment.get_status_display(),
-                payment.payment_date.strftime('%Y-%m-%d') if payment.payment_date else 'N/A',
-                payment.receipt_number or 'N/A',
-                payment.created_at.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+    context = {
+        'payments': page_obj,
+        'form': form,
+        'total_payments': total_payments,
+        'total_amount': total_amount,
+        'completed_payments': completed_payments,
+        'page_obj': page_obj,
+        'filtered_payments': payments,  # For download functionality
+    }
+    
+    return render(request, 'myapp/payment_list.html', context)
+
+@login_required
+def download_payment_data(request):
+    """Download filtered payment data as CSV or Excel"""
+    from datetime import datetime
+    from .export_services import (
+        Sheet, csv_response, filter_payments, iter_values, parse_export_filters,
+        scope_to_user, xlsx_response,
+    )
+
+    # Same filters as payment_list, limited to what the user may see
+    filters = parse_export_filters(request.GET)
+    payments = filter_payments(scope_to_user(request, Payment.objects.all()), filters).order_by('-payment_date', '-created_at')
+
+    status_labels = dict(Payment._meta.get_field('status').choices)
+    headers = [
+        'Payment ID', 'Student ID', 'Student Name', 'Fee Category',
+        'Amount (RM)', 'Payment Method', 'Status', 'Payment Date',
+        'Receipt Number', 'Created Date'
+    ]
+    fields = (
+        'id', 'student__student_id', 'student__first_name', 'student__last_name', 'fee_structure__category__name',
+        'amount', 'payment_method', 'status', 'payment_date', 'receipt_number', 'created_at',
+    )
+
+    def rows(excel):
+        for (payment_id, student_id, first_name, last_name, category, amount, method, status,
+             payment_date, receipt_number, created_at) in iter_values(payments, fields):
+            yield [
+                payment_id,
+                student_id,
+                f"{first_name} {last_name}",
+                category or 'N/A',
+                float(amount) if excel else amount,
+                method,
+                status_labels.get(status, status),
+                payment_date.strftime('%Y-%m-%d') if payment_date else 'N/A',
+                receipt_number or 'N/A',
+                timezone.localtime(created_at).strftime('%Y-%m-%d %H:%M'),
+            ]
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if filters['format'] == 'excel' and Workbook is not None:
+        return xlsx_response(
+            'payment_data',
+            [Sheet("Payment Data", headers, rows(excel=True), widths=[12, 14, 30, 20, 14, 16, 12, 14, 20, 18])],
+            f'payment_data_{timestamp}.xlsx'
+        )
+    # CSV, also the fallback when openpyxl is not installed
+    return csv_response('payment_data', Sheet("Payment Data", headers, rows(excel=False)), f'payment_data_{timestamp}.csv')
 
 @login_required
 def add_payment(request):
@@ -2840,11 +2205,11 @@ def payment_reports(request):
 def send_payment_reminder(request, payment_id):
     """Send payment reminder via email and text message"""
     try:
-        print("\n=== Starting Payment Reminder Process ===")
+        logger.debug("Starting payment reminder process")
         
         # Get fee status record (this represents the fee that needs to be paid)
         fee_status = get_object_or_404(FeeStatus, id=payment_id)
-        print(f"Found fee status: ID={fee_status.id}, Amount={fee_status.amount}")
+        logger.debug("Found fee status: ID=%s, Amount=%s", fee_status.id, fee_status.amount)
         
         # Calculate the amount to be paid (with discounts applied)
         try:
@@ -2875,8 +2240,8 @@ def send_payment_reminder(request, payment_id):
         if student_email:
             recipient_emails.append(student_email)
         
-        print(f"Recipient emails: {recipient_emails}")
-        print(f"Student phone: {student_phone}")
+        logger.debug("Recipient emails: %s", recipient_emails)
+        logger.debug("Student phone: %s", student_phone)
         
         # Prepare email content
         subject = f'Payment Reminder - {fee_status.fee_structure.category.name}'
@@ -2890,49 +2255,39 @@ def send_payment_reminder(request, payment_id):
         }
         
         # Render email template
-        print("Rendering email template...")
+        logger.debug("Rendering email template...")
         html_message = render_to_string('myapp/email/payment_reminder_email.html', context)
         plain_message = strip_tags(html_message)
         
-        print("\n=== Email Content ===")
-        print(f"To: {', '.join(recipient_emails)}")
-        print(f"Subject: {subject}")
-        print(f"Message: {plain_message[:200]}...")  # Print first 200 chars
-        print("===================\n")
-        
-        # Send email
-        print("Attempting to send email...")
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_emails,
-            html_message=html_message,
-            fail_silently=False,
+        logger.debug("Queueing reminder email to %s, subject: %s, message: %.200s...", recipient_emails, subject, plain_message)
+        
+        # Queue the email; the outbox worker sends it (one reminder per fee per day)
+        OutboundEmail.enqueue(
+            recipient_emails,
+            subject,
+            plain_message,
+            html_body=html_message,
+            idempotency_key=f'payment-reminder:{fee_status.id}:{today}',
         )
         
-        print("Email sent successfully!")
+        logger.info("Payment reminder email queued for fee status %s", fee_status.id)
         
         # Send text message if phone number is available
         if student_phone:
             try:
                 send_text_message(student_phone, fee_status, amount_to_pay, days_text, is_overdue)
-                print("Text message sent successfully!")
-                messages.success(request, f'Reminder sent via email and text message to {student.first_name} {student.last_name}')
+                logger.debug("Text message sent successfully")
+                messages.success(request, f'Reminder email queued and text message sent to {student.first_name} {student.last_name}')
             except Exception as e:
-                print(f"Error sending text message: {str(e)}")
-                messages.success(request, f'Email reminder sent successfully. Text message failed: {str(e)}')
+                logger.warning("Error sending text message: %s", e)
+                messages.success(request, f'Email reminder queued. Text message failed: {str(e)}')
         else:
-            messages.success(request, f'Email reminder sent successfully to {len(recipient_emails)} recipient(s)')
+            messages.success(request, f'Email reminder queued for {len(recipient_emails)} recipient(s)')
         
     except Exception as e:
-        print(f"\nError occurred: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error sending payment reminder for fee status %s", payment_id)
         messages.error(request, f'Error sending reminder: {str(e)}')
     
-    print("=== Payment Reminder Process Complete ===\n")
     return redirect('myapp:payment_reminders')
 
 def send_text_message(phone_number, fee_status, amount_to_pay, days_text, is_overdue):
@@ -2949,10 +2304,7 @@ def send_text_message(phone_number, fee_status, amount_to_pay, days_text, is_ove
         else:
             message = f"REMINDER: {student_name}, your {fee_category} payment of RM {amount_to_pay:.2f} is due in {days_text}. Please ensure timely payment."
         
-        print(f"\n=== Text Message Content ===")
-        print(f"To: {phone_number}")
-        print(f"Message: {message}")
-        print("=============================\n")
+        logger.debug("Text message to %s: %s", phone_number, message)
         
         # TODO: Integrate with actual SMS service
         # Example with Twilio:
@@ -2967,7 +2319,7 @@ def send_text_message(phone_number, fee_status, amount_to_pay, days_text, is_ove
         return True
         
     except Exception as e:
-        print(f"Error in send_text_message: {str(e)}")
+        logger.warning("Error in send_text_message: %s", e)
         raise e
 
 @login_required
@@ -2982,6 +2334,10 @@ def payment_reminders(request):
     overdue_payments = pending_fees.filter(due_date__lt=today)
     upcoming_payments = pending_fees.filter(due_date__gte=today)
     
+    # Resolve discounts for both lists up front (one waiver query each)
+    FeeStatus.resolve_discounts(overdue_payments)
+    FeeStatus.resolve_discounts(upcoming_payments)
+    
     # Calculate totals using the discounted amounts
     total_overdue = 0
     total_upcoming = 0
@@ -3008,6 +2364,39 @@ def payment_reminders(request):
     }
     return render(request, 'myapp/payment_reminders.html', context)
 
+@login_required
+def reminder_campaigns(request):
+    """List bulk reminder campaigns and queue new ones for the `run_reminder_campaigns --loop` process"""
+    if not (request.user.is_superuser or request.user.is_staff):
+        messages.error(request, 'Access denied. Admin privileges required.')
+        return redirect('myapp:payment_reminders')
+
+    if request.method == 'POST':
+        try:
+            upcoming_days = max(0, int(request.POST.get('upcoming_days', 7)))
+        except ValueError:
+            upcoming_days = 7
+        campaign = ReminderCampaign.objects.create(
+            name=request.POST.get('name') or f"Payment reminders {timezone.now():%Y-%m-%d %H:%M}",
+            include_overdue=bool(request.POST.get('include_overdue')),
+            upcoming_days=upcoming_days,
+            created_by=request.user,
+        )
+        messages.success(request, f'Campaign "{campaign.name}" queued. Reminders will be sent shortly.')
+        return redirect('myapp:reminder_campaigns')
+
+    campaigns = ReminderCampaign.objects.select_related('created_by')[:20]
+    return render(request, 'myapp/reminder_campaigns.html', {'campaigns': campaigns})
+
+@login_required
+@require_GET
+def reminder_campaign_progress(request, campaign_id):
+    """Progress counters of one campaign, polled by the campaigns page"""
+    if not (request.user.is_superuser or request.user.is_staff):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    campaign = get_object_or_404(ReminderCampaign, id=campaign_id)
+    return JsonResponse(campaign.as_progress_dict())
+
 @login_required
 def donation_categories(request):
     categories = DonationCategory.objects.all()
@@ -3141,6 +2530,8 @@ def donate(request):
         response['Content-Disposition'] = f'attachment; filename="donation_certificate_{name}.pdf"'
         
         # Create the PDF object
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
         p = canvas.Canvas(response, pagesize=letter)
         width, height = letter
         
@@ -3180,6 +2571,8 @@ def payment_receipt(request, payment_id):
         payment = get_object_or_404(Payment, id=payment_id)
         response = HttpResponse(content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="payment_receipt_{payment.id}.pdf"'
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
         p = canvas.Canvas(response, pagesize=letter)
         width, height = letter
         p.setFont("Helvetica-Bold", 16)
@@ -3285,6 +2678,9 @@ def payment_receipts(request):
     
     context = {
         'payments': payments,
+        # Ties the Email buttons of this page render to one send each, so a
+        # double click queues one receipt and reloading the page allows a resend
+        'send_token': uuid.uuid4().hex,
     }
     return render(request, 'myapp/payment_receipts.html', context)
 
@@ -3332,11 +2728,11 @@ def print_receipts(request):
 @login_required
 def email_receipt(request, payment_id):
     try:
-        print("\n=== Starting Email Process ===")
+        logger.debug("Starting receipt email process")
         
         # Get payment
         payment = get_object_or_404(Payment, id=payment_id)
-        print(f"Found payment: ID={payment.id}, Amount={payment.amount}")
+        logger.debug("Found payment: ID=%s, Amount=%s", payment.id, payment.amount)
         
         # Basic email content
         subject = f'Payment Receipt - {payment.id}'
@@ -3351,33 +2747,23 @@ def email_receipt(request, payment_id):
         Thank you for your payment!
         """
         
-        print("\n=== Email Content ===")
-        print(f"To: moaaj.upm@gmail.com")
-        print(f"Subject: {subject}")
-        print(f"Message: {message}")
-        print("===================\n")
-        
-        # Try to send email
-        print("Attempting to send email...")
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=['moaaj.upm@gmail.com'],
-            fail_silently=False,
-        )
+        logger.debug("Queueing receipt email, subject: %s, message: %s", subject, message)
         
-        print("Email sent successfully!")
-        messages.success(request, 'Email has been sent to moaaj.upm@gmail.com')
+        # Queue the email once per send token; a link without one is an explicit resend
+        send_token = request.GET.get('send') or uuid.uuid4().hex
+        if OutboundEmail.enqueue(
+            ['moaaj.upm@gmail.com'], subject, message,
+            idempotency_key=f'payment-receipt:{payment.id}:{send_token[:64]}'
+        ):
+            logger.info("Receipt email queued for payment %s", payment.id)
+            messages.success(request, 'Email has been queued for moaaj.upm@gmail.com')
+        else:
+            messages.info(request, 'This receipt email has already been queued for moaaj.upm@gmail.com')
         
     except Exception as e:
-        print(f"\nError occurred: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error sending receipt email for payment %s", payment_id)
         messages.error(request, f'Error sending email: {str(e)}')
     
-    print("=== Email Process Complete ===\n")
     return redirect('myapp:payment_receipts')
 
 @login_required
@@ -3471,6 +2857,8 @@ def generate_reminder_letter(request, payment_id):
     response['Content-Disposition'] = f'attachment; filename="reminder_{fee_status.student.student_id}_{fee_status.fee_structure.category.name}.pdf"'
     
     # Create the PDF object
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
     p = canvas.Canvas(response, pagesize=letter)
     width, height = letter
     
@@ -3600,6 +2988,8 @@ def view_fee_waiver_letter(request, waiver_id):
     response['Content-Disposition'] = f'attachment; filename="fee_waiver_{waiver_id}.pdf"'
     
     # Create the PDF object
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
     p = canvas.Canvas(response, pagesize=letter)
     width, height = letter
     
@@ -3632,95 +3022,25 @@ def view_fee_waiver_letter(request, waiver_id):
 
 @login_required
 def fee_reports(request):
-    # Get date range from request
+    from .export_services import parse_export_filters
+    from .fee_report_services import cached_fee_report_summary, report_payments, report_waivers
+
+    # Get date range from request; dates that don't parse are ignored
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
-    
-    # Base querysets
-    collected_payments = Payment.objects.filter(status='completed')
-    pending_payments = Payment.objects.filter(status='pending')
-    waived_fees = FeeWaiver.objects.filter(status='approved')
-    
-    # Apply date filters if provided
-    if start_date:
-        collected_payments = collected_payments.filter(payment_date__gte=start_date)
-        pending_payments = pending_payments.filter(payment_date__gte=start_date)
-        waived_fees = waived_fees.filter(start_date__gte=start_date)
-    
-    if end_date:
-        collected_payments = collected_payments.filter(payment_date__lte=end_date)
-        pending_payments = pending_payments.filter(payment_date__lte=end_date)
-        waived_fees = waived_fees.filter(end_date__lte=end_date)
-    
-    # Add related fields
-    collected_payments = collected_payments.select_related('student', 'fee_structure__category')
-    pending_payments = pending_payments.select_related('student', 'fee_structure__category')
-    
-    # Calculate totals
-    total_collected = collected_payments.aggregate(total=Sum('amount'))['total'] or 0
-    total_pending = pending_payments.aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Calculate total waived amount
-    total_waived = 0
-    for waiver in waived_fees:
-        if waiver.percentage:
-            avg_fee = Payment.objects.filter(
-                fee_structure__category=waiver.category
-            ).aggregate(avg=Avg('amount'))['avg'] or 0
-            total_waived += (avg_fee * waiver.percentage / 100)
-        else:
-            total_waived += waiver.amount or 0
-    
-    # Get counts
-    collected_count = collected_payments.count()
-    pending_count = pending_payments.count()
-    waived_count = waived_fees.count()
-    
-    # Generate category summary
-    categories = FeeCategory.objects.all()
-    category_summary = []
-    
-    for category in categories:
-        category_collected = collected_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        category_pending = pending_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        category_waived = 0
-        category_waivers = waived_fees.filter(category=category)
-        for waiver in category_waivers:
-            if waiver.percentage:
-                avg_fee = Payment.objects.filter(
-                    fee_structure__category=category
-                ).aggregate(avg=Avg('amount'))['avg'] or 0
-                category_waived += (avg_fee * waiver.percentage / 100)
-            else:
-                category_waived += waiver.amount or 0
-        
-        category_total = category_collected + category_pending + category_waived
-        
-        category_summary.append({
-            'name': category.name,
-            'collected': category_collected,
-            'pending': category_pending,
-            'waived': category_waived,
-            'total': category_total
-        })
-    
+    filters = parse_export_filters(request.GET)
+
+    payments = report_payments(filters['date_from'], filters['date_to'])
+    collected_payments = payments.filter(status='completed').select_related('student', 'fee_structure__category')
+    pending_payments = payments.filter(status='pending').select_related('student', 'fee_structure__category')
+    waived_fees = report_waivers(filters['date_from'], filters['date_to']).select_related('student', 'category')
+
+    # Totals, counts and the category summary come from a few grouped queries, cached per date range
     context = {
         'collected_payments': collected_payments,
         'pending_payments': pending_payments,
         'waived_fees': waived_fees,
-        'total_collected': total_collected,
-        'total_pending': total_pending,
-        'total_waived': total_waived,
-        'collected_count': collected_count,
-        'pending_count': pending_count,
-        'waived_count': waived_count,
-        'category_summary': category_summary,
+        **cached_fee_report_summary(filters['date_from'], filters['date_to']),
         'start_date': start_date,
         'end_date': end_date,
     }
@@ -3733,136 +3053,69 @@ def export_fee_report(request):
     if Workbook is None:
         messages.error(request, 'Excel export requires openpyxl library. Please install it.')
         return redirect('fee_reports')
-    
-    # Get date range from request
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    
-    # Get the same data as fee_reports view
-    collected_payments = Payment.objects.filter(status='completed')
-    pending_payments = Payment.objects.filter(status='pending')
-    waived_fees = FeeWaiver.objects.filter(status='approved')
-    
-    # Apply date filters if provided
-    if start_date:
-        collected_payments = collected_payments.filter(payment_date__gte=start_date)
-        pending_payments = pending_payments.filter(payment_date__gte=start_date)
-        waived_fees = waived_fees.filter(start_date__gte=start_date)
-    
-    if end_date:
-        collected_payments = collected_payments.filter(payment_date__lte=end_date)
-        pending_payments = pending_payments.filter(payment_date__lte=end_date)
-        waived_fees = waived_fees.filter(end_date__lte=end_date)
-    
-    # Add related fields
-    collected_payments = collected_payments.select_related('student', 'fee_structure__category')
-    pending_payments = pending_payments.select_related('student', 'fee_structure__category')
-    
-    # Create Excel workbook
-    wb = Workbook()
-    
-    # Summary Sheet
-    ws_summary = wb.active
-    ws_summary.title = "Summary"
-    ws_summary.append(['Fee Category', 'Collected', 'Pending', 'Waived', 'Total'])
-    
+
+    from .export_services import Sheet, filter_payments, iter_values, parse_export_filters, scope_to_user, xlsx_response
+    from .fee_report_services import fee_report_summary
+
+    # Date range from request, parsed like every other export
+    filters = parse_export_filters(request.GET)
+    payments = filter_payments(scope_to_user(request, Payment.objects.all()), {**filters, 'status': ''})
+    collected_payments = payments.filter(status='completed')
+    pending_payments = payments.filter(status='pending')
+    waived_fees = scope_to_user(request, FeeWaiver.objects.filter(status='approved'))
+    if filters['date_from']:
+        waived_fees = waived_fees.filter(start_date__gte=filters['date_from'])
+    if filters['date_to']:
+        waived_fees = waived_fees.filter(end_date__lte=filters['date_to'])
+
     # Get category summary
-    categories = FeeCategory.objects.all()
-    for category in categories:
-        category_collected = collected_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        category_pending = pending_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        category_waived = 0
-        category_waivers = waived_fees.filter(category=category)
-        for waiver in category_waivers:
-            if waiver.percentage:
-                avg_fee = Payment.objects.filter(
-                    fee_structure__category=category
-                ).aggregate(avg=Avg('amount'))['avg'] or 0
-                category_waived += (avg_fee * waiver.percentage / 100)
-            else:
-                category_waived += waiver.amount or 0
-        
-        category_total = category_collected + category_pending + category_waived
-        
-        # Add row to summary sheet
-        ws_summary.append([
-            category.name,
-            float(category_collected),
-            float(category_pending),
-            float(category_waived),
-            float(category_total)
-        ])
-    
-    # Collected Payments Sheet
-    ws_collected = wb.create_sheet("Collected Payments")
-    ws_collected.append(['Date', 'Student', 'Category', 'Amount', 'Payment Method'])
-    
-    for payment in collected_payments:
-        ws_collected.append([
-            payment.payment_date,
-            f"{payment.student.first_name} {payment.student.last_name}",
-            payment.fee_structure.category.name if payment.fee_structure else 'N/A',
-            float(payment.amount),
-            payment.payment_method
-        ])
-
-    # Pending Payments Sheet
-    ws_pending = wb.create_sheet("Pending Payments")
-    ws_pending.append(['Date', 'Student', 'Category', 'Amount', 'Payment Method'])
-    
-    for payment in pending_payments:
-        ws_pending.append([
-            payment.payment_date,
-            f"{payment.student.first_name} {payment.student.last_name}",
-            payment.fee_structure.category.name if payment.fee_structure else 'N/A',
-            float(payment.amount),
-            payment.payment_method
-        ])
-
-    # Waived Fees Sheet
-    ws_waived = wb.create_sheet("Waived Fees")
-    ws_waived.append(['Student', 'Category', 'Amount', 'Percentage', 'Start Date', 'End Date'])
-    
-    for waiver in waived_fees:
-        ws_waived.append([
-            f"{waiver.student.first_name} {waiver.student.last_name}" if waiver.student else 'N/A',
-            waiver.category.name if waiver.category else 'N/A',
-            float(waiver.amount) if waiver.amount else 0,
-            float(waiver.percentage) if waiver.percentage else 0,
-            waiver.start_date,
-            waiver.end_date
-        ])
-
-    # Create response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    summary_rows = [
+        [row['name'], float(row['collected']), float(row['pending']), float(row['waived']), float(row['total'])]
+        for row in fee_report_summary(payments, waived_fees)['category_summary']
+    ]
+
+    payment_fields = (
+        'payment_date', 'student__first_name', 'student__last_name', 'fee_structure__category__name',
+        'amount', 'payment_method',
     )
-    response['Content-Disposition'] = 'attachment; filename=fee_report.xlsx'
-    
-    # Save workbook to response
-    wb.save(response)
-    
-    return response
+
+    def payment_rows(queryset):
+        for payment_date, first_name, last_name, category, amount, method in iter_values(queryset, payment_fields):
+            yield [payment_date, f"{first_name} {last_name}", category or 'N/A', float(amount), method]
+
+    def waiver_rows():
+        fields = ('student__first_name', 'student__last_name', 'category__name', 'amount', 'percentage', 'start_date', 'end_date')
+        for first_name, last_name, category, amount, percentage, start_date, end_date in iter_values(waived_fees, fields):
+            yield [
+                f"{first_name} {last_name}" if first_name is not None else 'N/A',
+                category or 'N/A',
+                float(amount) if amount else 0,
+                float(percentage) if percentage else 0,
+                start_date,
+                end_date
+            ]
+
+    payment_headers = ['Date', 'Student', 'Category', 'Amount', 'Payment Method']
+    return xlsx_response('fee_report', [
+        Sheet("Summary", ['Fee Category', 'Collected', 'Pending', 'Waived', 'Total'], summary_rows),
+        Sheet("Collected Payments", payment_headers, payment_rows(collected_payments.order_by('payment_date', 'id'))),
+        Sheet("Pending Payments", payment_headers, payment_rows(pending_payments.order_by('payment_date', 'id'))),
+        Sheet("Waived Fees", ['Student', 'Category', 'Amount', 'Percentage', 'Start Date', 'End Date'], waiver_rows()),
+    ], 'fee_report.xlsx')
 
 @login_required
 def edit_student(request, id):
     student = get_object_or_404(Student, id=id)
     if request.method == 'POST':
-        print(f"DEBUG: edit_student POST request received for student {id}")
-        print(f"DEBUG: POST data: {request.POST}")
+        logger.debug("edit_student POST request received for student %s", id)
+        logger.debug("POST data: %s", request.POST)
         
         form = StudentForm(request.POST, instance=student)
-        print(f"DEBUG: Form is_valid: {form.is_valid()}")
+        logger.debug("Form is_valid: %s", form.is_valid())
         
         if not form.is_valid():
-            print(f"DEBUG: Form errors: {form.errors}")
-            print(f"DEBUG: Form non_field_errors: {form.non_field_errors()}")
+            logger.debug("Form errors: %s", form.errors)
+            logger.debug("Form non_field_errors: %s", form.non_field_errors())
         
         if form.is_valid():
             # Store old form level for comparison
@@ -3874,12 +3127,12 @@ def edit_student(request, id):
             # Handle is_active field properly - checkbox returns 'on' when checked, None when unchecked
             student.is_active = request.POST.get('is_active') == 'on'
             student.save()
-            print(f"DEBUG: Student saved successfully. ID: {student.id}, Name: {student.first_name} {student.last_name}")
-            print(f"DEBUG: Updated fields - Level: {student.level}, Level Custom: {student.level_custom}, Year Batch: {student.year_batch}, Active: {student.is_active}")
+            logger.debug("Student saved successfully. ID: %s, Name: %s %s", student.id, student.first_name, student.last_name)
+            logger.debug("Updated fields - Level: %s, Level Custom: %s, Year Batch: %s, Active: %s", student.level, student.level_custom, student.year_batch, student.is_active)
             
             # Force refresh from database to ensure we have the latest data
             student.refresh_from_db()
-            print(f"DEBUG: After refresh - Level: {student.level}, Level Custom: {student.level_custom}, Year Batch: {student.year_batch}, Active: {student.is_active}")
+            logger.debug("After refresh - Level: %s, Level Custom: %s, Year Batch: %s, Active: %s", student.level, student.level_custom, student.year_batch, student.is_active)
             
             # Check if form level changed
             if (old_level != student.level or old_level_custom != student.level_custom) and student.level == 'form' and student.level_custom:
@@ -3888,15 +3141,12 @@ def edit_student(request, id):
                 
                 # Remove old fee statuses that don't match the new form level
                 old_fee_statuses = FeeStatus.objects.filter(student=student)
-                for old_status in old_fee_statuses:
-                    if old_status.fee_structure.form.lower() != student.level_custom.lower():
+                for old_status in old_fee_statuses.select_related('fee_structure'):
+                    if not old_status.fee_structure.applies_to(student):
                         old_status.delete()
                 
                 # Get fee structures for the new form level
-                form_fees = FeeStructure.objects.filter(
-                    form__iexact=student.level_custom,
-                    is_active=True
-                )
+                form_fees = FeeStructure.for_student(student)
                 
                 generated_count = 0
                 for fee_structure in form_fees:
@@ -3985,43 +3235,38 @@ def delete_student(request, id):
 
 @login_required
 def fee_analytics_dashboard(request):
+    from .rollup_services import payment_rollups
+
     # Get date range from request
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     
-    # Base querysets
-    collected_payments = Payment.objects.filter(status='completed')
-    pending_payments = Payment.objects.filter(status='pending')
-    overdue_payments = Payment.objects.filter(
-        payment_date__lt=timezone.now().date(),
-        status='pending'
-    )
-    
-    # Apply date filters if provided
+    # Totals come from the daily revenue rollups instead of the payments table
+    rollups = payment_rollups()
+    ranged = rollups
     if start_date:
-        collected_payments = collected_payments.filter(payment_date__gte=start_date)
-        pending_payments = pending_payments.filter(payment_date__gte=start_date)
-        overdue_payments = overdue_payments.filter(payment_date__gte=start_date)
-    
+        ranged = ranged.filter(day__gte=start_date)
     if end_date:
-        collected_payments = collected_payments.filter(payment_date__lte=end_date)
-        pending_payments = pending_payments.filter(payment_date__lte=end_date)
-        overdue_payments = overdue_payments.filter(payment_date__lte=end_date)
-    
-    # Calculate totals
-    total_collected = collected_payments.aggregate(total=Sum('amount'))['total'] or 0
-    total_pending = pending_payments.aggregate(total=Sum('amount'))['total'] or 0
-    overdue_amount = overdue_payments.aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Get counts
-    paid_count = collected_payments.count()
+        ranged = ranged.filter(day__lte=end_date)
+    
+    # Calculate totals and counts
+    totals = ranged.aggregate(
+        collected=Sum('total_amount', filter=Q(status='completed')),
+        pending=Sum('total_amount', filter=Q(status='pending')),
+        overdue=Sum('total_amount', filter=Q(status='pending', day__lt=timezone.now().date())),
+        paid_count=Sum('payment_count', filter=Q(status='completed')),
+    )
+    total_collected = totals['collected'] or 0
+    total_pending = totals['pending'] or 0
+    overdue_amount = totals['overdue'] or 0
+    paid_count = totals['paid_count'] or 0
     
     # Get monthly data for trends
-    monthly_data = Payment.objects.annotate(
-        month=TruncMonth('payment_date')
+    monthly_data = rollups.annotate(
+        month=TruncMonth('day')
     ).values('month').annotate(
-        collected=Sum('amount', filter=Q(status='completed')),
-        pending=Sum('amount', filter=Q(status='pending'))
+        collected=Sum('total_amount', filter=Q(status='completed')),
+        pending=Sum('total_amount', filter=Q(status='pending'))
     ).order_by('month')[:12]
     
     monthly_labels = [data['month'].strftime('%b %Y') for data in monthly_data]
@@ -4029,19 +3274,17 @@ def fee_analytics_dashboard(request):
     monthly_pending = [float(data['pending'] or 0) for data in monthly_data]
     
     # Get category data
+    category_totals = {
+        row['category']: row
+        for row in ranged.filter(category__isnull=False).values('category').annotate(
+            collected=Sum('total_amount', filter=Q(status='completed')),
+            pending=Sum('total_amount', filter=Q(status='pending'))
+        ).order_by()
+    }
     categories = FeeCategory.objects.all()
     category_labels = [category.name for category in categories]
-    category_collected = []
-    category_pending = []
-    
-    for category in categories:
-        category_collected.append(float(collected_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0))
-        
-        category_pending.append(float(pending_payments.filter(
-            fee_structure__category=category
-        ).aggregate(total=Sum('amount'))['total'] or 0))
+    category_collected = [float((category_totals.get(category.id) or {}).get('collected') or 0) for category in categories]
+    category_pending = [float((category_totals.get(category.id) or {}).get('pending') or 0) for category in categories]
     
     # Get recent payments
     recent_payments = Payment.objects.select_related(
@@ -4186,6 +3429,8 @@ def donation_receipt(request, donation_id):
         response['Content-Disposition'] = f'attachment; filename="donation_receipt_{donation.id}.pdf"'
         
         # Create the PDF object
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
         p = canvas.Canvas(response, pagesize=letter)
         width, height = letter
         
@@ -4352,14 +3597,8 @@ def mark_fee_as_paid(request, fee_id):
         fee.is_paid = True
         fee.save()
         
-        # Remove from cart if it exists
-        cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-        removed_from_cart = False
-        if 'individual_fees' in cart and fee_id in cart['individual_fees']:
-            cart['individual_fees'].remove(fee_id)
-            request.session['cart'] = cart
-            request.session.modified = True
-            removed_from_cart = True
+        # Remove from any cart it is in
+        removed_from_cart = ParentCart.discard(individual_fee=fee) > 0
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             message = f'Fee "{fee.name}" marked as paid' + (' and removed from cart.' if removed_from_cart else '.')
@@ -4389,12 +3628,8 @@ def mark_fee_status_as_paid(request, fee_status_id):
         fee_status.status = 'paid'
         fee_status.save()
         
-        # Remove from cart if it exists
-        cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-        if 'fee_statuses' in cart and fee_status_id in cart['fee_statuses']:
-            cart['fee_statuses'].remove(fee_status_id)
-            request.session['cart'] = cart
-            request.session.modified = True
+        # Remove from any cart it is in
+        ParentCart.discard(fee_status=fee_status)
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
@@ -4450,37 +3685,45 @@ def payment_analytics_dashboard(request):
     elif view_type == 'category' and category_id:
         payments = payments.filter(fee_structure__category_id=category_id)
     
+    # Statistics and breakdowns come from the daily revenue rollups unless the
+    # view narrows to a student, class or batch, which the rollups don't keep
+    if (view_type == 'student' and student_id) or (view_type == 'class' and class_name) or (view_type == 'batch' and batch_year):
+        source = payments.order_by()
+        day_field, amount_field, category_field = 'payment_date', 'amount', 'fee_structure__category__name'
+        count_of = lambda: Count('id')
+    else:
+        from .rollup_services import payment_rollups
+        source = payment_rollups().filter(day__range=[date_from, date_to])
+        if view_type == 'category' and category_id:
+            source = source.filter(category_id=category_id)
+        day_field, amount_field, category_field = 'day', 'total_amount', 'category__name'
+        count_of = lambda: Sum('payment_count')
+    
+    def breakdown(queryset, field, order):
+        return queryset.values(field).annotate(
+            count=count_of(),
+            total_amount=Sum(amount_field)
+        ).order_by(order)
+    
     # Calculate statistics
-    total_payments = payments.count()
-    total_amount = payments.aggregate(total=Sum('amount'))['total'] or 0
+    totals = source.aggregate(count=count_of(), total=Sum(amount_field))
+    total_payments = totals['count'] or 0
+    total_amount = totals['total'] or 0
     
     # Status breakdown
-    status_breakdown = payments.values('status').annotate(
-        count=Count('id'),
-        total_amount=Sum('amount')
-    ).order_by('status')
+    status_breakdown = breakdown(source, 'status', 'status')
     
     # Monthly trend
-    monthly_trend = payments.extra(
-        select={'month': "EXTRACT(month FROM payment_date)"}
-    ).values('month').annotate(
-        count=Count('id'),
-        total_amount=Sum('amount')
-    ).order_by('month')
+    monthly_trend = breakdown(source.annotate(month=ExtractMonth(day_field)), 'month', 'month')
     
     # Category breakdown
-    category_breakdown = payments.values(
-        'fee_structure__category__name'
-    ).annotate(
-        count=Count('id'),
-        total_amount=Sum('amount')
-    ).order_by('-total_amount')
+    category_breakdown = [
+        {'fee_structure__category__name': row[category_field], 'count': row['count'], 'total_amount': row['total_amount']}
+        for row in breakdown(source, category_field, '-total_amount')
+    ]
     
     # Payment method breakdown
-    method_breakdown = payments.values('payment_method').annotate(
-        count=Count('id'),
-        total_amount=Sum('amount')
-    ).order_by('-total_amount')
+    method_breakdown = breakdown(source, 'payment_method', '-total_amount')
     
     # Get pending payments (FeeStatus records)
     pending_payments = FeeStatus.objects.filter(
@@ -4560,61 +3803,40 @@ def payment_analytics_dashboard(request):
 @login_required
 def payment_analytics_export(request):
     """Export payment analytics data"""
-    from django.http import HttpResponse
-    from django.db.models import Sum, Count
-    import csv
-    
+    from .export_services import (
+        Sheet, csv_response, filter_payments, filters_for_view, iter_values, parse_export_filters, scope_to_user
+    )
+
     view_type = request.GET.get('view', 'school')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    # Get payments data
-    payments = Payment.objects.filter(
-        payment_date__range=[date_from, date_to]
-    ).select_related('student', 'fee_structure__category')
-    
-    # Apply filters
-    if view_type == 'student':
-        student_id = request.GET.get('student')
-        if student_id:
-            payments = payments.filter(student_id=student_id)
-    elif view_type == 'class':
-        class_name = request.GET.get('class')
-        if class_name:
-            payments = payments.filter(student__class_name=class_name)
-    elif view_type == 'batch':
-        batch_year = request.GET.get('batch')
-        if batch_year:
-            payments = payments.filter(student__year_batch=batch_year)
-    elif view_type == 'category':
-        category_id = request.GET.get('category')
-        if category_id:
-            payments = payments.filter(fee_structure__category_id=category_id)
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="payment_analytics_{view_type}_{date_from}_to_{date_to}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow([
-        'Student Name', 'Student ID', 'Class', 'Batch', 
+    filters = filters_for_view(parse_export_filters(request.GET), view_type)
+    payments = filter_payments(scope_to_user(request, Payment.objects.all()), filters).order_by('payment_date', 'id')
+
+    fields = (
+        'student__first_name', 'student__last_name', 'student__student_id', 'student__class_name',
+        'student__year_batch', 'fee_structure__category__name', 'amount', 'payment_date',
+        'payment_method', 'status',
+    )
+
+    def rows():
+        for first_name, last_name, student_id, class_name, batch, category, amount, payment_date, method, status in iter_values(payments, fields):
+            yield [
+                f"{first_name} {last_name}",
+                student_id,
+                class_name or '',
+                batch,
+                category or 'Individual Fee',
+                amount,
+                payment_date,
+                method,
+                status,
+            ]
+
+    headers = [
+        'Student Name', 'Student ID', 'Class', 'Batch',
         'Fee Category', 'Amount', 'Payment Date', 'Payment Method', 'Status'
-    ])
-    
-    for payment in payments:
-        writer.writerow([
-            f"{payment.student.first_name} {payment.student.last_name}",
-            payment.student.student_id,
-            payment.student.class_name or '',
-            payment.student.year_batch,
-            payment.fee_structure.category.name if payment.fee_structure else 'Individual Fee',
-            payment.amount,
-            payment.payment_date,
-            payment.payment_method,
-            payment.status,
-        ])
-    
-    return response
+    ]
+    filename = f"payment_analytics_{view_type}_{filters['date_from'] or 'start'}_to_{filters['date_to'] or 'today'}.csv"
+    return csv_response('payment_analytics', Sheet("Payments", headers, rows()), filename)
 
 @login_required
 @require_GET
@@ -4627,10 +3849,7 @@ def get_form_fees(request):
     
     try:
         from .models import FeeStructure
-        fees = FeeStructure.objects.filter(
-            form__iexact=form,
-            is_active=True
-        ).select_related('category')
+        fees = FeeStructure.for_form(form).select_related('category')
         
         fees_data = []
         for fee in fees:
@@ -4655,153 +3874,63 @@ def get_form_fees(request):
 
 @login_required
 def bulk_add_students_form(request):
-    """Bulk add students through web form"""
+    """Bulk add students through web form or an uploaded XLSX/CSV file"""
+    if not (request.user.is_superuser or request.user.is_staff):
+        messages.error(request, 'Access denied. Admin privileges required.')
+        return redirect('home')
+
     if request.method == 'POST':
-        print("DEBUG: bulk_add_students_form POST request received")
-        print("DEBUG: POST data keys:", list(request.POST.keys()))
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        
-        # Find all student entries in the form
-        student_entries = {}
-        for key, value in request.POST.items():
-            if '_' in key:
-                parts = key.split('_')
-                if len(parts) >= 2:
-                    field_name = '_'.join(parts[:-1])
-                    student_num = parts[-1]
-                    
-                    if student_num.isdigit():
-                        if student_num not in student_entries:
-                            student_entries[student_num] = {}
-                        student_entries[student_num][field_name] = value
-        
-        print(f"DEBUG: Found {len(student_entries)} student entries")
-        
-        for student_num, student_data in student_entries.items():
-            try:
-                # Check required fields
-                required_fields = ['student_id', 'nric', 'first_name', 'last_name', 'year_batch']
-                missing_fields = [field for field in required_fields if not student_data.get(field)]
-                
-                if missing_fields:
-                    errors.append(f"Student {student_num}: Missing required fields: {', '.join(missing_fields)}")
-                    error_count += 1
-                    continue
-                
-                # Check if student already exists
-                if Student.objects.filter(student_id=student_data['student_id']).exists():
-                    errors.append(f"Student {student_num}: Student ID {student_data['student_id']} already exists")
-                    error_count += 1
-                    continue
-                
-                if Student.objects.filter(nric=student_data['nric']).exists():
-                    errors.append(f"Student {student_num}: NRIC {student_data['nric']} already exists")
-                    error_count += 1
-                    continue
-                
-                # Create student data
-                student_obj_data = {
-                    'student_id': student_data['student_id'],
-                    'nric': student_data['nric'],
-                    'first_name': student_data['first_name'],
-                    'last_name': student_data['last_name'],
-                    'year_batch': student_data['year_batch'],
-                    'is_active': student_data.get('is_active') == 'on',
-                    'level': student_data.get('level', 'form'),
-                    'level_custom': student_data.get('level_custom', ''),
-                    'class_name': student_data.get('class_name', ''),
-                    'program': student_data.get('program', ''),
-                }
-                
-                # Auto-assign form number if level is 'form' but no form number is selected
-                if student_obj_data['level'] == 'form' and not student_obj_data['level_custom']:
-                    student_obj_data['level_custom'] = 'Form 1'
-                    print(f"DEBUG: Auto-assigned form number for student {student_num}: Form 1")
-                
-                # Create student
-                student = Student(**student_obj_data)
-                student.save()
-                
-                # Automatically create user account
-                try:
-                    username = f"student_{student.student_id.lower()}"
-                    if not User.objects.filter(username=username).exists():
-                        password = f"{student.student_id.lower()}123"
-                        user = User.objects.create_user(
-                            username=username,
-                            email=f"{username}@school.com",
-                            password=password,
-                            first_name=student.first_name,
-                            last_name=student.last_name
-                        )
-                        from .models import UserProfile
-                        UserProfile.objects.create(
-                            user=user,
-                            role='student',
-                            student=student
-                        )
-                        print(f"DEBUG: User account created for student {student_num} - Username: {username}")
-                except Exception as e:
-                    print(f"DEBUG: Error creating user account for student {student_num}: {e}")
-                
-                # Generate fee statuses if student has a form level
-                if student.level == 'form' and student.level_custom:
-                    try:
-                        from .models import FeeStructure, FeeStatus
-                        from datetime import date, timedelta
-                        
-                        form_fees = FeeStructure.objects.filter(
-                            form__iexact=student.level_custom,
-                            is_active=True
-                        )
-                        
-                        for fee_structure in form_fees:
-                            existing_status = FeeStatus.objects.filter(
-                                student=student,
-                                fee_structure=fee_structure
-                            ).first()
-                            
-                            if not existing_status:
-                                if fee_structure.frequency == 'yearly':
-                                    due_date = date.today() + timedelta(days=30)
-                                elif fee_structure.frequency == 'termly':
-                                    due_date = date.today() + timedelta(days=90)
-                                elif fee_structure.frequency == 'monthly':
-                                    due_date = date.today() + timedelta(days=30)
-                                else:
-                                    due_date = date.today() + timedelta(days=30)
-                                
-                                FeeStatus.objects.create(
-                                    student=student,
-                                    fee_structure=fee_structure,
-                                    amount=fee_structure.amount or 0,
-                                    due_date=due_date,
-                                    status='pending'
-                                )
-                                print(f"DEBUG: Created fee status for student {student_num} - {fee_structure.category.name}")
-                    except Exception as e:
-                        print(f"DEBUG: Error creating fee statuses for student {student_num}: {e}")
-                    
-                    success_count += 1
-                    print(f"DEBUG: Successfully created student {student_num} - {student.first_name} {student.last_name}")
-                    
-            except Exception as e:
-                errors.append(f"Student {student_num}: {str(e)}")
-                error_count += 1
-        
-        # Show results
-        if success_count > 0:
-            messages.success(request, f'Successfully added {success_count} students with automatic user account creation and form number assignment.')
-        if error_count > 0:
-            messages.warning(request, f'Failed to add {error_count} students. See details below.')
-            for error in errors:
-                messages.error(request, error)
-        
-        return redirect('myapp:student_list')
-    
+        from .student_import_services import StudentImportError, form_rows, import_students, read_rows
+
+        upload = request.FILES.get('file')
+        try:
+            rows = read_rows(upload) if upload else form_rows(request.POST)
+            result = import_students(
+                rows,
+                create_accounts=request.POST.get('create_accounts', 'on') == 'on',
+                dry_run=request.POST.get('dry_run') == 'on'
+            )
+        except StudentImportError as e:
+            messages.error(request, str(e))
+            return render(request, 'myapp/bulk_add_students_form.html')
+
+        if not result.rows:
+            messages.warning(request, 'No students found to add.')
+            return render(request, 'myapp/bulk_add_students_form.html')
+
+        if result.is_valid and not result.dry_run:
+            messages.success(
+                request,
+                f'Successfully added {result.students_created} students with {result.accounts_created} user accounts, '
+                f'{result.parents_created} parent accounts and {result.fee_statuses_created} fee records.'
+            )
+            if not (result.accounts_created or result.parents_created):
+                return redirect('myapp:student_list')
+            # New accounts have no password yet; hand out their set-password links
+            invited = result.queue_invitations(request.build_absolute_uri)
+            messages.info(
+                request,
+                f'Set-password links for the new accounts are in the import report'
+                f'{f" and were emailed to {invited} parents" if invited else ""}.'
+            )
+            return render(request, 'myapp/bulk_add_students_form.html', {
+                'import_result': result,
+                'report': result.save_report(request.user, build_url=request.build_absolute_uri),
+            })
+
+        if result.is_valid:
+            messages.success(request, f'All {len(result.rows)} rows are valid. Upload again without "Check only" to add them.')
+        else:
+            messages.warning(
+                request,
+                f'{len(result.error_rows)} of {len(result.rows)} rows have errors, so no students were added. '
+                f'Fix them and upload again.'
+            )
+        return render(request, 'myapp/bulk_add_students_form.html', {
+            'import_result': result,
+            'report': result.save_report(request.user),
+        })
+
     return render(request, 'myapp/bulk_add_students_form.html')
 
 @login_required
@@ -4901,22 +4030,18 @@ def send_reminder_email(request, payment_id):
     html_message = render_to_string('myapp/email/payment_reminder_email.html', context)
     plain_message = strip_tags(html_message)
     
-    # Send email
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_emails,
-            html_message=html_message,
-            fail_silently=False,
-        )
-        if student_email:
-            messages.success(request, f'Email reminder sent successfully to {student.first_name} {student.last_name} ({student_email})')
-        else:
-            messages.success(request, f'Email reminder sent to admin email (student email not available)')
-    except Exception as e:
-        messages.error(request, f'Failed to send email: {str(e)}')
+    # Queue the email; the outbox worker sends it (one reminder per fee per day)
+    OutboundEmail.enqueue(
+        recipient_emails,
+        subject,
+        plain_message,
+        html_body=html_message,
+        idempotency_key=f'payment-reminder:{fee_status.id}:{today}',
+    )
+    if student_email:
+        messages.success(request, f'Email reminder queued for {student.first_name} {student.last_name} ({student_email})')
+    else:
+        messages.success(request, f'Email reminder queued for admin email (student email not available)')
     
     # Generate Gmail URL with letter content
     letter_content = generate_letter_content(fee_status, amount_to_pay, days_text, is_overdue)
@@ -11,6 +11,7 @@ from django.http import JsonResponse
 from django.utils import timezone
 from datetime import date, timedelta
 from decimal import Decimal
+import logging
 
 from .models import (
     Student, FeeCategory, FeeStructure, Payment, PaymentReceipt, 
@@ -19,6 +20,8 @@ from .models import (
 from .forms import StudentForm, FeeStructureForm, IndividualStudentFeeForm
 from accounts.decorators import form1_admin_required
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # FORM 1 ADMIN CORE VIEWS - STRICT DATA ISOLATION
 # ============================================================================
@@ -49,7 +52,7 @@ def form1_admin_dashboard(request):
         # STRICT FILTERING: Only Form 1 students
         form1_students = Student.objects.filter(
             level='form',
-            level_custom__iexact='Form 1',
+            form_level=1,
             is_active=True
         )
         
@@ -59,7 +62,7 @@ def form1_admin_dashboard(request):
         if total_students > 0:
             # STRICT FILTERING: Only Form 1 fee structures
             form1_fee_structures = FeeStructure.objects.filter(
-                form__iexact='Form 1',
+                form_level=1,
                 is_active=True
             )
             
@@ -99,7 +102,7 @@ def form1_admin_dashboard(request):
             
             # Fee categories for Form 1
             form1_fee_categories = FeeCategory.objects.filter(
-                feestructure__form__iexact='Form 1'
+                feestructure__form_level=1
             ).distinct()
             
             # Payment methods breakdown
@@ -132,8 +135,7 @@ def form1_admin_dashboard(request):
         
     except Exception as e:
         # Log error but don't cause redirect loop
-        print(f"Error in Form 1 admin dashboard: {str(e)}")
-        pass
+        logger.exception("Error in Form 1 admin dashboard: %s", e)
     
     return render(request, 'myapp/form1_admin_dashboard_simple.html', context)
 
@@ -145,7 +147,7 @@ def form1_student_list(request):
     # STRICT FILTERING: Only Form 1 students
     form1_students = Student.objects.filter(
         level='form',
-        level_custom__iexact='Form 1',
+        form_level=1,
         is_active=True
     ).order_by('first_name', 'last_name')
     
@@ -212,7 +214,7 @@ def form1_student_detail(request, id):
         Student, 
         id=id,
         level='form',
-        level_custom__iexact='Form 1',
+        form_level=1,
         is_active=True
     )
     
@@ -252,20 +254,20 @@ def form1_fee_management(request):
     
     # STRICT FILTERING: Only Form 1 fee structures
     form1_fee_structures = FeeStructure.objects.filter(
-        form__iexact='Form 1',
+        form_level=1,
         is_active=True
     ).order_by('category__name', 'name')
     
     # STRICT FILTERING: Only Form 1 individual fees
     form1_individual_fees = IndividualStudentFee.objects.filter(
         student__level='form',
-        student__level_custom__iexact='Form 1',
+        student__form_level=1,
         student__is_active=True
     ).select_related('student', 'fee_structure').order_by('-created_at')
     
     # Fee categories for Form 1
     form1_fee_categories = FeeCategory.objects.filter(
-        feestructure__form__iexact='Form 1'
+        feestructure__form_level=1
     ).distinct()
     
     # Fee statistics
@@ -320,7 +322,7 @@ def form1_add_individual_fee(request):
             individual_fee = form.save(commit=False)
             
             # STRICT VALIDATION: Ensure only Form 1 students can be selected
-            if individual_fee.student.level != 'form' or individual_fee.student.level_custom.lower() != 'form 1':
+            if individual_fee.student.level != 'form' or individual_fee.student.form_level != 1:
                 messages.error(request, 'You can only add fees for Form 1 students.')
                 return redirect('form1_admin:add_individual_fee')
             
@@ -333,7 +335,7 @@ def form1_add_individual_fee(request):
         # STRICT FILTERING: Only Form 1 students in dropdown
         form.fields['student'].queryset = Student.objects.filter(
             level='form',
-            level_custom__iexact='Form 1',
+            form_level=1,
             is_active=True
         ).order_by('first_name', 'last_name')
     
@@ -378,7 +380,7 @@ def form1_edit_fee_structure(request, structure_id):
     fee_structure = get_object_or_404(
         FeeStructure,
         id=structure_id,
-        form__iexact='Form 1'
+        form_level=1
     )
     
     if request.method == 'POST':
@@ -410,7 +412,7 @@ def form1_payment_management(request):
     # STRICT FILTERING: Only Form 1 students
     form1_students = Student.objects.filter(
         level='form',
-        level_custom__iexact='Form 1',
+        form_level=1,
         is_active=True
     )
     
@@ -494,7 +496,7 @@ def form1_payment_receipts(request):
     # STRICT FILTERING: Only Form 1 students
     form1_students = Student.objects.filter(
         level='form',
-        level_custom__iexact='Form 1',
+        form_level=1,
         is_active=True
     )
     
@@ -520,7 +522,7 @@ def form1_payment_receipt(request, payment_id):
         Payment,
         id=payment_id,
         student__level='form',
-        student__level_custom__iexact='Form 1',
+        student__form_level=1,
         student__is_active=True
     )
     
@@ -553,7 +555,7 @@ def form1_analytics(request):
     # STRICT FILTERING: Only Form 1 students
     form1_students = Student.objects.filter(
         level='form',
-        level_custom__iexact='Form 1',
+        form_level=1,
         is_active=True
     )
     
@@ -14,7 +14,8 @@ from io import BytesIO
 
 from .models import (
     Student, FeeCategory, FeeStructure, Payment, PaymentReceipt, 
-    Invoice, FeeDiscount, PaymentReminder, IndividualStudentFee, FeeStatus
+    Invoice, FeeDiscount, PaymentReminder, IndividualStudentFee, FeeStatus,
+    StudentFeeLedger
 )
 from .forms import StudentForm, FeeStructureForm, IndividualStudentFeeForm
 from accounts.decorators import form3_admin_required
@@ -26,13 +27,13 @@ def form3_admin_dashboard(request):
     
     # Get only Form 3 students - handle both numeric and text formats
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     ).order_by('first_name', 'last_name')
     
     # Get Form 3 fee structures
     form3_fee_structures = FeeStructure.objects.filter(
-        form__iexact='Form 3',
+        form_level=3,
         is_active=True
     )
     
@@ -46,27 +47,26 @@ def form3_admin_dashboard(request):
         student__in=form3_students
     )
     
-    # Calculate statistics for Form 3 only
+    # Calculate statistics for Form 3 only from the per-student fee ledger
+    StudentFeeLedger.refresh_missing(form3_students)
+    ledger_totals = StudentFeeLedger.objects.filter(student__in=form3_students).aggregate(
+        payment_count=Sum('payment_count'),
+        revenue=Sum('paid_amount'),
+        completed_count=Sum('completed_payment_count'),
+        outstanding_count=Sum('outstanding_count'),
+    )
     total_form3_students = form3_students.count()
-    total_form3_payments = Payment.objects.filter(student__in=form3_students).count()
-    total_form3_revenue = Payment.objects.filter(
-        student__in=form3_students,
-        status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    total_form3_payments = ledger_totals['payment_count'] or 0
+    total_form3_revenue = ledger_totals['revenue'] or Decimal('0.00')
     
     # Pending payments for Form 3 students (fees that are due but not paid)
-    pending_payments = form3_fee_statuses.filter(
-        status__in=['pending', 'overdue']
-    ).count()
+    pending_payments = ledger_totals['outstanding_count'] or 0
     
     # Completed payments for Form 3 students
-    completed_payments = Payment.objects.filter(
-        student__in=form3_students,
-        status='completed'
-    ).count()
+    completed_payments = ledger_totals['completed_count'] or 0
     
     # Pending fees for Form 3 students
-    pending_fees = form3_fee_statuses.filter(status__in=['pending', 'overdue']).count()
+    pending_fees = pending_payments
     
     # Recent Form 3 activities
     recent_payments = form3_payments[:5]
@@ -99,7 +99,7 @@ def form3_student_list(request):
     
     # Base queryset - only Form 3 students (handle both numeric and text formats)
     base_queryset = Student.objects.filter(
-        level_custom__in=['3', 'Form 3']
+        form_level=3
     )
     
     # Filter based on show parameter
@@ -127,7 +127,7 @@ def form3_student_detail(request, id):
     # Get student and verify they are Form 3
     student = get_object_or_404(Student, id=id)
     
-    if not (student.level_custom in ['3', 'Form 3']):
+    if student.form_level != 3:
         messages.error(request, 'Access denied. This student is not in Form 3.')
         return redirect('form3_admin:student_list')
     
@@ -165,7 +165,7 @@ def form3_fee_management(request):
     
     # Get Form 3 students first (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -178,7 +178,7 @@ def form3_fee_management(request):
     
     fee_structures = FeeStructure.objects.filter(
         id__in=unpaid_fee_structure_ids,
-        form__iexact='Form 3',
+        form_level=3,
         is_active=True
     ).select_related('category')
     
@@ -204,7 +204,7 @@ def form3_payment_management(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -265,7 +265,7 @@ def form3_add_individual_fee(request):
             individual_fee = form.save(commit=False)
             
             # Verify student is Form 3
-            if not (individual_fee.student.level_custom in ['3', 'Form 3']):
+            if individual_fee.student.form_level != 3:
                 messages.error(request, 'Access denied. Can only add fees for Form 3 students.')
                 return redirect('form3_admin:add_individual_fee')
             
@@ -277,7 +277,7 @@ def form3_add_individual_fee(request):
         form = IndividualStudentFeeForm()
         # Filter students to only Form 3 (handle both numeric and text formats)
         form.fields['student'].queryset = Student.objects.filter(
-            level_custom__in=['3', 'Form 3'],
+            form_level=3,
             is_active=True
         )
     
@@ -297,7 +297,7 @@ def form3_analytics(request):
         # Get Form 3 students
         form3_students = Student.objects.filter(
             level='form',
-            level_custom__iexact='Form 3',
+            form_level=3,
             is_active=True
         )
         
@@ -493,7 +493,7 @@ def form3_pending_fees(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -523,7 +523,7 @@ def form3_add_fee_status(request):
             fee_status = form.save(commit=False)
             
             # Verify student is Form 3
-            if not (fee_status.student.level_custom in ['3', 'Form 3']):
+            if fee_status.student.form_level != 3:
                 messages.error(request, 'Access denied. Can only add fee status for Form 3 students.')
                 return redirect('form3_admin:add_fee_status')
             
@@ -535,7 +535,7 @@ def form3_add_fee_status(request):
         form = FeeStatusForm()
         # Filter students to only Form 3 (handle both numeric and text formats)
         form.fields['student'].queryset = Student.objects.filter(
-            level_custom__in=['3', 'Form 3'],
+            form_level=3,
             is_active=True
         )
     
@@ -553,7 +553,7 @@ def form3_fee_waivers(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -583,7 +583,7 @@ def form3_add_fee_waiver(request):
             fee_waiver = form.save(commit=False)
             
             # Verify student is Form 3
-            if not (fee_waiver.student.level_custom in ['3', 'Form 3']):
+            if fee_waiver.student.form_level != 3:
                 messages.error(request, 'Access denied. Can only add fee waivers for Form 3 students.')
                 return redirect('form3_admin:add_fee_waiver')
             
@@ -595,7 +595,7 @@ def form3_add_fee_waiver(request):
         form = FeeWaiverForm()
         # Filter students to only Form 3 (handle both numeric and text formats)
         form.fields['student'].queryset = Student.objects.filter(
-            level_custom__in=['3', 'Form 3'],
+            form_level=3,
             is_active=True
         )
     
@@ -613,7 +613,7 @@ def form3_fee_reports(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -643,7 +643,7 @@ def form3_export_fee_report(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -719,7 +719,7 @@ def form3_payment_receipts(request):
     
     # Get Form 3 students (handle both numeric and text formats)
     form3_students = Student.objects.filter(
-        level_custom__in=['3', 'Form 3'],
+        form_level=3,
         is_active=True
     )
     
@@ -744,7 +744,7 @@ def form3_payment_receipt(request, payment_id):
     payment = get_object_or_404(Payment, id=payment_id)
     
     # Verify student is Form 3
-    if not (payment.student.level_custom in ['3', 'Form 3']):
+    if payment.student.form_level != 3:
         messages.error(request, 'Access denied. This payment is not for a Form 3 student.')
         return redirect('form3_admin:payment_receipts')
     
@@ -2,20 +2,23 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponseRedirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
-from accounts.decorators import admin_required, student_required, parent_required, role_required, student_owns_payment, student_owns_student_record
-from .models import Student, Parent, Payment, FeeStructure, FeeCategory, DonationEvent, Donation, FeeStatus, IndividualStudentFee, Invoice
+from django.db.models import Exists, OuterRef, Q, Sum, Count
+from accounts.decorators import admin_required, student_required, student_record_required, parent_required, role_required, student_owns_payment, student_owns_student_record
+from .models import Student, Parent, Payment, FeeStructure, FeeCategory, DonationEvent, Donation, FeeStatus, IndividualStudentFee, Invoice, ParentCart, StudentFeeLedger, normalize_form_level
 from .forms import PaymentForm, StudentForm, FeeStructureForm
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.http import FileResponse
-from reportlab.pdfgen import canvas
-from io import BytesIO
 import csv
+import logging
 from django.http import HttpResponse
 from .models import Invoice
+from .checkout_services import CheckoutService, CheckoutError
+from .report_services import PdfReport, report_styles, table_style
+from donation.instrumentation import query_budget
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
 
 # ============================================================================
 # ADMIN-ONLY VIEWS
@@ -58,26 +61,36 @@ def form3_admin_dashboard(request):
     # Get the form level from request (set by decorator)
     form_level = getattr(request, 'form_level', 'form3')
     
-    # Filter students by form level - handle both numeric and text formats
-    form_level_value = form_level.replace('form', '')  # Convert 'form3' to '3'
-    form_level_text = form_level.replace('form', 'Form ')  # Convert 'form3' to 'Form 3'
+    # Filter students by normalized form level ('form3' -> 3)
+    form_level_value = normalize_form_level(form_level)
     
     form_students = Student.objects.filter(
-        level_custom__in=[form_level_value, form_level_text],  # Include both '3' and 'Form 3'
+        form_level=form_level_value,
         is_active=True
     )
     
-    # Calculate statistics for Form 3 only
+    # Calculate statistics for Form 3 only from the per-student fee ledger
+    StudentFeeLedger.refresh_missing(form_students)
+    form_ledgers = StudentFeeLedger.objects.filter(student__in=form_students)
+    ledger_totals = form_ledgers.aggregate(
+        total_payments=Sum('payment_count'),
+        total_paid=Sum('completed_payment_count'),
+        pending_payments=Sum('pending_payment_count'),
+        overdue_payments=Sum('overdue_count'),
+        total_revenue=Sum('paid_amount'),
+        pending_amount=Sum('pending_payment_amount'),
+    )
     total_students = form_students.count()
-    total_payments = Payment.objects.filter(student__in=form_students).count()
-    total_paid = Payment.objects.filter(student__in=form_students, status='completed').count()
-    pending_payments = Payment.objects.filter(student__in=form_students, status='pending').count()
-    overdue_payments = FeeStatus.objects.filter(student__in=form_students, status='overdue').count()
-    total_revenue = Payment.objects.filter(student__in=form_students, status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
+    total_payments = ledger_totals['total_payments'] or 0
+    total_paid = ledger_totals['total_paid'] or 0
+    pending_payments = ledger_totals['pending_payments'] or 0
+    overdue_payments = ledger_totals['overdue_payments'] or 0
+    total_revenue = ledger_totals['total_revenue'] or 0
     
     # DEBUG: Print to console
-    print(f"DEBUG FORM3 DASHBOARD: {total_students} students, {total_payments} payments, RM {total_revenue}")
-    print(f"DEBUG: First 5 students: {[f'{s.student_id}: {s.first_name} {s.last_name}' for s in form_students[:5]]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("FORM3 DASHBOARD: %s students, %s payments, RM %s", total_students, total_payments, total_revenue)
+        logger.debug("First 5 students: %s", [f'{s.student_id}: {s.first_name} {s.last_name}' for s in form_students[:5]])
     
     # PIBG Donation Statistics for Form 3 students
     from .models import PibgDonation
@@ -86,24 +99,33 @@ def form3_admin_dashboard(request):
     
     # Calculate rates
     payment_rate = (total_paid / total_payments * 100) if total_payments > 0 else 0
-    collection_rate = (total_revenue / (total_revenue + (Payment.objects.filter(student__in=form_students, status='pending').aggregate(Sum('amount'))['amount__sum'] or 0)) * 100) if total_revenue > 0 else 0
+    collection_rate = (total_revenue / (total_revenue + (ledger_totals['pending_amount'] or 0)) * 100) if total_revenue > 0 else 0
     
     # Get class-wise data for Form 3
-    form_classes = form_students.values_list('class_name', flat=True).distinct()
+    class_ledgers = {
+        row['student__class_name']: row
+        for row in form_ledgers.exclude(student__class_name__isnull=True).exclude(student__class_name='').values(
+            'student__class_name'
+        ).annotate(
+            total_students=Count('id'),
+            paid_students=Sum('completed_payment_count'),
+            revenue=Sum('paid_amount'),
+        ).order_by()
+    }
     class_data = []
     
-    for class_name in form_classes:
+    for class_name in form_students.values_list('class_name', flat=True).distinct():
         if class_name:
-            class_students = form_students.filter(class_name=class_name)
-            class_paid = Payment.objects.filter(student__in=class_students, status='completed').count()
-            class_revenue = Payment.objects.filter(student__in=class_students, status='completed').aggregate(Sum('amount'))['amount__sum'] or 0
+            row = class_ledgers.get(class_name, {})
+            class_student_count = row.get('total_students', 0)
+            class_paid = row.get('paid_students') or 0
             
             class_data.append({
                 'class_name': class_name,
-                'total_students': class_students.count(),
+                'total_students': class_student_count,
                 'paid_students': class_paid,
-                'revenue': class_revenue,
-                'payment_rate': (class_paid / class_students.count() * 100) if class_students.count() > 0 else 0
+                'revenue': row.get('revenue') or 0,
+                'payment_rate': (class_paid / class_student_count * 100) if class_student_count > 0 else 0
             })
     
     # Recent payments for Form 3 students
@@ -146,18 +168,17 @@ def form3_students_page(request):
     sort_by = request.GET.get('sort', 'first_name')
     sort_order = request.GET.get('order', 'asc')
     
-    # Base queryset - only Form 3 students (handle both numeric and text formats)
-    form_level_value = form_level.replace('form', '')  # Convert 'form3' to '3'
-    form_level_text = form_level.replace('form', 'Form ')  # Convert 'form3' to 'Form 3'
+    # Base queryset - only students in this form level ('form3' -> 3)
+    form_level_value = normalize_form_level(form_level)
     
     form_students = Student.objects.filter(
-        level_custom__in=[form_level_value, form_level_text],  # Include both '3' and 'Form 3'
+        form_level=form_level_value,
         is_active=True
     )
     
     if show == 'all':
         form_students = Student.objects.filter(
-            level_custom__in=[form_level_value, form_level_text]
+            form_level=form_level_value
         )
     
     # Apply search filter
@@ -201,8 +222,9 @@ def form3_students_page(request):
     all_year_batches = form_students.values_list('year_batch', flat=True).distinct().order_by('-year_batch')
     
     # DEBUG: Print to console
-    print(f"DEBUG FORM3 STUDENTS: {form_students.count()} students found")
-    print(f"DEBUG: First 5 students: {[f'{s.student_id}: {s.first_name} {s.last_name}' for s in form_students[:5]]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("FORM3 STUDENTS: %s students found", form_students.count())
+        logger.debug("First 5 students: %s", [f'{s.student_id}: {s.first_name} {s.last_name}' for s in form_students[:5]])
     
     # Pagination
     paginator = Paginator(form_students, 20)  # Show 20 students per page
@@ -346,15 +368,9 @@ def download_admin_dashboard_pdf(request):
         messages.error(request, 'Access denied. Only superusers can download dashboard data.')
         return redirect('myapp:admin_dashboard')
     
-    from django.http import HttpResponse
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import Table, Paragraph, Spacer, PageBreak
     from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
     from django.utils import timezone
-    from io import BytesIO
     from datetime import datetime, timedelta
     
     # Get all the same data as the dashboard
@@ -458,49 +474,18 @@ def download_admin_dashboard_pdf(request):
         
         recent_donations = dummy_recent_donations
     
-    # Create PDF response
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="admin_dashboard_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    
-    # Create PDF document
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    header_style = ParagraphStyle(
-        'CustomHeader',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
-    
-    subheader_style = ParagraphStyle(
-        'CustomSubHeader',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceAfter=8,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
+    report = PdfReport(f'admin_dashboard_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf')
+    styles = report_styles()
+    title_style = styles['title']
+    header_style = styles['header']
+    subheader_style = styles['subheader']
     
     # Build PDF content
     story = []
     
     # Title
     story.append(Paragraph("STUDENT FEE COLLECTION ADMIN DASHBOARD", title_style))
-    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
+    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['normal']))
     story.append(Spacer(1, 20))
     
     # Summary Statistics
@@ -517,18 +502,7 @@ def download_admin_dashboard_pdf(request):
     ]
     
     summary_table = Table(summary_data, colWidths=[2*inch, 1.5*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-    ]))
+    summary_table.setStyle(table_style('banded', font_size=10, align='LEFT', padding=8))
     
     story.append(summary_table)
     story.append(Spacer(1, 20))
@@ -544,18 +518,7 @@ def download_admin_dashboard_pdf(request):
         monthly_data.append([label, f"{count:,}", f"{amount:,.2f}"])
     
     monthly_table = Table(monthly_data, colWidths=[2*inch, 2*inch, 2*inch])
-    monthly_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-    ]))
+    monthly_table.setStyle(table_style('banded', font_size=9))
     
     story.append(monthly_table)
     story.append(PageBreak())
@@ -574,22 +537,11 @@ def download_admin_dashboard_pdf(request):
             ])
         
         recent_table = Table(recent_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch, 1*inch])
-        recent_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-        ]))
+        recent_table.setStyle(table_style('banded', font_size=9))
         
         story.append(recent_table)
     else:
-        story.append(Paragraph("No recent donations found.", styles['Normal']))
+        story.append(Paragraph("No recent donations found.", styles['normal']))
     
     story.append(Spacer(1, 20))
     
@@ -607,18 +559,7 @@ def download_admin_dashboard_pdf(request):
     ]
     
     payment_status_table = Table(payment_status_data, colWidths=[2*inch, 2*inch, 2*inch])
-    payment_status_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-    ]))
+    payment_status_table.setStyle(table_style('banded', font_size=10, padding=8))
     
     story.append(payment_status_table)
     story.append(Spacer(1, 20))
@@ -643,18 +584,7 @@ def download_admin_dashboard_pdf(request):
             ])
         
         level_table = Table(level_table_data, colWidths=[2*inch, 2*inch, 2*inch])
-        level_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-        ]))
+        level_table.setStyle(table_style('banded', font_size=9))
         
         story.append(level_table)
     story.append(PageBreak())
@@ -679,18 +609,7 @@ def download_admin_dashboard_pdf(request):
     ]
     
     fee_categories_table = Table(fee_categories_data, colWidths=[2.5*inch, 2*inch, 1.5*inch])
-    fee_categories_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-    ]))
+    fee_categories_table.setStyle(table_style('banded', font_size=10, padding=8))
     
     story.append(fee_categories_table)
     story.append(Spacer(1, 20))
@@ -712,18 +631,7 @@ def download_admin_dashboard_pdf(request):
     ]
     
     form_class_table = Table(form_class_data, colWidths=[0.5*inch, 0.5*inch, 0.7*inch, 0.7*inch, 1*inch, 1*inch, 1*inch, 1*inch, 1*inch])
-    form_class_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.beige, colors.white])
-    ]))
+    form_class_table.setStyle(table_style('banded', font_size=8))
     
     story.append(form_class_table)
     story.append(Spacer(1, 20))
@@ -746,36 +654,16 @@ def download_admin_dashboard_pdf(request):
     ]
     
     summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.lightgreen, colors.white])
-    ]))
+    summary_table.setStyle(table_style('banded_green', font_size=11, align='LEFT', padding=8))
     
     story.append(summary_table)
     
     # Footer
     story.append(Spacer(1, 30))
-    story.append(Paragraph(f"Report generated by: {request.user.username}", styles['Normal']))
-    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-    
-    # Build PDF
-    doc.build(story)
+    story.append(Paragraph(f"Report generated by: {request.user.username}", styles['normal']))
+    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['normal']))
     
-    # Get PDF content
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Return PDF response
-    response.write(pdf_content)
-    return response
+    return report.build(story).response()
 
 @admin_required
 def moaaj_dashboard(request):
@@ -1209,14 +1097,14 @@ def student_detail(request, student_id):
 
 @login_required
 def school_fees_home(request):
-    print("DEBUG: school_fees_home view called!")
-    print(f"DEBUG: Request URL: {request.path}")
-    print(f"DEBUG: User: {request.user.username}")
+    logger.debug("school_fees_home view called!")
+    logger.debug("Request URL: %s", request.path)
+    logger.debug("User: %s", request.user.username)
     """School fees home - different content for different roles"""
     
     # Special handling for tamim123 - always treat as student
     if request.user.username == 'tamim123':
-        print("DEBUG: tamim123 detected, forcing student view")
+        logger.debug("tamim123 detected, forcing student view")
         try:
             profile = request.user.myapp_profile
             if profile.role == 'student':
@@ -1230,10 +1118,7 @@ def school_fees_home(request):
             
             # Get fee structures that are appropriate for this student's form/grade level
             student_level = student.get_level_display_value()
-            available_fees = FeeStructure.objects.filter(
-                form__iexact=student_level,
-                is_active=True
-            ).select_related('category')
+            available_fees = FeeStructure.for_student(student).select_related('category')
             
             # Filter out fees that are completely paid
             fees_to_show = []
@@ -1260,6 +1145,7 @@ def school_fees_home(request):
                 individual_fees = []
             
             # Calculate discount information for each fee status
+            FeeStatus.resolve_discounts(fee_statuses)
             for fee_status in fee_statuses:
                 fee_status.discount_info = fee_status.get_discount_info()
             
@@ -1276,7 +1162,7 @@ def school_fees_home(request):
             }
             return render(request, 'myapp/school_fees_student.html', context)
         except Exception as e:
-            print(f"DEBUG: Error accessing tamim123 profile: {e}")
+            logger.warning("Error accessing tamim123 profile: %s", e)
             # If tamim123 has no profile, show error message
             from django.contrib import messages
             messages.error(request, 'Your user profile is not properly configured. Please contact the administrator.')
@@ -1305,8 +1191,9 @@ def school_fees_home(request):
                     student=student, 
                     status__in=['pending', 'overdue']
                 ).select_related('fee_structure')
-                print(f"DEBUG: Student {student.first_name} has {len(fee_statuses)} unpaid fee statuses")
-                print(f"DEBUG: Fee statuses: {[(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]]}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Student %s has %s unpaid fee statuses", student.first_name, len(fee_statuses))
+                    logger.debug("Fee statuses: %s", [(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]])
                 
                 # Force refresh from database
                 from django.db import connection
@@ -1315,7 +1202,8 @@ def school_fees_home(request):
                     student=student, 
                     status__in=['pending', 'overdue']
                 ).select_related('fee_structure')
-                print(f"DEBUG: After refresh - Fee statuses: {[(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]]}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("After refresh - Fee statuses: %s", [(fs.fee_structure.category.name, fs.status) for fs in fee_statuses[:3]])
                 
                 # Show all active fee structures for students
                 # If a fee has FeeStatus records, only show if any are pending/overdue
@@ -1380,58 +1268,48 @@ def school_fees_home(request):
             messages.error(request, 'Access denied.')
             return redirect('home')
     except Exception as e:
-        print(f"DEBUG: Error accessing user profile: {e}")
+        logger.warning("Error accessing user profile: %s", e)
         messages.error(request, 'Your user profile is not properly configured. Please contact the administrator.')
         return render(request, 'myapp/error.html', {'error_message': 'Profile not found'})
 
-@student_required
+@student_record_required
 @require_POST
 def add_to_cart(request):
     fee_id = request.POST.get('fee_id')
     fee_status_id = request.POST.get('fee_status_id')
     individual_fee_id = request.POST.get('individual_fee_id')
     next_url = request.POST.get('next')
-    
-    # Initialize cart structure if not exists
-    if 'cart' not in request.session:
-        request.session['cart'] = {'fees': [], 'fee_statuses': [], 'individual_fees': []}
-    
-    cart = request.session['cart']
-    
-    # Migrate old cart format to new format if needed
-    if isinstance(cart, list):
-        # Old format was a list of fee IDs
-        old_cart = cart
-        cart = {'fees': old_cart, 'fee_statuses': [], 'individual_fees': []}
-        request.session['cart'] = cart
-    elif 'fee_statuses' not in cart:
-        # Add fee_statuses if missing
-        cart['fee_statuses'] = []
-        request.session['cart'] = cart
+    student = request.user.myapp_profile.student
+    cart = ParentCart.for_student(student)
     
     if fee_status_id:
         # Handle fee status (with discount support)
-        if fee_status_id not in cart['fee_statuses']:
-            cart['fee_statuses'].append(fee_status_id)
-            request.session['cart'] = cart
+        fee_status = FeeStatus.objects.select_related('fee_structure__category').filter(
+            id=fee_status_id, student=student
+        ).first()
+        if fee_status is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(student, fee_status=fee_status):
             messages.success(request, 'Fee added to cart.')
         else:
             messages.info(request, 'Fee already in cart.')
     
     elif fee_id:
         # Handle regular fee structure (legacy support)
-        if fee_id not in cart['fees']:
-            cart['fees'].append(fee_id)
-            request.session['cart'] = cart
+        fee_structure = FeeStructure.objects.select_related('category').filter(id=fee_id).first()
+        if fee_structure is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(student, fee_structure=fee_structure):
             messages.success(request, 'Fee added to cart.')
         else:
             messages.info(request, 'Fee already in cart.')
     
     elif individual_fee_id:
         # Handle individual student fee
-        if individual_fee_id not in cart['individual_fees']:
-            cart['individual_fees'].append(individual_fee_id)
-            request.session['cart'] = cart
+        individual_fee = IndividualStudentFee.objects.filter(id=individual_fee_id, student=student).first()
+        if individual_fee is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(student, individual_fee=individual_fee):
             messages.success(request, 'Individual fee added to cart.')
         else:
             messages.info(request, 'Individual fee already in cart.')
@@ -1443,38 +1321,32 @@ def add_to_cart(request):
         return redirect(next_url)
     return redirect('myapp:school_fees_home')
 
-@student_required
+@query_budget(20)
+@student_record_required
 def view_cart(request):
-    print("DEBUG: view_cart function called!")
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-    print(f"DEBUG: Cart in session: {cart}")
-    
-    # Migrate old cart format to new format if needed
-    if isinstance(cart, list):
-        # Old format was a list of fee IDs
-        old_cart = cart
-        cart = {'fees': old_cart, 'fee_statuses': [], 'individual_fees': []}
-        request.session['cart'] = cart
-    elif 'fee_statuses' not in cart:
-        # Add fee_statuses if missing
-        cart['fee_statuses'] = []
-        request.session['cart'] = cart
+    logger.debug("view_cart function called!")
+    cart = ParentCart.for_student(request.user.myapp_profile.student).as_checkout_cart()
+    logger.debug("Cart contents: %s", cart)
     
     # Get fee statuses (with discount support)
     fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
-    print(f"DEBUG: Found {fee_statuses.count()} fee statuses in cart")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %s fee statuses in cart", fee_statuses.count())
     
     # Calculate discount information for each fee status
+    FeeStatus.resolve_discounts(fee_statuses)
     for fee_status in fee_statuses:
         fee_status.discount_info = fee_status.get_discount_info()
     
     # Get regular fees (legacy support)
     regular_fees = FeeStructure.objects.filter(id__in=cart.get('fees', []))
-    print(f"DEBUG: Found {regular_fees.count()} regular fees in cart")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %s regular fees in cart", regular_fees.count())
     
     # Get individual fees
     individual_fees = IndividualStudentFee.objects.filter(id__in=cart.get('individual_fees', []))
-    print(f"DEBUG: Found {individual_fees.count()} individual fees in cart")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found %s individual fees in cart", individual_fees.count())
     
     # Calculate totals
     fee_statuses_total = sum(fs.discount_info['discounted_amount'] for fs in fee_statuses)
@@ -1498,71 +1370,43 @@ def view_cart(request):
     }
     return render(request, 'myapp/cart.html', context)
 
-@student_required
+@student_record_required
 @require_POST
 def remove_from_cart(request):
-    fee_id = request.POST.get('fee_id')
-    fee_status_id = request.POST.get('fee_status_id')
-    individual_fee_id = request.POST.get('individual_fee_id')
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-    
-    # Migrate old cart format to new format if needed
-    if isinstance(cart, list):
-        # Old format was a list of fee IDs
-        old_cart = cart
-        cart = {'fees': old_cart, 'fee_statuses': [], 'individual_fees': []}
-        request.session['cart'] = cart
-    elif 'fee_statuses' not in cart:
-        # Add fee_statuses if missing
-        cart['fee_statuses'] = []
-        request.session['cart'] = cart
-    
-    if fee_status_id and fee_status_id in cart.get('fee_statuses', []):
-        cart['fee_statuses'].remove(fee_status_id)
-        request.session['cart'] = cart
-        messages.success(request, 'Fee removed from cart.')
-    elif fee_id and fee_id in cart.get('fees', []):
-        cart['fees'].remove(fee_id)
-        request.session['cart'] = cart
-        messages.success(request, 'Fee removed from cart.')
-    elif individual_fee_id and individual_fee_id in cart.get('individual_fees', []):
-        cart['individual_fees'].remove(individual_fee_id)
-        request.session['cart'] = cart
+    cart = ParentCart.for_student(request.user.myapp_profile.student)
+    removed = cart.remove_item(
+        fee_status_id=request.POST.get('fee_status_id'),
+        fee_structure_id=request.POST.get('fee_id'),
+        individual_fee_id=request.POST.get('individual_fee_id'),
+    )
+    if not removed:
+        messages.info(request, 'Fee not in cart.')
+    elif not (request.POST.get('fee_status_id') or request.POST.get('fee_id')):
         messages.success(request, 'Individual fee removed from cart.')
     else:
-        messages.info(request, 'Fee not in cart.')
+        messages.success(request, 'Fee removed from cart.')
     
     return redirect('myapp:view_cart')
 
-@student_required
+@student_record_required
 def checkout_cart(request):
-    print("=" * 50)
-    print("DEBUG: checkout_cart function called!")
-    print(f"DEBUG: Request method: {request.method}")
-    print(f"DEBUG: User: {request.user.username}")
-    print(f"DEBUG: Request path: {request.path}")
-    print(f"DEBUG: Request URL: {request.build_absolute_uri()}")
-    print(f"DEBUG: User is authenticated: {request.user.is_authenticated}")
-    print(f"DEBUG: User has myapp_profile: {hasattr(request.user, 'myapp_profile')}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("checkout_cart function called!")
+        logger.debug("Request method: %s", request.method)
+        logger.debug("User: %s", request.user.username)
+        logger.debug("Request path: %s", request.path)
+        logger.debug("Request URL: %s", request.build_absolute_uri())
+        logger.debug("User is authenticated: %s", request.user.is_authenticated)
+        logger.debug("User has myapp_profile: %s", hasattr(request.user, 'myapp_profile'))
     if hasattr(request.user, 'myapp_profile'):
-        print(f"DEBUG: User role: {request.user.myapp_profile.role}")
-    print("=" * 50)
+        logger.debug("User role: %s", request.user.myapp_profile.role)
     
     student = request.user.myapp_profile.student
+    fee_cart = ParentCart.for_student(student)
+    cart = fee_cart.as_checkout_cart()
     
     # Handle GET request - show checkout page
     if request.method == 'GET':
-        cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-        
-        # Migrate old cart format to new format if needed
-        if isinstance(cart, list):
-            old_cart = cart
-            cart = {'fees': old_cart, 'fee_statuses': [], 'individual_fees': []}
-            request.session['cart'] = cart
-        elif 'fee_statuses' not in cart:
-            cart['fee_statuses'] = []
-            request.session['cart'] = cart
-        
         # Get cart items
         fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
         regular_fees = FeeStructure.objects.filter(id__in=cart.get('fees', []))
@@ -1573,6 +1417,7 @@ def checkout_cart(request):
             return redirect('myapp:view_cart')
         
         # Calculate discount information for each fee status
+        FeeStatus.resolve_discounts(fee_statuses)
         for fee_status in fee_statuses:
             fee_status.discount_info = fee_status.get_discount_info()
         
@@ -1600,242 +1445,42 @@ def checkout_cart(request):
     # Handle POST request - process payment
     # Get payment method from form
     payment_method = request.POST.get('payment_method', 'online')
-    print(f"DEBUG: Student checkout payment method: {payment_method}")
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-    print(f"DEBUG: Cart contents: {cart}")
-    print(f"DEBUG: Student: {student.first_name if student else 'None'}")
-    
-    # Migrate old cart format to new format if needed
-    if isinstance(cart, list):
-        # Old format was a list of fee IDs
-        old_cart = cart
-        cart = {'fees': old_cart, 'fee_statuses': [], 'individual_fees': []}
-        request.session['cart'] = cart
-    elif 'fee_statuses' not in cart:
-        # Add fee_statuses if missing
-        cart['fee_statuses'] = []
-        request.session['cart'] = cart
-    
-    # Get fee statuses (with discount support)
-    fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
+    logger.debug("Student checkout payment method: %s", payment_method)
+    logger.debug("Cart contents: %s", cart)
+    logger.debug("Student: %s", student.first_name if student else 'None')
     
-    # Get regular fees (legacy support)
-    regular_fees = FeeStructure.objects.filter(id__in=cart.get('fees', []))
-    
-    # Get individual fees
-    individual_fees = IndividualStudentFee.objects.filter(id__in=cart.get('individual_fees', []))
-    
-    if not fee_statuses and not regular_fees and not individual_fees:
-        print("DEBUG: Cart is empty - no fees found")
+    if not any(cart.get(key) for key in ('fee_statuses', 'fees', 'individual_fees')):
+        logger.debug("Cart is empty - no fees found")
         messages.info(request, 'Your cart is empty.')
         return redirect('myapp:view_cart')
-    else:
-        print(f"DEBUG: Found {fee_statuses.count()} fee statuses, {regular_fees.count()} regular fees and {individual_fees.count()} individual fees")
-    
-    payment_ids = []
-    pibg_donation_ids = []  # Track PIBG donations created during this checkout
     
-    # Process fee statuses (with discount support)
-    for fee_status in fee_statuses:
-        if fee_status is not None:
-            print(f"DEBUG: Processing fee status {fee_status.id} - {fee_status.fee_structure.category.name}")
-            
-            # Get discounted amount
-            discounted_amount = fee_status.get_discounted_amount()
-            print(f"DEBUG: Original amount: {fee_status.amount}, Discounted amount: {discounted_amount}")
-            
-            # Create payment record with discounted amount
-            # Set status based on payment method
-            payment_status = 'pending' if payment_method == 'cash' else 'completed'
-            payment = Payment.objects.create(
-                student=student,
-                fee_structure=fee_status.fee_structure,
-                amount=discounted_amount,
-                payment_date=timezone.now().date(),
-                payment_method=payment_method,
-                status=payment_status
-            )
-            print(f"DEBUG: Created payment {payment.id} for fee status {fee_status.id}")
-            
-            # Update fee status based on payment method
-            if payment_method == 'cash':
-                # Keep fee status as pending until admin confirms cash payment
-                pass  # Don't update fee status yet
-            else:
-                # For non-cash payments, mark as paid immediately
-                fee_status.status = 'paid'
-                fee_status.save()
-            
-            payment_ids.append(payment.id)
-    
-    # Process regular fees (legacy support)
-    for fee in regular_fees:
-        if fee is not None:
-            print(f"DEBUG: Processing fee {fee.id} - {fee.category.name}")
-            
-            # Create payment record
-            # Set status based on payment method
-            payment_status = 'pending' if payment_method == 'cash' else 'completed'
-            payment = Payment.objects.create(
-                student=student,
-                fee_structure=fee,
-                amount=fee.amount,
-                payment_date=timezone.now().date(),
-                payment_method=payment_method,
-                status=payment_status
-            )
-            print(f"DEBUG: Created payment {payment.id} for fee {fee.id}")
-            
-            # Handle FeeStatus updates
-            if fee.frequency == 'monthly':
-                # For monthly fees, update all pending FeeStatus records
-                fee_statuses = FeeStatus.objects.filter(
-                    student=student,
-                    fee_structure=fee,
-                    status__in=['pending', 'overdue']
-                )
-                print(f"DEBUG: Found {fee_statuses.count()} pending FeeStatus records for monthly fee")
-                if fee_statuses.exists():
-                    fee_statuses.update(status='paid')
-                    print(f"DEBUG: Updated all pending FeeStatus records to paid")
-                else:
-                    # Create FeeStatus records for monthly fees if they don't exist
-                    print(f"DEBUG: No FeeStatus records found for monthly fee, creating them manually")
-                    
-                    # Create monthly FeeStatus records manually
-                    monthly_amount = fee.get_monthly_amount()
-                    from datetime import timedelta
-                    start_date = timezone.now().date()
-                    
-                    for month in range(fee.monthly_duration):
-                        due_date = start_date + timedelta(days=30 * month)
-                        
-                        # Create FeeStatus record
-                        fee_status = FeeStatus.objects.create(
-                            student=student,
-                            fee_structure=fee,
-                            amount=monthly_amount,
-                            due_date=due_date,
-                            status='paid'  # Mark as paid immediately
-                        )
-                        print(f"DEBUG: Created FeeStatus record {fee_status.id} for month {month + 1}")
-                    
-                    print(f"DEBUG: Created {fee.monthly_duration} FeeStatus records for monthly fee")
-            else:
-                # For non-monthly fees, always create or update FeeStatus
-                fee_status, created = FeeStatus.objects.get_or_create(
-                    student=student,
-                    fee_structure=fee,
-                    defaults={
-                        'amount': fee.amount,
-                        'due_date': timezone.now().date(),
-                        'status': 'paid'
-                    }
-                )
-                if not created:
-                    # Update existing FeeStatus to paid
-                    print(f"DEBUG: Updating existing FeeStatus {fee_status.id} from {fee_status.status} to paid")
-                    fee_status.status = 'paid'
-                    fee_status.save()
-                else:
-                    print(f"DEBUG: Created new FeeStatus {fee_status.id} with status paid")
-            
-            # Get the final status for debugging
-            if fee.frequency == 'monthly':
-                final_statuses = FeeStatus.objects.filter(student=student, fee_structure=fee)
-                print(f"DEBUG: Final FeeStatus records for monthly fee: {[fs.status for fs in final_statuses]}")
-            else:
-                final_status = FeeStatus.objects.filter(student=student, fee_structure=fee).first()
-                print(f"DEBUG: Final FeeStatus status: {final_status.status if final_status else 'None'}")
-            
-            payment_ids.append(payment.id)
-    
-    # Process individual fees
-    for individual_fee in individual_fees:
-        if individual_fee is not None:
-            # Create payment for individual fee
-            # Set status based on payment method
-            payment_status = 'pending' if payment_method == 'cash' else 'completed'
-            payment = Payment.objects.create(
-                student=student,
-                fee_structure=None,  # Individual fees don't have fee_structure
-                amount=individual_fee.amount,
-                payment_date=timezone.now().date(),
-                payment_method=payment_method,
-                status=payment_status
-            )
-            # Mark the individual fee as paid only for non-cash payments
-            if payment_method != 'cash':
-                individual_fee.is_paid = True
-                individual_fee.save()
-            payment_ids.append(payment.id)
-    
-    print("DEBUG: Finished processing regular fees")
-    
-    # Process PIBG donation if selected
-    donation_amount = request.POST.get('donation_amount', '0')
-    custom_donation_amount = request.POST.get('custom_donation_amount', '')
-    
-    print(f"DEBUG: Student donation amount selected: {donation_amount}")
-    print(f"DEBUG: Student custom donation amount: {custom_donation_amount}")
-    
-    if donation_amount and donation_amount != '0':
-        from .models import PibgDonation, PibgDonationSettings
-        donation_settings = PibgDonationSettings.get_settings()
-        
-        # Determine actual donation amount
-        if donation_amount == 'custom':
-            actual_donation_amount = float(custom_donation_amount) if custom_donation_amount else 0
-        else:
-            actual_donation_amount = float(donation_amount)
-        
-        if actual_donation_amount > 0:
-            # Validate donation amount
-            if donation_amount == 'custom':
-                if actual_donation_amount < donation_settings.minimum_custom_amount or actual_donation_amount > donation_settings.maximum_custom_amount:
-                    print(f"ERROR: Custom donation amount {actual_donation_amount} out of range")
-                    messages.error(request, f'Custom donation amount must be between RM {donation_settings.minimum_custom_amount} and RM {donation_settings.maximum_custom_amount}')
-                    return redirect('myapp:view_cart')
-            
-            # Create PIBG donation record
-            # Set status based on payment method
-            donation_status = 'pending' if payment_method == 'cash' else 'completed'
-            pibg_donation = PibgDonation.objects.create(
-                student=student,
-                parent=None,  # Student checkout, no parent
-                amount=actual_donation_amount,
-                payment_method=payment_method,
-                status=donation_status
-            )
-            pibg_donation_ids.append(pibg_donation.id)  # Track this donation
-            print(f"DEBUG: Created student PIBG donation {pibg_donation.receipt_number} for RM {actual_donation_amount}")
+    # Pay for everything in the cart (and the optional PIBG donation) in one transaction
+    try:
+        result = CheckoutService([student], payment_method=payment_method).checkout(
+            cart,
+            donation_amount=request.POST.get('donation_amount', '0'),
+            custom_donation_amount=request.POST.get('custom_donation_amount', ''),
+        )
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('myapp:view_cart')
+    payments = result['payments']
+    payment_ids = [payment.id for payment in payments]
+    pibg_donation_ids = [donation.id for donation in result['pibg_donations']]
     
-    print("DEBUG: About to clear cart...")
     # Clear cart - include all cart types
-    print(f"DEBUG: Clearing cart. Before: {request.session.get('cart')}")
-    request.session['cart'] = {'fees': [], 'fee_statuses': [], 'individual_fees': []}
-    request.session.modified = True  # Force session save
-    print(f"DEBUG: Cart cleared. After: {request.session.get('cart')}")
-    print(f"DEBUG: Session modified flag: {request.session.modified}")
-    
-    # Force save the session
-    request.session.save()
-    print(f"DEBUG: Session saved. Cart after save: {request.session.get('cart')}")
-    
-    # Force database refresh
-    from django.db import connection
-    connection.close()
-    print("DEBUG: Database connection closed to force refresh")
+    fee_cart.clear()
+    logger.debug("Cart cleared")
     
     total_payments = Payment.objects.filter(student=student).count()
     request.session['total_payments'] = total_payments
     # Store the last payment IDs and PIBG donation IDs in session for receipt and invoice
     request.session['last_cart_payment_ids'] = payment_ids
     request.session['last_cart_pibg_donation_ids'] = pibg_donation_ids
-    print(f"DEBUG: Stored payment_ids in session: {payment_ids}")
-    print(f"DEBUG: Stored pibg_donation_ids in session: {pibg_donation_ids}")
-    print(f"DEBUG: Session cart_payment_ids after store: {request.session.get('last_cart_payment_ids')}")
-    print(f"DEBUG: Session cart_pibg_donation_ids after store: {request.session.get('last_cart_pibg_donation_ids')}")
+    logger.debug("Stored payment_ids in session: %s", payment_ids)
+    logger.debug("Stored pibg_donation_ids in session: %s", pibg_donation_ids)
+    logger.debug("Session cart_payment_ids after store: %s", request.session.get('last_cart_payment_ids'))
+    logger.debug("Session cart_pibg_donation_ids after store: %s", request.session.get('last_cart_pibg_donation_ids'))
     
     # Add success message based on payment method
     if payment_method == 'cash':
@@ -1844,34 +1489,12 @@ def checkout_cart(request):
         messages.success(request, f'Payment completed successfully! {len(payment_ids)} item(s) paid. Invoice generated.')
     
     # Instead of redirecting, render the invoice page directly
-    print("DEBUG: Rendering invoice page directly")
+    logger.debug("Rendering invoice page directly")
     
     # Generate invoices for each payment
     from datetime import timedelta
     invoices = []
-    for payment_id in payment_ids:
-        payment = Payment.objects.get(id=payment_id)
-        invoice, created = Invoice.objects.get_or_create(
-            payment=payment,
-            defaults={
-                'student': student,
-                'amount': payment.amount,
-                'due_date': timezone.now().date() + timedelta(days=30),
-                'status': 'sent',
-                'notes': f'Invoice for {payment.fee_structure.category.name if payment.fee_structure else "Individual Fee"}',
-                'terms_conditions': 'Payment is due within 30 days of invoice date.'
-            }
-        )
-        invoices.append(invoice)
-    
-    print(f"DEBUG: Generated {len(invoices)} invoices")
-    print("DEBUG: Rendering invoice page directly")
-    
-    # Generate invoices for each payment
-    from datetime import timedelta
-    invoices = []
-    for payment_id in payment_ids:
-        payment = Payment.objects.get(id=payment_id)
+    for payment in payments:
         invoice, created = Invoice.objects.get_or_create(
             payment=payment,
             defaults={
@@ -1885,8 +1508,8 @@ def checkout_cart(request):
         )
         invoices.append(invoice)
     
-    print(f"DEBUG: Generated {len(invoices)} invoices")
-    print("DEBUG: Rendering beautiful invoice page directly")
+    logger.debug("Generated %s invoices", len(invoices))
+    logger.debug("Rendering beautiful invoice page directly")
     
     # Create beautiful invoice HTML directly
     from django.http import HttpResponse
@@ -2316,8 +1939,8 @@ def cart_receipt_pdf(request):
     payments = Payment.objects.filter(id__in=payment_ids)
     student = request.user.myapp_profile.student
     # Generate PDF
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer)
+    report = PdfReport('payment_receipt.pdf')
+    p = report.canvas()
     p.setFont("Helvetica-Bold", 16)
     p.drawString(100, 800, "Payment Receipt")
     p.setFont("Helvetica", 12)
@@ -2360,35 +1983,34 @@ def cart_receipt_pdf(request):
     p.drawString(100, y, f"Total Paid: RM {total}")
     p.showPage()
     p.save()
-    buffer.seek(0)
-    response = FileResponse(buffer, as_attachment=True, filename='payment_receipt.pdf')
-    response['Content-Disposition'] += '; filename="payment_receipt.pdf"'
+    response = report.response()
     # Add a Refresh header to redirect after download
     response['Refresh'] = '0; url=/student/cart-invoice/'
     return response
 
 @student_required
 def cart_invoice(request):
-    print("DEBUG: cart_invoice function called!")
-    print(f"DEBUG: Request method: {request.method}")
-    print(f"DEBUG: Request path: {request.path}")
-    print(f"DEBUG: User: {request.user.username}")
+    logger.debug("cart_invoice function called!")
+    logger.debug("Request method: %s", request.method)
+    logger.debug("Request path: %s", request.path)
+    logger.debug("User: %s", request.user.username)
     
     payment_ids = request.session.get('last_cart_payment_ids', [])
     pibg_donation_ids = request.session.get('last_cart_pibg_donation_ids', [])
-    print(f"DEBUG: payment_ids from session: {payment_ids}")
-    print(f"DEBUG: pibg_donation_ids from session: {pibg_donation_ids}")
+    logger.debug("payment_ids from session: %s", payment_ids)
+    logger.debug("pibg_donation_ids from session: %s", pibg_donation_ids)
     
     # If no payment IDs in session, show a message
     if not payment_ids:
-        print("DEBUG: No payment IDs found, redirecting to school fees")
+        logger.debug("No payment IDs found, redirecting to school fees")
         messages.warning(request, 'No recent payments found. Please complete a payment first.')
         return redirect('myapp:school_fees_home')
     
     payments = Payment.objects.filter(id__in=payment_ids)
-    print(f"DEBUG: found {payments.count()} payments")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("found %s payments", payments.count())
     student = request.user.myapp_profile.student
-    print(f"DEBUG: student: {student}")
+    logger.debug("student: %s", student)
     
     # Get PIBG donations - use multiple strategies to ensure we find them
     from .models import PibgDonation
@@ -2401,7 +2023,7 @@ def cart_invoice(request):
         session_donations = PibgDonation.objects.filter(id__in=pibg_donation_ids).order_by('-created_at')
         if session_donations.exists():
             recent_donations = list(session_donations)
-            print(f"DEBUG: found {len(recent_donations)} PIBG donations from session for student {student.student_id}")
+            logger.debug("found %s PIBG donations from session for student %s", len(recent_donations), student.student_id)
     
     # Strategy 2: If no session donations, get today's donations
     if not recent_donations:
@@ -2412,7 +2034,7 @@ def cart_invoice(request):
         ).order_by('-created_at')
         if today_donations.exists():
             recent_donations = list(today_donations)
-            print(f"DEBUG: found {len(recent_donations)} PIBG donations from today for student {student.student_id}")
+            logger.debug("found %s PIBG donations from today for student %s", len(recent_donations), student.student_id)
     
     # Strategy 3: If still no donations, get last 24 hours
     if not recent_donations:
@@ -2422,7 +2044,7 @@ def cart_invoice(request):
             created_at__gte=yesterday
         ).order_by('-created_at'))
         if recent_donations:
-            print(f"DEBUG: found {len(recent_donations)} PIBG donations from last 24 hours for student {student.student_id}")
+            logger.debug("found %s PIBG donations from last 24 hours for student %s", len(recent_donations), student.student_id)
     
     # Strategy 4: If still no donations, get the most recent 5 donations
     if not recent_donations:
@@ -2430,29 +2052,29 @@ def cart_invoice(request):
             student=student
         ).order_by('-created_at')[:5])
         if recent_donations:
-            print(f"DEBUG: found {len(recent_donations)} recent PIBG donations for student {student.student_id}")
+            logger.debug("found %s recent PIBG donations for student %s", len(recent_donations), student.student_id)
     
     # Final check - if we still have no donations, show all donations for this student
     if not recent_donations:
         all_donations = PibgDonation.objects.filter(student=student).order_by('-created_at')
         recent_donations = list(all_donations)
-        print(f"DEBUG: showing ALL {len(recent_donations)} PIBG donations for student {student.student_id}")
+        logger.debug("showing ALL %s PIBG donations for student %s", len(recent_donations), student.student_id)
     
     # TEMPORARY: Force show recent donations for testing (remove in production)
     if not recent_donations:
-        print("DEBUG: FORCING to show recent donations for testing")
+        logger.debug("FORCING to show recent donations for testing")
         recent_donations = list(PibgDonation.objects.filter(student=student).order_by('-created_at')[:3])
-        print(f"DEBUG: FORCED to show {len(recent_donations)} recent donations")
+        logger.debug("FORCED to show %s recent donations", len(recent_donations))
     
     # ALWAYS show recent donations for tamim123 for testing
     if student.student_id == 'tamim123' and not recent_donations:
-        print("DEBUG: SPECIAL CASE - tamim123, showing recent donations")
+        logger.debug("SPECIAL CASE - tamim123, showing recent donations")
         recent_donations = list(PibgDonation.objects.filter(student=student).order_by('-created_at')[:5])
-        print(f"DEBUG: SPECIAL CASE - showing {len(recent_donations)} donations for tamim123")
+        logger.debug("SPECIAL CASE - showing %s donations for tamim123", len(recent_donations))
     
-    print(f"DEBUG: Final count - {len(recent_donations)} PIBG donations will be shown")
+    logger.debug("Final count - %s PIBG donations will be shown", len(recent_donations))
     for donation in recent_donations:
-        print(f"DEBUG: PIBG donation {donation.receipt_number}: RM{donation.amount} created at {donation.created_at}")
+        logger.debug("PIBG donation %s: RM%s created at %s", donation.receipt_number, donation.amount, donation.created_at)
     
     # Generate invoices for each payment
     invoices = []
@@ -2471,14 +2093,15 @@ def cart_invoice(request):
         )
         invoices.append(invoice)
     
-    print(f"DEBUG: Generated {len(invoices)} invoices")
-    print(f"DEBUG: Rendering cart_invoice.html template")
+    logger.debug("Generated %s invoices", len(invoices))
+    logger.debug("Rendering cart_invoice.html template")
     
     # Additional debug: Check all PIBG donations for this student
     all_donations = PibgDonation.objects.filter(student=student).order_by('-created_at')
-    print(f"DEBUG: Total PIBG donations for student {student.student_id}: {all_donations.count()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Total PIBG donations for student %s: %s", student.student_id, all_donations.count())
     for donation in all_donations[:3]:  # Show last 3
-        print(f"DEBUG: All donations - {donation.receipt_number}: RM{donation.amount} at {donation.created_at}")
+        logger.debug("All donations - %s: RM%s at %s", donation.receipt_number, donation.amount, donation.created_at)
     
     return render(request, 'myapp/cart_invoice.html', {
         'invoices': invoices, 
@@ -2495,8 +2118,8 @@ def cart_invoice_pdf(request):
     student = request.user.myapp_profile.student
     
     # Generate PDF
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer)
+    report = PdfReport('invoice.pdf')
+    p = report.canvas()
     p.setFont("Helvetica-Bold", 16)
     p.drawString(100, 800, "INVOICE")
     p.setFont("Helvetica", 12)
@@ -2601,9 +2224,7 @@ def cart_invoice_pdf(request):
     
     p.showPage()
     p.save()
-    buffer.seek(0)
-    response = FileResponse(buffer, as_attachment=True, filename='invoice.pdf')
-    response['Content-Disposition'] += '; filename="invoice.pdf"'
+    response = report.response()
     # Add a Refresh header to redirect after download
     response['Refresh'] = '0; url=/student/cart-invoice/'
     return response
@@ -2669,14 +2290,16 @@ def access_denied(request):
 # PARENT-ONLY VIEWS (Same functionality as students but for parents)
 # ============================================================================
 
+@query_budget(25)
 @login_required
 def parent_dashboard(request):
     """Parent dashboard - only accessible by parents"""
     try:
         parent = Parent.objects.get(user=request.user)
         
-        # Get all children
-        children = parent.students.filter(is_active=True)
+        # Get all children with their fee ledgers
+        children = list(parent.students.filter(is_active=True).select_related('fee_ledger'))
+        ledgers = StudentFeeLedger.for_students(children)
         
         # Calculate summary statistics
         total_outstanding = 0
@@ -2684,56 +2307,24 @@ def parent_dashboard(request):
         children_data = []
         
         for child in children:
-            # Get outstanding fees (pending/overdue fee statuses)
-            outstanding_fees = FeeStatus.objects.filter(
-                student=child,
-                status__in=['pending', 'overdue']
-            )
-            child_outstanding = outstanding_fees.aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            # Get paid fees (completed payments)
-            paid_fees = Payment.objects.filter(
-                student=child,
-                status='completed'
-            ).aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            # Get individual fees
-            individual_fees = IndividualStudentFee.objects.filter(
-                student=child,
-                is_paid=False,
-                is_active=True
-            )
-            individual_outstanding = individual_fees.aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            total_child_outstanding = child_outstanding + individual_outstanding
+            ledger = ledgers[child.id]
+            total_child_outstanding = ledger.total_outstanding_amount
             
             children_data.append({
                 'child': child,
                 'outstanding_amount': total_child_outstanding,
-                'paid_amount': paid_fees,
-                'outstanding_count': outstanding_fees.count() + individual_fees.count(),
+                'paid_amount': ledger.paid_amount,
+                'outstanding_count': ledger.total_outstanding_count,
             })
             
             total_outstanding += total_child_outstanding
-            total_paid += paid_fees
-
-        # Get cart info from session
-        cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-        cart_items_count = len(cart.get('fees', [])) + len(cart.get('fee_statuses', [])) + len(cart.get('individual_fees', []))
-        print(f"DEBUG: Parent dashboard - Cart items count: {cart_items_count}")
-        
-        # Calculate cart total
-        cart_total = 0
-        if cart_items_count > 0:
-            fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
-            regular_fees = FeeStructure.objects.filter(id__in=cart.get('fees', []))
-            individual_fees = IndividualStudentFee.objects.filter(id__in=cart.get('individual_fees', []))
-            
-            cart_total = (
-                sum(fs.get_discounted_amount() for fs in fee_statuses) +
-                sum(fee.amount for fee in regular_fees) +
-                sum(fee.amount for fee in individual_fees)
-            )
+            total_paid += ledger.paid_amount
+
+        # Cart badge and total are precomputed on the cart row
+        cart = ParentCart.for_parent(parent)
+        cart_items_count = cart.item_count
+        cart_total = cart.total_amount
+        logger.debug("Parent dashboard - Cart items count: %s", cart_items_count)
 
         context = {
             'parent': parent,
@@ -2753,6 +2344,7 @@ def parent_dashboard(request):
         return redirect('home')
 
 
+@query_budget(15)
 @login_required
 def parent_child_fees(request, student_id):
     """View detailed fees for a specific child - parent version of student fees"""
@@ -2767,6 +2359,7 @@ def parent_child_fees(request, student_id):
             student=child,
             status__in=['pending', 'overdue']
         ).select_related('fee_structure__category')
+        FeeStatus.resolve_discounts(fee_statuses)
 
         # 2. Individual fees
         individual_fees = IndividualStudentFee.objects.filter(
@@ -2775,37 +2368,19 @@ def parent_child_fees(request, student_id):
             is_active=True
         ).select_related('category')
 
-        # 3. Available fee structures (same logic as student)
-        student_level = child.get_level_display_value()
-        available_fees = FeeStructure.objects.filter(
-            form__iexact=student_level,
-            is_active=True
+        # 3. Available fee structures (same logic as student), without fees that
+        # are completely paid: only show fees that either have no status yet or
+        # still have a pending/overdue one, checked in the same query
+        child_statuses = FeeStatus.objects.filter(student=child, fee_structure=OuterRef('pk'))
+        fees_to_show = FeeStructure.for_student(child).filter(
+            ~Exists(child_statuses) | Exists(child_statuses.filter(status__in=['pending', 'overdue']))
         ).select_related('category')
 
-        # Filter out fees that are completely paid
-        fees_to_show = []
-        for fee_structure in available_fees:
-            existing_statuses = FeeStatus.objects.filter(
-                student=child,
-                fee_structure=fee_structure
-            )
-            
-            # Only show fees that either:
-            # 1. Have no existing status (never been assigned)
-            # 2. Have existing status but it's not paid (status is pending/overdue)
-            if not existing_statuses.exists():
-                fees_to_show.append(fee_structure)
-            else:
-                # Check if all existing statuses are unpaid
-                unpaid_statuses = existing_statuses.filter(status__in=['pending', 'overdue'])
-                if unpaid_statuses.exists():
-                    fees_to_show.append(fee_structure)
-
         # 4. Payment history
         payment_history = Payment.objects.filter(
             student=child,
             status='completed'
-        ).order_by('-payment_date')
+        ).select_related('fee_structure__category').order_by('-payment_date')
 
         context = {
             'parent': parent,
@@ -2839,6 +2414,7 @@ def parent_add_to_cart(request):
     next_url = request.POST.get('next')
     
     # Verify student belongs to parent
+    student = None
     if student_id:
         try:
             student = Student.objects.get(id=student_id, parents=parent)
@@ -2846,35 +2422,40 @@ def parent_add_to_cart(request):
             messages.error(request, 'Access denied.')
             return redirect('home')
     
-    # Initialize cart structure if not exists (same as student system)
-    if 'cart' not in request.session:
-        request.session['cart'] = {'fees': [], 'fee_statuses': [], 'individual_fees': []}
-    
-    cart = request.session['cart']
+    cart = ParentCart.for_parent(parent)
     
     if fee_status_id:
         # Handle fee status (with discount support)
-        if fee_status_id not in cart['fee_statuses']:
-            cart['fee_statuses'].append(fee_status_id)
-            request.session['cart'] = cart
+        fee_status = FeeStatus.objects.select_related('student', 'fee_structure__category').filter(
+            id=fee_status_id, student__parents=parent
+        ).first()
+        if fee_status is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(fee_status.student, fee_status=fee_status):
             messages.success(request, 'Fee added to cart.')
         else:
             messages.info(request, 'Fee already in cart.')
     
     elif fee_id:
         # Handle regular fee structure
-        if fee_id not in cart['fees']:
-            cart['fees'].append(fee_id)
-            request.session['cart'] = cart
+        fee_structure = FeeStructure.objects.select_related('category').filter(id=fee_id).first()
+        if fee_structure is not None and student is None:
+            student = next((child for child in parent.students.all() if fee_structure.applies_to(child)), None)
+        if fee_structure is None or student is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(student, fee_structure=fee_structure):
             messages.success(request, 'Fee added to cart.')
         else:
             messages.info(request, 'Fee already in cart.')
     
     elif individual_fee_id:
         # Handle individual student fee
-        if individual_fee_id not in cart['individual_fees']:
-            cart['individual_fees'].append(individual_fee_id)
-            request.session['cart'] = cart
+        individual_fee = IndividualStudentFee.objects.select_related('student').filter(
+            id=individual_fee_id, student__parents=parent
+        ).first()
+        if individual_fee is None:
+            messages.error(request, 'Fee not found.')
+        elif cart.add_item(individual_fee.student, individual_fee=individual_fee):
             messages.success(request, 'Individual fee added to cart.')
         else:
             messages.info(request, 'Individual fee already in cart.')
@@ -2887,6 +2468,7 @@ def parent_add_to_cart(request):
     return redirect('myapp:parent_dashboard')
 
 
+@query_budget(20)
 @login_required
 def parent_view_cart(request):
     """View parent's cart - same functionality as student view_cart"""
@@ -2896,12 +2478,13 @@ def parent_view_cart(request):
         messages.error(request, 'Parent profile not found.')
         return redirect('home')
 
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
+    cart = ParentCart.for_parent(parent).as_checkout_cart()
     
     # Get fee statuses (with discount support)
     fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
     
     # Calculate discount information for each fee status
+    FeeStatus.resolve_discounts(fee_statuses)
     for fee_status in fee_statuses:
         fee_status.discount_info = fee_status.get_discount_info()
     
@@ -2932,25 +2515,23 @@ def parent_view_cart(request):
 @require_POST
 def parent_remove_from_cart(request):
     """Remove fee from parent's cart - same functionality as student remove_from_cart"""
-    fee_id = request.POST.get('fee_id')
-    fee_status_id = request.POST.get('fee_status_id')
-    individual_fee_id = request.POST.get('individual_fee_id')
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
-    
-    if fee_status_id and fee_status_id in cart.get('fee_statuses', []):
-        cart['fee_statuses'].remove(fee_status_id)
-        request.session['cart'] = cart
-        messages.success(request, 'Fee removed from cart.')
-    elif fee_id and fee_id in cart.get('fees', []):
-        cart['fees'].remove(fee_id)
-        request.session['cart'] = cart
-        messages.success(request, 'Fee removed from cart.')
-    elif individual_fee_id and individual_fee_id in cart.get('individual_fees', []):
-        cart['individual_fees'].remove(individual_fee_id)
-        request.session['cart'] = cart
+    try:
+        parent = Parent.objects.get(user=request.user)
+    except Parent.DoesNotExist:
+        messages.error(request, 'Parent profile not found.')
+        return redirect('home')
+
+    removed = ParentCart.for_parent(parent).remove_item(
+        fee_status_id=request.POST.get('fee_status_id'),
+        fee_structure_id=request.POST.get('fee_id'),
+        individual_fee_id=request.POST.get('individual_fee_id'),
+    )
+    if not removed:
+        messages.info(request, 'Fee not in cart.')
+    elif not (request.POST.get('fee_status_id') or request.POST.get('fee_id')):
         messages.success(request, 'Individual fee removed from cart.')
     else:
-        messages.info(request, 'Fee not in cart.')
+        messages.success(request, 'Fee removed from cart.')
     
     return redirect('myapp:parent_view_cart')
 
@@ -2964,280 +2545,60 @@ def parent_checkout_cart(request):
         messages.error(request, 'Parent profile not found.')
         return redirect('home')
 
-    cart = request.session.get('cart', {'fees': [], 'fee_statuses': [], 'individual_fees': []})
+    fee_cart = ParentCart.for_parent(parent)
+    cart = fee_cart.as_checkout_cart()
     
     # Get cart items
     fee_statuses = FeeStatus.objects.filter(id__in=cart.get('fee_statuses', []))
     regular_fees = FeeStructure.objects.filter(id__in=cart.get('fees', []))
     individual_fees = IndividualStudentFee.objects.filter(id__in=cart.get('individual_fees', []))
     
-    print(f"DEBUG: Cart contents - fee_statuses: {cart.get('fee_statuses', [])}, fees: {cart.get('fees', [])}, individual_fees: {cart.get('individual_fees', [])}")
-    print(f"DEBUG: Found {fee_statuses.count()} fee statuses, {regular_fees.count()} regular fees, {individual_fees.count()} individual fees")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Cart contents - fee_statuses: %s, fees: %s, individual_fees: %s", cart.get('fee_statuses', []), cart.get('fees', []), cart.get('individual_fees', []))
+        logger.debug("Found %s fee statuses, %s regular fees, %s individual fees", fee_statuses.count(), regular_fees.count(), individual_fees.count())
     
     if not fee_statuses and not regular_fees and not individual_fees:
         messages.info(request, 'Your cart is empty.')
         return redirect('myapp:parent_view_cart')
     
     if request.method == 'POST':
-        print("DEBUG: Parent checkout POST request received")
+        logger.debug("Parent checkout POST request received")
         payment_method = request.POST.get('payment_method', 'online')
-        print(f"DEBUG: Payment method: {payment_method}")
-        payment_ids = []
-        pibg_donation_ids = []  # Track PIBG donations created during this checkout
-        
-        # Use transaction to ensure data consistency
-        from django.db import transaction
+        logger.debug("Payment method: %s", payment_method)
         
+        # Pay for the children's fees (and the optional PIBG donation) in one transaction
         try:
-            with transaction.atomic():
-                print(f"DEBUG: Processing {fee_statuses.count()} fee statuses, {regular_fees.count()} regular fees, {individual_fees.count()} individual fees")
-        
-                # Process fee statuses (with discount support) - same as student
-                for fee_status in fee_statuses:
-                    if fee_status is not None:
-                        # Verify this fee belongs to parent's child
-                        if not parent.students.filter(id=fee_status.student.id).exists():
-                            print(f"DEBUG: Access denied to fee status {fee_status.id}")
-                            messages.error(request, 'Access denied to fee.')
-                            continue
-                        
-                        # Get discounted amount
-                        discounted_amount = fee_status.get_discounted_amount()
-                        print(f"DEBUG: Processing fee status {fee_status.id} - amount: {discounted_amount}")
-                        
-                        # Create payment record with unique receipt number
-                        import time
-                        receipt_number = f'PAR{timezone.now().strftime("%Y%m%d%H%M%S")}{int(time.time() * 1000000) % 1000:03d}'
-                        payment = Payment.objects.create(
-                            student=fee_status.student,
-                            fee_structure=fee_status.fee_structure,
-                            amount=discounted_amount,
-                            payment_date=timezone.now().date(),
-                            payment_method=payment_method,
-                            status='completed',
-                            receipt_number=receipt_number
-                        )
-                        
-                        # Update fee status to paid
-                        fee_status.status = 'paid'
-                        fee_status.save()
-                        
-                        payment_ids.append(payment.id)
-                        print(f"DEBUG: Created payment {payment.id} with receipt {receipt_number}")
-                
-                # Process regular fees
-                for fee in regular_fees:
-                    if fee is not None:
-                        print(f"DEBUG: Processing regular fee {fee.id} - {fee.category.name} for Form {fee.form}")
-                        
-                        # For regular fees, we need a student context
-                        # Use the first child that matches this fee's form
-                        matching_child = parent.students.filter(
-                            level_custom=fee.form,
-                            is_active=True
-                        ).first()
-                        
-                        # Also try matching by get_level_display_value
-                        if not matching_child:
-                            for child in parent.students.filter(is_active=True):
-                                if child.get_level_display_value() == fee.form:
-                                    matching_child = child
-                                    break
-                        
-                        if matching_child:
-                            print(f"DEBUG: Found matching child {matching_child.first_name} for Form {fee.form}")
-                            import time
-                            receipt_number = f'PAR{timezone.now().strftime("%Y%m%d%H%M%S")}{int(time.time() * 1000000) % 1000:03d}'
-                            # Set status based on payment method
-                            payment_status = 'pending' if payment_method == 'cash' else 'completed'
-                            payment = Payment.objects.create(
-                                student=matching_child,
-                                fee_structure=fee,
-                                amount=fee.amount,
-                                payment_date=timezone.now().date(),
-                                payment_method=payment_method,
-                                status=payment_status,
-                                receipt_number=receipt_number
-                            )
-                            
-                            # Create or update FeeStatus based on payment method
-                            fee_status_status = 'pending' if payment_method == 'cash' else 'paid'
-                            if fee.frequency == 'monthly':
-                                # For monthly fees, create multiple FeeStatus records
-                                monthly_amount = fee.get_monthly_amount()
-                                start_date = timezone.now().date()
-                                
-                                for month in range(fee.monthly_duration):
-                                    due_date = start_date + timedelta(days=30 * month)
-                                    
-                                    fee_status, created = FeeStatus.objects.get_or_create(
-                                        student=matching_child,
-                                        fee_structure=fee,
-                                        due_date=due_date,
-                                        defaults={
-                                            'amount': monthly_amount,
-                                            'status': fee_status_status
-                                        }
-                                    )
-                                    if not created and payment_method != 'cash':
-                                        fee_status.status = 'paid'
-                                        fee_status.save()
-                                
-                                print(f"DEBUG: Created/updated {fee.monthly_duration} FeeStatus records for monthly fee")
-                            else:
-                                # For non-monthly fees, create or update single FeeStatus
-                                fee_status, created = FeeStatus.objects.get_or_create(
-                                    student=matching_child,
-                                    fee_structure=fee,
-                                    defaults={
-                                        'amount': fee.amount,
-                                        'due_date': timezone.now().date(),
-                                        'status': fee_status_status
-                                    }
-                                )
-                                if not created and payment_method != 'cash':
-                                    fee_status.status = 'paid'
-                                    fee_status.save()
-                                
-                                print(f"DEBUG: Created/updated FeeStatus {fee_status.id} for regular fee")
-                            
-                            payment_ids.append(payment.id)
-                            print(f"DEBUG: Created regular fee payment {payment.id} for {matching_child.first_name}")
-                        else:
-                            print(f"DEBUG: No matching child found for Form {fee.form}")
-                
-                # Process individual fees
-                for individual_fee in individual_fees:
-                    if individual_fee is not None:
-                        # Verify this fee belongs to parent's child
-                        if not parent.students.filter(id=individual_fee.student.id).exists():
-                            print(f"DEBUG: Access denied to individual fee {individual_fee.id}")
-                            messages.error(request, 'Access denied to fee.')
-                            continue
-                        
-                        import time
-                        receipt_number = f'PAR{timezone.now().strftime("%Y%m%d%H%M%S")}{int(time.time() * 1000000) % 1000:03d}'
-                        # Set status based on payment method
-                        payment_status = 'pending' if payment_method == 'cash' else 'completed'
-                        payment = Payment.objects.create(
-                            student=individual_fee.student,
-                            fee_structure=None,
-                            amount=individual_fee.amount,
-                            payment_date=timezone.now().date(),
-                            payment_method=payment_method,
-                            status=payment_status,
-                            receipt_number=receipt_number
-                        )
-                        
-                        # Mark individual fee as paid only for non-cash payments
-                        if payment_method != 'cash':
-                            individual_fee.is_paid = True
-                            individual_fee.save()
-                        
-                        payment_ids.append(payment.id)
-                        print(f"DEBUG: Created individual fee payment {payment.id}")
-                
-                # Process PIBG donation if selected
-                donation_amount = request.POST.get('donation_amount', '0')
-                custom_donation_amount = request.POST.get('custom_donation_amount', '')
-                
-                print(f"DEBUG: Donation amount selected: {donation_amount}")
-                print(f"DEBUG: Custom donation amount: {custom_donation_amount}")
-                
-                if donation_amount and donation_amount != '0':
-                    from .models import PibgDonation, PibgDonationSettings
-                    donation_settings = PibgDonationSettings.get_settings()
-                    
-                    # Determine actual donation amount
-                    if donation_amount == 'custom':
-                        actual_donation_amount = float(custom_donation_amount) if custom_donation_amount else 0
-                    else:
-                        actual_donation_amount = float(donation_amount)
-                    
-                    if actual_donation_amount > 0:
-                        # Validate donation amount
-                        if donation_amount == 'custom':
-                            if actual_donation_amount < donation_settings.minimum_custom_amount or actual_donation_amount > donation_settings.maximum_custom_amount:
-                                raise ValueError(f"Custom donation amount must be between RM {donation_settings.minimum_custom_amount} and RM {donation_settings.maximum_custom_amount}")
-                        
-                        # Create PIBG donation record for each student in the cart
-                        students_in_cart = set()
-                        for fee_status in fee_statuses:
-                            students_in_cart.add(fee_status.student)
-                        for fee in regular_fees:
-                            # For regular fees, we need to determine which students they apply to
-                            # For now, we'll create one donation for the first child
-                            if parent.students.exists():
-                                students_in_cart.add(parent.students.first())
-                        for individual_fee in individual_fees:
-                            students_in_cart.add(individual_fee.student)
-                        
-                        # If no specific students, use first child
-                        if not students_in_cart and parent.students.exists():
-                            students_in_cart.add(parent.students.first())
-                        
-                        # Create one donation per unique student (or just one if no students)
-                        if students_in_cart:
-                            student_for_donation = list(students_in_cart)[0]  # Use first student for the donation
-                        else:
-                            student_for_donation = parent.students.first() if parent.students.exists() else None
-                        
-                        if student_for_donation:
-                            pibg_donation = PibgDonation.objects.create(
-                                student=student_for_donation,
-                                parent=parent,
-                                amount=actual_donation_amount,
-                                payment_method=payment_method,
-                                status='completed'
-                            )
-                            pibg_donation_ids.append(pibg_donation.id)  # Track this donation
-                            print(f"DEBUG: Created PIBG donation {pibg_donation.receipt_number} for RM {actual_donation_amount}")
-                
-                print(f"DEBUG: Total payments created: {len(payment_ids)}")
-        
-        except Exception as e:
-            print(f"DEBUG: Error during payment processing: {str(e)}")
+            result = CheckoutService(
+                parent.students.all(), payment_method=payment_method, parent=parent, receipt_prefix='PAR', invoices=True
+            ).checkout(
+                cart,
+                donation_amount=request.POST.get('donation_amount', '0'),
+                custom_donation_amount=request.POST.get('custom_donation_amount', ''),
+            )
+        except CheckoutError as e:
+            logger.warning("Error during payment processing: %s", e)
             messages.error(request, f'Payment processing failed: {str(e)}')
             return redirect('myapp:parent_view_cart')
+        if result['skipped']:
+            messages.warning(request, f"{result['skipped']} item(s) were skipped because they are already paid or not linked to your children.")
+        payment_ids = [payment.id for payment in result['payments']]
+        pibg_donation_ids = [donation.id for donation in result['pibg_donations']]
+        logger.debug("Total payments created: %s", len(payment_ids))
         
         # Store payment IDs and PIBG donation IDs in session for receipt/invoice generation
         request.session['last_cart_payment_ids'] = payment_ids
         request.session['last_cart_pibg_donation_ids'] = pibg_donation_ids
-        print(f"DEBUG: Stored payment IDs in session: {payment_ids}")
-        print(f"DEBUG: Stored PIBG donation IDs in session: {pibg_donation_ids}")
+        logger.debug("Stored payment IDs in session: %s", payment_ids)
+        logger.debug("Stored PIBG donation IDs in session: %s", pibg_donation_ids)
         
-        # Generate invoices for each payment
-        from datetime import timedelta
-        invoices = []
-        try:
-            for payment_id in payment_ids:
-                payment = Payment.objects.get(id=payment_id)
-                invoice, created = Invoice.objects.get_or_create(
-                    payment=payment,
-                    defaults={
-                        'student': payment.student,
-                        'amount': payment.amount,
-                        'due_date': timezone.now().date() + timedelta(days=30),
-                        'status': 'paid',  # Mark as paid since payment is completed
-                        'notes': f'Invoice for {payment.fee_structure.category.name if payment.fee_structure else "Individual Fee"}',
-                        'terms_conditions': 'Payment completed successfully. Thank you!'
-                    }
-                )
-                invoices.append(invoice)
-                print(f"DEBUG: Generated invoice {invoice.invoice_number} for payment {payment.id}")
-        except Exception as e:
-            print(f"DEBUG: Error generating invoices: {str(e)}")
+        logger.debug("Generated invoices: %s", [invoice.invoice_number for invoice in result['invoices']])
         
         # Clear cart completely (same as student system)
-        print(f"DEBUG: Clearing cart. Before: {request.session.get('cart', {})}")
-        request.session['cart'] = {'fees': [], 'fee_statuses': [], 'individual_fees': []}
-        request.session.modified = True  # Ensure session is saved
-        request.session.save()  # Force save session
-        print(f"DEBUG: Cart cleared. After: {request.session.get('cart', {})}")
-        print("DEBUG: Cart cleared and session saved")
+        fee_cart.clear()
+        logger.debug("Cart cleared")
         
         if payment_ids:
-            print(f"DEBUG: Payment successful with {len(payment_ids)} payments")
+            logger.debug("Payment successful with %s payments", len(payment_ids))
             # Add success message based on payment method
             if payment_method == 'cash':
                 messages.info(request, f'Cash payment request submitted successfully! {len(payment_ids)} item(s) marked as pending. Please make the cash payment at the school office. An admin will confirm your payment.')
@@ -3256,23 +2617,20 @@ def parent_checkout_cart(request):
                 'success_message': f'Payment completed successfully! {len(payment_ids)} fees paid.',
             }
             
-            print("DEBUG: Rendering parent receipt directly")
-            
-            # Verify cart is actually empty
-            final_cart_check = request.session.get('parent_cart', {})
-            print(f"DEBUG: Final cart check after clearing: {final_cart_check}")
+            logger.debug("Rendering parent receipt directly")
             
             # Add a flag to show success on dashboard
             context['show_dashboard_link'] = True
             
             return render(request, 'myapp/parent_receipt.html', context)
         else:
-            print("DEBUG: No payments processed, redirecting to cart")
+            logger.debug("No payments processed, redirecting to cart")
             messages.error(request, 'No payments were processed.')
             return redirect('myapp:parent_view_cart')
     
     # GET request - show checkout form
     # Calculate totals for display
+    FeeStatus.resolve_discounts(fee_statuses)
     fee_statuses_total = sum(fs.get_discounted_amount() for fs in fee_statuses)
     regular_total = sum(fee.amount for fee in regular_fees)
     individual_total = sum(fee.amount for fee in individual_fees)
@@ -3333,8 +2691,8 @@ def parent_cart_invoice(request):
         
         payment_ids = request.session.get('last_cart_payment_ids', [])
         pibg_donation_ids = request.session.get('last_cart_pibg_donation_ids', [])
-        print(f"DEBUG: payment_ids from session: {payment_ids}")
-        print(f"DEBUG: pibg_donation_ids from session: {pibg_donation_ids}")
+        logger.debug("payment_ids from session: %s", payment_ids)
+        logger.debug("pibg_donation_ids from session: %s", pibg_donation_ids)
         
         if not payment_ids:
             messages.warning(request, 'No recent payments found. Please complete a payment first.')
@@ -3348,7 +2706,8 @@ def parent_cart_invoice(request):
         # Get PIBG donations from session first (most accurate)
         from .models import PibgDonation
         recent_donations = PibgDonation.objects.filter(id__in=pibg_donation_ids).order_by('-created_at')
-        print(f"DEBUG: found {recent_donations.count()} PIBG donations from session for parent {parent.user.username}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("found %s PIBG donations from session for parent %s", recent_donations.count(), parent.user.username)
         
         # If no donations found in session, fallback to time-based search
         if not recent_donations.exists():
@@ -3373,10 +2732,11 @@ def parent_cart_invoice(request):
                     parent=parent
                 ).order_by('-created_at')[:3]  # Get last 3 donations
             
-            print(f"DEBUG: fallback - found {recent_donations.count()} recent PIBG donations for parent {parent.user.username}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("fallback - found %s recent PIBG donations for parent %s", recent_donations.count(), parent.user.username)
         
         for donation in recent_donations:
-            print(f"DEBUG: PIBG donation {donation.receipt_number}: RM{donation.amount} created at {donation.created_at}")
+            logger.debug("PIBG donation %s: RM%s created at %s", donation.receipt_number, donation.amount, donation.created_at)
         
         context = {
             'parent': parent,
@@ -3402,8 +2762,8 @@ def parent_cart_invoice_pdf(request):
         payments = Payment.objects.filter(id__in=payment_ids)
         
         # Generate PDF
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
+        report = PdfReport(f'parent_invoice_{timezone.now().strftime("%Y%m%d")}.pdf')
+        p = report.canvas()
         p.setFont("Helvetica-Bold", 16)
         p.drawString(100, 800, "SCHOOL FEES INVOICE")
         p.setFont("Helvetica", 12)
@@ -3500,10 +2860,7 @@ def parent_cart_invoice_pdf(request):
         
         p.showPage()
         p.save()
-        buffer.seek(0)
-        
-        response = FileResponse(buffer, as_attachment=True, filename=f'parent_invoice_{timezone.now().strftime("%Y%m%d")}.pdf')
-        return response
+        return report.response()
         
     except Parent.DoesNotExist:
         messages.error(request, 'Parent profile not found.')
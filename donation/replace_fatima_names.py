@@ -23,7 +23,9 @@ def replace_fatima_names():
         print("\nUpdating names from Fatima to Amina...")
         
         # Update all Fatima names to Amina
+        student_ids = list(fatima_students.values_list('id', flat=True))
         updated_count = fatima_students.update(first_name='Amina')
+        Student.refresh_search_text(Student.objects.filter(id__in=student_ids))
         
         print(f"✅ Successfully updated {updated_count} students from Fatima to Amina")
         
@@ -52,11 +52,13 @@ class WaqafAssetAdmin(admin.ModelAdmin):
         """Display contribution count"""
         return obj.get_contribution_count()
     contribution_count.short_description = "Contributions"
+    contribution_count.admin_order_field = 'contribution_count'
 
     def total_contributed(self, obj):
         """Display total contributed amount"""
         return f"RM {obj.get_total_contributed():,.2f}"
     total_contributed.short_description = "Total Contributed"
+    total_contributed.admin_order_field = 'total_contributed'
 
     def funding_progress(self, obj):
         """Display funding progress as percentage"""
@@ -66,8 +68,8 @@ class WaqafAssetAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         """Show all assets by default, but allow filtering by archive status"""
-        qs = super().get_queryset(request)
-        return qs
+        # Contribution figures are annotated instead of counted per row
+        return super().get_queryset(request).with_funding_stats()
 
     def get_list_display(self, request):
         """Customize list display based on archive filter"""
@@ -1,4 +1,4 @@
-from django.db.models import Sum, Count, Avg, F
+from django.db.models import Sum, Count, Avg, F, Exists, OuterRef
 from django.utils import timezone
 from datetime import timedelta
 import numpy as np
@@ -135,19 +135,16 @@ class WaqafAIService:
     @staticmethod
     def get_asset_management_recommendations():
         """Generate recommendations for asset management"""
-        assets = WaqafAsset.objects.all()
+        # Utilization and recent distributions are annotated, one query for all assets
+        recent_distributions = FundDistribution.objects.filter(
+            asset=OuterRef('pk'),
+            date_distributed__gte=timezone.now() - timedelta(days=90)
+        )
+        assets = WaqafAsset.objects.with_funding_stats().annotate(has_recent_distributions=Exists(recent_distributions))
         recommendations = []
         
         for asset in assets:
-            # Calculate utilization rate
-            filled_slots = asset.total_slots - asset.slots_available
-            utilization_rate = (filled_slots / asset.total_slots * 100) if asset.total_slots > 0 else 0
-            
-            # Get recent distributions
-            recent_distributions = FundDistribution.objects.filter(
-                asset=asset,
-                date_distributed__gte=timezone.now() - timedelta(days=90)
-            )
+            utilization_rate = asset.funding_progress
             
             # Generate recommendations based on utilization and distributions
             if utilization_rate < 30:
@@ -158,7 +155,7 @@ class WaqafAIService:
                     'priority': 'high'
                 })
             
-            if not recent_distributions.exists():
+            if not asset.has_recent_distributions:
                 recommendations.append({
                     'asset': asset.name,
                     'type': 'distribution',
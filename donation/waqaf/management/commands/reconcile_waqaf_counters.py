@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from waqaf.models import Contribution, Contributor, WaqafAsset
+
+
+class Command(BaseCommand):
+    help = 'Recompute available slots of waqaf assets and contributor totals from their contributions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the counters that are out of step',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        taken = dict(
+            Contribution.objects.exclude(payment_status='FAILED').filter(asset__isnull=False)
+            .values_list('asset')
+            .annotate(slots=Sum('number_of_slots'))
+            .order_by()
+        )
+        assets_fixed = 0
+        for asset in WaqafAsset.objects.only('id', 'name', 'total_slots', 'slots_available'):
+            expected = max(asset.total_slots - (taken.get(asset.id) or 0), 0)
+            if asset.slots_available == expected:
+                continue
+            recorded = asset.slots_available
+            if not dry_run:
+                # Recomputed under a row lock, so contributions made meanwhile are not lost
+                expected = asset.update_slots()
+            self.stdout.write(f"  {asset.name}: {recorded} -> {expected} slots available")
+            assets_fixed += 1
+
+        totals = dict(
+            Contribution.objects.values_list('contributor')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        )
+        contributors_fixed = 0
+        for contributor in Contributor.objects.only('id', 'name', 'amount_contributed'):
+            expected = totals.get(contributor.id) or 0
+            if contributor.amount_contributed == expected:
+                continue
+            recorded = contributor.amount_contributed
+            if not dry_run:
+                contributor.update_total_contribution()
+                expected = contributor.amount_contributed
+            self.stdout.write(f"  {contributor.name}: RM {recorded} -> RM {expected} contributed")
+            contributors_fixed += 1
+
+        summary = f"{assets_fixed} asset(s) and {contributors_fixed} contributor(s)"
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"{summary} out of step (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciled {summary}"))
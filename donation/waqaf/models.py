@@ -1,8 +1,44 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 import uuid
 
+
+class SlotsUnavailable(ValueError):
+    """A contribution asked for more slots than its asset has left"""
+
+
+class WaqafAssetQuerySet(models.QuerySet):
+    def with_slot_progress(self):
+        """
+        Annotate each asset with slots_taken and funding_progress (percent of
+        its slots taken), both read from the asset's own columns, without
+        joining contributions
+        """
+        slots_taken = F('total_slots') - F('slots_available')
+        return self.annotate(
+            slots_taken=slots_taken,
+            funding_progress=Case(
+                When(total_slots=0, then=Value(0.0)),
+                default=slots_taken * 100.0 / F('total_slots'),
+                output_field=models.FloatField(),
+            ),
+        )
+
+    def with_funding_stats(self):
+        """
+        ``with_slot_progress`` plus contribution_count and total_contributed,
+        grouped in the same query, so listing assets does not count
+        contributions per asset
+        """
+        return self.with_slot_progress().annotate(
+            contribution_count=Count('contribution'),
+            total_contributed=Coalesce(Sum('contribution__amount'), Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+
+
 class WaqafAsset(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
@@ -15,6 +51,8 @@ class WaqafAsset(models.Model):
     archived_at = models.DateTimeField(blank=True, null=True, help_text='When this asset was archived')
     archived_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, help_text='User who archived this asset')
 
+    objects = WaqafAssetQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -31,13 +69,43 @@ class WaqafAsset(models.Model):
             self.save(update_fields=['slot_price'])
 
     def update_slots(self):
-        self.slots_available = self.total_slots - self.contribution_set.count()
-        self.save()
+        """Recompute available slots from the slots held by the asset's contributions"""
+        with transaction.atomic():
+            # Lock the row so contributions cannot take slots between the count and the write
+            WaqafAsset.objects.select_for_update().filter(pk=self.pk).first()
+            taken = self.contribution_set.exclude(payment_status='FAILED').aggregate(
+                total=models.Sum('number_of_slots')
+            )['total'] or 0
+            self.slots_available = max(self.total_slots - taken, 0)
+            WaqafAsset.objects.filter(pk=self.pk).update(slots_available=self.slots_available)
+        return self.slots_available
+
+    @classmethod
+    def take_slots(cls, asset_id, slots):
+        """
+        Take ``slots`` from an asset (or give them back when negative) in one
+        UPDATE. Taking only succeeds while enough slots are left, so
+        concurrent contributions can never push the count below zero.
+        """
+        if not asset_id or not slots:
+            return
+        if slots < 0:
+            cls.objects.filter(pk=asset_id).update(slots_available=F('slots_available') - slots)
+        elif not cls.objects.filter(pk=asset_id, slots_available__gte=slots).update(slots_available=F('slots_available') - slots):
+            available = cls.objects.filter(pk=asset_id).values_list('slots_available', flat=True).first() or 0
+            raise SlotsUnavailable(f'Only {available} slots available for this asset.')
 
     def save(self, *args, **kwargs):
         # Auto-calculate slot price if target_amount and total_slots are set
         if self.target_amount > 0 and self.total_slots > 0:
             self.slot_price = self.target_amount / self.total_slots
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # slots_available only changes through take_slots/update_slots; writing
+            # back the count loaded with this instance would undo their updates
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'slots_available'
+            ]
         super().save(*args, **kwargs)
 
     def archive(self, user=None):
@@ -45,21 +113,23 @@ class WaqafAsset(models.Model):
         self.is_archived = True
         self.archived_at = timezone.now()
         self.archived_by = user
-        self.save()
+        self.save(update_fields=['is_archived', 'archived_at', 'archived_by'])
 
     def unarchive(self):
         """Unarchive this asset"""
         self.is_archived = False
         self.archived_at = None
         self.archived_by = None
-        self.save()
+        self.save(update_fields=['is_archived', 'archived_at', 'archived_by'])
 
     def is_fully_funded(self):
-        """Check if asset is fully funded"""
-        return self.contribution_set.count() >= self.total_slots
+        """Check if every slot of the asset is taken"""
+        return self.slots_available == 0
 
     def get_funding_progress(self):
         """Get funding progress percentage"""
+        if hasattr(self, 'funding_progress'):
+            return self.funding_progress
         if self.total_slots == 0:
             return 0
         filled_slots = self.total_slots - self.slots_available
@@ -78,10 +148,14 @@ class WaqafAsset(models.Model):
 
     def get_contribution_count(self):
         """Get total number of contributions for this asset"""
+        if hasattr(self, 'contribution_count'):
+            return self.contribution_count
         return self.contribution_set.count()
 
     def get_total_contributed(self):
         """Get total amount contributed for this asset"""
+        if hasattr(self, 'total_contributed'):
+            return self.total_contributed
         return self.contribution_set.aggregate(
             total=models.Sum('amount')
         )['total'] or 0
@@ -102,9 +176,14 @@ class Contributor(models.Model):
         return self.name
 
     def update_total_contribution(self):
-        total = sum(contribution.amount for contribution in self.contribution_set.all())
-        self.amount_contributed = total
-        self.save()
+        self.amount_contributed = self.contribution_set.aggregate(total=models.Sum('amount'))['total'] or 0
+        Contributor.objects.filter(pk=self.pk).update(amount_contributed=self.amount_contributed)
+
+    @classmethod
+    def add_to_total(cls, contributor_id, amount):
+        """Add ``amount`` to a contributor's total in the database, without reading it first"""
+        if contributor_id and amount:
+            cls.objects.filter(pk=contributor_id).update(amount_contributed=F('amount_contributed') + amount)
 
 class Contribution(models.Model):
     contributor = models.ForeignKey(Contributor, on_delete=models.CASCADE)
@@ -149,15 +228,38 @@ class Contribution(models.Model):
     def __str__(self):
         return f"{self.contributor.name} - {self.number_of_slots} slots ({self.amount} RM)"
 
+    def slots_held(self):
+        """Slots this contribution takes from its asset; failed payments give theirs back"""
+        return self.number_of_slots if self.asset_id and self.payment_status != 'FAILED' else 0
+
+    def _stored_counted(self):
+        stored = Contribution.objects.filter(pk=self.pk).values_list(
+            'asset_id', 'number_of_slots', 'payment_status', 'contributor_id', 'amount'
+        ).first() if self.pk else None
+        if stored is None:
+            return None, 0, None, 0
+        asset_id, slots, status, contributor_id, amount = stored
+        return asset_id, slots if asset_id and status != 'FAILED' else 0, contributor_id, amount
+
     def save(self, *args, **kwargs):
         if self.asset:  # Only calculate amount if asset is set
             self.amount = self.number_of_slots * self.asset.slot_price
-        super().save(*args, **kwargs)
-        # Update contributor's total contribution
-        self.contributor.update_total_contribution()
-        # Update asset's available slots if asset exists
-        if self.asset:
-            self.asset.update_slots()
+        asset_id, slots, contributor_id, amount = self._counted if self._counted is not None else self._stored_counted()
+        with transaction.atomic():
+            # Apply only the change since the contribution was loaded, as atomic
+            # updates, so concurrent contributions never overwrite each other
+            if asset_id == self.asset_id:
+                WaqafAsset.take_slots(self.asset_id, self.slots_held() - slots)
+            else:
+                WaqafAsset.take_slots(asset_id, -slots)
+                WaqafAsset.take_slots(self.asset_id, self.slots_held())
+            super().save(*args, **kwargs)
+            if contributor_id == self.contributor_id:
+                Contributor.add_to_total(self.contributor_id, self.amount - amount)
+            else:
+                Contributor.add_to_total(contributor_id, -amount)
+                Contributor.add_to_total(self.contributor_id, self.amount)
+        self._counted = (self.asset_id, self.slots_held(), self.contributor_id, self.amount)
         
         # Auto-generate payments if enabled
         if self.auto_generate_payments and self.payment_type == 'RECURRING':
@@ -346,3 +448,38 @@ class WaqafCartItem(models.Model):
     @property
     def slot_price(self):
         return self.asset.slot_price
+
+
+# Keep asset slots and contributor totals in step with contributions
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+
+@receiver(post_init, sender=Contribution)
+def remember_counted_contribution(sender, instance, **kwargs):
+    """Keep what the loaded contribution holds, so saves only apply the change"""
+    if not instance.pk:
+        instance._counted = (None, 0, None, 0)
+    elif {'asset_id', 'number_of_slots', 'payment_status', 'contributor_id', 'amount'} & instance.get_deferred_fields():
+        # Read lazily in save() rather than loading deferred fields for every row
+        instance._counted = None
+    else:
+        instance._counted = (instance.asset_id, instance.slots_held(), instance.contributor_id, instance.amount)
+
+
+@receiver(pre_delete, sender=Contribution)
+def release_contribution(sender, instance, **kwargs):
+    """Give a deleted contribution's slots back, in the same transaction as the delete"""
+    asset_id, slots, contributor_id, amount = instance._counted if instance._counted is not None else instance._stored_counted()
+    WaqafAsset.take_slots(asset_id, -slots)
+    Contributor.add_to_total(contributor_id, -amount)
+
+
+@receiver(post_save, sender=WaqafAsset)
+@receiver(post_delete, sender=WaqafAsset)
+@receiver(post_save, sender=Contribution)
+@receiver(post_delete, sender=Contribution)
+def invalidate_cached_chat_responses(sender, **kwargs):
+    """Cached chat answers list the open assets and their progress"""
+    from donation.response_cache import invalidate_chat_responses
+    transaction.on_commit(invalidate_chat_responses)
@@ -1,3 +1,155 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from myapp.tests import run_in_threads
+
+from .admin import WaqafAssetAdmin
+from .models import Contribution, Contributor, SlotsUnavailable, WaqafAsset
+
+
+class SlotCounterMixin:
+    def setUp(self):
+        self.asset = WaqafAsset.objects.create(
+            name='Well', description='Village well', current_value=Decimal('0'), target_amount=Decimal('1200.00'),
+            total_slots=12, slots_available=12
+        )
+        self.contributor = Contributor.objects.create(name='Aminah', email='aminah@example.com')
+
+    def contribute(self, slots=1, status='COMPLETED'):
+        return Contribution.objects.create(
+            contributor=self.contributor, asset=self.asset, number_of_slots=slots, amount=0, payment_status=status
+        )
+
+    def counters(self):
+        return (
+            WaqafAsset.objects.get(pk=self.asset.pk).slots_available,
+            Contributor.objects.get(pk=self.contributor.pk).amount_contributed,
+        )
+
+
+class WaqafSlotCounterTest(SlotCounterMixin, TestCase):
+    def test_contributions_take_and_release_slots(self):
+        contribution = self.contribute(3)
+        self.assertEqual(self.counters(), (9, Decimal('300.00')))
+
+        contribution.payment_status = 'FAILED'
+        contribution.save()
+        self.assertEqual(self.counters(), (12, Decimal('300.00')))
+        contribution.payment_status = 'COMPLETED'
+        contribution.number_of_slots = 5
+        contribution.save()
+        self.assertEqual(self.counters(), (7, Decimal('500.00')))
+
+        with self.assertRaises(SlotsUnavailable):
+            self.contribute(8)
+        self.assertEqual(Contribution.objects.count(), 1)
+        self.assertEqual(self.counters(), (7, Decimal('500.00')))
+
+        Contribution.objects.get(pk=contribution.pk).delete()
+        self.assertEqual(self.counters(), (12, Decimal('0.00')))
+
+    def test_reconcile_command(self):
+        self.contribute(4)
+        self.contribute(2, status='FAILED')
+        WaqafAsset.objects.filter(pk=self.asset.pk).update(slots_available=1)
+        Contributor.objects.filter(pk=self.contributor.pk).update(amount_contributed=0)
+
+        out = StringIO()
+        call_command('reconcile_waqaf_counters', '--dry-run', stdout=out)
+        self.assertIn('Well: 1 -> 8 slots available', out.getvalue())
+        self.assertEqual(self.counters(), (1, Decimal('0.00')))
+
+        call_command('reconcile_waqaf_counters', stdout=StringIO())
+        self.assertEqual(self.counters(), (8, Decimal('600.00')))
+
+    def test_saving_a_loaded_asset_keeps_the_slot_count(self):
+        stale = WaqafAsset.objects.get(pk=self.asset.pk)
+        self.contribute(3)
+        stale.name = 'Village well'
+        stale.save()
+        self.assertEqual(self.counters()[0], 9)
+
+        self.contribute(2)
+        stale.archive()
+        self.contribute(1)
+        stale.unarchive()
+        asset = WaqafAsset.objects.get(pk=self.asset.pk)
+        self.assertEqual((asset.name, asset.is_archived, asset.slots_available), ('Village well', False, 6))
+
+
+class WaqafFundingStatsTest(SlotCounterMixin, TestCase):
+    def add_asset(self, name):
+        return WaqafAsset.objects.create(
+            name=name, description=name, current_value=Decimal('0'), target_amount=Decimal('500.00'),
+            total_slots=5, slots_available=5
+        )
+
+    def test_funding_stats_are_annotated(self):
+        self.contribute(3)
+        self.contribute(2, status='FAILED')
+        WaqafAsset.objects.create(name='Empty', description='No slots', current_value=Decimal('0'))
+
+        assets = {asset.name: asset for asset in WaqafAsset.objects.with_funding_stats()}
+        well = assets['Well']
+        self.assertEqual(
+            (well.contribution_count, well.slots_taken, well.total_contributed, well.funding_progress),
+            (2, 3, Decimal('500.00'), 25.0)
+        )
+        self.assertEqual((assets['Empty'].contribution_count, assets['Empty'].total_contributed), (0, Decimal('0')))
+        self.assertEqual(assets['Empty'].funding_progress, 0)
+        self.assertFalse(well.is_fully_funded())
+
+    def test_asset_lists_do_not_query_per_asset(self):
+        self.contribute(3)
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(reverse('waqaf:waqaf')).status_code, 200)
+            return len(context)
+
+        baseline = queries()
+        for name in ('Mosque', 'School', 'Clinic'):
+            self.add_asset(name)
+        self.assertEqual(queries(), baseline)
+
+        request = RequestFactory().get('/')
+        model_admin = WaqafAssetAdmin(WaqafAsset, site)
+        assets = list(model_admin.get_queryset(request))
+        with self.assertNumQueries(0):
+            columns = [(model_admin.contribution_count(asset), model_admin.total_contributed(asset)) for asset in assets]
+        self.assertIn((1, 'RM 300.00'), columns)
+
+    def test_public_list_reads_progress_from_the_asset_row(self):
+        self.contribute(3)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('waqaf:waqaf'))
+        well = next(asset for asset in response.context['assets_progress'] if asset['name'] == 'Well')
+        self.assertEqual((well['filled_slots'], well['progress_percent']), (3, 25.0))
+        asset_queries = [query['sql'] for query in context.captured_queries if 'FROM "waqaf_waqafasset"' in query['sql']]
+        self.assertTrue(asset_queries)
+        self.assertFalse([sql for sql in asset_queries if 'GROUP BY' in sql or 'waqaf_contribution' in sql])
+
+
+class WaqafConcurrentSlotTest(SlotCounterMixin, TransactionTestCase):
+    def test_concurrent_contributions_never_oversell(self):
+        refused = []
+
+        def take_slot():
+            try:
+                self.contribute(1)
+            except SlotsUnavailable:
+                refused.append(1)
+
+        self.assertEqual(run_in_threads(take_slot, threads=4, repeat=5), [])
+        self.assertEqual(Contribution.objects.count(), 12)
+        self.assertEqual(len(refused), 8)
+        self.assertEqual(self.counters(), (0, Decimal('1200.00')))
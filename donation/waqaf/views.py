@@ -1,9 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from decimal import Decimal
-from .models import WaqafAsset, Contributor, Contribution, FundDistribution, WaqafCart, WaqafCartItem
+from .models import WaqafAsset, Contributor, Contribution, FundDistribution, WaqafCart, WaqafCartItem, SlotsUnavailable
 from .forms import WaqafContributionForm, ContributorForm, WaqafAssetForm
 from django.http import HttpResponse, JsonResponse
 from reportlab.pdfgen import canvas
@@ -136,15 +136,11 @@ def waqaf(request):
     
     if is_admin:
         # Admin view - show all assets with management options (excluding archived)
-        all_assets = WaqafAsset.objects.filter(is_archived=False)
+        all_assets = WaqafAsset.objects.filter(is_archived=False).with_funding_stats()
         
-        # Calculate progress for each asset
+        # Progress and contribution counts come annotated with each asset
         assets_progress = []
         for asset in all_assets:
-            filled_slots = asset.total_slots - asset.slots_available
-            progress_percent = (filled_slots / asset.total_slots * 100) if asset.total_slots > 0 else 0
-            contributions_count = Contribution.objects.filter(asset=asset).count()
-            
             assets_progress.append({
                 'id': asset.id,
                 'name': asset.name,
@@ -154,9 +150,9 @@ def waqaf(request):
                 'total_slots': asset.total_slots,
                 'slots_available': asset.slots_available,
                 'slot_price': asset.slot_price,
-                'progress_percent': progress_percent,
-                'filled_slots': filled_slots,
-                'contributions_count': contributions_count
+                'progress_percent': asset.funding_progress,
+                'filled_slots': asset.slots_taken,
+                'contributions_count': asset.contribution_count
             })
         
         # Get count of archived assets for admin reference
@@ -165,20 +161,17 @@ def waqaf(request):
         context = {
             'is_admin': True,
             'assets_progress': assets_progress,
-            'total_assets': all_assets.count(),
+            'total_assets': len(assets_progress),
             'total_contributions': Contribution.objects.count(),
             'total_amount': Contribution.objects.aggregate(total=models.Sum('amount'))['total'] or 0,
             'archived_count': archived_count
         }
     else:
         # Regular user view - show available assets with cart functionality (excluding archived)
-        available_assets = WaqafAsset.objects.filter(slots_available__gt=0, is_archived=False)
+        available_assets = WaqafAsset.objects.filter(slots_available__gt=0, is_archived=False).with_slot_progress()
         
-        # Calculate progress for each asset
         assets_progress = []
         for asset in available_assets:
-            filled_slots = asset.total_slots - asset.slots_available
-            progress_percent = (filled_slots / asset.total_slots * 100) if asset.total_slots > 0 else 0
             assets_progress.append({
                 'id': asset.id,
                 'name': asset.name,
@@ -188,14 +181,14 @@ def waqaf(request):
                 'total_slots': asset.total_slots,
                 'slots_available': asset.slots_available,
                 'slot_price': asset.slot_price,
-                'progress_percent': progress_percent,
-                'filled_slots': filled_slots
+                'progress_percent': asset.funding_progress,
+                'filled_slots': asset.slots_taken
             })
         
         context = {
             'is_admin': False,
             'assets_progress': assets_progress,
-            'total_assets': available_assets.count()
+            'total_assets': len(assets_progress)
         }
     
     return render(request, 'waqaf/waqaf.html', context)
@@ -252,7 +245,17 @@ def contribute_waqaf(request):
             # Set payment status to COMPLETED automatically
             contribution.payment_status = 'COMPLETED'
             
-            contribution.save()
+            try:
+                contribution.save()
+            except SlotsUnavailable as e:
+                # Another contribution took the slots after the check above
+                messages.error(request, str(e))
+                available_assets = WaqafAsset.objects.filter(slots_available__gt=0, is_archived=False)
+                return render(request, 'waqaf/contribute.html', {
+                    'contributor_form': contributor_form,
+                    'contribution_form': contribution_form,
+                    'available_assets': available_assets
+                })
             
             # Always generate certificate after every contribution
             request.session['certificate_id'] = contribution.id
@@ -340,18 +343,16 @@ def view_archived_assets(request):
         messages.error(request, 'Permission denied')
         return redirect('waqaf:waqaf')
     
-    archived_assets = WaqafAsset.objects.filter(is_archived=True).order_by('-archived_at')
+    archived_assets = WaqafAsset.objects.filter(is_archived=True).with_funding_stats().order_by('-archived_at')
     
-    # Calculate progress for each archived asset
     for asset in archived_assets:
-        filled_slots = asset.total_slots - asset.slots_available
-        asset.progress_percent = (filled_slots / asset.total_slots * 100) if asset.total_slots > 0 else 0
-        asset.filled_slots = filled_slots
+        asset.progress_percent = asset.funding_progress
+        asset.filled_slots = asset.slots_taken
     
     context = {
         'archived_assets': archived_assets,
         'is_admin': True,
-        'total_archived': archived_assets.count(),
+        'total_archived': len(archived_assets),
     }
     
     return render(request, 'waqaf/archived_assets.html', context)
@@ -788,48 +789,43 @@ def checkout_waqaf_cart(request):
                 contributor.address = contributor_address
                 contributor.save()
             
-            # Create contributions for each cart item
+            # Create contributions for each cart item; each one takes its asset's slots,
+            # and the whole cart is rolled back if any asset has run out
             contributions = []
             
-            if request.user.is_authenticated:
-                # For authenticated users, process database cart items
-                for item in cart.items.all():
-                    contribution = Contribution.objects.create(
-                        contributor=contributor,
-                        asset=item.asset,
-                        number_of_slots=item.number_of_slots,
-                        amount=item.total_amount,
-                        payment_status='COMPLETED',
-                        dedicated_for=request.POST.get('dedicated_for', ''),
-                        payment_type='ONE_OFF'
-                    )
-                    contributions.append(contribution)
-                    
-                    # Update asset slots
-                    item.asset.slots_available -= item.number_of_slots
-                    item.asset.save()
-                
-                # Clear cart
-                cart.clear()
-            else:
-                # For anonymous users, process session cart items
-                for item in cart:
-                    asset = WaqafAsset.objects.get(id=item['asset_id'])
-                    contribution = Contribution.objects.create(
-                        contributor=contributor,
-                        asset=asset,
-                        number_of_slots=item['number_of_slots'],
-                        amount=Decimal(str(item['total_amount'])),
-                        payment_status='COMPLETED',
-                        dedicated_for=request.POST.get('dedicated_for', ''),
-                        payment_type='ONE_OFF'
-                    )
-                    contributions.append(contribution)
+            with transaction.atomic():
+                if request.user.is_authenticated:
+                    # For authenticated users, process database cart items
+                    for item in cart.items.select_related('asset'):
+                        contribution = Contribution.objects.create(
+                            contributor=contributor,
+                            asset=item.asset,
+                            number_of_slots=item.number_of_slots,
+                            amount=item.total_amount,
+                            payment_status='COMPLETED',
+                            dedicated_for=request.POST.get('dedicated_for', ''),
+                            payment_type='ONE_OFF'
+                        )
+                        contributions.append(contribution)
                     
-                    # Update asset slots
-                    asset.slots_available -= item['number_of_slots']
-                    asset.save()
-                
+                    # Clear cart
+                    cart.clear()
+                else:
+                    # For anonymous users, process session cart items
+                    for item in cart:
+                        asset = WaqafAsset.objects.get(id=item['asset_id'])
+                        contribution = Contribution.objects.create(
+                            contributor=contributor,
+                            asset=asset,
+                            number_of_slots=item['number_of_slots'],
+                            amount=Decimal(str(item['total_amount'])),
+                            payment_status='COMPLETED',
+                            dedicated_for=request.POST.get('dedicated_for', ''),
+                            payment_type='ONE_OFF'
+                        )
+                        contributions.append(contribution)
+            
+            if not request.user.is_authenticated:
                 # Clear session cart
                 request.session['waqaf_cart'] = []
             
@@ -5,7 +5,7 @@ from django.contrib import messages
 from django.http import HttpResponseRedirect
 from django.urls import path, reverse
 from django.template.response import TemplateResponse
-from django.db.models import Sum, Count
+from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta
 from .models import WaqafAsset, Contributor, Contribution, Payment, FundDistribution
@@ -182,10 +182,7 @@ class WaqafAdminSite(AdminSite):
         ).aggregate(total=Sum('amount'))['total'] or 0
         
         # Get top assets by contributions
-        top_assets = WaqafAsset.objects.annotate(
-            contribution_count=Count('contribution'),
-            total_contributed=Sum('contribution__amount')
-        ).order_by('-contribution_count')[:5]
+        top_assets = WaqafAsset.objects.with_funding_stats().order_by('-contribution_count')[:5]
         
         context = {
             'title': 'Waqaf Management Dashboard',